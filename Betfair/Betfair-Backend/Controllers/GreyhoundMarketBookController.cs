@@ -151,6 +151,58 @@ public class GreyhoundMarketBookController : ControllerBase
         }
     }
 
+    [HttpPost("markets")]
+    public async Task<IActionResult> GetGreyhoundMarketsOdds([FromBody] MarketIdsRequest request)
+    {
+        if (request?.MarketIds == null || !request.MarketIds.Any())
+        {
+            return BadRequest(new { message = "Market IDs are required" });
+        }
+
+        try
+        {
+            using var connection = new NpgsqlConnection(_connectionString);
+            await connection.OpenAsync();
+
+            // Same rows as market/{marketId}, for every requested market in one query
+            var query = @"
+                SELECT 
+                    marketid,
+                    selectionid,
+                    status,
+                    pricetype,
+                    price,
+                    size
+                FROM greyhoundmarketbook 
+                WHERE marketid = ANY(@MarketIds)
+                ORDER BY marketid, selectionid, pricetype, price";
+
+            var rows = await connection.QueryAsync(query, new { MarketIds = request.MarketIds.Distinct().ToArray() });
+
+            var markets = rows
+                .GroupBy(r => (string)r.marketid)
+                .ToDictionary(g => g.Key, g => g.Select(r => new
+                {
+                    selectionid = r.selectionid,
+                    status = r.status,
+                    pricetype = r.pricetype,
+                    price = r.price,
+                    size = r.size
+                }).ToList());
+
+            return Ok(new
+            {
+                markets,
+                count = markets.Count,
+                retrievedAt = DateTime.UtcNow
+            });
+        }
+        catch (Exception ex)
+        {
+            return StatusCode(500, new { message = "Error fetching greyhound markets odds", error = ex.Message });
+        }
+    }
+
     [HttpGet("status/{marketId}")]
     public async Task<IActionResult> GetMarketStatus(string marketId)
     {
@@ -193,3 +245,8 @@ public class GreyhoundMarketBookController : ControllerBase
         }
     }
 }
+
+public class MarketIdsRequest
+{
+    public List<string> MarketIds { get; set; } = new();
+}
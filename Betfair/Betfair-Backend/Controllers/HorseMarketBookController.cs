@@ -73,4 +73,44 @@ public class HorseMarketBookController : ControllerBase
             return StatusCode(500, new { error = ex.Message, details = ex.StackTrace });
         }
     }
+
+    [HttpPost("market-books")]
+    public async Task<IActionResult> GetMarketBooks([FromBody] MarketIdsRequest request)
+    {
+        if (request?.MarketIds == null || !request.MarketIds.Any())
+        {
+            return BadRequest(new { message = "Market IDs are required" });
+        }
+
+        try
+        {
+            // One listMarketBook call (the service splits it into Betfair's 40-market requests)
+            var jsonResponse = await _marketApiService.ListMarketBookAsync(request.MarketIds.Distinct().ToList());
+
+            var markets = new Dictionary<string, System.Text.Json.JsonElement>();
+            if (!string.IsNullOrEmpty(jsonResponse))
+            {
+                var response = System.Text.Json.JsonSerializer.Deserialize<System.Text.Json.JsonElement>(jsonResponse);
+                if (response.TryGetProperty("result", out var result) && result.ValueKind == System.Text.Json.JsonValueKind.Array)
+                {
+                    foreach (var marketBook in result.EnumerateArray())
+                    {
+                        markets[marketBook.GetProperty("marketId").GetString()] = marketBook;
+                    }
+                }
+            }
+
+            return Ok(new
+            {
+                markets,
+                count = markets.Count,
+                retrievedAt = DateTime.UtcNow
+            });
+        }
+        catch (Exception ex)
+        {
+            Console.WriteLine($"ERROR in GetMarketBooks for {request.MarketIds.Count} markets: {ex.Message}");
+            return StatusCode(500, new { error = ex.Message });
+        }
+    }
 }
@@ -3,19 +3,19 @@ Check and settle REAL greyhound lay bets (live trading)
 Fetches actual results from Betfair and updates live_trades database
 """
 
-import sqlite3
-import requests
 import logging
 from datetime import datetime, timedelta
 import sys
 import os
 import csv
 
+import pandas as pd
+
 sys.path.insert(0, '/Users/clairegrady/RiderProjects/betfair/utilities')
 from db_connection_helper import get_db_connection
+from settlement import get_market_results, settle_bets, write_settlements
 
 LIVE_TRADES_DB = "/Users/clairegrady/RiderProjects/betfair/databases/greyhounds/live_trades_greyhounds.db"
-BACKEND_URL = "http://localhost:5173"
 
 logging.basicConfig(
     level=logging.INFO,
@@ -43,97 +43,6 @@ def get_unsettled_bets():
     return bets
 
 
-def fetch_race_results(market_ids: list) -> dict:
-    """Fetch race results from backend API"""
-    try:
-        url = f"{BACKEND_URL}/api/results/settled"
-        logger.info(f"📡 Fetching results from {url} for {len(market_ids)} markets...")
-        
-        response = requests.post(
-            url,
-            json={"marketIds": market_ids},
-            timeout=30
-        )
-        
-        logger.info(f"📡 Backend response: {response.status_code}")
-        
-        if response.status_code == 200:
-            data = response.json()
-            markets_with_results = len(data.get('markets', {}))
-            logger.info(f"✅ Received results for {markets_with_results}/{len(market_ids)} markets from API")
-            return data.get('markets', {})
-        
-        logger.error(f"❌ Error fetching results: HTTP {response.status_code}")
-        logger.error(f"   Response: {response.text[:200]}")
-        return {}
-        
-    except Exception as e:
-        logger.error(f"❌ Error contacting backend: {e}")
-        import traceback
-        logger.error(traceback.format_exc())
-        return {}
-
-
-def get_results_from_db(market_id: str) -> list:
-    """
-    Fallback: Get results from GreyhoundMarketBook database
-    """
-    try:
-        conn = get_db_connection('betfairmarket')
-        cursor = conn.cursor()
-        
-        # Get distinct selection IDs and their status (BSP column doesn't exist in this table)
-        cursor.execute("""
-            SELECT DISTINCT selectionid, runnername, status
-            FROM greyhoundmarketbook
-            WHERE marketid = %s
-            AND status IS NOT NULL
-        """, (market_id,))
-        
-        rows = cursor.fetchall()
-        
-        if not rows:
-            conn.close()
-            return None
-        
-        # Build results
-        results = []
-        for sel_id, runner_name, status in rows:
-            # Clean trap number from name
-            import re
-            clean_name = re.sub(r'^\d+\.\s*', '', runner_name) if runner_name else f'Dog {sel_id}'
-            
-            results.append({
-                'selectionId': sel_id,
-                'runnerName': clean_name,
-                'status': status,
-                'bsp': None  # BSP not stored in greyhoundmarketbook
-            })
-        
-        conn.close()
-        logger.info(f"   ✅ Found {market_id} in database")
-        return results if results else None
-        
-    except Exception as e:
-        logger.warning(f"   ⚠️  Error getting results from DB for {market_id}: {e}")
-        return None
-
-
-def update_bet_result(bet_id: int, result: str, finishing_position: int, pnl: float, bsp: float = None):
-    """Update a LAY bet with its result"""
-    conn = get_db_connection(LIVE_TRADES_DB)
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        UPDATE live_trades
-        SET result = %s, finishing_position = %s, profit_loss = %s, bsp = %s
-        WHERE id = %s
-    """, (result, finishing_position, pnl, bsp, bet_id))
-    
-    conn.commit()
-    conn.close()
-
-
 def check_results():
     """Check and settle all pending bets (all dates)"""
     logger.info("="*80)
@@ -148,131 +57,42 @@ def check_results():
     
     logger.info("")
     
-    # Group bets by market_id
-    markets_to_check = {}
-    for bet in unsettled_bets:
-        bet_id, market_id, betfair_bet_id, dog_name, odds, stake, liability, position, selection_id, venue, race_number, date, total_matched = bet
-        
-        if market_id not in markets_to_check:
-            markets_to_check[market_id] = []
-        
-        markets_to_check[market_id].append({
-            'id': bet_id,
-            'bet_id': betfair_bet_id,
-            'dog_name': dog_name,
-            'odds': odds,
-            'stake': stake,
-            'liability': liability,
-            'position': position,
-            'selection_id': selection_id,
-            'venue': venue,
-            'race_number': race_number,
-            'date': date,
-            'total_matched': total_matched or stake  # Use total_matched if available, otherwise stake
-        })
-    
-    logger.info(f"🔍 Checking {len(markets_to_check)} markets...")
+    bets = pd.DataFrame(unsettled_bets, columns=[
+        'id', 'market_id', 'bet_id', 'dog_name', 'odds', 'stake', 'liability',
+        'position', 'selection_id', 'venue', 'race_number', 'date', 'total_matched'
+    ])
+    
+    # Settle on the ACTUAL matched amount (not the requested stake):
+    # - Dog WINS = We LOSE (pay liability on MATCHED amount)
+    # - Dog LOSES = We WIN (keep MATCHED stake)
+    bets['requested_stake'] = bets['stake'].astype(float)
+    bets['stake'] = bets['total_matched'].fillna(bets['stake']).astype(float)
+    bets.loc[bets['stake'] == 0, 'stake'] = bets['requested_stake']
+    bets['liability'] = bets['stake'] * (bets['odds'].astype(float) - 1)  # odds = initial_odds_requested
+    
+    market_ids = bets['market_id'].unique().tolist()
+    logger.info(f"🔍 Checking {len(market_ids)} markets...")
     logger.info("")
     
-    # Fetch all results from API
-    results = fetch_race_results(list(markets_to_check.keys()))
-    
-    # For markets not found in API, try database fallback
-    missing_markets = [mid for mid in markets_to_check.keys() if mid not in results]
-    if missing_markets:
-        logger.info(f"🔍 Checking {len(missing_markets)} markets in database fallback...")
-        for market_id in missing_markets:
-            db_results = get_results_from_db(market_id)
-            if db_results:
-                results[market_id] = db_results
-                logger.info(f"   ✅ Found {market_id} in database")
-    
-    logger.info(f"✅ Total markets with results: {len(results)}/{len(markets_to_check)}")
+    # Backend API (all markets in one call), then one DB query for the rest
+    results = get_market_results(market_ids, sport='greyhound')
     logger.info("")
     
-    settled_count = 0
+    settled, pending_markets = settle_bets(bets, results)
+    for market_id in pending_markets:
+        logger.debug(f"⏳ {market_id} - no results yet / NOT SETTLED YET (all ACTIVE) - skipping...")
     
-    # Process each market
-    for market_id, bets in markets_to_check.items():
-        market_results = results.get(market_id)
-        
-        if not market_results:
-            logger.debug(f"No results yet for market {market_id}")
-            continue
-        
-        # Create lookup by selection_id
-        results_lookup = {r['selectionId']: r for r in market_results}
-        
-        # Find winner and placed dogs
-        winners = [r for r in market_results if r.get('status') == 'WINNER']
-        placed = [r for r in market_results if r.get('status') == 'PLACED']
-        
-        # CRITICAL: Check if race is settled (has WINNER/LOSER, not just ACTIVE)
-        settled_dogs = [r for r in market_results if r.get('status') and r.get('status') != 'ACTIVE']
-        
-        if not settled_dogs:
-            logger.debug(f"⏳ {bets[0]['venue']} R{bets[0]['race_number']} - NOT SETTLED YET (all ACTIVE) - skipping...")
-            continue
-        
-        # Process each bet in this market
-        for bet in bets:
-            selection_id = bet['selection_id']
-            dog_name = bet['dog_name']
-            position = bet['position']
-            
-            # Get result for this dog
-            dog_result = results_lookup.get(selection_id)
-            if not dog_result:
-                logger.warning(f"   ⚠️  {dog_name} (Pos {position}): No result found")
-                continue
-            
-            # Determine finishing position
-            status = dog_result.get('status', 'UNKNOWN')
-            
-            # DEBUG: Log what Betfair returned
-            logger.debug(f"   🔍 {dog_name}: status={status}, bsp={dog_result.get('bsp')}")
-            
-            if status == 'WINNER':
-                finishing_position = 1
-            elif status == 'PLACED':
-                placed_ids = [r['selectionId'] for r in placed]
-                placed_index = placed_ids.index(selection_id) if selection_id in placed_ids else 0
-                finishing_position = 2 + placed_index
-            else:
-                finishing_position = 0
-            
-            # Get ACTUAL BSP
-            bsp_value = None
-            if dog_result.get('bsp') is not None:
-                bsp_value = dog_result.get('bsp')
-            
-            # Get the ACTUAL matched amount (not the requested stake)
-            matched_amount = bet['total_matched']  # Now we're fetching it properly
-            matched_liability = matched_amount * (bet['odds'] - 1)  # Use bet['odds'] which is initial_odds_requested
-            
-            # For LAY bets:
-            # - Dog WINS = We LOSE (pay liability on MATCHED amount)
-            # - Dog LOSES = We WIN (keep MATCHED stake)
-            if status == 'WINNER':
-                result = 'lost'
-                profit_loss = -matched_liability  # Loss based on matched amount
-            else:
-                result = 'won'
-                profit_loss = matched_amount  # Profit based on matched amount
-            
-            # Update database
-            update_bet_result(bet['id'], result, finishing_position, profit_loss, bsp_value)
-            
-            # Log result
-            emoji = "❌" if result == 'lost' else "✅"
-            logger.info(f"{emoji} {bet['venue']} R{bet['race_number']}: {dog_name} (Pos {position})")
-            logger.info(f"   Status: {status}, Finishing: {finishing_position}")
-            logger.info(f"   Matched: ${matched_amount:.2f}/${bet['stake']:.2f}, P&L: ${profit_loss:+.2f}")
-            
-            settled_count += 1
+    # All settlements in one UPDATE ... FROM (VALUES ...)
+    write_settlements('live_trades', settled, db_path=LIVE_TRADES_DB)
+    
+    for bet in settled.itertuples():
+        emoji = "❌" if bet.result == 'lost' else "✅"
+        logger.info(f"{emoji} {bet.venue} R{bet.race_number}: {bet.dog_name} (Pos {bet.position})")
+        logger.info(f"   Status: {bet.status}, Finishing: {bet.finishing_position}")
+        logger.info(f"   Matched: ${bet.stake:.2f}/${bet.requested_stake:.2f}, P&L: ${bet.profit_loss:+.2f}")
     
     logger.info("")
-    logger.info(f"✅ Settled {settled_count} bets")
+    logger.info(f"✅ Settled {len(settled)} bets")
     logger.info("")
 
 
@@ -0,0 +1,296 @@
+"""
+Load Test - Live Lay Strategy vs. the Fake Exchange
+Runs RealGreyhoundLayBetting's betting loop and race tasks against
+utilities/fake_exchange.py (started as a subprocess) with many races in the
+betting window at once, then reports:
+
+- Throughput: bets placed per second, backend requests per route, stream mcm/ocm traffic
+- Decision latency: window-to-bet, favorite search, placement etc. as p50/p95/p99
+  (the live script's own LatencyMetrics stages), plus event-loop lag
+- Missed races: races in the scenario that never got a first bet
+
+Only the Postgres-backed pieces are swapped out - the schedule and market IDs,
+runner names, duplicate-bet and daily-limit checks come from the scenario /
+memory, and trades are kept in a list (nothing is written to live_trades).
+Bet placement, order tracking, odds batching and the stream client are the
+live code paths. No real bets are placed: the backend URL is always the fake.
+
+Usage:
+    python benchmark_lay_betting.py --races 40 --spread 10
+    python benchmark_lay_betting.py --races 40 --stream --mcm-rate 20 --backend-latency-ms 80 --json results.json
+"""
+
+import sys
+sys.path.insert(0, '/Users/clairegrady/RiderProjects/betfair/utilities')
+sys.path.insert(0, '/Users/clairegrady/RiderProjects/betfair/greyhound-simulated/lay_betting')
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, List
+
+import pytz
+
+# The live module only sets up its REAL log file when run as a script, so importing it is safe
+logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+import lay_position_1_REAL as live
+from async_stream_client import AsyncBetfairStreamClient
+from latency_metrics import LatencyMetrics
+from fake_exchange import build_scenario, BACKEND_PORT, STREAM_PORT, CERT_DIR, MCM_RATE, JUMP_DELAY, FILL_PROBABILITY
+
+logger = logging.getLogger('benchmark')
+
+FAKE_EXCHANGE_SCRIPT = '/Users/clairegrady/RiderProjects/betfair/utilities/fake_exchange.py'
+LOOP_LAG_INTERVAL = 0.05    # Seconds between event-loop lag samples
+FINISH_AFTER_START = 15.0   # Race tasks are done ~10s after the scheduled start (Stage 3)
+
+REPORT_STAGES = ('window_to_bet', 'find_favorite', 'get_favorite', 'market_status', 'place_limit_bet',
+                 'place_bsp_bet', 'cancel_bet', 'bet_status', 'save_trade', 'odds_age', 'loop_lag')
+
+
+class ScenarioRunnerMetadata:
+    """Runner names/boxes from the scenario (the RunnerMetadataCache surface the race tasks use)"""
+
+    def __init__(self, scenario: List[Dict]):
+        self._markets = {
+            m['market_id']: ({r['selection_id']: r['name'] for r in m['runners']},
+                             {r['selection_id']: r['box'] for r in m['runners']})
+            for m in scenario
+        }
+
+    def get(self, market_id: str):
+        return self._markets.get(market_id, ({}, {}))
+
+    def total_matched(self, market_id: str):
+        return None
+
+
+class BenchmarkLayBetting(live.RealGreyhoundLayBetting):
+    """The live strategy with its DB-backed schedule, checks and trade storage replaced by the scenario"""
+
+    def __init__(self, scenario: List[Dict], backend_url: str, metrics: LatencyMetrics):
+        super().__init__(backend_url, metrics)
+        self.runner_metadata = ScenarioRunnerMetadata(scenario)
+        self.scenario = scenario
+        self.first_bets: Dict[str, float] = {}   # market_id -> seconds before the scheduled start
+        self.started_at = time.time()
+
+    def open_trade_storage(self):
+        # Trades are kept in memory - the journal and risk totals both need Postgres
+        self.trades: List[Dict] = []
+
+    def get_upcoming_races(self) -> List[Dict]:
+        """Scenario races in the live betting window (5-60 seconds before the start)"""
+        now = time.time()
+        tz = pytz.timezone('Australia/Sydney')
+        return [
+            {
+                'venue': m['venue'],
+                'country': m['country'],
+                'race_number': m['race_number'],
+                'market_id': m['market_id'],
+                'seconds_until': m['start_time'] - now,
+                'race_datetime': datetime.fromtimestamp(m['start_time'], tz),
+            }
+            for m in self.scenario
+            if 5 <= m['start_time'] - now <= 60
+        ]
+
+    def has_already_bet_on_race(self, market_id: str) -> bool:
+        return market_id in self.first_bets
+
+    def check_daily_limits(self) -> tuple:
+        return True, ""
+
+    def save_live_trade(self, race_info: Dict, dog_info: Dict, bet_result, limit_on_close: float):
+        self.trades.append({'market_id': race_info['market_id'], 'selection_id': dog_info['selection_id'],
+                            'odds': dog_info['odds'], 'bet': bet_result, 'saved_at': time.time()})
+        race_start = race_info['race_datetime'].timestamp()
+        self.first_bets.setdefault(race_info['market_id'], race_start - time.time())
+
+
+async def monitor_loop_lag(metrics: LatencyMetrics):
+    """How late the event loop wakes a sleeping task - the cost of everything else running on it"""
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        metrics.observe('loop_lag', (time.perf_counter() - start - LOOP_LAG_INTERVAL) * 1000)
+
+
+async def start_fake_exchange(args, scenario_path: str) -> asyncio.subprocess.Process:
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, FAKE_EXCHANGE_SCRIPT,
+        '--scenario', scenario_path,
+        '--backend-port', str(args.backend_port),
+        '--stream-port', str(args.stream_port),
+        '--mcm-rate', str(args.mcm_rate),
+        '--jump-delay', str(args.jump_delay),
+        '--fill-probability', str(args.fill_probability),
+        '--backend-latency-ms', str(args.backend_latency_ms),
+        '--cert-dir', args.cert_dir,
+        stdout=asyncio.subprocess.PIPE,
+    )
+    # Wait for the servers to be listening
+    while True:
+        line = await asyncio.wait_for(process.stdout.readline(), 30)
+        if not line:
+            raise RuntimeError(f"fake_exchange.py exited with {await process.wait()}")
+        if line.startswith(b'FAKE_EXCHANGE_READY'):
+            return process
+
+
+async def run_benchmark(args) -> Dict:
+    scenario = build_scenario(args.races, args.first_race, args.spread, seed=args.seed,
+                              max_odds=min(live.MAX_ODDS * 0.9, 4.0))
+    scenario_file = tempfile.NamedTemporaryFile('w', suffix='.json', delete=False)
+    json.dump(scenario, scenario_file)
+    scenario_file.close()
+
+    fake = await start_fake_exchange(args, scenario_file.name)
+    metrics = LatencyMetrics('benchmark', jsonl_path=args.jsonl)
+    bot = BenchmarkLayBetting(scenario, f"http://127.0.0.1:{args.backend_port}", metrics)
+    started = bot.started_at = time.time()
+    tasks = []
+    try:
+        if args.stream:
+            stream = AsyncBetfairStreamClient('fake-app-key', 'fake-session', host='127.0.0.1',
+                                              port=args.stream_port, cafile=os.path.join(args.cert_dir, 'cert.pem'))
+            if not await stream.start():
+                raise RuntimeError("could not connect to the fake stream server")
+            bot.stream = stream
+            stream.order_handlers.append(bot.orders.apply_ocm)
+            bot.orders.streaming = stream.subscribe_to_orders()
+
+        tasks = [
+            asyncio.create_task(bot.orders.run_polling(bot.backend)),
+            asyncio.create_task(monitor_loop_lag(metrics)),
+            asyncio.create_task(bot.betting_loop()),
+        ]
+
+        finish_at = max(m['start_time'] for m in scenario) + FINISH_AFTER_START
+        print(f"🏁 {len(scenario)} races, first start in {args.first_race:.0f}s, "
+              f"running ~{finish_at - time.time():.0f}s ({'stream' if args.stream else 'backend polling'})")
+        while time.time() < finish_at or any(not t.done() for t in bot.active_tasks.values()):
+            await asyncio.sleep(1)
+            if time.time() > finish_at + 60:
+                logger.warning("Race tasks still running 60s after the last race - stopping")
+                break
+
+        elapsed = time.time() - started
+        fake_stats = (await bot.backend.get('/api/fake/stats')).json()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, *bot.active_tasks.values(), return_exceptions=True)
+        if bot.stream:
+            await bot.stream.disconnect()
+        await bot.market_books.close()
+        await bot.backend.close()
+        fake.terminate()
+        await fake.wait()
+        os.unlink(scenario_file.name)
+        metrics.close()
+
+    return build_report(args, scenario, bot, fake_stats, elapsed)
+
+
+def build_report(args, scenario: List[Dict], bot: BenchmarkLayBetting, fake_stats: Dict, elapsed: float) -> Dict:
+    snapshot = bot.metrics.snapshot()
+    # From the first race entering the betting window to the last bet
+    window_opened = max(min(m['start_time'] for m in scenario) - 60, bot.started_at)
+    active_seconds = max(t['saved_at'] for t in bot.trades) - window_opened if bot.trades else 0.0
+    requests = sum(r['count'] for r in fake_stats['requests'].values())
+    missed = [m for m in scenario if m['market_id'] not in bot.first_bets]
+
+    return {
+        'config': {
+            'races': args.races, 'spread_seconds': args.spread, 'stream': args.stream,
+            'mcm_rate': args.mcm_rate, 'backend_latency_ms': args.backend_latency_ms,
+            'fill_probability': args.fill_probability,
+        },
+        'elapsed_seconds': round(elapsed, 1),
+        'throughput': {
+            'bets_placed': len(bot.trades),
+            'bets_per_second': round(len(bot.trades) / active_seconds, 2) if active_seconds else None,
+            'backend_requests': requests,
+            'backend_requests_per_second': round(requests / fake_stats['elapsed_seconds'], 2)
+            if fake_stats['elapsed_seconds'] else None,
+            'mcm_sent': fake_stats['exchange']['mcm_sent'],
+            'ocm_sent': fake_stats['exchange']['ocm_sent'],
+            'stream_mcm_received': bot.stream.metrics['mcm'] if bot.stream else 0,
+        },
+        'latency_ms': {stage: snapshot['stages'][stage] for stage in REPORT_STAGES if stage in snapshot['stages']},
+        'counters': snapshot['counters'],
+        'first_bet_seconds_before_start': sorted(round(s, 1) for s in bot.first_bets.values()),
+        'missed_races': len(missed),
+        'missed': [f"{m['venue']} R{m['race_number']} ({m['market_id']})" for m in missed],
+        'backend_requests': fake_stats['requests'],
+        'exchange': fake_stats['exchange'],
+        'odds_batching': bot.market_books.stats(),
+        'orders': bot.orders.stats(),
+    }
+
+
+def print_report(report: Dict):
+    throughput = report['throughput']
+    print("")
+    print("=" * 80)
+    print(f"LOAD TEST: {report['config']['races']} races over {report['config']['spread_seconds']:g}s "
+          f"({'stream' if report['config']['stream'] else 'backend polling'}, "
+          f"backend +{report['config']['backend_latency_ms']:g}ms)")
+    print("=" * 80)
+    print(f"Bets placed:        {throughput['bets_placed']} ({throughput['bets_per_second']} /s while betting)")
+    print(f"Backend requests:   {throughput['backend_requests']} ({throughput['backend_requests_per_second']} /s)")
+    print(f"Stream traffic:     {throughput['mcm_sent']} mcm / {throughput['ocm_sent']} ocm sent, "
+          f"{throughput['stream_mcm_received']} mcm received")
+    print(f"Missed races:       {report['missed_races']}/{report['config']['races']}")
+    for race in report['missed']:
+        print(f"   - {race}")
+    print("")
+    print(f"{'stage':<18}{'n':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for stage, s in report['latency_ms'].items():
+        print(f"{stage:<18}{s['count']:>7}{s['p50_ms']:>10.1f}{s['p95_ms']:>10.1f}{s['p99_ms']:>10.1f}{s['max_ms']:>10.1f}")
+    print("")
+    print("Backend requests by route:")
+    for route, r in report['backend_requests'].items():
+        print(f"   {route:<48} {r['count']:>6}  mean {r['mean_ms']:.1f}ms")
+    print(f"Odds batching: {report['odds_batching']}")
+    print("=" * 80)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the live lay strategy against the fake exchange")
+    parser.add_argument('--races', type=int, default=40)
+    parser.add_argument('--first-race', type=float, default=70.0,
+                        help="Seconds until the first start (>= 28s into the window gets Stage 1)")
+    parser.add_argument('--spread', type=float, default=10.0, help="Seconds between the first and last starts")
+    parser.add_argument('--stream', action='store_true', help="Prices and orders from the fake stream server")
+    parser.add_argument('--mcm-rate', type=float, default=MCM_RATE, help="Price rounds per second")
+    parser.add_argument('--jump-delay', type=float, default=JUMP_DELAY)
+    parser.add_argument('--fill-probability', type=float, default=FILL_PROBABILITY)
+    parser.add_argument('--backend-latency-ms', type=float, default=0.0)
+    parser.add_argument('--backend-port', type=int, default=BACKEND_PORT)
+    parser.add_argument('--stream-port', type=int, default=STREAM_PORT)
+    parser.add_argument('--cert-dir', default=CERT_DIR)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--jsonl', help="Also write every latency observation to this JSONL file")
+    parser.add_argument('--json', help="Write the report as JSON")
+    parser.add_argument('--log-level', default='WARNING', help="Live script log level (INFO = production verbosity)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(args.log_level)
+    report = asyncio.run(run_benchmark(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
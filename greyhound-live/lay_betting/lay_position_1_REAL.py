@@ -17,14 +17,21 @@ LATE ENTRY (5-29s before race):
 
 CONCURRENT MODE:
 - Can process multiple races simultaneously
-- Each race gets its own async task
+- Each race gets its own async task (native asyncio - no thread pool)
+- Backend calls are non-blocking (shared aiohttp session)
+- With BETFAIR_SESSION_TOKEN set, prices come from the Stream API and tasks
+  await price updates instead of polling every second
 - No more missed races!
 
+LATENCY: each stage (status check, favorite lookups, placement, status checks)
+is timed into p50/p95/p99 histograms, along with window-to-bet time and the
+age of the odds each bet was priced from - written to a rotating JSONL file
+and, with LATENCY_METRICS_PORT set, served as Prometheus metrics
+
 BETTING WINDOW: 5-60 seconds before race start
 """
 
 import pandas as pd
-import requests
 import time
 import pytz
 from datetime import datetime, timedelta
@@ -34,42 +41,32 @@ import sys
 import os
 import json
 import asyncio
-from concurrent.futures import ThreadPoolExecutor
 
 # Add utilities to path
 sys.path.insert(0, '/Users/clairegrady/RiderProjects/betfair/utilities')
+sys.path.insert(0, '/Users/clairegrady/RiderProjects/betfair/greyhound-simulated/lay_betting')
 from db_connection_helper import get_db_connection
+from backend_client import AsyncBackendClient
+from order_tracker import OrderTracker
+from odds_batcher import MarketBookBatcher
+from async_stream_client import AsyncBetfairStreamClient
+from race_schedule import RaceScheduleCache
+from market_resolver import MarketResolver
+from runner_metadata import RunnerMetadataCache
+from trade_journal import TradeJournal
+from risk_state import RiskState
+from latency_metrics import LatencyMetrics
+from tick_ladder import round_price, add_ticks
 
 def round_to_valid_betfair_odds(odds: float) -> float:
-    """Round odds to valid Betfair tick size"""
-    if odds < 2:
-        result = round(odds / 0.01) * 0.01
-    elif odds < 3:
-        result = round(odds / 0.02) * 0.02
-    elif odds < 4:
-        result = round(odds / 0.05) * 0.05
-    elif odds < 6:
-        result = round(odds / 0.1) * 0.1
-    elif odds < 10:
-        result = round(odds / 0.2) * 0.2
-    elif odds < 20:
-        result = round(odds / 0.5) * 0.5
-    elif odds < 30:
-        result = round(odds / 1) * 1
-    elif odds < 50:
-        result = round(odds / 2) * 2
-    elif odds < 100:
-        result = round(odds / 5) * 5
-    else:
-        result = round(odds / 10) * 10
-    
-    # Clean up floating point errors by rounding to 2 decimal places
-    return round(result, 2)
+    """Round odds to the nearest valid Betfair price (precomputed tick ladder)"""
+    return round_price(odds)
 
 def add_ticks_to_odds(odds: float, num_ticks: int) -> float:
     """
     Add a specific number of Betfair ticks to the odds.
     For lay betting, adding ticks means HIGHER odds (worse for us, better for matching).
+    Walks the tick ladder, so moves that cross a band boundary (e.g. 3.95 → 4.1) stay valid.
     
     Args:
         odds: Current odds
@@ -78,33 +75,7 @@ def add_ticks_to_odds(odds: float, num_ticks: int) -> float:
     Returns:
         New odds with ticks added
     """
-    # Determine tick size based on odds range
-    if odds < 2:
-        tick_size = 0.01
-    elif odds < 3:
-        tick_size = 0.02
-    elif odds < 4:
-        tick_size = 0.05
-    elif odds < 6:
-        tick_size = 0.1
-    elif odds < 10:
-        tick_size = 0.2
-    elif odds < 20:
-        tick_size = 0.5
-    elif odds < 30:
-        tick_size = 1
-    elif odds < 50:
-        tick_size = 2
-    elif odds < 100:
-        tick_size = 5
-    else:
-        tick_size = 10
-    
-    # Add the ticks
-    new_odds = odds + (tick_size * num_ticks)
-    
-    # Ensure it's a valid tick (should already be, but just in case)
-    return round_to_valid_betfair_odds(new_odds)
+    return add_ticks(odds, num_ticks)
 
 # Load risk limits
 RISK_LIMITS_PATH = "/Users/clairegrady/RiderProjects/betfair/greyhound-live/RISK_LIMITS.json"
@@ -118,86 +89,76 @@ MIN_ODDS = RISK_LIMITS['minOdds']
 FLAT_STAKE = RISK_LIMITS['stakePerBet']
 
 # Database paths
-BACKEND_URL = "http://localhost:5173"  # Backend runs on port 5173
+BACKEND_URL = os.environ.get('BETFAIR_BACKEND_URL', "http://localhost:5173")  # Backend runs on port 5173
+
+# Stream API (optional) - without a session token prices come from the backend API
+APP_KEY = os.environ.get('BETFAIR_APP_KEY', "tjBWsmDXH5zwhfjj")
+SESSION_TOKEN = os.environ.get('BETFAIR_SESSION_TOKEN')
+PRICE_WAIT_SECONDS = 1.0  # Max wait for a price update before re-checking
+
+# Latency instrumentation - every stage timing goes to a rotating JSONL file;
+# set LATENCY_METRICS_PORT to also serve Prometheus metrics on localhost
+LATENCY_JSONL_PATH = f'/Users/clairegrady/RiderProjects/betfair/greyhound-live/logs/latency_lay_position_{POSITION_TO_LAY}_REAL.jsonl'
+LATENCY_METRICS_PORT = int(os.environ.get('LATENCY_METRICS_PORT', 0))
+LATENCY_SUMMARY_SECONDS = 600  # How often the p50/p95/p99 summary is logged
 
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,  # Changed back to INFO - DEBUG is too verbose
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(f'/Users/clairegrady/RiderProjects/betfair/greyhound-live/logs/lay_position_{POSITION_TO_LAY}_REAL.log'),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
 
+def configure_logging():
+    """File + console logging for a real trading run (not at import - importers keep their own)"""
+    logging.basicConfig(
+        level=logging.INFO,  # Changed back to INFO - DEBUG is too verbose
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(f'/Users/clairegrady/RiderProjects/betfair/greyhound-live/logs/lay_position_{POSITION_TO_LAY}_REAL.log'),
+            logging.StreamHandler()
+        ]
+    )
+
+
 class RealGreyhoundLayBetting:
     """Real money lay betting on greyhound favorites"""
     
-    def __init__(self):
+    def __init__(self, backend_url: str = BACKEND_URL, metrics: Optional[LatencyMetrics] = None):
         self.processed_markets = set()
-        self.session = requests.Session()
-        self.session.timeout = 10
+        self.backend = AsyncBackendClient(backend_url)  # Non-blocking, shared by all race tasks
+        self.stream = None  # AsyncBetfairStreamClient when SESSION_TOKEN is set
+        self.orders = OrderTracker()  # betId → matched/remaining/status, shared by all race tasks
+        self.market_books = MarketBookBatcher(self.backend, sport='greyhound')  # One backend call for concurrent races
         self.next_race_info = None  # Store (venue, race_num, race_datetime) for logging
         self.active_tasks = {}  # Track concurrent betting tasks by market_id
         self.task_lock = asyncio.Lock()  # Protect active_tasks dict
         self.logged_initial_races = False
         self.next_race_info = None
         self.no_runners_logged = set()  # Track markets we've already logged "no runners" for
+        self.schedule = RaceScheduleCache('greyhound_race_times')  # In-memory, sorted race start times
+        self.market_resolver = MarketResolver(sports=('greyhound',))  # (venue, date, race) → marketId
+        self.runner_metadata = RunnerMetadataCache('greyhound')  # Names/boxes for the day's markets
+        self.open_trade_storage()
+        # Per-stage latency
+        self.metrics = metrics or LatencyMetrics(f'live_lay_position_{POSITION_TO_LAY}', jsonl_path=LATENCY_JSONL_PATH)
+    
+    def open_trade_storage(self):
+        """Trade journal + risk totals (both backed by live_trades)"""
+        self.trades = TradeJournal(f'live_lay_position_{POSITION_TO_LAY}')  # fsync'd, written to live_trades in the background
+        self.risk = RiskState(journal=self.trades)  # Bets today / P&L totals for the RISK_LIMITS checks
     
     def check_daily_limits(self) -> tuple[bool, str]:
         """Check if we've hit daily risk limits. Returns (can_bet, reason)"""
         try:
-            conn = get_db_connection('betfair_trades')
-            cursor = conn.cursor()
-            
-            today = datetime.now().strftime('%Y-%m-%d')
-            
-            # Check daily bets and NET P&L (not just losses)
-            cursor.execute("""
-                SELECT 
-                    COUNT(*) as bets_today,
-                    COALESCE(SUM(profit_loss), 0) as net_pnl_today
-                FROM live_trades
-                WHERE date = %s AND status != 'FAILED'
-            """, (today,))
-            
-            bets_today, net_pnl_today = cursor.fetchone()
-            
-            # Check daily bet limit
-            if bets_today >= RISK_LIMITS['maxDailyBets']:
-                conn.close()
-                return False, f"Daily bet limit reached: {bets_today}/{RISK_LIMITS['maxDailyBets']}"
-            
-            # Check daily LOSS limit (only stop if NET P&L is negative and exceeds limit)
-            if net_pnl_today < 0 and abs(net_pnl_today) >= RISK_LIMITS['maxDailyLoss']:
-                conn.close()
-                return False, f"Daily loss limit reached: ${net_pnl_today:.2f} (limit: -${RISK_LIMITS['maxDailyLoss']:.2f})"
-            
-            # Check emergency stop loss (total P&L)
-            if 'emergencyStopLoss' in RISK_LIMITS:
-                cursor.execute("""
-                    SELECT COALESCE(SUM(profit_loss), 0) FROM live_trades WHERE result IN ('won', 'lost')
-                """)
-                total_pl = cursor.fetchone()[0]
-                
-                if total_pl <= -RISK_LIMITS['emergencyStopLoss']:
-                    conn.close()
-                    return False, f"EMERGENCY STOP: Total loss ${abs(total_pl):.2f} >= ${RISK_LIMITS['emergencyStopLoss']:.2f}"
-            
-            conn.close()
-            return True, ""
+            # In-memory running totals - refreshed/reconciled against live_trades on a timer
+            return self.risk.check(RISK_LIMITS)
             
         except Exception as e:
             logger.error(f"Error checking daily limits: {e}")
             return True, ""  # Default to allowing bet if check fails
     
-    def get_account_balance(self) -> Optional[float]:
+    async def get_account_balance(self) -> Optional[float]:
         """Get current Betfair account balance"""
         try:
-            url = f"{BACKEND_URL}/api/account/funds"
-            response = self.session.get(url, timeout=10)
+            url = "/api/account/funds"
+            response = await self.backend.get(url, timeout=10)
             
             if response.status_code == 200:
                 data = response.json()
@@ -213,63 +174,32 @@ class RealGreyhoundLayBetting:
             logger.error(f"Error getting account balance: {e}")
             return None
     
-    def get_bet_status(self, bet_id: str, market_id: str) -> Optional[Dict]:
+    async def get_bet_status(self, bet_id: str, market_id: str) -> Optional[Dict]:
         """
-        Get the current status of a bet using listCurrentOrders.
-        Returns dict with: sizePlaced, sizeMatched, sizeRemaining, status
+        Get the current status of a bet from the shared order tracker (O(1)).
+        The tracker is fed by the order stream or one batched listCurrentOrders poll per cycle;
+        a bet it hasn't seen yet triggers a single immediate poll.
+        Returns dict with: sizePlaced, sizeMatched, sizeRemaining, sizeCancelled, sizeLapsed, status, filled
         """
         try:
-            # Correct endpoint: GET /api/ManageOrders/current
-            url = f"{BACKEND_URL}/api/ManageOrders/current"
+            order = self.orders.get(bet_id)
+            if order is None and await self.orders.poll(self.backend):
+                order = self.orders.get(bet_id)
             
-            response = self.session.get(url, timeout=10)
-            
-            if response.status_code != 200:
-                logger.error(f"❌ listCurrentOrders HTTP {response.status_code}: {response.text}")
+            if order is None:
+                logger.warning(f"⚠️  Bet {bet_id} not found in current orders")
                 return None
             
-            data = response.json()
-            
-            # Backend returns raw Betfair response structure
-            result = data.get('result', data)
-            orders = result.get('currentOrders', [])
-            
-            if not orders:
-                logger.warning(f"⚠️  No current orders found (all may be matched/settled)")
-                return None
-            
-            # Find our specific bet by betId
-            order = None
-            for o in orders:
-                if o.get('betId') == bet_id:
-                    order = o
-                    break
-            
-            if not order:
-                logger.warning(f"⚠️  Bet {bet_id} not in current orders (likely fully matched or settled)")
-                # If bet is not in current orders, it's either fully matched or settled
-                # Return a "fully matched" status as best guess
-                return {
-                    'betId': bet_id,
-                    'sizePlaced': 1.0,  # Our standard stake
-                    'sizeMatched': 1.0,  # Assume fully matched
-                    'sizeRemaining': 0.0,
-                    'status': 'EXECUTION_COMPLETE',
-                    'averagePriceMatched': 0.0
-                }
-            
-            # Calculate sizePlaced from sizeRemaining + sizeMatched
-            size_remaining = order.get('sizeRemaining', 0)
-            size_matched = order.get('sizeMatched', 0)
-            size_placed = size_remaining + size_matched
-            
             return {
-                'betId': order.get('betId'),
-                'sizePlaced': size_placed,
-                'sizeMatched': size_matched,
-                'sizeRemaining': size_remaining,
-                'status': order.get('status'),
-                'averagePriceMatched': order.get('averagePriceMatched', 0)
+                'betId': order['betId'],
+                'sizePlaced': order['sizePlaced'],
+                'sizeMatched': order['sizeMatched'],
+                'sizeRemaining': order['sizeRemaining'],
+                'sizeCancelled': order.get('sizeCancelled', 0),
+                'sizeLapsed': order.get('sizeLapsed', 0),
+                'status': order['status'],
+                'filled': OrderTracker.is_filled(order),
+                'averagePriceMatched': order.get('averagePriceMatched') or 0
             }
             
         except Exception as e:
@@ -278,13 +208,13 @@ class RealGreyhoundLayBetting:
             logger.error(traceback.format_exc())
             return None
     
-    def cancel_bet(self, market_id: str, bet_id: str) -> bool:
+    async def cancel_bet(self, market_id: str, bet_id: str) -> bool:
         """Cancel an existing bet"""
         try:
             logger.info(f"🔍 CANCEL DEBUG → marketId={market_id}, betId={bet_id}")
             
             # Correct endpoint: /api/ManageOrders/cancel with marketId as query param
-            url = f"{BACKEND_URL}/api/ManageOrders/cancel?marketId={market_id}"
+            url = f"/api/ManageOrders/cancel?marketId={market_id}"
             
             # Body should be a list of CancelInstruction objects
             payload = [
@@ -293,7 +223,7 @@ class RealGreyhoundLayBetting:
                 }
             ]
             
-            response = self.session.post(url, json=payload, timeout=15)
+            response = await self.backend.post(url, json=payload, timeout=15)
             
             logger.info(f"🔍 CANCEL RESPONSE → HTTP {response.status_code}")
             
@@ -329,7 +259,7 @@ class RealGreyhoundLayBetting:
             logger.error(traceback.format_exc())
             return False
     
-    def place_limit_bet(self, market_id: str, selection_id: int, odds: float, stake: float, persistence: str = "LAPSE") -> Optional[Dict]:
+    async def place_limit_bet(self, market_id: str, selection_id: int, odds: float, stake: float, persistence: str = "LAPSE") -> Optional[Dict]:
         """
         Place a simple LIMIT order
         
@@ -340,7 +270,7 @@ class RealGreyhoundLayBetting:
             Dict with 'betId', 'status', 'sizeMatched', 'avgpriceMatched' if successful, None if failed
         """
         try:
-            url = f"{BACKEND_URL}/api/PlaceOrder"
+            url = "/api/PlaceOrder"
             
             # Log the exact market ID being sent
             logger.info(f"🔍 PLACE BET DEBUG → marketId='{market_id}' (type: {type(market_id).__name__}), selectionId={selection_id}, odds={odds}, stake={stake}, persistence={persistence}")
@@ -372,7 +302,7 @@ class RealGreyhoundLayBetting:
                 ]
             }
             
-            response = self.session.post(url, json=payload, timeout=15)
+            response = await self.backend.post(url, json=payload, timeout=15)
             
             if response.status_code == 200:
                 data = response.json()
@@ -402,6 +332,7 @@ class RealGreyhoundLayBetting:
                             bet_id = report.get('betId')
                             size_matched = report.get('sizeMatched', 0)
                             avg_price = report.get('averagePriceMatched', odds)
+                            self.orders.track(bet_id, market_id, stake, size_matched, avg_price)
                             
                             return {
                                 'betId': bet_id,
@@ -428,7 +359,7 @@ class RealGreyhoundLayBetting:
             logger.error(f"❌ Exception placing limit bet: {e}")
             return None
     
-    def cancel_and_place_bet(self, market_id: str, old_bet_id: str, selection_id: int, new_odds: float, stake: float) -> Optional[Dict]:
+    async def cancel_and_place_bet(self, market_id: str, old_bet_id: str, selection_id: int, new_odds: float, stake: float) -> Optional[Dict]:
         """
         CANCEL existing bet and PLACE new bet (safer than replaceOrders for greyhounds)
         
@@ -449,7 +380,7 @@ class RealGreyhoundLayBetting:
         """
         try:
             # STEP 1: Cancel the old bet using the correct endpoint
-            cancel_url = f"{BACKEND_URL}/api/ManageOrders/cancel?marketId={market_id}"
+            cancel_url = f"/api/ManageOrders/cancel?marketId={market_id}"
             
             # Body should be a list of CancelInstruction objects
             cancel_payload = [
@@ -459,7 +390,7 @@ class RealGreyhoundLayBetting:
             ]
             
             logger.info(f"🔍 CANCEL DEBUG → marketId={market_id}, betId={old_bet_id}")
-            cancel_response = self.session.post(cancel_url, json=cancel_payload, timeout=10)
+            cancel_response = await self.backend.post(cancel_url, json=cancel_payload, timeout=10)
             
             if cancel_response.status_code != 200:
                 logger.info(f"🎯 CANCEL FAILED → Bet {old_bet_id} is MATCHED ✅ (no replacement needed)")
@@ -480,7 +411,7 @@ class RealGreyhoundLayBetting:
             if snapped_odds != new_odds:
                 logger.info(f"📊 Snapped {new_odds:.2f} → {snapped_odds:.2f} (valid tick)")
             
-            place_result = self.place_limit_bet(market_id, selection_id, snapped_odds, stake)
+            place_result = await self.place_limit_bet(market_id, selection_id, snapped_odds, stake)
             
             if place_result:
                 logger.info(f"✅ Placed new bet {place_result['betId']} @ {snapped_odds:.2f}")
@@ -493,68 +424,46 @@ class RealGreyhoundLayBetting:
             logger.error(f"❌ Exception in cancel_and_place: {e}")
             return None
     
-    def check_bet_status(self, market_id: str, bet_id: str) -> Optional[Dict]:
+    async def check_bet_status(self, market_id: str, bet_id: str) -> Optional[Dict]:
         """
         Check if a bet is matched or unmatched
         
         Returns:
             Dict with 'status', 'sizeMatched', 'avgpriceMatched' if successful, None if failed
         """
-        try:
-            url = f"{BACKEND_URL}/api/ManageOrders/list"
+        bet = await self.get_bet_status(bet_id, market_id)
+        if not bet:
+            logger.warning(f"Bet status check returned empty result for {bet_id}")
+            return None
+        
+        size_matched = bet['sizeMatched']
+        avg_price = bet['averagePriceMatched']
+        
+        # CRITICAL: If sizeMatched > 0, bet is MATCHED (full or partial) regardless of 'status' field
+        # Betfair sometimes lags on updating 'status' but 'sizeMatched' is always accurate
+        # IMPORTANT: Partial matches should NOT be replaced (would cancel matched portion)
+        if size_matched > 0:
+            # Check if fully or partially matched
+            stake_requested = bet['sizePlaced']  # Total original stake
+            if size_matched >= stake_requested * 0.99:  # 99% threshold for rounding
+                logger.info(f"✅ Bet {bet_id}: FULLY matched {size_matched:.2f} @ {avg_price:.2f}")
+            else:
+                logger.warning(f"⚠️  Bet {bet_id}: PARTIALLY matched {size_matched:.2f}/{stake_requested:.2f} @ {avg_price:.2f} - stopping cascade")
             
-            payload = {
-                "marketId": market_id,
-                "betIds": [bet_id]
+            return {
+                'status': 'MATCHED',
+                'sizeMatched': size_matched,
+                'avgpriceMatched': avg_price
             }
-            
-            response = self.session.post(url, json=payload, timeout=10)
-            
-            if response.status_code == 200:
-                data = response.json()
-                result = data.get('result', data)
-                
-                if isinstance(result, list) and len(result) > 0:
-                    bet = result[0]
-                    size_matched = bet.get('sizeMatched', 0)
-                    avg_price = bet.get('averagepriceMatched', 0)
-                    bet_status = bet.get('status', 'UNKNOWN')
-                    
-                    # CRITICAL: If sizeMatched > 0, bet is MATCHED (full or partial) regardless of 'status' field
-                    # Betfair sometimes lags on updating 'status' but 'sizeMatched' is always accurate
-                    # IMPORTANT: Partial matches should NOT be replaced (would cancel matched portion)
-                    if size_matched > 0:
-                        # Check if fully or partially matched
-                        stake_requested = bet.get('sizeRemaining', 0) + size_matched  # Total original stake
-                        if size_matched >= stake_requested * 0.99:  # 99% threshold for rounding
-                            logger.info(f"✅ Bet {bet_id}: FULLY matched {size_matched:.2f} @ {avg_price:.2f}")
-                        else:
-                            logger.warning(f"⚠️  Bet {bet_id}: PARTIALLY matched {size_matched:.2f}/{stake_requested:.2f} @ {avg_price:.2f} - stopping cascade")
-                        
-                        return {
-                            'status': 'MATCHED',
-                            'sizeMatched': size_matched,
-                            'avgpriceMatched': avg_price
-                        }
-                    else:
-                        logger.info(f"⏳ Bet {bet_id}: Unmatched (status={bet_status})")
-                        return {
-                            'status': 'UNMATCHED',
-                            'sizeMatched': 0,
-                            'avgpriceMatched': None
-                        }
-                
-                logger.warning(f"Bet status check returned empty result for {bet_id}")
-                return None
-            else:
-                logger.warning(f"Bet status check HTTP {response.status_code} for {bet_id}: {response.text[:200]}")
-                return None
-                
-        except Exception as e:
-            logger.warning(f"Exception checking bet status for {bet_id}: {e}")
-            return None
+        
+        logger.info(f"⏳ Bet {bet_id}: Unmatched (status={bet['status']})")
+        return {
+            'status': 'UNMATCHED',
+            'sizeMatched': 0,
+            'avgpriceMatched': None
+        }
     
-    def place_bsp_bet(self, market_id: str, selection_id: int, max_bsp_price: float, stake: float) -> Optional[Dict]:
+    async def place_bsp_bet(self, market_id: str, selection_id: int, max_bsp_price: float, stake: float) -> Optional[Dict]:
         """
         Place a pure LIMIT_ON_CLOSE order (BSP only with max price limit)
         
@@ -565,7 +474,7 @@ class RealGreyhoundLayBetting:
             Dict with 'betId', 'status', etc. if successful, None if failed
         """
         try:
-            url = f"{BACKEND_URL}/api/PlaceOrder"
+            url = "/api/PlaceOrder"
             
             # Pure LIMIT_ON_CLOSE order - ONLY accepts BSP up to max_bsp_price
             # Use 'size' for fixed stake, not 'liability'
@@ -594,7 +503,7 @@ class RealGreyhoundLayBetting:
                 ]
             }
             
-            response = self.session.post(url, json=payload, timeout=15)
+            response = await self.backend.post(url, json=payload, timeout=15)
             
             if response.status_code == 200:
                 data = response.json()
@@ -643,7 +552,7 @@ class RealGreyhoundLayBetting:
             logger.error(f"❌ Exception placing BSP bet: {e}")
             return None
     
-    def place_market_on_close_bet(self, market_id: str, selection_id: int, stake: float) -> Optional[Dict]:
+    async def place_market_on_close_bet(self, market_id: str, selection_id: int, stake: float) -> Optional[Dict]:
         """
         Place a MARKET_ON_CLOSE order (accepts BSP at ANY price - no limit)
         Use this as last resort when Bet 1 & 2 have failed
@@ -652,7 +561,7 @@ class RealGreyhoundLayBetting:
             Dict with 'betId', 'status', etc. if successful, None if failed
         """
         try:
-            url = f"{BACKEND_URL}/api/PlaceOrder"
+            url = "/api/PlaceOrder"
             
             # MARKET_ON_CLOSE - accepts BSP up to MAX_ODDS
             max_liability = round(stake * (MAX_ODDS - 1), 2)  # Use MAX_ODDS from RISK_LIMITS
@@ -681,7 +590,7 @@ class RealGreyhoundLayBetting:
                 ]
             }
             
-            response = self.session.post(url, json=payload, timeout=15)
+            response = await self.backend.post(url, json=payload, timeout=15)
             
             if response.status_code == 200:
                 data = response.json()
@@ -713,62 +622,52 @@ class RealGreyhoundLayBetting:
             return None
     
     def save_live_trade(self, race_info: Dict, dog_info: Dict, bet_result: Optional[Dict], limit_on_close: float):
-        """Save real trade to database"""
+        """Save real trade (journaled locally and fsync'd; written to the DB in the background)"""
         try:
-            conn = get_db_connection('betfair_trades')
-            cursor = conn.cursor()
-            
             liability = FLAT_STAKE * (dog_info['odds'] - 1)
             
             now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             matched_str = now_str if (bet_result and bet_result.get('sizeMatched', 0) > 0) else None
             
-            cursor.execute("""
-                INSERT INTO live_trades (
-                    date, venue, country, race_number, market_id,
-                    dog_name, box_number, position_in_market, selection_id,
-                    initial_odds_requested, final_odds_matched, stake, liability,
-                    betfair_bet_id, status, total_matched, placement_time, matched_time
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                race_info['race_datetime'].strftime('%Y-%m-%d'),
-                race_info['venue'],
-                race_info['country'],
-                race_info['race_number'],
-                race_info['market_id'],
-                dog_info['dog_name'],
-                dog_info.get('box'),
-                POSITION_TO_LAY,
-                dog_info['selection_id'],
-                dog_info['odds'],  # initial_odds_requested
-                bet_result.get('avgpriceMatched') if bet_result else None,  # final_odds_matched
-                FLAT_STAKE,
-                liability,
-                bet_result['betId'] if bet_result else None,
-                bet_result['status'] if bet_result else 'FAILED',
-                dog_info.get('total_matched'),
-                now_str,  # placement_time
-                matched_str  # matched_time
-            ))
-            
-            conn.commit()
-            conn.close()
+            trade = {
+                'date': race_info['race_datetime'].strftime('%Y-%m-%d'),
+                'venue': race_info['venue'],
+                'country': race_info['country'],
+                'race_number': race_info['race_number'],
+                'market_id': race_info['market_id'],
+                'dog_name': dog_info['dog_name'],
+                'box_number': dog_info.get('box'),
+                'position_in_market': POSITION_TO_LAY,
+                'selection_id': dog_info['selection_id'],
+                'initial_odds_requested': dog_info['odds'],
+                'final_odds_matched': bet_result.get('avgpriceMatched') if bet_result else None,
+                'stake': FLAT_STAKE,
+                'liability': liability,
+                'betfair_bet_id': bet_result['betId'] if bet_result else None,
+                'status': bet_result['status'] if bet_result else 'FAILED',
+                'total_matched': dog_info.get('total_matched'),
+                'placement_time': now_str,
+                'matched_time': matched_str
+            }
+            self.trades.record('live_trades', trade)
             
-            logger.info(f"💾 Saved bet to DB: {race_info['venue']} R{race_info['race_number']} - {dog_info['dog_name']} @ {dog_info['odds']:.2f}")
+            logger.info(f"💾 Saved bet: {race_info['venue']} R{race_info['race_number']} - {dog_info['dog_name']} @ {dog_info['odds']:.2f}")
             
-        except Exception as db_error:
-            logger.error(f"❌ DATABASE ERROR saving live trade: {db_error}")
-            logger.error(f"   Race: {race_info.get('venue')} R{race_info.get('race_number')}")
-            logger.error(f"   Market ID: {race_info.get('market_id')}")
         except Exception as e:
             logger.error(f"❌ EXCEPTION saving live trade: {e}")
             logger.error(f"   Race: {race_info.get('venue')} R{race_info.get('race_number')}")
+            logger.error(f"   Market ID: {race_info.get('market_id')}")
             import traceback
             logger.error(traceback.format_exc())
     
     def has_already_bet_on_race(self, market_id: str) -> bool:
-        """Check if we've already placed a bet on this race (database check)"""
+        """Check if we've already placed a bet on this race (journal + database check)"""
         try:
+            # Trades still waiting for the background writer aren't in the DB yet
+            if any(t['market_id'] == market_id and t['status'] != 'FAILED'
+                   for t in self.trades.pending_rows('live_trades')):
+                return True
+            
             conn = get_db_connection('betfair_trades')
             cursor = conn.cursor()
             
@@ -787,74 +686,38 @@ class RealGreyhoundLayBetting:
             return False  # Default to allowing bet if check fails
     
     def get_upcoming_races(self) -> List[Dict]:
-        """Get greyhound races within betting window (5-50 seconds before race time)"""
+        """Get greyhound races within betting window (5-60 seconds before race time)"""
         try:
-            conn = get_db_connection('betfair_races')
-            cursor = conn.cursor()
-            
-            # Use cursor instead of pandas to avoid SQLAlchemy warning
-            query = """
-                SELECT venue, race_number, race_time, race_date, country, timezone
-                FROM greyhound_race_times
-                WHERE race_date::date >= CURRENT_DATE
-                AND race_date::date <= CURRENT_DATE + INTERVAL '1 day'
-                ORDER BY race_date, race_time
-            """
-            cursor.execute(query)
-            rows = cursor.fetchall()
-            conn.close()
+            # Re-reads greyhound_race_times only when the table has changed
+            self.schedule.refresh()
             
-            if not self.logged_initial_races:
-                logger.info(f"📊 Found {len(rows)} total races in database for today/tomorrow")
+            if not self.logged_initial_races and len(self.schedule):
+                logger.info(f"📊 Found {len(self.schedule)} total races in database for today/tomorrow")
                 self.logged_initial_races = True
             
-            if not rows:
-                return []
-            
-            aest_tz = pytz.timezone('Australia/Sydney')
-            now_aest = datetime.now(aest_tz)
+            # Track next upcoming race for logging (within 20 minutes, not 16 hours!)
+            next_race = self.schedule.next_race(max_seconds=1200)
+            self.next_race_info = (next_race['venue'], next_race['race_number'], next_race['race_datetime']) if next_race else None
             
             upcoming_races = []
-            next_race_info = None
-            min_seconds_until = float('inf')
-            
-            for row in rows:
-                venue, race_number, race_time, race_date, country, timezone_str = row
-                
-                # IMPORTANT: DB stores ALL times in AEST (converted by scraper)
-                # Parse as naive datetime, then localize to AEST
-                aest_tz = pytz.timezone('Australia/Sydney')
-                
-                race_datetime_str = f"{race_date} {race_time}"
-                race_datetime_naive = datetime.strptime(race_datetime_str, '%Y-%m-%d %H:%M')
-                race_datetime = aest_tz.localize(race_datetime_naive)
-                
-                seconds_until = (race_datetime - now_aest).total_seconds()
-                
-                # Track next upcoming race for logging (within 20 minutes, not 16 hours!)
-                if 0 < seconds_until < min_seconds_until and seconds_until <= 1200:  # Max 20 minutes
-                    min_seconds_until = seconds_until
-                    next_race_info = (venue, race_number, race_datetime)  # Store race_datetime instead of seconds
-                
-                # Betting window: 5-60 seconds before race time
-                # 30-60s: Full strategy (Stage 1 + Stage 2)
-                # 5-29s: Late entry (Stage 2 only - aggressive bet)
-                if 5 <= seconds_until <= 60:
-                    market_id = self.find_market_id(venue, race_number)
-                    if market_id:
-                        upcoming_races.append({
-                            'venue': venue,
-                            'country': country or 'AUS',
-                            'race_number': race_number,
-                            'market_id': market_id,
-                            'seconds_until': seconds_until,
-                            'race_datetime': race_datetime
-                        })
-                    else:
-                        logger.error(f"❌ NO MARKET FOUND: {venue} R{race_number} (in {seconds_until:.0f}s)")
             
-            # Store next race info for periodic logging
-            self.next_race_info = next_race_info
+            # Betting window: 5-60 seconds before race time
+            # 30-60s: Full strategy (Stage 1 + Stage 2)
+            # 5-29s: Late entry (Stage 2 only - aggressive bet)
+            for race in self.schedule.races_in_window(5, 60):
+                venue, race_number = race['venue'], race['race_number']
+                market_id = self.find_market_id(venue, race_number)
+                if market_id:
+                    upcoming_races.append({
+                        'venue': venue,
+                        'country': race['country'],
+                        'race_number': race_number,
+                        'market_id': market_id,
+                        'seconds_until': race['seconds_until'],
+                        'race_datetime': race['race_datetime']
+                    })
+                else:
+                    logger.error(f"❌ NO MARKET FOUND: {venue} R{race_number} (in {race['seconds_until']:.0f}s)")
             
             return upcoming_races
             
@@ -863,39 +726,14 @@ class RealGreyhoundLayBetting:
             return []
     
     def find_market_id(self, venue: str, race_number: int) -> Optional[str]:
-        """Find market ID in Betfair database"""
+        """Find market ID from the in-memory marketcatalogue index"""
         try:
-            conn = get_db_connection('betfairmarket')
-            cursor = conn.cursor()
-            
-            aest_tz = pytz.timezone('Australia/Sydney')
-            today_str = datetime.now(aest_tz).strftime("%-d")
-            
-            query = """
-                SELECT marketid
-                FROM marketcatalogue
-                WHERE eventname ILIKE %s
-                AND marketname ILIKE %s
-                AND eventtypename = 'Greyhound Racing'
-                LIMIT 1
-            """
-            
-            # Match the specific race number (e.g. "R1 ", "R10 ")
-            race_pattern = f'R{race_number} %'
-            venue_pattern = f'%{venue}%{today_str}%'
-            
-            cursor.execute(query, (venue_pattern, race_pattern))
-            
-            result = cursor.fetchone()
-            conn.close()
-            
-            return result[0] if result else None
-            
+            return self.market_resolver.find_market_id('greyhound', venue, race_number)
         except Exception as e:
             logger.error(f"Error finding market: {e}")
             return None
     
-    def check_market_status(self, market_id: str) -> Optional[Dict]:
+    async def check_market_status(self, market_id: str) -> Optional[Dict]:
         """
         Check actual market status from Betfair (OPEN/SUSPENDED/CLOSED)
         Returns: {
@@ -905,9 +743,20 @@ class RealGreyhoundLayBetting:
             'numberOfActiveRunners': int
         }
         """
+        # Stream market definition is pushed on every change - no round trip needed
+        book = self.stream.get_market_book(market_id) if self.stream else None
+        if book is not None and book.market_definition:
+            definition = book.market_definition
+            return {
+                'status': definition.get('status'),
+                'inplay': definition.get('inPlay', False),
+                'betDelay': definition.get('betDelay', 0),
+                'numberOfActiveRunners': sum(1 for r in definition.get('runners', []) if r.get('status') == 'ACTIVE')
+            }
+
         try:
-            url = f"{BACKEND_URL}/api/GreyhoundMarketBook/status/{market_id}"
-            response = self.session.get(url, timeout=5)
+            url = f"/api/GreyhoundMarketBook/status/{market_id}"
+            response = await self.backend.get(url, timeout=5)
             
             if response.status_code == 404:
                 logger.debug(f"Market {market_id} not yet available (404)")
@@ -935,30 +784,15 @@ class RealGreyhoundLayBetting:
             conn = get_db_connection('betfairmarket')
             cursor = conn.cursor()
             
-            # First, get runner names from marketcatalogue_runners (more reliable)
-            cursor.execute("""
-                SELECT selectionid, runnername, sortpriority
-                FROM marketcatalogue_runners
-                WHERE marketid = %s
-            """, (market_id,))
-            
-            name_map = {}
-            box_map = {}
-            for sel_id, name, sort in cursor.fetchall():
-                if name:
-                    name_map[sel_id] = name
-                if sort:
-                    box_map[sel_id] = sort
-            
             # FOR LAY BETTING: Get ONLY LAY odds for this market
             query = """
-                SELECT DISTINCT selectionid, price, runnername, box
+                SELECT selectionid, MIN(price)
                 FROM greyhoundmarketbook
                 WHERE marketid = %s
                 AND pricetype = 'AvailableToLay'
                 AND price IS NOT NULL
                 AND price > 0
-                ORDER BY selectionid, price ASC
+                GROUP BY selectionid
             """
             
             cursor.execute(query, (market_id,))
@@ -969,32 +803,18 @@ class RealGreyhoundLayBetting:
                 logger.warning(f"❌ No lay prices in DB for market {market_id}")
                 return None
             
-            # Group by selectionid and take best (lowest) lay price
-            import re
-            runners_dict = {}
-            
-            for sel_id, price, runner_name, box in results:
-                if sel_id not in runners_dict:
-                    # Prioritize name from marketcatalogue_runners
-                    if sel_id in name_map:
-                        clean_name = name_map[sel_id]
-                    elif runner_name:
-                        clean_name = re.sub(r'^\d+\.\s*', '', runner_name)
-                    else:
-                        clean_name = f'Dog {sel_id}'
-                    
-                    # Prioritize box from marketcatalogue_runners
-                    final_box = box_map.get(sel_id) or box
-                    
-                    runners_dict[sel_id] = {
-                        'selection_id': sel_id,
-                        'odds': price,
-                        'dog_name': clean_name,
-                        'box': final_box,
-                        'size_available': 0
-                    }
-            
-            odds_map = list(runners_dict.values())
+            # Names and boxes from the in-memory runner metadata cache
+            runner_names, box_numbers = self.runner_metadata.get(market_id)
+            odds_map = [
+                {
+                    'selection_id': sel_id,
+                    'odds': price,
+                    'dog_name': runner_names.get(sel_id, f'Dog {sel_id}'),
+                    'box': box_numbers.get(sel_id),
+                    'size_available': 0
+                }
+                for sel_id, price in results
+            ]
             if not odds_map:
                 return None
             
@@ -1009,16 +829,7 @@ class RealGreyhoundLayBetting:
             
             favorite = odds_map[0]
             
-            # Get total_matched
-            conn = get_db_connection('betfairmarket')
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT totalmatched FROM marketcatalogue WHERE marketid = %s
-            """, (market_id,))
-            
-            total_matched_row = cursor.fetchone()
-            total_matched = total_matched_row[0] if total_matched_row else None
-            conn.close()
+            total_matched = self.runner_metadata.total_matched(market_id)
             
             return {
                 'selection_id': favorite['selection_id'],
@@ -1034,109 +845,120 @@ class RealGreyhoundLayBetting:
             logger.error(traceback.format_exc())
             return None
     
-    def get_current_favorite(self, market_id: str) -> Optional[Dict]:
+    def get_runner_metadata(self, market_id: str) -> tuple:
+        """Runner names, box numbers and total matched for a market (in-memory - no SQL per tick)"""
+        runner_names, box_numbers = self.runner_metadata.get(market_id)
+        return runner_names, box_numbers, self.runner_metadata.total_matched(market_id)
+    
+    async def get_stream_odds(self, market_id: str) -> Optional[tuple]:
+        """Best lay per runner from the Stream API order book: (odds_map, total_matched, odds_at), or None"""
+        if not self.stream:
+            return None
+        
+        odds = self.stream.get_market_odds(market_id)
+        if not odds:
+            return None
+        
+        # Stream market definitions carry no runner names - same metadata cache as get_api_odds
+        runner_names, box_numbers, _ = await asyncio.to_thread(self.get_runner_metadata, market_id)
+        
+        odds_map = [
+            {
+                'selection_id': runner['selection_id'],
+                'odds': runner['odds'],
+                'dog_name': runner_names.get(runner['selection_id'], f"Dog {runner['selection_id']}"),
+                'box': box_numbers.get(runner['selection_id'])
+            }
+            for runner in odds['runners']
+        ]
+        book = self.stream.get_market_book(market_id)
+        return odds_map, book.tv, book.updated_at  # updated_at: when the book last changed
+    
+    async def get_api_odds(self, market_id: str) -> Optional[tuple]:
+        """
+        Best lay per runner via LIVE backend API call: (odds_map, total_matched, odds_at).
+        Falls back to DB if API fails (returns the DB favorite dict in that case).
+        """
+        # Coalesced with every other race task's request into one batched backend call
+        data = await self.market_books.get(market_id)
+        odds_at = time.time()
+        
+        if data is None:
+            logger.warning(f"⚠️  API returned no book for {market_id}, trying DB fallback")
+            return await asyncio.to_thread(self.get_odds_from_db, market_id)
+        
+        # DEBUG: Log what the API actually returns
+        logger.info(f"🔍 API Response keys: {list(data.keys())}")
+        
+        # GreyhoundMarketBookController returns 'odds' as flat array
+        odds_data = data.get('odds', [])
+        
+        if not odds_data:
+            # Try DB fallback
+            if market_id not in self.no_runners_logged:
+                logger.warning(f"⚠️  No odds data in API response, trying DB fallback")
+                self.no_runners_logged.add(market_id)
+            return await asyncio.to_thread(self.get_odds_from_db, market_id)
+        
+        logger.info(f"📡 API returned {len(odds_data)} price points for {market_id}")
+        logger.info(f"✅ USING API ODDS (real-time)")
+        
+        # Build odds map from the 'odds' array, grouping by selectionid
+        # FOR LAY BETTING: Use the best (lowest) lay price available
+        selection_lay_odds = {}
+        
+        for odd in odds_data:
+            sel_id = odd.get('selectionid')
+            price = odd.get('price')
+            pricetype = odd.get('pricetype')
+            
+            if sel_id and price and price > 0 and pricetype == 'AvailableToLay':
+                # For lay betting, take the LOWEST lay price (best price to lay at)
+                if sel_id not in selection_lay_odds or price < selection_lay_odds[sel_id]:
+                    selection_lay_odds[sel_id] = price
+        
+        # Only proceed if we have lay prices
+        if not selection_lay_odds:
+            logger.warning(f"❌ No lay prices available for market {market_id}")
+            if market_id not in self.no_runners_logged:
+                logger.info(f"⏰ Waiting for {market_id} market to open...")
+                self.no_runners_logged.add(market_id)
+            return None
+        
+        # Runner names from the metadata cache (its periodic refresh hits the DB - keep it off the event loop)
+        runner_names, box_numbers, total_matched = await asyncio.to_thread(self.get_runner_metadata, market_id)
+        
+        odds_map = []
+        for sel_id, odds in selection_lay_odds.items():
+            odds_map.append({
+                'selection_id': sel_id,
+                'odds': odds,
+                'dog_name': runner_names.get(sel_id, f'Dog {sel_id}'),
+                'box': box_numbers.get(sel_id)
+            })
+        
+        return odds_map, total_matched, odds_at
+    
+    async def get_current_favorite(self, market_id: str) -> Optional[Dict]:
         """
-        Get current favorite (lowest odds runner) via LIVE API call
-        Falls back to DB if API fails
+        Get current favorite (lowest odds runner) from the Stream API order book,
+        or via LIVE API call when not streaming. Falls back to DB if API fails.
         
         Args:
             market_id: Betfair market ID
         """
         try:
-            # Call backend API for LIVE odds from Betfair
-            url = f"{BACKEND_URL}/api/GreyhoundMarketBook/market/{market_id}"
-            response = self.session.get(url, timeout=10)
-            
-            if response.status_code != 200:
-                logger.warning(f"⚠️  API returned {response.status_code}, trying DB fallback")
-                return self.get_odds_from_db(market_id)
-            
-            data = response.json()
-            
-            # DEBUG: Log what the API actually returns
-            logger.info(f"🔍 API Response keys: {list(data.keys())}")
-            
-            # GreyhoundMarketBookController returns 'odds' as flat array
-            odds_data = data.get('odds', [])
-            
-            if not odds_data:
-                # Try DB fallback
-                if market_id not in self.no_runners_logged:
-                    logger.warning(f"⚠️  No odds data in API response, trying DB fallback")
-                    self.no_runners_logged.add(market_id)
-                return self.get_odds_from_db(market_id)
-            
-            logger.info(f"📡 API returned {len(odds_data)} price points for {market_id}")
-            logger.info(f"✅ USING API ODDS (real-time)")
-            
-            # Get runner names from database - prioritize marketcatalogue_runners
-            conn = get_db_connection('betfairmarket')
-            cursor = conn.cursor()
-            
-            # First get from marketcatalogue_runners (more reliable)
-            cursor.execute("""
-                SELECT selectionid, runnername, sortpriority
-                FROM marketcatalogue_runners
-                WHERE marketid = %s
-            """, (market_id,))
-            
-            runner_names = {}
-            box_numbers = {}
-            for sel_id, name, sort in cursor.fetchall():
-                if name:
-                    runner_names[sel_id] = name
-                if sort:
-                    box_numbers[sel_id] = sort
-            
-            # Fallback to greyhoundmarketbook if needed
-            cursor.execute("""
-                SELECT DISTINCT selectionid, runnername, box
-                FROM greyhoundmarketbook
-                WHERE marketid = %s
-            """, (market_id,))
-            
-            import re
-            for sel_id, runner_name, box in cursor.fetchall():
-                # Only use if not already in runner_names
-                if sel_id not in runner_names and runner_name:
-                    clean_name = re.sub(r'^\d+\.\s*', '', runner_name)
-                    runner_names[sel_id] = clean_name
-                # Only use box if not already set
-                if sel_id not in box_numbers and box:
-                    box_numbers[sel_id] = box
-            
-            # Build odds map from the 'odds' array, grouping by selectionid
-            # FOR LAY BETTING: Use the best (lowest) lay price available
-            selection_lay_odds = {}
-            
-            for odd in odds_data:
-                sel_id = odd.get('selectionid')
-                price = odd.get('price')
-                pricetype = odd.get('pricetype')
-                
-                if sel_id and price and price > 0 and pricetype == 'AvailableToLay':
-                    # For lay betting, take the LOWEST lay price (best price to lay at)
-                    if sel_id not in selection_lay_odds or price < selection_lay_odds[sel_id]:
-                        selection_lay_odds[sel_id] = price
-            
-            # Only proceed if we have lay prices
-            if not selection_lay_odds:
-                logger.warning(f"❌ No lay prices available for market {market_id}")
-                if market_id not in self.no_runners_logged:
-                    logger.info(f"⏰ Waiting for {market_id} market to open...")
-                    self.no_runners_logged.add(market_id)
-                return None
+            result = await self.get_stream_odds(market_id)
+            if result is not None:
+                self.metrics.count('odds_from_stream')
+            else:
+                result = await self.get_api_odds(market_id)
+                self.metrics.count('odds_from_db' if isinstance(result, dict) else 'odds_from_api')
             
-            # Build odds map
-            odds_map = []
-            for sel_id, odds in selection_lay_odds.items():
-                odds_map.append({
-                    'selection_id': sel_id,
-                    'odds': odds,
-                    'dog_name': runner_names.get(sel_id, f'Dog {sel_id}'),
-                    'box': box_numbers.get(sel_id)
-                })
+            if not result or isinstance(result, dict):
+                return result  # None, or the DB fallback favorite
             
+            odds_map, total_matched, odds_at = result
             if not odds_map:
                 return None
             
@@ -1162,21 +984,13 @@ class RealGreyhoundLayBetting:
             
             logger.debug(f"✅ Odds spread OK: 1st={favorite['odds']:.2f}, 2nd={second_favorite['odds']:.2f}, ratio={odds_ratio:.2f}x")
             
-            # Get total_matched
-            cursor.execute("""
-                SELECT totalmatched FROM marketcatalogue WHERE marketid = %s
-            """, (market_id,))
-            
-            total_matched_row = cursor.fetchone()
-            total_matched = total_matched_row[0] if total_matched_row else None
-            conn.close()
-            
             return {
                 'selection_id': favorite['selection_id'],
                 'dog_name': favorite['dog_name'],
                 'box': favorite.get('box'),
                 'odds': favorite['odds'],
-                'total_matched': total_matched
+                'total_matched': total_matched,
+                'odds_at': odds_at
             }
             
         except Exception as e:
@@ -1185,7 +999,28 @@ class RealGreyhoundLayBetting:
             logger.error(traceback.format_exc())
             return None
     
-    def execute_betting_strategy(self, race_info: Dict):
+    async def wait_for_price_update(self, market_id: str, timeout: float = PRICE_WAIT_SECONDS):
+        """Wait for the market's next price change (stream) or just the timeout (polling)"""
+        if self.stream:
+            await self.stream.wait_for_market_update(market_id, timeout)
+        else:
+            await asyncio.sleep(timeout)
+    
+    def record_decision(self, race_info: Dict, favorite: Dict, phase: str):
+        """Latency metrics at the moment a bet is sent: age of the odds it's priced from"""
+        market_id = race_info['market_id']
+        if favorite.get('odds_at'):
+            self.metrics.observe('odds_age', (time.time() - favorite['odds_at']) * 1000, market_id=market_id, phase=phase)
+        else:
+            self.metrics.count('decision_without_odds_age')  # DB fallback prices have no timestamp
+    
+    def record_bet_placed(self, race_info: Dict, phase: str):
+        """Latency metrics for a race's first bet: time since the race entered the betting window"""
+        if race_info.get('window_at') is not None:
+            self.metrics.observe('window_to_bet', (time.monotonic() - race_info['window_at']) * 1000,
+                                 market_id=race_info['market_id'], phase=phase)
+    
+    async def execute_betting_strategy(self, race_info: Dict):
         """
         Execute 2-stage strategy with partial match detection:
         - Stage 1 (T-30s): LIMIT at current -3% (aggressive, tries to get matched early)
@@ -1215,7 +1050,8 @@ class RealGreyhoundLayBetting:
             logger.info(f"⚡ LATE ENTRY: Starting at Stage 2 (race in {seconds_until_race:.0f}s)")
         
         # Check market status from Betfair (OPEN/SUSPENDED/CLOSED)
-        market_status = self.check_market_status(market_id)
+        with self.metrics.span('market_status', market_id=market_id):
+            market_status = await self.check_market_status(market_id)
         if market_status:
             status = market_status.get('status')
             inplay = market_status.get('inplay', False)
@@ -1258,12 +1094,18 @@ class RealGreyhoundLayBetting:
             logger.warning(f"⚠️  Could not retrieve market status - proceeding with caution")
         
         # Keep trying to get favorite until market opens√ or we're too late
-        max_attempts = 50  # Try for up to 50 seconds (covers T-45s to race start)
+        # Try for up to 50 seconds (covers T-45s to race start). With the stream, each
+        # retry wakes on the next price change instead of a fixed 1s poll.
+        deadline = time.monotonic() + 50
+        attempt = -1
         favorite = None
         dominant_favorite_count = 0  # Track how many times in a row we see dominant favorite
+        search_started = time.perf_counter()
         
-        for attempt in range(max_attempts):
-            favorite = self.get_current_favorite(market_id)
+        while time.monotonic() < deadline:
+            attempt += 1
+            with self.metrics.span('get_favorite', market_id=market_id):
+                favorite = await self.get_current_favorite(market_id)
             
             # Check for dominant favorite flag (but give it a few chances to change)
             if favorite and favorite.get('dominant_favorite'):
@@ -1282,7 +1124,7 @@ class RealGreyhoundLayBetting:
                 else:
                     # Keep checking - odds might change
                     logger.info(f"   ⏰ Dominant favorite detected ({dominant_favorite_count}/3 checks), waiting for odds to change...")
-                    time.sleep(2)  # Wait a bit longer between checks
+                    await asyncio.sleep(2)  # Fixed grace period between checks (not per price tick)
                     continue
             else:
                 # Reset counter if no longer dominant
@@ -1293,18 +1135,20 @@ class RealGreyhoundLayBetting:
             if not favorite:
                 if attempt == 0:
                     logger.info(f"⏰ Waiting for {race_info['venue']} R{race_info['race_number']} market to open...")
-                time.sleep(1)
+                await self.wait_for_price_update(market_id)
                 continue
             
             # Check if odds are valid
             if favorite['odds'] > 0 and favorite['odds'] <= MAX_ODDS and favorite['odds'] >= MIN_ODDS:
                 logger.info(f"✅ Market ready after {attempt+1} attempts")
+                self.metrics.observe('find_favorite', (time.perf_counter() - search_started) * 1000,
+                                     market_id=market_id, attempts=attempt + 1)
                 break  # Got valid odds!
             else:
                 logger.warning(f"⚠️  Favorite odds {favorite['odds']:.2f} out of range (MIN={MIN_ODDS}, MAX={MAX_ODDS})")
             
-            # Odds out of range - wait and retry
-            time.sleep(1)
+            # Odds out of range - wait for the next price change and retry
+            await self.wait_for_price_update(market_id)
         else:
             # Exhausted retries
             logger.warning(f"⚠️  Market never opened or odds out of range: {race_info['venue']} R{race_info['race_number']}")
@@ -1327,13 +1171,15 @@ class RealGreyhoundLayBetting:
             bet1_odds = round_to_valid_betfair_odds(min(current_best, MAX_ODDS))
             logger.info(f"   Stage 1 (T-30s): LIMIT @ {bet1_odds:.2f} (current odds, LAPSE)")
             
-            bet1 = self.place_limit_bet(
-                market_id=market_id,
-                selection_id=favorite['selection_id'],
-                odds=bet1_odds,
-                stake=FLAT_STAKE,
-                persistence="LAPSE"
-            )
+            self.record_decision(race_info, favorite, 'stage1')
+            with self.metrics.span('place_limit_bet', market_id=market_id, phase='stage1'):
+                bet1 = await self.place_limit_bet(
+                    market_id=market_id,
+                    selection_id=favorite['selection_id'],
+                    odds=bet1_odds,
+                    stake=FLAT_STAKE,
+                    persistence="LAPSE"
+                )
             
             if not bet1:
                 logger.error(f"❌ Stage 1 failed: {race_info['venue']} R{race_info['race_number']} (see bet placement error above)")
@@ -1341,16 +1187,19 @@ class RealGreyhoundLayBetting:
             
             bet1_id = bet1['betId']
             logger.info(f"✅ Stage 1: Bet {bet1_id} placed @ {bet1_odds:.2f}")
-            self.save_live_trade(race_info, favorite, bet1, current_best)
+            self.record_bet_placed(race_info, 'stage1')
+            with self.metrics.span('save_trade', market_id=market_id):
+                await asyncio.to_thread(self.save_live_trade, race_info, favorite, bet1, current_best)
             
-            # Wait 30 seconds for Stage 2 (T-30s to T-0s = race start)
-            logger.info(f"⏰ Waiting 30s for Stage 2 (race start)...")
-            time.sleep(30)
+            # Wait up to 30 seconds for Stage 2 (T-30s to T-0s = race start) - a full match ends it early
+            logger.info(f"⏰ Waiting up to 30s for Stage 2 (race start)...")
+            await self.orders.wait_until_complete(bet1_id, timeout=30)
         
         # STAGE 2 (T-0s = race start): Check Stage 1 status, if unmatched cancel and replace
         if start_stage == 1 and bet1_id:
             logger.info(f"🔍 Stage 2 (race start): Checking Stage 1 status...")
-            bet_status = self.get_bet_status(bet1_id, market_id)
+            with self.metrics.span('bet_status', market_id=market_id, phase='stage2'):
+                bet_status = await self.get_bet_status(bet1_id, market_id)
             
             if not bet_status:
                 logger.error(f"❌ Could not get bet status for {bet1_id} - backend error")
@@ -1362,7 +1211,7 @@ class RealGreyhoundLayBetting:
             
             logger.info(f"📊 Stage 1 Status: matched=${size_matched:.2f}, remaining=${size_remaining:.2f}")
             
-            if size_remaining == 0:
+            if bet_status['filled']:
                 # FULLY MATCHED - we're done!
                 logger.info(f"✅ Stage 1 FULLY MATCHED → ${size_matched:.2f} @ {bet_status['averagePriceMatched']:.2f}")
                 logger.info(f"🏁 Betting complete")
@@ -1375,18 +1224,27 @@ class RealGreyhoundLayBetting:
             else:
                 logger.info(f"🟡 Stage 1 PARTIALLY MATCHED (${size_matched:.2f}) → Canceling and placing Stage 2 for FULL stake")
             
-            # Cancel Stage 1
-            cancel_success = self.cancel_bet(market_id, bet1_id)
+            # Cancel Stage 1 - always, even if the tracker shows nothing remaining (it may be stale)
+            with self.metrics.span('cancel_bet', market_id=market_id):
+                cancel_success = await self.cancel_bet(market_id, bet1_id)
             if not cancel_success:
-                logger.error(f"❌ Failed to cancel Stage 1 bet {bet1_id}")
-                logger.warning(f"⚠️  Stage 1 may still be active - not placing Stage 2")
-                logger.info(f"🏁 Betting complete (Stage 1 still active)")
-                return
-            
-            logger.info(f"✅ Stage 1 canceled successfully")
+                order = self.orders.get(bet1_id)
+                # Only a remainder the exchange itself reported cancelled/lapsed is safe to replace
+                reported_off = (order and order['sizeRemaining'] == 0 and not order.get('missing')
+                                and order.get('sizeCancelled', 0) + order.get('sizeLapsed', 0) > 0)
+                if not reported_off:
+                    logger.error(f"❌ Failed to cancel Stage 1 bet {bet1_id}")
+                    logger.warning(f"⚠️  Stage 1 may still be active - not placing Stage 2")
+                    logger.info(f"🏁 Betting complete (Stage 1 still active)")
+                    return
+                logger.info(f"⚪ Stage 1 remainder already off the exchange "
+                            f"(cancelled=${order['sizeCancelled']:.2f}, lapsed=${order['sizeLapsed']:.2f})")
+            else:
+                logger.info(f"✅ Stage 1 canceled successfully")
             
             # Get fresh current odds for Stage 2
-            current_favorite = self.get_current_favorite(market_id)
+            with self.metrics.span('get_favorite', market_id=market_id):
+                current_favorite = await self.get_current_favorite(market_id)
             if not current_favorite:
                 logger.warning(f"⚠️  Could not get current favorite for Stage 2")
                 logger.info(f"🏁 Betting complete (no coverage)")
@@ -1396,13 +1254,15 @@ class RealGreyhoundLayBetting:
             stage2_odds = round_to_valid_betfair_odds(current_favorite['odds'])
             stage2_odds = min(stage2_odds, MAX_ODDS)
             
-            bet2 = self.place_limit_bet(
-                market_id=market_id,
-                selection_id=current_favorite['selection_id'],
-                odds=stage2_odds,
-                stake=FLAT_STAKE,
-                persistence="LAPSE"
-            )
+            self.record_decision(race_info, current_favorite, 'stage2')
+            with self.metrics.span('place_limit_bet', market_id=market_id, phase='stage2'):
+                bet2 = await self.place_limit_bet(
+                    market_id=market_id,
+                    selection_id=current_favorite['selection_id'],
+                    odds=stage2_odds,
+                    stake=FLAT_STAKE,
+                    persistence="LAPSE"
+                )
             
             if not bet2:
                 logger.warning(f"⚠️  Stage 2 bet failed - no coverage")
@@ -1412,13 +1272,14 @@ class RealGreyhoundLayBetting:
             bet2_id = bet2['betId']
             logger.info(f"✅ Stage 2: Bet {bet2_id} placed @ {stage2_odds:.2f} (fresh current odds, LAPSE)")
             
-            # Wait 10 seconds for Stage 3 (race start to T+10s)
-            logger.info(f"⏰ Waiting 10s for Stage 3 (T+10s after race start)...")
-            time.sleep(10)
+            # Wait up to 10 seconds for Stage 3 (race start to T+10s) - a full match ends it early
+            logger.info(f"⏰ Waiting up to 10s for Stage 3 (T+10s after race start)...")
+            await self.orders.wait_until_complete(bet2_id, timeout=10)
             
             # STAGE 3 (T+10s): Check Stage 2 status, if unmatched place BSP
             logger.info(f"🔍 Stage 3 (T+10s): Checking Stage 2 status...")
-            bet2_status = self.get_bet_status(bet2_id, market_id)
+            with self.metrics.span('bet_status', market_id=market_id, phase='stage3'):
+                bet2_status = await self.get_bet_status(bet2_id, market_id)
             
             if not bet2_status:
                 logger.error(f"❌ Could not get Stage 2 bet status for {bet2_id}")
@@ -1430,7 +1291,7 @@ class RealGreyhoundLayBetting:
             
             logger.info(f"📊 Stage 2 Status: matched=${size_matched_2:.2f}, remaining=${size_remaining_2:.2f}")
             
-            if size_remaining_2 == 0:
+            if bet2_status['filled']:
                 # FULLY MATCHED - we're done!
                 logger.info(f"✅ Stage 2 FULLY MATCHED → ${size_matched_2:.2f} @ {bet2_status['averagePriceMatched']:.2f}")
                 logger.info(f"🏁 Betting complete")
@@ -1447,12 +1308,13 @@ class RealGreyhoundLayBetting:
             # Place BSP bet
             max_bsp_odds = round_to_valid_betfair_odds(min(current_favorite['odds'] * 2.00, MAX_ODDS))
             
-            bet3 = self.place_bsp_bet(
-                market_id=market_id,
-                selection_id=current_favorite['selection_id'],
-                max_bsp_price=max_bsp_odds,
-                stake=bsp_stake
-            )
+            with self.metrics.span('place_bsp_bet', market_id=market_id, phase='stage3'):
+                bet3 = await self.place_bsp_bet(
+                    market_id=market_id,
+                    selection_id=current_favorite['selection_id'],
+                    max_bsp_price=max_bsp_odds,
+                    stake=bsp_stake
+                )
             
             if bet3:
                 logger.info(f"✅ Stage 3 (BSP): Bet {bet3['betId']} placed - ${bsp_stake:.2f} stake, max BSP {max_bsp_odds:.2f}")
@@ -1472,7 +1334,7 @@ class RealGreyhoundLayBetting:
             # Wait until race start
             if seconds_until_race > 0:
                 logger.info(f"⏰ Waiting {seconds_until_race:.0f}s for race start (Stage 2)...")
-                time.sleep(seconds_until_race)
+                await asyncio.sleep(seconds_until_race)
             
             # Stage 2: Place LIMIT at race start
             logger.info(f"🔍 Late Stage 2 (race start): Placing LIMIT bet")
@@ -1480,13 +1342,15 @@ class RealGreyhoundLayBetting:
             stage2_odds = round_to_valid_betfair_odds(current_best)
             stage2_odds = min(stage2_odds, MAX_ODDS)
             
-            bet2 = self.place_limit_bet(
-                market_id=market_id,
-                selection_id=favorite['selection_id'],
-                odds=stage2_odds,
-                stake=FLAT_STAKE,
-                persistence="LAPSE"
-            )
+            self.record_decision(race_info, favorite, 'late_stage2')
+            with self.metrics.span('place_limit_bet', market_id=market_id, phase='late_stage2'):
+                bet2 = await self.place_limit_bet(
+                    market_id=market_id,
+                    selection_id=favorite['selection_id'],
+                    odds=stage2_odds,
+                    stake=FLAT_STAKE,
+                    persistence="LAPSE"
+                )
             
             if not bet2:
                 logger.error(f"❌ Late Stage 2 failed: {race_info['venue']} R{race_info['race_number']}")
@@ -1495,17 +1359,20 @@ class RealGreyhoundLayBetting:
             
             bet2_id = bet2['betId']
             logger.info(f"✅ Late Stage 2: Bet {bet2_id} placed @ {stage2_odds:.2f} (LAPSE)")
-            self.save_live_trade(race_info, favorite, bet2, current_best)
+            self.record_bet_placed(race_info, 'late_stage2')
+            with self.metrics.span('save_trade', market_id=market_id):
+                await asyncio.to_thread(self.save_live_trade, race_info, favorite, bet2, current_best)
             
-            # Wait 10 seconds for Stage 3
-            logger.info(f"⏰ Waiting 10s for Stage 3 (T+10s after race start)...")
-            time.sleep(10)
+            # Wait up to 10 seconds for Stage 3 - a full match ends it early
+            logger.info(f"⏰ Waiting up to 10s for Stage 3 (T+10s after race start)...")
+            await self.orders.wait_until_complete(bet2_id, timeout=10)
             
             # Stage 3: Check if matched, if not place BSP
             logger.info(f"🔍 Late Stage 3 (T+10s): Checking Stage 2 status...")
-            bet2_status = self.get_bet_status(bet2_id, market_id)
+            with self.metrics.span('bet_status', market_id=market_id, phase='late_stage3'):
+                bet2_status = await self.get_bet_status(bet2_id, market_id)
             
-            if bet2_status and bet2_status['sizeRemaining'] == 0:
+            if bet2_status and bet2_status['filled']:
                 logger.info(f"✅ Late Stage 2 FULLY MATCHED → ${bet2_status['sizeMatched']:.2f} @ {bet2_status['averagePriceMatched']:.2f}")
                 logger.info(f"🏁 Betting complete")
                 return
@@ -1514,12 +1381,13 @@ class RealGreyhoundLayBetting:
             logger.info(f"⚪ Late Stage 2 not fully matched → Placing BSP")
             max_bsp_odds = round_to_valid_betfair_odds(min(current_best * 2.00, MAX_ODDS))
             
-            bet3 = self.place_bsp_bet(
-                market_id=market_id,
-                selection_id=favorite['selection_id'],
-                max_bsp_price=max_bsp_odds,
-                stake=FLAT_STAKE
-            )
+            with self.metrics.span('place_bsp_bet', market_id=market_id, phase='late_stage3'):
+                bet3 = await self.place_bsp_bet(
+                    market_id=market_id,
+                    selection_id=favorite['selection_id'],
+                    max_bsp_price=max_bsp_odds,
+                    stake=FLAT_STAKE
+                )
             
             if bet3:
                 logger.info(f"✅ Late Stage 3 (BSP): Bet {bet3['betId']} placed - max BSP {max_bsp_odds:.2f}")
@@ -1528,12 +1396,41 @@ class RealGreyhoundLayBetting:
             
             logger.info(f"🏁 Betting complete")
         
-    async def execute_betting_strategy_async(self, race_info: Dict):
-        """Async wrapper for execute_betting_strategy - runs in thread pool"""
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, self.execute_betting_strategy, race_info)
+    async def start_stream(self):
+        """Connect to the Stream API if a session token is configured (otherwise poll the backend)"""
+        if not SESSION_TOKEN:
+            logger.info("📡 No BETFAIR_SESSION_TOKEN - using backend API for prices")
+            return
+        
+        stream = AsyncBetfairStreamClient(APP_KEY, SESSION_TOKEN)
+        if await stream.start():
+            self.stream = stream
+            stream.order_handlers.append(self.orders.apply_ocm)
+            self.orders.streaming = stream.subscribe_to_orders()
+            logger.info("📡 Stream API connected - race tasks await price and order updates")
+        else:
+            logger.warning("⚠️  Stream API unavailable - using backend API for prices")
     
     async def run_async(self):
+        """Start the price stream, run the betting loop, and close connections on exit"""
+        await self.start_stream()
+        if LATENCY_METRICS_PORT:
+            self.metrics.serve(LATENCY_METRICS_PORT)
+        # One batched listCurrentOrders per cycle while bets are open (idle on the order stream)
+        order_poller = asyncio.create_task(self.orders.run_polling(self.backend))
+        try:
+            await self.betting_loop()
+        finally:
+            order_poller.cancel()
+            if self.stream:
+                await self.stream.disconnect()
+            await self.market_books.close()
+            await self.backend.close()
+            await asyncio.to_thread(self.trades.close)  # Write any trades still queued
+            self.metrics.log_summary()
+            self.metrics.close()
+    
+    async def betting_loop(self):
         """Main async betting loop with concurrent race handling"""
         logger.info(f"🚨 REAL BETTING STARTED - ${FLAT_STAKE}/bet, Max odds {MAX_ODDS}")
         logger.info(f"🔀 CONCURRENT MODE: Can handle multiple simultaneous races")
@@ -1541,6 +1438,7 @@ class RealGreyhoundLayBetting:
         cycle_count = 0
         last_log_time = datetime.now() - timedelta(seconds=31)  # Force immediate log on first cycle
         last_balance_check = datetime.now()
+        last_latency_summary = datetime.now()
         
         while True:
             try:
@@ -1549,19 +1447,26 @@ class RealGreyhoundLayBetting:
                 
                 # Check account balance every 30 minutes
                 if (now - last_balance_check).total_seconds() >= 1800:
-                    balance = self.get_account_balance()
+                    balance = await self.get_account_balance()
                     if balance is not None and balance < FLAT_STAKE * 10:
                         logger.warning(f"LOW BALANCE: ${balance:.2f}")
                     last_balance_check = now
                 
-                # Get upcoming races (T-30s to T-60s window)
-                races = self.get_upcoming_races()
+                # Stage latency percentiles every 10 minutes
+                if (now - last_latency_summary).total_seconds() >= LATENCY_SUMMARY_SECONDS:
+                    self.metrics.log_summary()
+                    last_latency_summary = now
+                
+                # Get upcoming races (T-30s to T-60s window) - DB refreshes run off the event loop
+                races = await asyncio.to_thread(self.get_upcoming_races)
                 
                 # Clean up completed tasks
                 async with self.task_lock:
                     completed_markets = [m for m, task in self.active_tasks.items() if task.done()]
                     for market_id in completed_markets:
                         del self.active_tasks[market_id]
+                        if self.stream:
+                            self.stream.forget_market(market_id)
                 
                 # Log status every 30 seconds
                 if (now - last_log_time).total_seconds() >= 30:
@@ -1597,22 +1502,31 @@ class RealGreyhoundLayBetting:
                         if market_id in self.active_tasks:
                             continue  # Already being processed
                     
+                    race['window_at'] = time.monotonic()  # Start of window → bet latency
+                    
                     # DUPLICATE PROTECTION 3: Database check (all sessions)
-                    if self.has_already_bet_on_race(market_id):
+                    with self.metrics.span('already_bet_check', market_id=market_id):
+                        already_bet = await asyncio.to_thread(self.has_already_bet_on_race, market_id)
+                    if already_bet:
                         self.processed_markets.add(market_id)  # Don't check again
                         continue
                     
                     # CHECK DAILY LIMITS BEFORE BETTING
-                    can_bet, reason = self.check_daily_limits()
+                    with self.metrics.span('risk_check', market_id=market_id):
+                        can_bet, reason = await asyncio.to_thread(self.check_daily_limits)
                     if not can_bet:
                         logger.error(f"🛑 STOPPED: {reason}")
                         return  # Exit entirely
                     
+                    # Stream this market's prices so the task can await updates
+                    if self.stream:
+                        self.stream.subscribe_to_market(market_id)
+                    
                     # Start concurrent task for this race
                     logger.info(f"🚀 Starting concurrent task for {race['venue']} R{race['race_number']}")
                     async with self.task_lock:
                         self.active_tasks[market_id] = asyncio.create_task(
-                            self.execute_betting_strategy_async(race)
+                            self.execute_betting_strategy(race)
                         )
                     
                     # Mark as processed
@@ -1658,6 +1572,7 @@ if __name__ == "__main__":
     if response == "START REAL TRADING":
         print("✅ Starting real trading...")
         print("")
+        configure_logging()
         betting = RealGreyhoundLayBetting()
         betting.run()
     else:
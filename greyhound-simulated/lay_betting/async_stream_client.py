@@ -0,0 +1,228 @@
+"""
+asyncio Betfair Stream API Consumer
+Same protocol, order-book cache and metrics as BetfairStreamClient, but runs on the
+event loop (asyncio SSL streams) instead of a daemon thread with a blocking socket.
+
+Race tasks await price events instead of polling (and order events, via
+subscribe_to_orders() + order_handlers):
+
+    stream = AsyncBetfairStreamClient(APP_KEY, session_token)
+    await stream.start()                       # connect + authenticate + listen task
+    stream.subscribe_to_market(market_id)
+    if await stream.wait_for_market_update(market_id, timeout=1.0):
+        odds = stream.get_market_odds(market_id)
+
+Framing is handled by StreamReader.readuntil(b'\\r\\n'), which keeps partial frames
+buffered between reads. Reconnects resume from the last initialClk/clk exactly
+like the threaded client.
+"""
+import asyncio
+import json
+import logging
+import ssl
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from betfair_stream_client import (
+    BetfairStreamClient, StreamConnectionLost, HEARTBEAT_MS, MAX_RECONNECT_DELAY
+)
+
+logger = logging.getLogger(__name__)
+
+STREAM_READ_LIMIT = 16 * 1024 * 1024   # Max single frame (SUB_IMAGEs for many markets can be large)
+
+
+class AsyncBetfairStreamClient(BetfairStreamClient):
+    """Betfair Stream API client for asyncio code - price updates are awaitable events"""
+
+    def __init__(self, app_key: str, session_token: str, heartbeat_ms: int = HEARTBEAT_MS,
+                 conflate_ms: Optional[int] = None, host: Optional[str] = None,
+                 port: Optional[int] = None, cafile: Optional[str] = None):
+        super().__init__(app_key, session_token, heartbeat_ms, conflate_ms, host, port, cafile)
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._listen_task: Optional[asyncio.Task] = None
+        # One event per market someone is waiting on; set (and replaced) on each change
+        self._market_events: Dict[str, asyncio.Event] = {}
+        self.connected = asyncio.Event()
+
+    async def connect(self):
+        """Open the SSL stream (asyncio enables TCP_NODELAY on TCP transports)"""
+        try:
+            context = ssl.create_default_context(cafile=self.cafile)
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, ssl=context, limit=STREAM_READ_LIMIT),
+                timeout=15
+            )
+            logger.info(f"🔌 Connected to {self.host}:{self.port}")
+
+            response = await self._read_message()
+            if response and response.get('op') == 'connection':
+                self.connection_id = response.get('connectionId')
+                self.metrics['connected_at'] = datetime.now()
+                logger.info(f"✅ Connection ID: {self.connection_id}")
+                return True
+
+            return False
+
+        except Exception as e:
+            logger.error(f"❌ Connection failed: {e}")
+            return False
+
+    async def authenticate(self):
+        """Authenticate with Betfair"""
+        try:
+            self._send_message({
+                "op": "authentication",
+                "id": self._next_id(),
+                "appKey": self.app_key,
+                "session": self.session_token
+            })
+            response = await self._read_message()
+
+            if response and response.get('statusCode') == 'SUCCESS':
+                logger.info("✅ Authenticated successfully")
+                self.connected.set()
+                return True
+            else:
+                logger.error(f"❌ Authentication failed: {response}")
+                return False
+
+        except Exception as e:
+            logger.error(f"❌ Authentication error: {e}")
+            return False
+
+    async def start(self) -> bool:
+        """Connect, authenticate and start the listen task"""
+        if not await self.connect() or not await self.authenticate():
+            return False
+        self.start_listening()
+        return True
+
+    def start_listening(self):
+        """Start the listen task on the running event loop"""
+        self.running = True
+        self._listen_task = asyncio.get_running_loop().create_task(self._listen_loop())
+        logger.info("🎧 Started listening task")
+
+    async def _listen_loop(self):
+        """Receive and process messages, reconnecting on failure"""
+        while self.running:
+            try:
+                message = await self._next_message()
+                if message is None:
+                    continue
+                self._notify(self._process_message(message))
+            except StreamConnectionLost as e:
+                if not self.running:
+                    break
+                logger.warning(f"⚠️  Stream connection lost: {e}")
+                await self._reconnect()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"Error in listen loop: {e}")
+                await asyncio.sleep(1)
+
+    async def _reconnect(self):
+        """Reconnect, re-authenticate and resume the subscription from the last clk"""
+        delay = 1
+        while self.running:
+            self._close_socket()
+            self.metrics['reconnects'] += 1
+            logger.info(f"🔄 Reconnecting to Stream API (attempt {self.metrics['reconnects']})...")
+
+            if await self.connect() and await self.authenticate():
+                self._resubscribe()
+                return
+
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    def _notify(self, market_ids: List[str]):
+        """Wake every task waiting on these markets"""
+        for market_id in market_ids:
+            event = self._market_events.pop(market_id, None)
+            if event is not None:
+                event.set()
+
+    async def wait_for_market_update(self, market_id: str, timeout: float) -> bool:
+        """
+        Wait until the market's book next changes.
+
+        Returns True on an update, False if nothing changed within timeout.
+        """
+        event = self._market_events.get(market_id)
+        if event is None:
+            event = self._market_events[market_id] = asyncio.Event()
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def _send_message(self, message: dict):
+        """Queue a JSON message on the transport (non-blocking)"""
+        if self._writer is None:
+            raise StreamConnectionLost("not connected")
+        self._writer.write((json.dumps(message) + '\r\n').encode('utf-8'))
+
+    async def _read_frame(self, timeout: Optional[float]) -> bytes:
+        """Next CRLF-delimited frame (without the delimiter)"""
+        if self._reader is None:
+            raise StreamConnectionLost("not connected")
+        try:
+            frame = await asyncio.wait_for(self._reader.readuntil(b'\r\n'), timeout)
+        except asyncio.TimeoutError:
+            raise  # Caller decides (TimeoutError is an OSError on 3.11+)
+        except asyncio.IncompleteReadError:
+            raise StreamConnectionLost("socket closed by server")
+        except (OSError, asyncio.LimitOverrunError) as e:
+            raise StreamConnectionLost(str(e))
+
+        self.metrics['bytes_received'] += len(frame)
+        return frame[:-2]
+
+    async def _next_message(self) -> Optional[dict]:
+        """Next message, treating a silent stream (missed heartbeats) as a lost connection"""
+        try:
+            frame = await self._read_frame(self._heartbeat_timeout())
+        except asyncio.TimeoutError:
+            if not self._has_subscriptions():
+                return None
+            raise StreamConnectionLost(f"no data for {self._heartbeat_timeout():.0f}s (missed heartbeats)")
+
+        messages = self._parse_frames([frame]) if frame else []
+        return messages[0] if messages else None
+
+    async def _read_message(self) -> Optional[dict]:
+        """Read the next message during connect/authenticate"""
+        try:
+            while True:
+                frame = await self._read_frame(timeout=15)
+                messages = self._parse_frames([frame]) if frame else []
+                if messages:
+                    return messages[0]
+        except Exception as e:
+            logger.error(f"Error reading message: {e}")
+            return None
+
+    def _close_socket(self):
+        self.connected.clear()
+        if self._writer is not None:
+            try:
+                self._writer.close()
+            except Exception:
+                pass
+        self._reader = None
+        self._writer = None
+
+    async def disconnect(self):
+        """Stop the listen task and close the connection"""
+        self.running = False
+        if self._listen_task is not None:
+            self._listen_task.cancel()
+            await asyncio.gather(self._listen_task, return_exceptions=True)
+            self._listen_task = None
+        self._close_socket()
+        logger.info("🔌 Disconnected from Stream API")
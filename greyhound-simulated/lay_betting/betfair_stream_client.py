@@ -2,217 +2,522 @@
 Direct Betfair Stream API Consumer
 Connects directly to Betfair's Stream API for real-time odds
 Bypasses C# backend and PostgreSQL for maximum speed
+
+Framing: messages are CRLF-delimited JSON. A single recv() can contain several
+messages (or part of one) under bursty mcm traffic, so bytes are kept in a
+persistent receive buffer and every complete frame is processed.
+
+Resilience: if the socket drops, goes quiet for longer than the heartbeat
+timeout, or Betfair closes the connection, the client reconnects,
+re-authenticates and resubscribes with the last initialClk/clk so the stream
+resumes from where it left off instead of starting from a fresh image.
+
+Orders: subscribe_to_orders() adds the order stream on the same connection;
+every ocm message is passed to the callables in order_handlers (e.g.
+OrderTracker.apply_ocm).
+
+Endpoint: stream-api.betfair.com:443 unless BETFAIR_STREAM_HOST / BETFAIR_STREAM_PORT
+(or host/port) say otherwise; BETFAIR_STREAM_CAFILE (or cafile) adds a CA to trust,
+e.g. the self-signed certificate of utilities/fake_exchange.py for load tests.
+
+Recording: set client.recorder to a StreamRecorder and every raw mcm frame is
+appended to disk with its receive time (see stream_recorder.py for replay).
 """
 import json
+import os
 import socket
 import ssl
 import threading
 import time
 from datetime import datetime
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 import logging
 
+from market_cache import MarketBook, MarketCache
+
 logger = logging.getLogger(__name__)
 
+RECV_BUFFER_SIZE = 64 * 1024       # Bytes per socket read
+HEARTBEAT_MS = 5000                # Ask Betfair for a heartbeat when the market is quiet
+HEARTBEAT_TIMEOUT_FACTOR = 3       # Reconnect after this many missed heartbeats
+MAX_RECONNECT_DELAY = 30           # Seconds (backoff doubles from 1s up to this)
+
+STREAM_HOST = os.environ.get('BETFAIR_STREAM_HOST', "stream-api.betfair.com")
+STREAM_PORT = int(os.environ.get('BETFAIR_STREAM_PORT', 443))
+STREAM_CAFILE = os.environ.get('BETFAIR_STREAM_CAFILE')  # Extra CA to trust (local stand-in servers)
+
+
+class StreamConnectionLost(Exception):
+    """Socket closed, timed out or Betfair closed the connection"""
+
 
 class BetfairStreamClient:
     """Direct connection to Betfair Stream API for real-time odds"""
-    
-    def __init__(self, app_key: str, session_token: str):
+
+    def __init__(self, app_key: str, session_token: str, heartbeat_ms: int = HEARTBEAT_MS,
+                 conflate_ms: Optional[int] = None, host: Optional[str] = None,
+                 port: Optional[int] = None, cafile: Optional[str] = None):
         self.app_key = app_key
         self.session_token = session_token
-        self.host = "stream-api.betfair.com"
-        self.port = 443
-        
-        # In-memory cache of latest odds {market_id: {selection_id: {price, size, timestamp}}}
-        self.market_data = {}
-        self.market_definitions = {}  # Store runner names, etc
-        
+        self.host = host or STREAM_HOST
+        self.port = port or STREAM_PORT
+        self.cafile = cafile or STREAM_CAFILE
+        self.heartbeat_ms = heartbeat_ms
+        self.conflate_ms = conflate_ms
+
+        # In-memory order books for every subscribed market (ladders, traded, LTP, definitions)
+        self.cache = MarketCache()
+
         self.socket = None
         self.connection_id = None
         self.running = False
+        self.connected = threading.Event()  # Authenticated and not dropped/stalled - cached books are live
         self.subscribed_markets = set()
-        
+        self.forgotten_markets = set()  # Dropped by forget_market - late changes for them are ignored
+
+        self._recv_buffer = bytearray()
+        self._send_lock = threading.Lock()
+        self._message_id = 0
+
+        # Optional StreamRecorder - raw mcm frames are appended as they arrive
+        self.recorder = None
+
+        # Stream position, replayed on resubscribe so we get deltas rather than a new image
+        self.initial_clk = None
+        self.clk = None
+
+        # Order stream (same connection, its own clks)
+        self.orders_subscribed = False
+        self.order_handlers = []
+        self.order_initial_clk = None
+        self.order_clk = None
+
+        # Metrics
+        self.metrics = {
+            'messages': 0,
+            'mcm': 0,
+            'ocm': 0,
+            'heartbeats': 0,
+            'conflated': 0,
+            'bytes_received': 0,
+            'reconnects': 0,
+            'connected_at': None,
+            'last_message_at': None,
+            'last_heartbeat_at': None,
+            'max_publish_lag_ms': 0.0,
+        }
+
+    def _next_id(self) -> int:
+        self._message_id += 1
+        return self._message_id
+
     def connect(self):
         """Establish SSL connection to Stream API"""
         try:
             # Create SSL socket
-            context = ssl.create_default_context()
-            raw_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            context = ssl.create_default_context(cafile=self.cafile)
+            raw_socket = socket.create_connection((self.host, self.port), timeout=15)
+            raw_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
             self.socket = context.wrap_socket(raw_socket, server_hostname=self.host)
-            self.socket.connect((self.host, self.port))
-            
+            self._recv_buffer = bytearray()
+
             logger.info(f"🔌 Connected to {self.host}:{self.port}")
-            
+
             # Read connection message
             response = self._read_message()
             if response and response.get('op') == 'connection':
                 self.connection_id = response.get('connectionId')
+                self.metrics['connected_at'] = datetime.now()
                 logger.info(f"✅ Connection ID: {self.connection_id}")
                 return True
-            
+
             return False
-            
+
         except Exception as e:
             logger.error(f"❌ Connection failed: {e}")
             return False
-    
+
     def authenticate(self):
         """Authenticate with Betfair"""
         try:
             auth_message = {
                 "op": "authentication",
-                "id": 1,
+                "id": self._next_id(),
                 "appKey": self.app_key,
                 "session": self.session_token
             }
-            
+
             self._send_message(auth_message)
             response = self._read_message()
-            
+
             if response and response.get('statusCode') == 'SUCCESS':
+                self.connected.set()
                 logger.info("✅ Authenticated successfully")
                 return True
             else:
                 logger.error(f"❌ Authentication failed: {response}")
                 return False
-                
+
         except Exception as e:
             logger.error(f"❌ Authentication error: {e}")
             return False
-    
+
+    def _subscription_message(self, resume: bool) -> dict:
+        """
+        Build a marketSubscription for ALL subscribed markets.
+
+        A new marketSubscription replaces the previous one on the connection, so it
+        must always carry the full market set.
+        """
+        message = {
+            "op": "marketSubscription",
+            "id": self._next_id(),
+            "marketFilter": {"marketIds": sorted(self.subscribed_markets)},
+            "marketDataFilter": {
+                "fields": ["EX_BEST_OFFERS", "EX_TRADED", "EX_TRADED_VOL", "EX_LTP", "EX_MARKET_DEF"],
+                "ladderLevels": 3  # Get top 3 price levels
+            },
+            "heartbeatMs": self.heartbeat_ms
+        }
+        if self.conflate_ms is not None:
+            message["conflateMs"] = self.conflate_ms
+        if resume and self.initial_clk and self.clk:
+            message["initialClk"] = self.initial_clk
+            message["clk"] = self.clk
+        return message
+
     def subscribe_to_market(self, market_id: str):
         """Subscribe to a specific market for real-time updates"""
         try:
             if market_id in self.subscribed_markets:
                 return True
-            
-            subscribe_message = {
-                "op": "marketSubscription",
-                "id": 2,
-                "marketIds": [market_id],
-                "marketDataFilter": {
-                    "fields": ["EX_BEST_OFFERS", "EX_MARKET_DEF"],
-                    "ladderLevels": 3  # Get top 3 price levels
-                }
-            }
-            
-            self._send_message(subscribe_message)
-            
-            # Don't wait for response - it comes asynchronously
+
             self.subscribed_markets.add(market_id)
-            logger.info(f"📡 Subscribed to market: {market_id}")
+            self.forgotten_markets.discard(market_id)
+
+            # Market set changed, so this is a new subscription - old clks don't apply
+            self.initial_clk = None
+            self.clk = None
+            self._send_message(self._subscription_message(resume=False))
+
+            # Don't wait for response - it comes asynchronously
+            logger.info(f"📡 Subscribed to market: {market_id} ({len(self.subscribed_markets)} total)")
             return True
-            
+
         except Exception as e:
             logger.error(f"❌ Subscribe error: {e}")
             return False
-    
+
+    def _order_subscription_message(self, resume: bool) -> dict:
+        """orderSubscription for all of this account's orders (unmatched orders carry full state)"""
+        message = {
+            "op": "orderSubscription",
+            "id": self._next_id(),
+            "orderFilter": {"includeOverallPosition": False},
+            "segmentationEnabled": True,
+            "heartbeatMs": self.heartbeat_ms
+        }
+        if resume and self.order_initial_clk and self.order_clk:
+            message["initialClk"] = self.order_initial_clk
+            message["clk"] = self.order_clk
+        return message
+
+    def subscribe_to_orders(self):
+        """Subscribe to the order stream (fills, cancels and lapses pushed as ocm messages)"""
+        try:
+            self.orders_subscribed = True
+            self._send_message(self._order_subscription_message(resume=False))
+            logger.info("📡 Subscribed to order stream")
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ Order subscribe error: {e}")
+            return False
+
+    def _resubscribe(self):
+        """After a reconnect: resume market and order subscriptions from their last clks"""
+        if self.subscribed_markets:
+            self._send_message(self._subscription_message(resume=True))
+            logger.info(f"📡 Resubscribed to {len(self.subscribed_markets)} market(s)"
+                        f"{' from clk' if self.clk else ''}")
+        if self.orders_subscribed:
+            self._send_message(self._order_subscription_message(resume=True))
+            logger.info(f"📡 Resubscribed to order stream{' from clk' if self.order_clk else ''}")
+
+    def _has_subscriptions(self) -> bool:
+        # Betfair only sends heartbeats for an active subscription
+        return bool(self.subscribed_markets) or self.orders_subscribed
+
+    def forget_market(self, market_id: str):
+        """
+        Drop a finished market from the cache and the subscription set.
+
+        The remaining markets are resubscribed so Betfair stops streaming it (and the
+        set stays under the subscription limit). With none left there's nothing to send -
+        an empty marketFilter would mean every market - and _process_message ignores
+        changes for forgotten markets, including any already in flight.
+        """
+        if market_id not in self.subscribed_markets:
+            return
+        self.subscribed_markets.discard(market_id)
+        self.forgotten_markets.add(market_id)
+        self.cache.remove(market_id)
+        # Market set changed - the old clks belong to the previous subscription
+        self.initial_clk = None
+        self.clk = None
+
+        if self.subscribed_markets:
+            try:
+                self._send_message(self._subscription_message(resume=False))
+            except Exception as e:
+                # A reconnect resubscribes without it anyway
+                logger.warning(f"⚠️  Could not resubscribe without {market_id}: {e}")
+
     def start_listening(self):
         """Start listening thread for incoming messages"""
         self.running = True
         thread = threading.Thread(target=self._listen_loop, daemon=True)
         thread.start()
         logger.info("🎧 Started listening thread")
-    
+
+    def _heartbeat_timeout(self) -> float:
+        return max(self.heartbeat_ms / 1000.0 * HEARTBEAT_TIMEOUT_FACTOR, 5.0)
+
     def _listen_loop(self):
-        """Main loop to receive and process messages"""
+        """Main loop to receive and process messages, reconnecting on failure"""
         while self.running:
             try:
-                message = self._read_message()
-                if message:
+                if self.socket is not None:
+                    self.socket.settimeout(self._heartbeat_timeout())
+                for message in self._read_messages():
                     self._process_message(message)
+                    if not self.running:
+                        break
+            except StreamConnectionLost as e:
+                self.connected.clear()
+                if not self.running:
+                    break
+                logger.warning(f"⚠️  Stream connection lost: {e}")
+                self._reconnect()
             except Exception as e:
                 logger.error(f"Error in listen loop: {e}")
                 time.sleep(1)
-    
-    def _process_message(self, message: dict):
-        """Process incoming Stream API messages"""
+
+    def _reconnect(self):
+        """Reconnect, re-authenticate and resume the subscription from the last clk"""
+        delay = 1
+        while self.running:
+            self._close_socket()
+            self.metrics['reconnects'] += 1
+            logger.info(f"🔄 Reconnecting to Stream API (attempt {self.metrics['reconnects']})...")
+
+            if self.connect() and self.authenticate():
+                self._resubscribe()
+                return
+
+            time.sleep(delay)
+            delay = min(delay * 2, MAX_RECONNECT_DELAY)
+
+    def _process_message(self, message: dict) -> List[str]:
+        """Process incoming Stream API messages. Returns the IDs of markets whose book changed."""
         op = message.get('op')
-        
+
         if op == 'mcm':  # Market Change Message
-            for mc in message.get('mc', []):
-                market_id = mc.get('id')
-                
-                # Store market definition (runner names, etc)
-                if 'marketDefinition' in mc:
-                    self.market_definitions[market_id] = mc['marketDefinition']
-                
-                # Process runner changes (odds)
-                for rc in mc.get('rc', []):
-                    selection_id = rc.get('id')
-                    
-                    # Get lay prices (batl = Best Available To Lay)
-                    batl = rc.get('batl', [])
-                    if batl:
-                        if market_id not in self.market_data:
-                            self.market_data[market_id] = {}
-                        
-                        # batl format: [[level, price, size], [level, price, size], ...]
-                        best_lay = batl[0] if batl else None
-                        if best_lay and len(best_lay) >= 3:
-                            self.market_data[market_id][selection_id] = {
-                                'price': best_lay[1],  # Price is at index 1
-                                'size': best_lay[2],   # Size is at index 2
-                                'timestamp': datetime.now(),
-                                'level': best_lay[0]   # Level is at index 0
-                            }
-                            
-                            logger.debug(f"💰 {market_id} | Runner {selection_id} | Lay @ {best_lay[1]} (${best_lay[2]})")
-        
+            self.metrics['mcm'] += 1
+
+            # Track stream position for resubscription
+            if message.get('initialClk'):
+                self.initial_clk = message['initialClk']
+            if message.get('clk'):
+                self.clk = message['clk']
+
+            if message.get('con'):
+                self.metrics['conflated'] += 1
+
+            if 'pt' in message:
+                lag_ms = time.time() * 1000 - message['pt']
+                if lag_ms > self.metrics['max_publish_lag_ms']:
+                    self.metrics['max_publish_lag_ms'] = lag_ms
+
+            if message.get('ct') == 'HEARTBEAT':
+                self.metrics['heartbeats'] += 1
+                self.metrics['last_heartbeat_at'] = datetime.now()
+                return []
+
+            # Markets dropped by forget_market may still arrive until the new subscription lands
+            if self.forgotten_markets and any(mc.get('id') in self.forgotten_markets for mc in message.get('mc', [])):
+                message['mc'] = [mc for mc in message['mc'] if mc.get('id') not in self.forgotten_markets]
+
+            # Apply ladder / traded / LTP deltas (img replaces the cached image)
+            changed = self.cache.apply_mcm(message)
+            for market_id in changed:
+                logger.debug(f"💰 {market_id} updated")
+            return changed
+
+        elif op == 'ocm':  # Order Change Message
+            self.metrics['ocm'] += 1
+
+            if message.get('initialClk'):
+                self.order_initial_clk = message['initialClk']
+            if message.get('clk'):
+                self.order_clk = message['clk']
+
+            if message.get('ct') == 'HEARTBEAT':
+                self.metrics['heartbeats'] += 1
+                self.metrics['last_heartbeat_at'] = datetime.now()
+                return []
+
+            for handler in self.order_handlers:
+                handler(message)
+
         elif op == 'status':
             status = message.get('statusCode')
             if status != 'SUCCESS':
                 logger.warning(f"⚠️  Status: {message}")
-    
+            if message.get('connectionClosed'):
+                raise StreamConnectionLost(f"Betfair closed the connection ({message.get('errorCode')})")
+
+        return []
+
+    @property
+    def market_definitions(self) -> Dict[str, Dict]:
+        """Latest market definition per market (runner names, status, etc)"""
+        return {market_id: book.market_definition for market_id, book in self.cache.markets.items()}
+
+    def get_market_book(self, market_id: str) -> Optional[MarketBook]:
+        """Live order book for a market (read-only views - don't mutate)"""
+        return self.cache.get(market_id)
+
     def get_market_odds(self, market_id: str) -> Optional[Dict]:
-        """Get latest odds for a market from in-memory cache"""
-        if market_id not in self.market_data:
+        """Get latest best lay odds for a market from in-memory cache"""
+        book = self.cache.get(market_id)
+        if book is None:
             return None
-        
+
+        runner_defs = book.runner_definitions()
+
         runners = []
-        market_def = self.market_definitions.get(market_id, {})
-        runner_defs = {r['id']: r for r in market_def.get('runners', [])}
-        
-        for selection_id, data in self.market_data[market_id].items():
-            runner_def = runner_defs.get(selection_id, {})
-            
+        for runner in book.by_best_lay():
+            runner_def = runner_defs.get(runner.selection_id, {})
+            price, size = runner.best_lay(1)[0]
+
             runners.append({
-                'selection_id': selection_id,
-                'odds': data['price'],
-                'size': data['size'],
-                'dog_name': runner_def.get('name', f'Dog {selection_id}'),
+                'selection_id': runner.selection_id,
+                'odds': price,
+                'size': size,
+                'dog_name': runner_def.get('name', f'Dog {runner.selection_id}'),
                 'box': runner_def.get('sortPriority'),
-                'timestamp': data['timestamp']
+                'ltp': runner.ltp,
+                'spread': runner.spread(),
+                'weight_of_money': runner.weight_of_money(),
+                'timestamp': datetime.fromtimestamp(runner.updated_at)
             })
-        
+
         return {'runners': runners} if runners else None
-    
+
+    def get_metrics(self) -> Dict:
+        """Stream health: message counts, heartbeats, conflation and reconnects"""
+        metrics = dict(self.metrics)
+        last = metrics['last_message_at']
+        metrics['seconds_since_last_message'] = (datetime.now() - last).total_seconds() if last else None
+        metrics['subscribed_markets'] = len(self.subscribed_markets)
+        metrics['conflation_rate'] = metrics['conflated'] / metrics['mcm'] if metrics['mcm'] else 0.0
+        return metrics
+
     def _send_message(self, message: dict):
         """Send JSON message to Stream API"""
         message_str = json.dumps(message) + '\r\n'
-        self.socket.sendall(message_str.encode('utf-8'))
-    
+        with self._send_lock:
+            self.socket.sendall(message_str.encode('utf-8'))
+
+    def _fill_buffer(self):
+        """One socket read (up to RECV_BUFFER_SIZE bytes) appended to the receive buffer"""
+        try:
+            chunk = self.socket.recv(RECV_BUFFER_SIZE)
+        except socket.timeout:
+            if not self._has_subscriptions():
+                return
+            raise StreamConnectionLost(f"no data for {self._heartbeat_timeout():.0f}s (missed heartbeats)")
+        except (OSError, AttributeError) as e:
+            raise StreamConnectionLost(str(e))
+
+        if not chunk:
+            raise StreamConnectionLost("socket closed by server")
+
+        self.metrics['bytes_received'] += len(chunk)
+        self._recv_buffer += chunk
+
+    def _pop_frames(self) -> List[bytes]:
+        """Remove and return every complete CRLF-delimited frame (a partial frame stays buffered)"""
+        end = self._recv_buffer.rfind(b'\r\n')
+        if end == -1:
+            return []
+        complete = bytes(self._recv_buffer[:end])
+        del self._recv_buffer[:end + 2]
+        return [frame for frame in complete.split(b'\r\n') if frame]
+
+    def _parse_frames(self, frames: List[bytes]) -> List[dict]:
+        messages = []
+        for frame in frames:
+            try:
+                message = json.loads(frame)
+            except ValueError as e:
+                logger.error(f"Error parsing message: {e} ({frame[:200]!r})")
+                continue
+
+            messages.append(message)
+            if self.recorder is not None and message.get('op') == 'mcm':
+                self.recorder.record(frame)
+
+        self.metrics['messages'] += len(messages)
+        if messages:
+            self.metrics['last_message_at'] = datetime.now()
+        return messages
+
+    def _read_messages(self) -> List[dict]:
+        """Block until data arrives, then return EVERY complete message buffered so far"""
+        frames = self._pop_frames()
+        while not frames:
+            self._fill_buffer()
+            frames = self._pop_frames()
+        return self._parse_frames(frames)
+
     def _read_message(self) -> Optional[dict]:
-        """Read and parse JSON message from Stream API"""
+        """
+        Read and parse the next JSON message from Stream API.
+
+        Only one frame is consumed - anything else received in the same read
+        stays in the buffer for the next call instead of being dropped.
+        """
         try:
-            buffer = b''
-            while b'\r\n' not in buffer:
-                chunk = self.socket.recv(4096)
-                if not chunk:
-                    return None
-                buffer += chunk
-            
-            message_str = buffer.split(b'\r\n')[0].decode('utf-8')
-            return json.loads(message_str)
-            
+            while True:
+                end = self._recv_buffer.find(b'\r\n')
+                if end == -1:
+                    self._fill_buffer()
+                    continue
+
+                frame = bytes(self._recv_buffer[:end])
+                del self._recv_buffer[:end + 2]
+                messages = self._parse_frames([frame]) if frame else []
+                if messages:
+                    return messages[0]
+
         except Exception as e:
             logger.error(f"Error reading message: {e}")
             return None
-    
+
+    def _close_socket(self):
+        self.connected.clear()
+        if self.socket:
+            try:
+                self.socket.close()
+            except Exception:
+                pass
+        self.socket = None
+        self._recv_buffer = bytearray()
+
     def disconnect(self):
         """Close connection"""
         self.running = False
-        if self.socket:
-            self.socket.close()
+        self._close_socket()
         logger.info("🔌 Disconnected from Stream API")
@@ -15,6 +15,9 @@ from datetime import datetime, timedelta
 import logging
 from typing import Dict, List, Optional
 from db_connection_helper import get_db_connection
+from shared_odds import SharedOddsReader
+from runner_metadata import RunnerMetadataCache
+from trade_journal import TradeJournal
 
 # Configuration
 POSITION_TO_LAY = 3  # Laying the FAVORITE
@@ -44,6 +47,9 @@ class GreyhoundLayBetting:
         self.processed_markets = set()
         self.session = requests.Session()
         self.session.timeout = 10
+        self.shared_odds = SharedOddsReader()  # Filled by shared_odds.py serve, if it's running
+        self.runner_metadata = RunnerMetadataCache('greyhound')  # Names/boxes for the day's markets
+        self.trades = TradeJournal(f'greyhound_lay_position_{POSITION_TO_LAY}')  # Write-behind paper trades
     
     @staticmethod
     def parse_event_name(event_name: str) -> Dict:
@@ -167,31 +173,16 @@ class GreyhoundLayBetting:
             conn = get_db_connection('betfairmarket')
             cursor = conn.cursor()
             
-            # First, get runner names from marketcatalogue_runners (more reliable)
-            cursor.execute("""
-                SELECT selectionid, runnername, sortpriority
-                FROM marketcatalogue_runners
-                WHERE marketid = %s
-            """, (market_id,))
-            
-            name_map = {}
-            box_map = {}
-            for sel_id, name, sort in cursor.fetchall():
-                if name:
-                    name_map[sel_id] = name
-                if sort:
-                    box_map[sel_id] = sort
-            
-            # FOR LAY BETTING: Get ONLY LAY odds for this market
+            # FOR LAY BETTING: Get ONLY LAY odds for this market (best = lowest per runner)
             # NO FALLBACK TO BACK PRICES
             query = """
-                SELECT DISTINCT selectionid, price, runnername, box
+                SELECT selectionid, MIN(price)
                 FROM greyhoundmarketbook
                 WHERE marketid = %s
                 AND pricetype = 'AvailableToLay'
                 AND price IS NOT NULL
                 AND price > 0
-                ORDER BY selectionid, price ASC
+                GROUP BY selectionid
             """
             
             cursor.execute(query, (market_id,))
@@ -202,31 +193,17 @@ class GreyhoundLayBetting:
                 logger.warning(f"❌ No lay prices in DB for market {market_id}")
                 return None
             
-            # Group by selectionid and take best (lowest) lay price
-            import re
-            runners_dict = {}
-            
-            for sel_id, price, runner_name, box in results:
-                if sel_id not in runners_dict:
-                    # Prioritize name from marketcatalogue_runners, fallback to greyhoundmarketbook
-                    if sel_id in name_map:
-                        clean_name = name_map[sel_id]
-                    elif runner_name:
-                        clean_name = re.sub(r'^\d+\.\s*', '', runner_name)
-                    else:
-                        clean_name = f'Dog {sel_id}'
-                    
-                    # Prioritize box from marketcatalogue_runners
-                    final_box = box_map.get(sel_id) or box
-                    
-                    runners_dict[sel_id] = {
-                        'selection_id': sel_id,
-                        'odds': price,
-                        'dog_name': clean_name,
-                        'box': final_box
-                    }
-            
-            odds_map = list(runners_dict.values())
+            # Names and boxes from the in-memory runner metadata cache
+            runner_names, box_numbers = self.runner_metadata.get(market_id)
+            odds_map = [
+                {
+                    'selection_id': sel_id,
+                    'odds': price,
+                    'dog_name': runner_names.get(sel_id, f'Dog {sel_id}'),
+                    'box': box_numbers.get(sel_id)
+                }
+                for sel_id, price in results
+            ]
             return {'runners': odds_map} if odds_map else None
             
         except Exception as e:
@@ -236,57 +213,26 @@ class GreyhoundLayBetting:
     def get_odds_and_runners(self, market_id: str) -> Optional[Dict]:
         """Get current odds for all runners (tries API first, then DB fallback)"""
         try:
-            url = f"{BACKEND_URL}/api/GreyhoundMarketBook/market/{market_id}"
-            response = self.session.get(url, timeout=10)
-            
-            if response.status_code != 200:
-                logger.debug(f"API returned {response.status_code}, trying DB fallback")
-                return self.get_odds_from_db(market_id)
-            
-            data = response.json()
-            # The API returns 'odds' not 'runners'
-            odds_data = data.get('odds', [])
+            # Host-wide shared odds cache first (utilities/shared_odds.py serve), then the API
+            odds_data = self.shared_odds.odds_rows(market_id)
+            if odds_data is None:
+                url = f"{BACKEND_URL}/api/GreyhoundMarketBook/market/{market_id}"
+                response = self.session.get(url, timeout=10)
+                
+                if response.status_code != 200:
+                    logger.debug(f"API returned {response.status_code}, trying DB fallback")
+                    return self.get_odds_from_db(market_id)
+                
+                data = response.json()
+                # The API returns 'odds' not 'runners'
+                odds_data = data.get('odds', [])
             
             if not odds_data:
                 logger.warning(f"❌ No odds data returned from API for market {market_id}")
                 return self.get_odds_from_db(market_id)
             
-            # Get runner names from database - prioritize marketcatalogue_runners
-            conn = get_db_connection('betfairmarket')
-            cursor = conn.cursor()
-            
-            # First get from marketcatalogue_runners (more reliable)
-            cursor.execute("""
-                SELECT selectionid, runnername, sortpriority
-                FROM marketcatalogue_runners
-                WHERE marketid = %s
-            """, (market_id,))
-            
-            runner_names = {}
-            box_numbers = {}
-            for sel_id, name, sort in cursor.fetchall():
-                if name:
-                    runner_names[sel_id] = name
-                if sort:
-                    box_numbers[sel_id] = sort
-            
-            # Fallback to greyhoundmarketbook if needed
-            cursor.execute("""
-                SELECT DISTINCT selectionid, runnername, box
-                FROM greyhoundmarketbook
-                WHERE marketid = %s
-            """, (market_id,))
-            
-            import re
-            for sel_id, runner_name, box in cursor.fetchall():
-                # Only use if not already in runner_names
-                if sel_id not in runner_names and runner_name:
-                    clean_name = re.sub(r'^\d+\.\s*', '', runner_name)
-                    runner_names[sel_id] = clean_name
-                # Only use box if not already set
-                if sel_id not in box_numbers and box:
-                    box_numbers[sel_id] = box
-            conn.close()
+            # Runner names and boxes from the in-memory metadata cache (no SQL per tick)
+            runner_names, box_numbers = self.runner_metadata.get(market_id)
             
             # Build odds map from the 'odds' array, grouping by selectionid
             # FOR LAY BETTING: Use the best (lowest) lay price available
@@ -327,54 +273,28 @@ class GreyhoundLayBetting:
             return self.get_odds_from_db(market_id)
     
     def place_lay_bet(self, race_info: Dict, dog: Dict, position: int):
-        """Record a lay bet"""
+        """Record a lay bet (journaled locally; written to the DB in the background)"""
         try:
-            # Get total matched from MarketCatalogue
-            total_matched = None
-            try:
-                betfair_conn = get_db_connection('betfairmarket')
-                betfair_cursor = betfair_conn.cursor()
-                betfair_cursor.execute("""
-                    SELECT totalmatched FROM marketcatalogue WHERE marketid = %s
-                """, (race_info['market_id'],))
-                result = betfair_cursor.fetchone()
-                if result:
-                    total_matched = result[0]
-                betfair_conn.close()
-            except Exception as e:
-                logger.debug(f"Could not fetch TotalMatched: {e}")
-            
-            conn = get_db_connection('betfair_trades')
-            cursor = conn.cursor()
-            
             liability = FLAT_STAKE * (dog['odds'] - 1)
             
-            cursor.execute("""
-                INSERT INTO paper_trades_greyhounds
-                (date, venue, country, race_number, market_id, selection_id, dog_name, box_number,
-                 position_in_market, odds, stake, liability, finishing_position, result, total_matched, created_at)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                datetime.now().strftime('%Y-%m-%d'),
-                race_info['venue'],
-                race_info['country'],
-                race_info['race_number'],
-                race_info['market_id'],
-                dog['selection_id'],
-                dog['dog_name'],
-                dog.get('box'),  # Get box number from dog data
-                position,
-                dog['odds'],
-                FLAT_STAKE,
-                liability,
-                0,  # Will be updated later
-                'pending',
-                total_matched,
-                datetime.now()  # created_at timestamp
-            ))
-            
-            conn.commit()
-            conn.close()
+            self.trades.record('paper_trades_greyhounds', {
+                'date': datetime.now().strftime('%Y-%m-%d'),
+                'venue': race_info['venue'],
+                'country': race_info['country'],
+                'race_number': race_info['race_number'],
+                'market_id': race_info['market_id'],
+                'selection_id': dog['selection_id'],
+                'dog_name': dog['dog_name'],
+                'box_number': dog.get('box'),  # Get box number from dog data
+                'position_in_market': position,
+                'odds': dog['odds'],
+                'stake': FLAT_STAKE,
+                'liability': liability,
+                'finishing_position': 0,  # Will be updated later
+                'result': 'pending',
+                'total_matched': self.runner_metadata.total_matched(race_info['market_id']),  # From MarketCatalogue
+                'created_at': datetime.now()
+            })
             
             box_info = f" [Box {dog.get('box')}]" if dog.get('box') else ""
             logger.info(f"✅ LAY BET: {dog['dog_name']}{box_info} (ID: {dog['selection_id']}) @ {dog['odds']} (Position {position}) - Liability: ${liability:.2f}")
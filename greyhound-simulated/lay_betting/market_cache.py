@@ -0,0 +1,257 @@
+"""
+Stream API Order-Book Cache
+Per-market, per-runner order books built from Betfair Stream API market change
+messages (mcm), with deltas applied the way the Stream API specifies:
+
+- batb / batl (best available to back/lay) are LEVEL based: [level, price, size],
+  size 0 removes the level
+- atb / atl (full depth) and trd (traded) are PRICE based: [price, size],
+  size 0 removes the price
+- ltp / tv replace the last traded price / traded volume
+- img: true (on the market or runner) replaces the cached image instead of merging
+
+Ladders are stored as immutable tuples rebuilt when a delta touches them, so
+strategies read best-N levels, spread and weight of money without copying.
+
+Usage:
+    cache = MarketCache()
+    cache.apply_mcm(message)                  # from BetfairStreamClient._process_message
+    book = cache.get('1.234567')
+    runner = book.runners[12345678]
+    runner.best_lay(3)                         # ((2.5, 40.0), (2.52, 10.0), (2.54, 7.5))
+    runner.spread(), runner.weight_of_money(), runner.ltp
+"""
+
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+Ladder = Tuple[Tuple[float, float], ...]
+
+
+def _apply_level_deltas(levels: Dict[int, Tuple[float, float]], deltas: Iterable[List]) -> None:
+    """[level, price, size] deltas; size 0 removes the level"""
+    for level, price, size in deltas:
+        if size == 0:
+            levels.pop(level, None)
+        else:
+            levels[level] = (price, size)
+
+
+def _apply_price_deltas(prices: Dict[float, float], deltas: Iterable[List]) -> None:
+    """[price, size] deltas; size 0 removes the price"""
+    for price, size in deltas:
+        if size == 0:
+            prices.pop(price, None)
+        else:
+            prices[price] = size
+
+
+class RunnerBook:
+    """Order book for one runner (selection) in one market"""
+
+    __slots__ = (
+        'selection_id', 'handicap',
+        '_batb', '_batl', '_atb', '_atl', '_trd',
+        'back_levels', 'lay_levels', 'back_depth', 'lay_depth', 'traded',
+        'ltp', 'tv', 'spn', 'spf', 'updated_at', 'publish_time',
+    )
+
+    def __init__(self, selection_id: int, handicap: float = 0.0):
+        self.selection_id = selection_id
+        self.handicap = handicap
+        self._reset()
+
+    def _reset(self):
+        self._batb = {}
+        self._batl = {}
+        self._atb = {}
+        self._atl = {}
+        self._trd = {}
+        # Read views (immutable, rebuilt only when changed)
+        self.back_levels: Ladder = ()   # Best first (highest back price)
+        self.lay_levels: Ladder = ()    # Best first (lowest lay price)
+        self.back_depth: Ladder = ()
+        self.lay_depth: Ladder = ()
+        self.traded: Ladder = ()        # Ascending price
+        self.ltp = None
+        self.tv = None
+        self.spn = None
+        self.spf = None
+        self.updated_at = None
+        self.publish_time = None
+
+    def apply(self, rc: Dict, publish_time: Optional[int] = None):
+        """Apply a runner change (rc) - a full image if rc['img'] is set"""
+        if rc.get('img'):
+            self._reset()
+
+        if 'batb' in rc:
+            _apply_level_deltas(self._batb, rc['batb'])
+            self.back_levels = tuple(self._batb[k] for k in sorted(self._batb))
+        if 'batl' in rc:
+            _apply_level_deltas(self._batl, rc['batl'])
+            self.lay_levels = tuple(self._batl[k] for k in sorted(self._batl))
+        if 'atb' in rc:
+            _apply_price_deltas(self._atb, rc['atb'])
+            self.back_depth = tuple(sorted(self._atb.items(), reverse=True))
+        if 'atl' in rc:
+            _apply_price_deltas(self._atl, rc['atl'])
+            self.lay_depth = tuple(sorted(self._atl.items()))
+        if 'trd' in rc:
+            _apply_price_deltas(self._trd, rc['trd'])
+            self.traded = tuple(sorted(self._trd.items()))
+        if 'ltp' in rc:
+            self.ltp = rc['ltp']
+        if 'tv' in rc:
+            self.tv = rc['tv']
+        if 'spn' in rc:
+            self.spn = rc['spn']
+        if 'spf' in rc:
+            self.spf = rc['spf']
+
+        self.updated_at = time.time()
+        self.publish_time = publish_time
+
+    # Read views ---------------------------------------------------------
+
+    def _levels(self, side: str) -> Ladder:
+        # Prefer level-based best offers; fall back to full depth when subscribed to EX_ALL_OFFERS
+        if side == 'back':
+            return self.back_levels or self.back_depth
+        return self.lay_levels or self.lay_depth
+
+    def best_back(self, n: int = 1) -> Ladder:
+        return self._levels('back')[:n]
+
+    def best_lay(self, n: int = 1) -> Ladder:
+        return self._levels('lay')[:n]
+
+    @property
+    def best_back_price(self) -> Optional[float]:
+        levels = self._levels('back')
+        return levels[0][0] if levels else None
+
+    @property
+    def best_lay_price(self) -> Optional[float]:
+        levels = self._levels('lay')
+        return levels[0][0] if levels else None
+
+    def spread(self) -> Optional[float]:
+        """Best lay minus best back (None if either side is empty)"""
+        back, lay = self.best_back_price, self.best_lay_price
+        if back is None or lay is None:
+            return None
+        return round(lay - back, 2)
+
+    def weight_of_money(self, n: int = 3) -> Optional[float]:
+        """
+        Share of the top-n volume on the back side: back / (back + lay).
+        > 0.5 means more money waiting to back than to lay.
+        """
+        back = sum(size for _, size in self._levels('back')[:n])
+        lay = sum(size for _, size in self._levels('lay')[:n])
+        total = back + lay
+        return back / total if total else None
+
+    def traded_volume(self) -> float:
+        """Total traded on this runner (tv if sent, otherwise summed from the traded ladder)"""
+        if self.tv is not None:
+            return self.tv
+        return sum(size for _, size in self.traded)
+
+    def age(self) -> Optional[float]:
+        """Seconds since this runner last changed"""
+        return time.time() - self.updated_at if self.updated_at else None
+
+
+class MarketBook:
+    """Order books for every runner in one market plus its market definition"""
+
+    def __init__(self, market_id: str):
+        self.market_id = market_id
+        self.runners: Dict[int, RunnerBook] = {}
+        self.market_definition: Dict = {}
+        self.tv = None
+        self.publish_time = None
+        self.updated_at = None
+
+    def apply(self, mc: Dict, publish_time: Optional[int] = None):
+        """Apply a market change (mc) - a full image if mc['img'] is set"""
+        if mc.get('img'):
+            self.runners = {}
+            self.tv = None
+
+        if 'marketDefinition' in mc:
+            self.market_definition = mc['marketDefinition']
+        if 'tv' in mc:
+            self.tv = mc['tv']
+
+        for rc in mc.get('rc', []):
+            selection_id = rc['id']
+            runner = self.runners.get(selection_id)
+            if runner is None:
+                runner = self.runners[selection_id] = RunnerBook(selection_id, rc.get('hc', 0.0))
+            runner.apply(rc, publish_time)
+
+        self.publish_time = publish_time
+        self.updated_at = time.time()
+
+    @property
+    def status(self) -> Optional[str]:
+        return self.market_definition.get('status')
+
+    @property
+    def inplay(self) -> bool:
+        return bool(self.market_definition.get('inPlay'))
+
+    def runner_definitions(self) -> Dict[int, Dict]:
+        return {r['id']: r for r in self.market_definition.get('runners', [])}
+
+    def active_runners(self) -> List[RunnerBook]:
+        """Runners not removed/non-runner according to the market definition"""
+        definitions = self.runner_definitions()
+        return [
+            runner for selection_id, runner in self.runners.items()
+            if definitions.get(selection_id, {}).get('status', 'ACTIVE') == 'ACTIVE'
+        ]
+
+    def by_best_lay(self) -> List[RunnerBook]:
+        """Active runners with a lay price, favourite first (selection ID breaks ties)"""
+        runners = [r for r in self.active_runners() if r.best_lay_price is not None]
+        runners.sort(key=lambda r: (r.best_lay_price, r.selection_id))
+        return runners
+
+
+class MarketCache:
+    """All subscribed markets' order books, updated from mcm messages"""
+
+    def __init__(self):
+        self.markets: Dict[str, MarketBook] = {}
+
+    def apply_mcm(self, message: Dict) -> List[str]:
+        """
+        Apply one mcm message. Returns the IDs of the markets it changed.
+
+        On a SUB_IMAGE the whole cache for those markets is replaced via their img flags.
+        """
+        publish_time = message.get('pt')
+        changed = []
+        for mc in message.get('mc', []):
+            market_id = mc.get('id')
+            if not market_id:
+                continue
+            book = self.markets.get(market_id)
+            if book is None:
+                book = self.markets[market_id] = MarketBook(market_id)
+            book.apply(mc, publish_time)
+            changed.append(market_id)
+        return changed
+
+    def get(self, market_id: str) -> Optional[MarketBook]:
+        return self.markets.get(market_id)
+
+    def remove(self, market_id: str):
+        self.markets.pop(market_id, None)
+
+    def clear(self):
+        self.markets.clear()
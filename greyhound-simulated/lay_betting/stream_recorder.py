@@ -0,0 +1,250 @@
+"""
+Stream Tick Recorder
+Appends every raw mcm frame the stream client receives to compressed,
+date-partitioned files, and replays them back through the same
+BetfairStreamClient._process_message path - live odds can be reproduced for
+debugging and backtests without Postgres or a Betfair connection.
+
+File format: one record per line, `<receive time in ms> <raw mcm JSON>\\n`
+(Betfair frames never contain newlines), gzip by default or zstd when the
+zstandard package is installed. One file per recorder session per day:
+    {base_dir}/2025-01-13/mcm-093015.ndjson.gz
+
+Recording (works with both the threaded and the asyncio client):
+    stream = BetfairStreamClient(APP_KEY, session_token)
+    stream.recorder = StreamRecorder("/path/to/ticks")
+
+Replay (speed=1.0 is real time, None is as fast as possible):
+    client = BetfairStreamClient(app_key='', session_token='')
+    replay(client, recorded_files("/path/to/ticks", "2025-01-13"), speed=None,
+           on_update=lambda market_ids, received_at: ...)
+    client.get_market_odds(market_id)
+
+Usage:
+    python stream_recorder.py record /path/to/ticks 1.234567890 1.234567891
+    python stream_recorder.py replay /path/to/ticks --from 2025-01-13 --to 2025-01-14 --speed 0
+"""
+import argparse
+import gzip
+import io
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+import zlib
+from datetime import datetime
+from typing import Callable, Iterator, List, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+FLUSH_SECONDS = 1.0   # Flush compressed output at most this often (bounds loss on a crash)
+EXTENSIONS = {'gzip': '.ndjson.gz', 'zstd': '.ndjson.zst', 'none': '.ndjson'}
+
+
+class StreamRecorder:
+    """Appends raw mcm frames with their receive time to {base_dir}/{YYYY-MM-DD}/mcm-HHMMSS.ndjson.*"""
+
+    def __init__(self, base_dir: str, compression: Optional[str] = None, flush_seconds: float = FLUSH_SECONDS):
+        if compression is None:
+            compression = 'zstd' if zstandard is not None else 'gzip'
+        if compression not in EXTENSIONS:
+            raise ValueError(f"Unknown compression: {compression}")
+        if compression == 'zstd' and zstandard is None:
+            raise ValueError("zstd compression needs the zstandard package")
+
+        self.base_dir = base_dir
+        self.compression = compression
+        self.flush_seconds = flush_seconds
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._date = None
+        self._last_flush = 0.0
+
+        self.path = None
+        self.frames = 0
+        self.bytes = 0
+
+    def _open(self, now: datetime):
+        self._close_file()
+        day_dir = os.path.join(self.base_dir, now.strftime('%Y-%m-%d'))
+        os.makedirs(day_dir, exist_ok=True)
+        self.path = os.path.join(day_dir, f"mcm-{now.strftime('%H%M%S')}{EXTENSIONS[self.compression]}")
+
+        if self.compression == 'gzip':
+            self._file = gzip.open(self.path, 'ab', compresslevel=6)
+        elif self.compression == 'zstd':
+            self._file = zstandard.ZstdCompressor(level=3).stream_writer(open(self.path, 'ab'))
+        else:
+            self._file = open(self.path, 'ab')
+        self._date = now.date()
+        logger.info(f"📼 Recording stream to {self.path}")
+
+    def record(self, frame: bytes, received_at: Optional[float] = None):
+        """Append one raw frame (bytes as received, without the CRLF)"""
+        received_at = time.time() if received_at is None else received_at
+        line = b'%d %s\n' % (int(received_at * 1000), frame)
+
+        with self._lock:
+            now = datetime.fromtimestamp(received_at)
+            if self._file is None or now.date() != self._date:
+                self._open(now)
+
+            self._file.write(line)
+            self.frames += 1
+            self.bytes += len(line)
+
+            if received_at - self._last_flush >= self.flush_seconds:
+                self._flush()
+                self._last_flush = received_at
+
+    def _flush(self):
+        if self.compression == 'zstd':
+            self._file.flush(zstandard.FLUSH_BLOCK)
+        elif self.compression == 'gzip':
+            self._file.flush(zlib.Z_SYNC_FLUSH)
+        else:
+            self._file.flush()
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def close(self):
+        with self._lock:
+            self._close_file()
+
+    def stats(self) -> dict:
+        return {'path': self.path, 'frames': self.frames, 'bytes': self.bytes}
+
+
+def recorded_files(base_dir: str, start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[str]:
+    """Recorded files between two YYYY-MM-DD dates (inclusive), oldest first"""
+    files = []
+    for day in sorted(os.listdir(base_dir)):
+        day_dir = os.path.join(base_dir, day)
+        if not os.path.isdir(day_dir):
+            continue
+        if (start_date and day < start_date) or (end_date and day > end_date):
+            continue
+        files.extend(
+            os.path.join(day_dir, name) for name in sorted(os.listdir(day_dir))
+            if name.startswith('mcm-') and name.endswith(tuple(EXTENSIONS.values()))
+        )
+    return files
+
+
+def read_records(path: str) -> Iterator[Tuple[float, bytes]]:
+    """(receive time in seconds, raw frame) for every record in one file, via mmap"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if path.endswith('.gz'):
+                stream = gzip.GzipFile(fileobj=mapped)
+            elif path.endswith('.zst'):
+                if zstandard is None:
+                    raise ValueError(f"{path} needs the zstandard package")
+                stream = io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(mapped))
+            else:
+                stream = mapped
+
+            try:
+                for line in iter(stream.readline, b''):
+                    timestamp, _, frame = line.rstrip(b'\n').partition(b' ')
+                    if frame:
+                        yield int(timestamp) / 1000.0, frame
+            except (EOFError, zlib.error) as e:
+                # Recorder killed mid-write: everything before the last flush is still readable
+                logger.warning(f"⚠️  {path} ends early ({e})")
+
+
+def replay(client, files: List[str], speed: Optional[float] = 1.0,
+           on_update: Optional[Callable[[List[str], float], None]] = None) -> dict:
+    """
+    Feed recorded frames through client._process_message in order.
+
+    speed: 1.0 = original pacing, 10.0 = ten times faster, None/0 = no waiting.
+    on_update(changed_market_ids, received_at) is called after every frame that changed a book.
+    """
+    frames = 0
+    first_at = None
+    started = time.monotonic()
+
+    for path in files:
+        for received_at, frame in read_records(path):
+            if speed:
+                if first_at is None:
+                    first_at = received_at
+                delay = (received_at - first_at) / speed - (time.monotonic() - started)
+                if delay > 0:
+                    time.sleep(delay)
+
+            changed = client._process_message(json.loads(frame))
+            frames += 1
+            if on_update is not None and changed:
+                on_update(changed, received_at)
+
+    return {
+        'frames': frames,
+        'markets': len(client.cache.markets),
+        'elapsed_seconds': time.monotonic() - started,
+    }
+
+
+def main():
+    from betfair_stream_client import BetfairStreamClient
+
+    parser = argparse.ArgumentParser(description="Record or replay Betfair stream mcm frames")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record_cmd = commands.add_parser('record')
+    record_cmd.add_argument('base_dir')
+    record_cmd.add_argument('market_ids', nargs='+')
+    record_cmd.add_argument('--compression', choices=sorted(EXTENSIONS))
+
+    replay_cmd = commands.add_parser('replay')
+    replay_cmd.add_argument('base_dir')
+    replay_cmd.add_argument('--from', dest='start_date')
+    replay_cmd.add_argument('--to', dest='end_date')
+    replay_cmd.add_argument('--speed', type=float, default=0, help="1 = real time, 0 = max speed")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.command == 'record':
+        stream = BetfairStreamClient(os.environ.get('BETFAIR_APP_KEY', "tjBWsmDXH5zwhfjj"),
+                                     os.environ['BETFAIR_SESSION_TOKEN'])
+        stream.recorder = StreamRecorder(args.base_dir, args.compression)
+        if not (stream.connect() and stream.authenticate()):
+            return
+        stream.start_listening()
+        for market_id in args.market_ids:
+            stream.subscribe_to_market(market_id)
+        try:
+            while True:
+                time.sleep(60)
+                logger.info(f"📼 {stream.recorder.stats()}")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stream.disconnect()
+            stream.recorder.close()
+    else:
+        files = recorded_files(args.base_dir, args.start_date, args.end_date)
+        client = BetfairStreamClient(app_key='', session_token='')
+        result = replay(client, files, speed=args.speed or None)
+        logger.info(f"▶️  Replayed {result['frames']} frames from {len(files)} files: "
+                    f"{result['markets']} markets in {result['elapsed_seconds']:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
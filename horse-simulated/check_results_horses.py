@@ -3,20 +3,17 @@ Check Results for Horse Racing LAY Betting Paper Trades
 Updates finishing positions and calculates profit/loss
 """
 
-import sqlite3
-import requests
-import json
 import csv
 import sys
 import os
 from datetime import datetime, timedelta
-from typing import Dict, List
+
+import pandas as pd
 
 # Add utilities to path
 sys.path.insert(0, '/Users/clairegrady/RiderProjects/betfair/utilities')
-from db_connection_helper import get_db_connection, db_transaction, execute_with_retry
-
-BACKEND_URL = "http://localhost:5173"
+from db_connection_helper import get_db_connection
+from settlement import get_market_results, settle_bets, write_settlements
 
 def get_unsettled_bets():
     """Get all paper LAY bets that haven't been settled yet"""
@@ -53,85 +50,6 @@ def get_unsettled_bets():
     conn.close()
     return bets
 
-def fetch_settled_results(market_ids: List[str]) -> Dict:
-    """Fetch settled results from backend"""
-    try:
-        print(f"   🌐 Calling backend with {len(market_ids)} market IDs...")
-        response = requests.post(
-            f"{BACKEND_URL}/api/results/settled",
-            json={"marketIds": market_ids},
-            timeout=30
-        )
-        
-        print(f"   📡 Backend response: {response.status_code}")
-        
-        if response.status_code == 200:
-            data = response.json()
-            return data
-        else:
-            print(f"❌ Error fetching results: {response.status_code}")
-            return {}
-    except Exception as e:
-        print(f"❌ Error contacting backend: {e}")
-        return {}
-
-def get_results_from_db(market_id: str) -> Dict:
-    """Fallback: Get results from HorseMarketBook"""
-    try:
-        conn = psycopg2.connect(host="localhost", database="betfairmarket", user="clairegrady")
-        cursor = conn.cursor()
-        
-        # Get distinct selection IDs and their status/BSP with placing info
-        cursor.execute("""
-            SELECT DISTINCT SelectionId, RUNNER_NAME, Status, BSP, STALL_DRAW, PlacedDate
-            FROM HorseMarketBook
-            WHERE MarketId = ?
-            AND Status IS NOT NULL
-        """, (market_id,))
-        
-        results = []
-        for sel_id, runner_name, status, bsp, barrier, placed_date in cursor.fetchall():
-            # Clean saddle cloth number from name
-            import re
-            clean_name = re.sub(r'^\d+\.\s*', '', runner_name) if runner_name else f'Horse {sel_id}'
-            
-            # Determine finishing position based on status
-            finishing_position = None
-            if status == 'WINNER':
-                finishing_position = 1
-            elif status == 'PLACED':
-                finishing_position = 2  # Could be 2nd or 3rd
-            
-            results.append({
-                'selectionId': sel_id,
-                'runnerName': clean_name,
-                'status': status,
-                'bsp': bsp,
-                'barrier': barrier,
-                'finishingPosition': finishing_position
-            })
-        
-        conn.close()
-        return results if results else None
-        
-    except Exception as e:
-        print(f"   ⚠️  Error getting results from DB: {e}")
-        return None
-
-def update_bet_result(bet_id: int, result: str, finishing_position: int, pnl: float, bsp: float = None):
-    """Update a LAY bet with its result"""
-    conn = get_db_connection('betfair_trades')
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        UPDATE paper_trades
-        SET result = ?, finishing_position = ?, profit_loss = ?, bsp = ?
-        WHERE id = ?
-    """, (result, finishing_position, pnl, bsp, bet_id))
-    
-    conn.commit()
-    conn.close()
-
 def check_results():
     """Main function to check and settle horse racing LAY paper bets"""
     print("\n🏇 Checking Horse Racing LAY Betting Paper Trading Results\n")
@@ -144,137 +62,53 @@ def check_results():
     
     print(f"📊 Found {len(unsettled_bets)} unsettled LAY bets\n")
     
-    # Group bets by market_id
-    bets_by_market = {}
-    for bet in unsettled_bets:
-        market_id = bet['market_id']
-        if market_id not in bets_by_market:
-            bets_by_market[market_id] = []
-        bets_by_market[market_id].append(bet)
-    
-    print(f"📋 Checking {len(bets_by_market)} unique markets...\n")
-    
-    # Try backend API first, fall back to DB
-    market_ids = list(bets_by_market.keys())
-    all_markets = {}
-    
-    # Try backend API in batches
-    BATCH_SIZE = 5
-    for i in range(0, len(market_ids), BATCH_SIZE):
-        batch = market_ids[i:i+BATCH_SIZE]
-        print(f"🔍 Fetching batch {i//BATCH_SIZE + 1} ({len(batch)} markets)...")
-        results_data = fetch_settled_results(batch)
-        
-        if results_data and 'markets' in results_data:
-            all_markets.update(results_data['markets'])
+    bets = pd.DataFrame(unsettled_bets)
+    market_ids = bets['market_id'].unique().tolist()
+    print(f"📋 Checking {len(market_ids)} unique markets...\n")
     
-    print(f"✅ Fetched {len(all_markets)} markets from API")
+    # Backend API first, then one DB query for every market it didn't return
+    all_markets = get_market_results(market_ids, sport='horse', batch_size=25, log=print)
+    print()
     
-    # For markets not found in API, try database
-    missing_markets = [mid for mid in market_ids if mid not in all_markets]
-    if missing_markets:
-        print(f"🔍 Checking {len(missing_markets)} markets in database...")
-        for market_id in missing_markets:
-            db_results = get_results_from_db(market_id)
-            if db_results:
-                all_markets[market_id] = db_results
+    # Settled = at least one runner off ACTIVE AND a WINNER
+    settled, pending_markets = settle_bets(bets, all_markets, require_winner=True)
     
-    print(f"✅ Total markets found: {len(all_markets)}\n")
-    
-    # Process each market
-    total_bets_settled = 0
-    total_pnl = 0.0
-    wins = 0  # For LAY bets, a "win" means the horse LOST
-    losses = 0  # For LAY bets, a "loss" means the horse WON
-    
-    for market_id, market_bets in bets_by_market.items():
+    for market_id in pending_markets:
         if market_id not in all_markets:
             print(f"⚠️  Market {market_id} not yet settled or not found")
-            continue
-        
-        market_results = all_markets[market_id]
-        
-        # Check if settled - must have at least one WINNER
-        settled_horses = [r for r in market_results if r.get('status') and r.get('status') != 'ACTIVE']
-        winners = [r for r in market_results if r.get('status') == 'WINNER']
-        
-        if not settled_horses or not winners:
-            print(f"\n⏳ Race: {market_bets[0]['venue']} R{market_bets[0]['race_number']}")
+        else:
+            market_bets = bets[bets['market_id'] == market_id]
+            print(f"\n⏳ Race: {market_bets['venue'].iloc[0]} R{market_bets['race_number'].iloc[0]}")
             print(f"   ⚠️  NOT SETTLED YET (no winner found) - skipping...")
-            continue
-        
-        # Create lookup by selection_id
-        results_lookup = {r['selectionId']: r for r in market_results}
-        
-        # Find placed horses (winners already found above)
-        placed = [r for r in market_results if r.get('status') == 'PLACED']
-        winner_ids = [r['selectionId'] for r in winners]
-        placed_ids = [r['selectionId'] for r in placed]
-        winner_names = [r.get('runnerName') or f"Horse {r['selectionId']}" for r in winners]
-        placed_names = [r.get('runnerName') or f"Horse {r['selectionId']}" for r in placed]
+    
+    for market_id, market_bets in settled.groupby('market_id', sort=False):
+        market_results = all_markets[market_id]
+        winner_names = [r.get('runnerName') or f"Horse {r['selectionId']}" for r in market_results if r.get('status') == 'WINNER']
+        placed_names = [r.get('runnerName') or f"Horse {r['selectionId']}" for r in market_results if r.get('status') == 'PLACED']
+        first = market_bets.iloc[0]
         
-        print(f"\n🏁 Race: {market_bets[0]['venue']} ({market_bets[0]['country']}) - R{market_bets[0]['race_number']}")
+        print(f"\n🏁 Race: {first['venue']} ({first['country']}) - R{first['race_number']}")
         print(f"   Market ID: {market_id}")
         print(f"   🏆 Winner: {', '.join(winner_names)}")
         if placed_names:
             print(f"   🥈 Placed: {', '.join(placed_names)}")
         print(f"   LAY Bets on this race: {len(market_bets)}")
         
-        for bet in market_bets:
-            bet_id = bet['id']
-            selection_id = bet['selection_id']
-            stake = bet['stake']
-            liability = bet['liability']
-            odds_taken = bet['odds']
-            horse_name = bet['horse_name']
-            position = bet['position_in_market']
-            
-            # Get result for this horse
-            horse_result = results_lookup.get(selection_id)
-            if not horse_result:
-                print(f"   ⚠️  {horse_name} (Pos {position}): No result found")
-                continue
-            
-            # Determine finishing position
-            horse_status = horse_result.get('status', 'UNKNOWN')
-            horse_won = selection_id in winner_ids
-            horse_placed = selection_id in placed_ids
-            
-            if horse_won:
-                finishing_position = 1
-            elif horse_placed:
-                # If placed, assign 2 or 3
-                placed_index = placed_ids.index(selection_id) if selection_id in placed_ids else 0
-                finishing_position = 2 + placed_index
-            else:
-                finishing_position = 0  # Did not place
-            
-            # Get ACTUAL BSP from settled market results (not projections)
-            bsp_value = None
-            if horse_result.get('bsp') is not None:
-                bsp_value = horse_result.get('bsp')  # Already in results from API
-            
-            # For LAY bets:
-            # - If horse WON, we LOSE the liability
-            # - If horse LOST (including placed), we WIN the stake
-            
-            if horse_won:
-                # Horse won, so our LAY bet loses
-                pnl = -liability
-                result = 'lost'
-                losses += 1
-                print(f"   ❌ {horse_name} (Pos {position} LAY): LOST ${abs(pnl):.2f} @ {odds_taken:.2f} (horse WON 1st)")
+        for bet in market_bets.itertuples():
+            # For LAY bets: horse WON -> we lose the liability, horse LOST (including placed) -> we win the stake
+            if bet.result == 'lost':
+                print(f"   ❌ {bet.horse_name} (Pos {bet.position_in_market} LAY): LOST ${abs(bet.profit_loss):.2f} @ {bet.odds:.2f} (horse WON 1st)")
             else:
-                # Horse lost, so our LAY bet wins
-                pnl = stake
-                result = 'won'
-                wins += 1
-                position_text = f"{finishing_position}nd/3rd" if horse_placed else "no place"
-                print(f"   ✅ {horse_name} (Pos {position} LAY): WON ${pnl:.2f} @ {odds_taken:.2f} (horse {position_text})")
-            
-            update_bet_result(bet_id, result, finishing_position, pnl, bsp_value)
-            total_bets_settled += 1
-            total_pnl += pnl
+                position_text = f"{bet.finishing_position}nd/3rd" if bet.finishing_position > 1 else "no place"
+                print(f"   ✅ {bet.horse_name} (Pos {bet.position_in_market} LAY): WON ${bet.profit_loss:.2f} @ {bet.odds:.2f} (horse {position_text})")
+    
+    # All settlements in one UPDATE ... FROM (VALUES ...)
+    write_settlements('paper_trades', settled)
+    
+    total_bets_settled = len(settled)
+    total_pnl = float(settled['profit_loss'].sum()) if total_bets_settled else 0.0
+    wins = int((settled['result'] == 'won').sum()) if total_bets_settled else 0  # For LAY bets, a "win" means the horse LOST
+    losses = total_bets_settled - wins  # For LAY bets, a "loss" means the horse WON
     
     # Summary
     print("\n" + "="*70)
@@ -15,6 +15,9 @@ from datetime import datetime, timedelta
 import logging
 from typing import Dict, List, Optional
 from db_connection_helper import get_db_connection
+from shared_odds import SharedOddsReader
+from runner_metadata import RunnerMetadataCache
+from trade_journal import TradeJournal
 
 # Configuration
 POSITION_TO_LAY = 10  # Laying the FAVORITE
@@ -43,6 +46,9 @@ class HorseLayBetting:
         self.processed_markets = set()
         self.session = requests.Session()
         self.session.timeout = 10
+        self.shared_odds = SharedOddsReader()  # Filled by shared_odds.py serve, if it's running
+        self.runner_metadata = RunnerMetadataCache('horse')  # Names/barriers for the day's markets
+        self.trades = TradeJournal(f'horse_lay_position_{POSITION_TO_LAY}')  # Write-behind paper trades
     
     @staticmethod
     def parse_event_name(event_name: str) -> Dict:
@@ -164,26 +170,10 @@ class HorseLayBetting:
             if not price_results:
                 return None
             
-            # Get runner names and barriers
-            cursor.execute("""
-                SELECT DISTINCT selectionid, runner_name, stall_draw
-                FROM horsemarketbook
-                WHERE marketid = %s
-                AND runner_name IS NOT NULL
-            """, (market_id,))
-            runner_results = cursor.fetchall()
-            
             conn.close()
             
-            # Build lookups
-            import re
-            runner_names = {}
-            barrier_numbers = {}
-            for sel_id, runner_name, barrier in runner_results:
-                clean_name = re.sub(r'^\d+\.\s*', '', runner_name) if runner_name else f'Horse {sel_id}'
-                runner_names[sel_id] = clean_name
-                if barrier:
-                    barrier_numbers[sel_id] = barrier
+            # Names and barriers from the in-memory runner metadata cache
+            runner_names, barrier_numbers = self.runner_metadata.get(market_id)
             
             # Build odds map - take best (lowest) lay price per selection
             runners_dict = {}
@@ -206,39 +196,25 @@ class HorseLayBetting:
     def get_odds_and_runners(self, market_id: str) -> Optional[Dict]:
         """Get current odds for all runners (tries API first, then MarketBookLayprices fallback)"""
         try:
-            url = f"{BACKEND_URL}/api/horse-racing/market-book/{market_id}"
-            response = self.session.get(url, timeout=10)
-            
-            if response.status_code != 200:
-                logger.debug(f"API returned {response.status_code}, trying MarketBookLayprices fallback")
-                return self.get_odds_from_db(market_id)
-            
-            data = response.json()
-            runners = data.get('runners', [])
+            # Host-wide shared odds cache first (utilities/shared_odds.py serve), then the API
+            market_book = self.shared_odds.market_book(market_id)
+            if market_book is None:
+                url = f"{BACKEND_URL}/api/horse-racing/market-book/{market_id}"
+                response = self.session.get(url, timeout=10)
+                
+                if response.status_code != 200:
+                    logger.debug(f"API returned {response.status_code}, trying MarketBookLayprices fallback")
+                    return self.get_odds_from_db(market_id)
+                
+                market_book = response.json()
+            runners = market_book.get('runners', [])
             
             if not runners:
                 logger.debug("No runners from API, trying MarketBookLayprices fallback")
                 return self.get_odds_from_db(market_id)
             
-            # Get runner names and barriers from HorseMarketBook table
-            conn = get_db_connection("betfairmarket")
-            cursor = conn.cursor()
-            cursor.execute("""
-                SELECT DISTINCT selectionid, runner_name, stall_draw
-                FROM horsemarketbook
-                WHERE marketid = %s
-            """, (market_id,))
-            
-            import re
-            runner_names = {}
-            barrier_numbers = {}
-            for sel_id, runner_name, barrier in cursor.fetchall():
-                if runner_name:
-                    clean_name = re.sub(r'^\d+\.\s*', '', runner_name)
-                    runner_names[sel_id] = clean_name
-                if barrier:
-                    barrier_numbers[sel_id] = barrier
-            conn.close()
+            # Runner names and barriers from the in-memory metadata cache (no SQL per tick)
+            runner_names, barrier_numbers = self.runner_metadata.get(market_id)
             
             # Build odds map
             odds_map = []
@@ -264,53 +240,27 @@ class HorseLayBetting:
             return self.get_odds_from_db(market_id)
     
     def place_lay_bet(self, race_info: Dict, horse: Dict, position: int):
-        """Record a lay bet"""
+        """Record a lay bet (journaled locally; written to the DB in the background)"""
         try:
-            # Get total matched from MarketCatalogue
-            total_matched = None
-            try:
-                betfair_conn = get_db_connection("betfairmarket")
-                betfair_cursor = betfair_conn.cursor()
-                betfair_cursor.execute("""
-                    SELECT totalmatched FROM marketcatalogue WHERE marketid = %s
-                """, (race_info['market_id'],))
-                result = betfair_cursor.fetchone()
-                if result:
-                    total_matched = result[0]
-                betfair_conn.close()
-            except Exception as e:
-                logger.debug(f"Could not fetch TotalMatched: {e}")
-            
-            conn = get_db_connection('betfair_trades')
-            cursor = conn.cursor()
-            
             liability = FLAT_STAKE * (horse['odds'] - 1)
             
-            cursor.execute("""
-                INSERT INTO paper_trades_horses
-                (date, venue, country, race_number, market_id, selection_id, horse_name, barrier_number,
-                 position_in_market, odds, stake, liability, finishing_position, result, total_matched)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (
-                datetime.now().strftime('%Y-%m-%d'),
-                race_info['venue'],
-                race_info['country'],
-                race_info['race_number'],
-                race_info['market_id'],
-                horse['selection_id'],
-                horse['horse_name'],
-                horse.get('barrier'),  # Get barrier number from horse data
-                position,
-                horse['odds'],
-                FLAT_STAKE,
-                liability,
-                0,  # Will be updated later
-                'pending',
-                total_matched
-            ))
-            
-            conn.commit()
-            conn.close()
+            self.trades.record('paper_trades_horses', {
+                'date': datetime.now().strftime('%Y-%m-%d'),
+                'venue': race_info['venue'],
+                'country': race_info['country'],
+                'race_number': race_info['race_number'],
+                'market_id': race_info['market_id'],
+                'selection_id': horse['selection_id'],
+                'horse_name': horse['horse_name'],
+                'barrier_number': horse.get('barrier'),  # Get barrier number from horse data
+                'position_in_market': position,
+                'odds': horse['odds'],
+                'stake': FLAT_STAKE,
+                'liability': liability,
+                'finishing_position': 0,  # Will be updated later
+                'result': 'pending',
+                'total_matched': self.runner_metadata.total_matched(race_info['market_id'])  # From MarketCatalogue
+            })
             
             barrier_info = f" [Barrier {horse.get('barrier')}]" if horse.get('barrier') else ""
             logger.info(f"✅ LAY BET: {horse['horse_name']}{barrier_info} (ID: {horse['selection_id']}) @ {horse['odds']} (Position {position}) - Liability: ${liability:.2f}")
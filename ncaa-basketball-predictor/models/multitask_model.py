@@ -151,30 +151,41 @@ class MultiTaskNCAAModel(nn.Module):
             dict with predictions and confidence levels
         """
         with torch.no_grad():
-            outputs = self.forward(x)
-            
-            # Calculate confidence from quantile spread
-            margin_confidence = self._calculate_confidence(
-                outputs['margin'], 
-                expected_range=30.0  # Typical margin range in basketball
-            )
-            
-            totals_confidence = self._calculate_confidence(
-                outputs['totals'],
-                expected_range=40.0  # Typical totals range
-            )
+            return self.outputs_with_confidence(self.forward(x))
+    
+    def outputs_with_confidence(self, outputs):
+        """
+        predict_with_confidence's result from forward() outputs - also used
+        with the outputs of a TorchScript-compiled copy of the model.
+        
+        Args:
+            outputs: dict from forward()
             
-            return {
-                'winner_prob': outputs['winner'].cpu().numpy(),
-                'margin_pred': outputs['margin'][:, 1].cpu().numpy(),  # 50th percentile
-                'margin_lower': outputs['margin'][:, 0].cpu().numpy(),  # 10th percentile
-                'margin_upper': outputs['margin'][:, 2].cpu().numpy(),  # 90th percentile
-                'margin_confidence': margin_confidence,
-                'totals_pred': outputs['totals'][:, 1].cpu().numpy(),
-                'totals_lower': outputs['totals'][:, 0].cpu().numpy(),
-                'totals_upper': outputs['totals'][:, 2].cpu().numpy(),
-                'totals_confidence': totals_confidence
-            }
+        Returns:
+            dict with predictions and confidence levels (numpy arrays)
+        """
+        # Calculate confidence from quantile spread
+        margin_confidence = self._calculate_confidence(
+            outputs['margin'], 
+            expected_range=30.0  # Typical margin range in basketball
+        )
+        
+        totals_confidence = self._calculate_confidence(
+            outputs['totals'],
+            expected_range=40.0  # Typical totals range
+        )
+        
+        return {
+            'winner_prob': outputs['winner'].cpu().numpy(),
+            'margin_pred': outputs['margin'][:, 1].cpu().numpy(),  # 50th percentile
+            'margin_lower': outputs['margin'][:, 0].cpu().numpy(),  # 10th percentile
+            'margin_upper': outputs['margin'][:, 2].cpu().numpy(),  # 90th percentile
+            'margin_confidence': margin_confidence,
+            'totals_pred': outputs['totals'][:, 1].cpu().numpy(),
+            'totals_lower': outputs['totals'][:, 0].cpu().numpy(),
+            'totals_upper': outputs['totals'][:, 2].cpu().numpy(),
+            'totals_confidence': totals_confidence
+        }
     
     def _calculate_confidence(self, quantiles, expected_range):
         """
@@ -5,6 +5,11 @@ NCAA Basketball Paper Trading Script
 - Loads trained models (XGBoost + Multi-task Neural Network)
 - Makes predictions with confidence intervals
 - Simulates paper trades with Kelly Criterion bet sizing
+
+Predictions are made for the whole slate at once (predict_games): one feature
+matrix, one scaler transform, one XGBoost call and one forward pass under
+torch.inference_mode - optionally through a TorchScript-compiled copy of the
+network (--torchscript).
 """
 
 import sys
@@ -24,7 +29,7 @@ from sklearn.preprocessing import StandardScaler
 
 # Import our models
 from models.multitask_model import create_model
-from pipelines.feature_engineering_v2 import build_features_for_game
+from pipelines.feature_engineering_v2 import FeatureService
 
 logging.basicConfig(
     level=logging.INFO,
@@ -144,7 +149,7 @@ def update_lineups_for_game(game_id, home_team, away_team, season):
         return False
 
 
-def load_models():
+def load_models(torchscript=False):
     """Load trained models (XGBoost and Multi-task Neural Network)"""
     models = {}
     
@@ -181,91 +186,132 @@ def load_models():
             'feature_cols': feature_cols
         }
         logger.info("✅ Loaded Multi-task Neural Network")
+        
+        if torchscript:
+            # Scripted, frozen forward pass for CPU inference (confidence is still computed by the model)
+            try:
+                models['multitask']['compiled'] = torch.jit.optimize_for_inference(torch.jit.script(model))
+                logger.info("✅ Compiled Multi-task Neural Network with TorchScript")
+            except Exception as e:
+                logger.warning(f"⚠️ TorchScript compilation failed, using eager mode: {e}")
     else:
         logger.warning("⚠️ Multi-task model not found")
     
     return models
 
 
-def make_prediction(game, models):
+def xgboost_feature_columns(models, features):
     """
-    Make prediction for a game using ensemble of models.
-    Returns dict with predictions and confidence levels.
+    Column order for the XGBoost model: its feature names if it was fitted
+    on a DataFrame, else the multi-task model's feature_cols when the counts
+    match, else the order the features were built in
     """
-    try:
-        # Build features for the game
-        features = build_features_for_game(
-            game['game_id'],
-            game['home_team_name'],
-            game['away_team_name'],
-            game['game_date'],
-            game['season']
-        )
-        
+    xgb_model = models['xgboost']
+    names = getattr(xgb_model, 'feature_names_in_', None)
+    if names is not None:
+        return list(names)
+    
+    if 'multitask' in models and len(models['multitask']['feature_cols']) == getattr(xgb_model, 'n_features_in_', None):
+        return models['multitask']['feature_cols']
+    
+    return list(features.columns)
+
+
+def feature_matrix(features, columns):
+    """Feature rows as a float matrix in `columns` order (missing features are 0.0)"""
+    return features.reindex(columns=columns, fill_value=0.0).to_numpy(dtype=np.float64)
+
+
+def predict_games(games, models, feature_service):
+    """
+    Make predictions for a slate of games using ensemble of models: one
+    feature build, one scaler transform, one XGBoost call and one forward pass.
+    Returns a DataFrame with one row per game whose features could be built.
+    """
+    features_list = feature_service.build_features_for_games(games)
+    
+    predicted_games = []
+    for game, features in zip(games, features_list):
         if features is None:
             logger.warning(f"Could not build features for game {game['game_id']}")
-            return None
-        
-        predictions = {
-            'game_id': game['game_id'],
-            'home_team': game['home_team_name'],
-            'away_team': game['away_team_name'],
-            'game_date': game['game_date']
-        }
-        
-        # XGBoost prediction (winner only)
-        if 'xgboost' in models:
-            xgb_model = models['xgboost']
-            xgb_prob = xgb_model.predict_proba([features])[0][1]  # Probability of home win
-            predictions['xgb_win_prob'] = float(xgb_prob)
-        
-        # Multi-task Neural Network prediction
-        if 'multitask' in models:
+        else:
+            predicted_games.append((game, features))
+    
+    if not predicted_games:
+        return pd.DataFrame()
+    
+    features = pd.DataFrame([features for _, features in predicted_games])
+    predictions = pd.DataFrame({
+        'game_id': [game['game_id'] for game, _ in predicted_games],
+        'home_team': [game['home_team_name'] for game, _ in predicted_games],
+        'away_team': [game['away_team_name'] for game, _ in predicted_games],
+        'game_date': [game['game_date'] for game, _ in predicted_games],
+    })
+    
+    # XGBoost prediction (winner only)
+    if 'xgboost' in models:
+        try:
+            X = feature_matrix(features, xgboost_feature_columns(models, features))
+            predictions['xgb_win_prob'] = models['xgboost'].predict_proba(X)[:, 1].astype(np.float64)  # Probability of home win
+        except Exception as e:
+            logger.error(f"XGBoost prediction failed: {e}")
+    
+    # Multi-task Neural Network prediction
+    if 'multitask' in models:
+        try:
             mt_model = models['multitask']['model']
             scaler = models['multitask']['scaler']
             feature_cols = models['multitask']['feature_cols']
             
-            # Ensure features are in correct order
-            features_array = np.array([features[col] if col in features else 0.0 
-                                       for col in feature_cols]).reshape(1, -1)
-            features_scaled = scaler.transform(features_array)
-            features_tensor = torch.FloatTensor(features_scaled)
+            features_scaled = scaler.transform(feature_matrix(features, feature_cols))
+            features_tensor = torch.from_numpy(features_scaled).float()
             
-            with torch.no_grad():
-                mt_predictions = mt_model.predict_with_confidence(features_tensor)
-                
-                predictions['mt_win_prob'] = float(mt_predictions['winner_prob'][0][0])
-                predictions['margin_pred'] = float(mt_predictions['margin_pred'][0])
-                predictions['margin_lower'] = float(mt_predictions['margin_lower'][0])
-                predictions['margin_upper'] = float(mt_predictions['margin_upper'][0])
-                predictions['margin_confidence'] = float(mt_predictions['margin_confidence'][0])
-                predictions['total_pred'] = float(mt_predictions['totals_pred'][0])
-                predictions['total_lower'] = float(mt_predictions['totals_lower'][0])
-                predictions['total_upper'] = float(mt_predictions['totals_upper'][0])
-                predictions['total_confidence'] = float(mt_predictions['totals_confidence'][0])
-        
-        # Ensemble: average XGBoost and Multi-task win probabilities
-        if 'xgb_win_prob' in predictions and 'mt_win_prob' in predictions:
-            predictions['win_prob'] = (predictions['xgb_win_prob'] + predictions['mt_win_prob']) / 2
-        elif 'mt_win_prob' in predictions:
-            predictions['win_prob'] = predictions['mt_win_prob']
-        elif 'xgb_win_prob' in predictions:
-            predictions['win_prob'] = predictions['xgb_win_prob']
-        else:
-            logger.warning("No valid predictions available")
-            return None
-        
-        # Determine predicted winner
-        predictions['predicted_winner'] = (
-            game['home_team_name'] if predictions['win_prob'] > 0.5 
-            else game['away_team_name']
-        )
-        
-        return predictions
-        
-    except Exception as e:
-        logger.error(f"Error making prediction for game {game['game_id']}: {e}")
+            with torch.inference_mode():
+                if 'compiled' in models['multitask']:
+                    mt_predictions = mt_model.outputs_with_confidence(models['multitask']['compiled'](features_tensor))
+                else:
+                    mt_predictions = mt_model.predict_with_confidence(features_tensor)
+            
+            predictions['mt_win_prob'] = mt_predictions['winner_prob'][:, 0]
+            predictions['margin_pred'] = mt_predictions['margin_pred']
+            predictions['margin_lower'] = mt_predictions['margin_lower']
+            predictions['margin_upper'] = mt_predictions['margin_upper']
+            predictions['margin_confidence'] = mt_predictions['margin_confidence']
+            predictions['total_pred'] = mt_predictions['totals_pred']
+            predictions['total_lower'] = mt_predictions['totals_lower']
+            predictions['total_upper'] = mt_predictions['totals_upper']
+            predictions['total_confidence'] = mt_predictions['totals_confidence']
+        except Exception as e:
+            logger.error(f"Multi-task prediction failed: {e}")
+    
+    # Ensemble: average XGBoost and Multi-task win probabilities
+    prob_cols = [c for c in ('xgb_win_prob', 'mt_win_prob') if c in predictions]
+    if not prob_cols:
+        logger.warning("No valid predictions available")
+        return pd.DataFrame()
+    
+    # float64 throughout, so values can be written to SQLite as-is
+    model_cols = [c for c in predictions.columns if c not in ('game_id', 'home_team', 'away_team', 'game_date')]
+    predictions[model_cols] = predictions[model_cols].astype(np.float64)
+    predictions['win_prob'] = predictions[prob_cols].mean(axis=1)
+    
+    # Determine predicted winner
+    predictions['predicted_winner'] = np.where(
+        predictions['win_prob'] > 0.5, predictions['home_team'], predictions['away_team']
+    )
+    
+    return predictions
+
+
+def make_prediction(game, models, feature_service):
+    """
+    Make prediction for a single game (see predict_games).
+    Returns dict with predictions and confidence levels, or None.
+    """
+    predictions = predict_games([game], models, feature_service)
+    if predictions.empty:
         return None
+    return predictions.to_dict('records')[0]
 
 
 def kelly_criterion(win_prob, odds, fraction=0.25):
@@ -391,7 +437,7 @@ def save_paper_trade(prediction, odds_data, stake_info):
     logger.info(f"   Win Prob: {prediction['win_prob']:.1%}")
 
 
-def main(hours_ahead=8, min_edge=0.05, min_confidence=0.6, bankroll=1000.0):
+def main(hours_ahead=8, min_edge=0.05, min_confidence=0.6, bankroll=1000.0, torchscript=False):
     """Main paper trading loop"""
     logger.info("\n" + "="*70)
     logger.info("NCAA BASKETBALL PAPER TRADING")
@@ -407,7 +453,7 @@ def main(hours_ahead=8, min_edge=0.05, min_confidence=0.6, bankroll=1000.0):
     
     # Load models
     logger.info("\nLoading models...")
-    models = load_models()
+    models = load_models(torchscript=torchscript)
     
     if not models:
         logger.error("❌ No models loaded. Cannot make predictions.")
@@ -421,30 +467,34 @@ def main(hours_ahead=8, min_edge=0.05, min_confidence=0.6, bankroll=1000.0):
         logger.info("No upcoming games found")
         return
     
-    # Process each game
-    trades_made = 0
+    # One feature service for the run: lineup updates invalidate the teams' player aggregates
+    feature_service = FeatureService()
+    
+    logger.info("\nChecking for lineup updates...")
     for game in games:
-        logger.info("\n" + "-"*70)
-        logger.info(f"Game: {game['away_team_name']} @ {game['home_team_name']}")
-        logger.info(f"Date: {game['game_date']}")
-        logger.info(f"ID: {game['game_id']}")
-        
-        # Update lineups
-        logger.info("Checking for lineup updates...")
         lineup_updated = update_lineups_for_game(
             game['game_id'],
             game['home_team_name'],
             game['away_team_name'],
             game['season']
         )
-        
-        # Make prediction
-        logger.info("Making prediction...")
-        prediction = make_prediction(game, models)
-        
-        if prediction is None:
-            logger.warning("⚠️ Could not make prediction for this game")
-            continue
+        if lineup_updated:
+            feature_service.invalidate(game['home_team_name'], game['season'])
+            feature_service.invalidate(game['away_team_name'], game['season'])
+    
+    # Predict the whole slate at once
+    logger.info(f"\nMaking predictions for {len(games)} games...")
+    predictions = predict_games(games, models, feature_service)
+    games_by_id = {game['game_id']: game for game in games}
+    
+    # Process each prediction
+    trades_made = 0
+    for prediction in predictions.to_dict('records'):
+        game = games_by_id[prediction['game_id']]
+        logger.info("\n" + "-"*70)
+        logger.info(f"Game: {game['away_team_name']} @ {game['home_team_name']}")
+        logger.info(f"Date: {game['game_date']}")
+        logger.info(f"ID: {game['game_id']}")
         
         logger.info(f"Predicted winner: {prediction['predicted_winner']} "
                    f"(prob: {prediction['win_prob']:.1%})")
@@ -483,9 +533,11 @@ def main(hours_ahead=8, min_edge=0.05, min_confidence=0.6, bankroll=1000.0):
     
     logger.info("\n" + "="*70)
     logger.info(f"✅ Paper trading complete!")
-    logger.info(f"   Processed {len(games)} games")
+    logger.info(f"   Processed {len(games)} games ({len(predictions)} predicted)")
     logger.info(f"   Made {trades_made} paper trades")
+    logger.info(f"   Feature cache: {feature_service.stats()}")
     logger.info("="*70)
+    feature_service.close()
 
 
 if __name__ == '__main__':
@@ -496,6 +548,7 @@ if __name__ == '__main__':
     parser.add_argument('--min-edge', type=float, default=0.05, help='Minimum edge required')
     parser.add_argument('--min-confidence', type=float, default=0.6, help='Minimum confidence required')
     parser.add_argument('--bankroll', type=float, default=1000.0, help='Starting bankroll')
+    parser.add_argument('--torchscript', action='store_true', help='Run the multi-task network through TorchScript')
     
     args = parser.parse_args()
     
@@ -503,6 +556,7 @@ if __name__ == '__main__':
         hours_ahead=args.hours,
         min_edge=args.min_edge,
         min_confidence=args.min_confidence,
-        bankroll=args.bankroll
+        bankroll=args.bankroll,
+        torchscript=args.torchscript
     )
 
@@ -20,6 +20,12 @@ Design Principles:
 - Proper handling of missing data
 - Comprehensive logging
 - Efficient computation
+
+The training dataset is built set-based: each source table is read once for
+the seasons involved and joined onto all games with merges (recent form on the
+snapshot taken as of the game date, as in get_recent_form). The per-game
+get_* / build_game_features methods are kept for looking at a single game and
+produce the same features.
 """
 
 import sqlite3
@@ -28,8 +34,7 @@ import numpy as np
 from pathlib import Path
 from datetime import datetime, timedelta
 import logging
-from typing import Dict, Optional, Tuple
-from tqdm import tqdm
+from typing import Dict, List, Optional, Tuple
 
 logging.basicConfig(
     level=logging.INFO,
@@ -39,6 +44,33 @@ logger = logging.getLogger(__name__)
 
 DB_PATH = Path(__file__).parent.parent / "ncaa_basketball.db"
 
+# Season tables keyed by KenPom team name: source column -> (feature, default for NULL)
+KENPOM_FEATURES = {
+    'adj_em': ('kp_adj_em', 0), 'adj_o': ('kp_adj_oe', 100), 'adj_d': ('kp_adj_de', 100),
+    'adj_tempo': ('kp_adj_tempo', 68), 'luck': ('kp_luck', 0), 'sos': ('kp_sos', 0),
+    'soso': ('kp_sos_o', 0), 'sosd': ('kp_sos_d', 0), 'rank': ('kp_rank', 200),
+}
+FOUR_FACTORS_FEATURES = {
+    'efg_pct': ('ff_efg', 0.5), 'to_pct': ('ff_to', 0.2), 'or_pct': ('ff_or', 0.3), 'ft_rate': ('ff_ftr', 0.3),
+    'def_efg_pct': ('ff_def_efg', 0.5), 'def_to_pct': ('ff_def_to', 0.2), 'dor_pct': ('ff_def_or', 0.3),
+    'def_ft_rate': ('ff_def_ftr', 0.3),
+}
+TEAM_METRICS_FEATURES = {
+    'avg_height': ('tm_height', 75), 'eff_height': ('tm_height_eff', 75), 'experience': ('tm_experience', 1.5),
+    'bench_strength': ('tm_bench', 0), 'continuity': ('tm_continuity', 0.5),
+}
+MISC_STATS_FEATURES = {
+    'fg3_pct': ('shoot_3p', 0.33), 'fg2_pct': ('shoot_2p', 0.48), 'ft_pct': ('shoot_ft', 0.70),
+}
+
+FORM_FEATURES = ['form_last5_wp', 'form_last5_margin', 'form_last10_wp', 'form_last10_margin',
+                 'form_streak', 'form_rest_days']
+H2H_FEATURES = {'h2h_games': 0, 'h2h_win_pct': 0.5, 'h2h_avg_margin': 0, 'h2h_rivalry': 0, 'h2h_same_conf': 0}
+ROTATION_FEATURES = ['rot_top5_ortg', 'rot_top5_usage', 'rot_bench_ortg', 'rot_depth', 'rot_balance',
+                     'rot_total_players']
+GAME_COLUMNS = ['game_id', 'game_date', 'season', 'home_team_id', 'away_team_id', 'home_team_name',
+                'away_team_name', 'home_score', 'away_score', 'home_win', 'margin']
+
 
 class FeatureEngineer:
     """Builds comprehensive features for NCAA Basketball prediction"""
@@ -471,6 +503,240 @@ class FeatureEngineer:
         
         return features
     
+    # ------------------------------------------------------------------
+    # Set-based loaders: one query per source table for all games
+    # ------------------------------------------------------------------
+    
+    @staticmethod
+    def _season_params(seasons: List[int]) -> Tuple[str, List[int]]:
+        return ','.join('?' * len(seasons)), [int(s) for s in seasons]
+    
+    def load_kenpom_names(self) -> pd.Series:
+        """ESPN team name -> KenPom team name (first mapping per name, like get_kenpom_name)"""
+        mapping = pd.read_sql_query(
+            "SELECT our_team_name, kenpom_team_name FROM team_name_mapping", self.conn
+        ).drop_duplicates('our_team_name')
+        return mapping.set_index('our_team_name')['kenpom_team_name']
+    
+    def load_season_table(self, table: str, features: Dict[str, Tuple[str, float]], seasons: List[int]) -> pd.DataFrame:
+        """One row per (kenpom_name, season) from a KenPom season table, NULLs filled with the feature defaults"""
+        placeholders, params = self._season_params(seasons)
+        query = f"""
+            SELECT team_name AS kenpom_name, season, {', '.join(features)}
+            FROM {table}
+            WHERE season IN ({placeholders})
+        """
+        
+        df = pd.read_sql_query(query, self.conn, params=params)
+        df = df.drop_duplicates(['kenpom_name', 'season'])
+        df = df.rename(columns={column: feature for column, (feature, _) in features.items()})
+        return df.fillna({feature: default for feature, default in features.values()})
+    
+    def load_recent_form_table(self, seasons: List[int]) -> pd.DataFrame:
+        """All recent_form snapshots for the seasons, with the form_* features computed"""
+        placeholders, params = self._season_params(seasons)
+        query = f"""
+            SELECT 
+                team_id, season, as_of_date,
+                last5_wins, last5_losses, last5_avg_margin,
+                last10_wins, last10_losses, last10_avg_margin,
+                current_win_streak, current_loss_streak,
+                days_since_last_game
+            FROM recent_form
+            WHERE season IN ({placeholders})
+        """
+        
+        form = pd.read_sql_query(query, self.conn, params=params)
+        
+        last5_total = form['last5_wins'] + form['last5_losses']
+        last10_total = form['last10_wins'] + form['last10_losses']
+        form['form_last5_wp'] = (form['last5_wins'] / last5_total).where(last5_total > 0, 0.5)
+        form['form_last5_margin'] = form['last5_avg_margin'].fillna(0)
+        form['form_last10_wp'] = (form['last10_wins'] / last10_total).where(last10_total > 0, 0.5)
+        form['form_last10_margin'] = form['last10_avg_margin'].fillna(0)
+        # Positive for a win streak, negative for a loss streak
+        form['form_streak'] = form['current_win_streak'].where(
+            form['current_win_streak'] > 0, -form['current_loss_streak']
+        )
+        form['form_rest_days'] = form['days_since_last_game'].fillna(2)
+        
+        form['as_of_date'] = pd.to_datetime(form['as_of_date'])
+        return form[['team_id', 'season', 'as_of_date'] + FORM_FEATURES].sort_values('as_of_date')
+    
+    def load_head_to_head_table(self) -> pd.DataFrame:
+        query = """
+            SELECT 
+                team1_id, team2_id,
+                games_played, team1_wins,
+                avg_margin, is_rivalry, same_conference
+            FROM head_to_head
+        """
+        
+        return pd.read_sql_query(query, self.conn).drop_duplicates(['team1_id', 'team2_id'])
+    
+    def load_rotation_table(self, seasons: List[int]) -> pd.DataFrame:
+        """get_player_rotation_features for every (team_id, season) with 5+ rated players"""
+        placeholders, params = self._season_params(seasons)
+        query = f"""
+            SELECT 
+                p.team_id,
+                ps.season,
+                ps.offensive_rating,
+                ps.usage_rate,
+                ps.minutes_played,
+                ps.games_played
+            FROM player_stats ps
+            JOIN players p ON ps.player_id = p.player_id
+            WHERE ps.season IN ({placeholders})
+                AND ps.offensive_rating IS NOT NULL
+                AND ps.usage_rate IS NOT NULL
+        """
+        
+        players = pd.read_sql_query(query, self.conn, params=params)
+        keys = ['team_id', 'season']
+        
+        # Rank players within each team by actual playing time (games * minutes)
+        players['total_minutes'] = players['games_played'] * players['minutes_played'].fillna(20)
+        players = players.sort_values(keys + ['total_minutes'], ascending=[True, True, False], kind='stable')
+        players['slot'] = players.groupby(keys).cumcount()
+        players['n_players'] = players.groupby(keys)['slot'].transform('size')
+        players = players[players['n_players'] >= 5]
+        
+        def weighted_mean(frame: pd.DataFrame, column: str) -> pd.Series:
+            """Minutes-weighted mean per team, plain mean where the team's minutes sum to 0"""
+            weighted = (frame[column] * frame['total_minutes']).groupby([frame['team_id'], frame['season']]).sum()
+            grouped = frame.groupby(keys)
+            weights = grouped['total_minutes'].sum()
+            return (weighted / weights).where(weights > 0, grouped[column].mean())
+        
+        top5 = players[players['slot'] < 5]
+        bench = players[(players['slot'] >= 5) & (players['slot'] < 10)]
+        grouped = players.groupby(keys)
+        
+        rotation = pd.DataFrame({
+            'rot_top5_ortg': weighted_mean(top5, 'offensive_rating'),
+            'rot_top5_usage': weighted_mean(top5, 'usage_rate'),
+        })
+        rotation['rot_bench_ortg'] = weighted_mean(bench, 'offensive_rating').reindex(rotation.index).fillna(95)
+        rotation['rot_depth'] = (players['games_played'] >= 10).groupby([players['team_id'], players['season']]).sum()
+        
+        # Minutes distribution (Gini coefficient approximation) - players ascending by minutes are 1..n
+        n = grouped['slot'].size()
+        ascending_index = players['n_players'] - players['slot']
+        index_sum = (ascending_index * players['total_minutes']).groupby([players['team_id'], players['season']]).sum()
+        gini = (2 * index_sum) / (n * grouped['total_minutes'].sum()) - (n + 1) / n
+        rotation['rot_balance'] = 1.0 - gini  # Higher = more balanced
+        rotation['rot_total_players'] = n
+        
+        return rotation[ROTATION_FEATURES].reset_index()
+    
+    # ------------------------------------------------------------------
+    # Set-based feature build
+    # ------------------------------------------------------------------
+    
+    @staticmethod
+    def _merge_sides(games: pd.DataFrame, table: pd.DataFrame, key: str, features: List[str]) -> pd.DataFrame:
+        """Left-join a (key, season) table onto games twice, as home_* and away_* columns"""
+        for side in ('home', 'away'):
+            renamed = table[[key, 'season'] + features].rename(
+                columns={key: f'{side}_{key}', **{f: f'{side}_{f}' for f in features}}
+            )
+            games = games.merge(renamed, on=[f'{side}_{key}', 'season'], how='left')
+        return games
+    
+    def build_features_frame(self, games: pd.DataFrame) -> pd.DataFrame:
+        """build_game_features for every game at once - one query per source table"""
+        seasons = sorted(games['season'].unique())
+        df = games.sort_values('game_date', kind='stable').reset_index(drop=True)
+        
+        # KenPom name for each side (unmapped names are used as-is)
+        kenpom_names = self.load_kenpom_names()
+        for side in ('home', 'away'):
+            names = df[f'{side}_team_name']
+            df[f'{side}_kenpom_name'] = names.map(kenpom_names).where(names.isin(kenpom_names.index), names)
+        
+        def side_columns(features: List[str]) -> Tuple[List[str], List[str]]:
+            return [f'home_{f}' for f in features], [f'away_{f}' for f in features]
+        
+        # 1-2. KenPom ratings and Four Factors
+        kp_features = [f for f, _ in KENPOM_FEATURES.values()]
+        ff_features = [f for f, _ in FOUR_FACTORS_FEATURES.values()]
+        df = self._merge_sides(df, self.load_season_table('kenpom_ratings', KENPOM_FEATURES, seasons),
+                               'kenpom_name', kp_features)
+        df = self._merge_sides(df, self.load_season_table('four_factors', FOUR_FACTORS_FEATURES, seasons),
+                               'kenpom_name', ff_features)
+        
+        # 3. Recent form - the snapshot as of the game date only (no row -> NaN, as in get_recent_form)
+        form = self.load_recent_form_table(seasons).drop_duplicates(['team_id', 'season', 'as_of_date'])
+        df['game_dt'] = pd.to_datetime(df['game_date'])
+        for side in ('home', 'away'):
+            side_form = form.rename(columns={'team_id': f'{side}_team_id', 'as_of_date': 'game_dt',
+                                             **{f: f'{side}_{f}' for f in FORM_FEATURES}})
+            side_form[f'{side}_team_id'] = side_form[f'{side}_team_id'].astype(df[f'{side}_team_id'].dtype)
+            side_form['season'] = side_form['season'].astype(df['season'].dtype)
+            df = df.merge(side_form, on=[f'{side}_team_id', 'season', 'game_dt'], how='left')
+        
+        # 4. Head-to-head (head_to_head rows are ordered lower team ID first)
+        h2h = self.load_head_to_head_table()
+        flip = df['home_team_id'] > df['away_team_id']
+        df['team1_id'] = df['home_team_id'].where(~flip, df['away_team_id'])
+        df['team2_id'] = df['away_team_id'].where(~flip, df['home_team_id'])
+        df = df.merge(h2h, on=['team1_id', 'team2_id'], how='left')
+        flip = df['home_team_id'] > df['away_team_id']
+        found = df['games_played'].notna()
+        
+        win_pct = (df['team1_wins'] / df['games_played']).where(df['games_played'] > 0, 0.5)
+        df['h2h_games'] = df['games_played']
+        df['h2h_win_pct'] = win_pct.where(~flip, 1.0 - win_pct)
+        df['h2h_avg_margin'] = df['avg_margin'].where(~flip, -df['avg_margin'])
+        df['h2h_rivalry'] = df['is_rivalry']
+        df['h2h_same_conf'] = df['same_conference']
+        for feature, default in H2H_FEATURES.items():
+            df.loc[~found, feature] = default
+        
+        # 5. Matchup features - NaN unless both teams have the source row
+        df['matchup_em_diff'] = df['home_kp_adj_em'] - df['away_kp_adj_em']
+        df['matchup_oe_diff'] = df['home_kp_adj_oe'] - df['away_kp_adj_oe']
+        df['matchup_de_diff'] = df['away_kp_adj_de'] - df['home_kp_adj_de']  # Lower DE is better
+        df['matchup_tempo_diff'] = df['home_kp_adj_tempo'] - df['away_kp_adj_tempo']
+        df['matchup_rank_diff'] = df['away_kp_rank'] - df['home_kp_rank']  # Lower rank is better
+        df['matchup_efg_diff'] = df['home_ff_efg'] - df['away_ff_efg']
+        df['matchup_to_diff'] = df['away_ff_to'] - df['home_ff_to']  # Lower TO is better
+        df['matchup_or_diff'] = df['home_ff_or'] - df['away_ff_or']
+        df['matchup_ftr_diff'] = df['home_ff_ftr'] - df['away_ff_ftr']
+        df['matchup_form_diff'] = df['home_form_last5_wp'] - df['away_form_last5_wp']
+        
+        # 6. Team Strength
+        tm_features = [f for f, _ in TEAM_METRICS_FEATURES.values()]
+        shoot_features = [f for f, _ in MISC_STATS_FEATURES.values()]
+        df = self._merge_sides(df, self.load_season_table('team_metrics', TEAM_METRICS_FEATURES, seasons),
+                               'kenpom_name', tm_features)
+        df = self._merge_sides(df, self.load_season_table('misc_stats', MISC_STATS_FEATURES, seasons),
+                               'kenpom_name', shoot_features)
+        
+        # 7. Player/Rotation Features
+        rotation = self.load_rotation_table(seasons)
+        rotation['team_id'] = rotation['team_id'].astype(df['home_team_id'].dtype)
+        df = self._merge_sides(df, rotation, 'team_id', ROTATION_FEATURES)
+        
+        # 8. Situational Features
+        df['neutral_site'] = df['neutral_site'].fillna(0).astype(int)
+        df['is_tournament'] = df['tournament'].fillna('').astype(bool).astype(int)
+        df['rest_differential'] = df['home_form_rest_days'] - df['away_form_rest_days']
+        
+        feature_columns = []
+        for features in (kp_features, ff_features, FORM_FEATURES):
+            home, away = side_columns(features)
+            feature_columns += home + away
+        feature_columns += list(H2H_FEATURES)
+        feature_columns += [c for c in df.columns if c.startswith('matchup_')]
+        for features in (tm_features, shoot_features, ROTATION_FEATURES):
+            home, away = side_columns(features)
+            feature_columns += home + away
+        feature_columns += ['neutral_site', 'is_tournament', 'rest_differential']
+        
+        return df[feature_columns + GAME_COLUMNS]
+    
     def build_training_dataset(self, start_date: str = '2023-11-01', end_date: str = '2024-12-31') -> pd.DataFrame:
         """Build complete training dataset with all features"""
         logger.info("🏗️  Building training dataset...")
@@ -478,34 +744,8 @@ class FeatureEngineer:
         # Get all games
         games = self.get_training_games(start_date, end_date)
         
-        # Build features for each game
-        features_list = []
-        
-        for idx, game in tqdm(games.iterrows(), total=len(games), desc="Engineering features"):
-            try:
-                features = self.build_game_features(game)
-                
-                # Add game identifiers and target
-                features['game_id'] = game['game_id']
-                features['game_date'] = game['game_date']
-                features['season'] = game['season']
-                features['home_team_id'] = game['home_team_id']
-                features['away_team_id'] = game['away_team_id']
-                features['home_team_name'] = game['home_team_name']
-                features['away_team_name'] = game['away_team_name']
-                features['home_score'] = game['home_score']
-                features['away_score'] = game['away_score']
-                features['home_win'] = game['home_win']
-                features['margin'] = game['margin']
-                
-                features_list.append(features)
-                
-            except Exception as e:
-                logger.error(f"Error processing game {game['game_id']}: {e}")
-                continue
-        
-        # Convert to DataFrame
-        df = pd.DataFrame(features_list)
+        # Build features for all games at once
+        df = self.build_features_frame(games)
         
         logger.info(f"✅ Built {len(df)} game features with {len(df.columns)} columns")
         
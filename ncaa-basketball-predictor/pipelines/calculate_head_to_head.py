@@ -14,13 +14,25 @@ Design Principles:
 - Efficient database queries with proper joins
 - Type hints
 - Comprehensive validation
+
+The table is built set-based: the games in the lookback window are read once,
+each game is keyed by its (lower team ID, higher team ID) pair with the margin
+from the lower ID's side, and games played, wins, average margin and the last
+meeting come from one groupby. Rows are upserted with one executemany.
+
+Runs are incremental by default: only matchups with a game after the latest
+last_meeting_date already stored are recalculated (over their whole lookback
+window). When a new season moves the lookback window, or with --full, every
+matchup is recalculated.
 """
 
+import argparse
 import sqlite3
 import logging
 from pathlib import Path
-from typing import Optional, Dict, Any, Tuple
-from tqdm import tqdm
+from typing import Optional, Dict
+
+import pandas as pd
 
 # Setup logging
 logging.basicConfig(
@@ -31,6 +43,13 @@ logger = logging.getLogger(__name__)
 
 DB_PATH = Path(__file__).parent.parent / "ncaa_basketball.db"
 
+H2H_COLUMNS = [
+    'team1_id', 'team2_id',
+    'games_played', 'team1_wins', 'team2_wins',
+    'avg_margin', 'last_meeting_date', 'last_meeting_winner',
+    'is_rivalry', 'same_conference',
+]
+
 
 class HeadToHeadCalculator:
     """Calculates head-to-head matchup history"""
@@ -49,221 +68,124 @@ class HeadToHeadCalculator:
         if self.conn:
             self.conn.close()
     
-    def get_matchup_games(
-        self, 
-        team1_id: int, 
-        team2_id: int
-    ) -> list:
-        """Get all games between two teams (last N seasons)"""
-        cursor = self.conn.cursor()
-        
-        # Get current max season
-        max_season_query = "SELECT MAX(season) as max_season FROM games"
-        max_season = cursor.execute(max_season_query).fetchone()['max_season']
-        min_season = max_season - self.lookback_seasons
-        
-        query = """
-            SELECT 
-                game_date,
-                season,
-                home_team_id,
-                away_team_id,
-                home_score,
-                away_score,
-                neutral_site
-            FROM games
-            WHERE ((home_team_id = ? AND away_team_id = ?) OR 
-                   (home_team_id = ? AND away_team_id = ?))
-                AND home_score IS NOT NULL
-                AND away_score IS NOT NULL
-                AND season >= ?
-            ORDER BY game_date
-        """
-        
-        results = cursor.execute(
-            query, 
-            (team1_id, team2_id, team2_id, team1_id, min_season)
-        ).fetchall()
-        
-        return [dict(row) for row in results]
+    def get_min_season(self, up_to_date: Optional[str] = None) -> Optional[int]:
+        """First season in the lookback window (as of up_to_date, if given)"""
+        query = "SELECT MAX(season) FROM games WHERE ? IS NULL OR game_date <= ?"
+        max_season = self.conn.execute(query, (up_to_date, up_to_date)).fetchone()[0]
+        return None if max_season is None else max_season - self.lookback_seasons
     
-    def calculate_h2h_metrics(
-        self, 
-        team1_id: int, 
-        team2_id: int, 
-        games: list
-    ) -> Optional[Dict[str, Any]]:
-        """Calculate head-to-head metrics"""
-        if not games:
-            return None
-        
-        games_played = len(games)
-        team1_wins = 0
-        team2_wins = 0
-        margins = []
-        
-        for game in games:
-            # Determine winner from team1's perspective
-            if game['home_team_id'] == team1_id:
-                margin = game['home_score'] - game['away_score']
-                if game['home_score'] > game['away_score']:
-                    team1_wins += 1
-                else:
-                    team2_wins += 1
-            else:  # team1 is away
-                margin = game['away_score'] - game['home_score']
-                if game['away_score'] > game['home_score']:
-                    team1_wins += 1
-                else:
-                    team2_wins += 1
-            
-            margins.append(margin)
-        
-        avg_margin = sum(margins) / len(margins) if margins else 0
-        last_meeting_date = games[-1]['game_date']
-        last_winner = team1_id if margins[-1] > 0 else team2_id
-        
-        # Rivalry indicator: 5+ games in lookback period
-        is_rivalry = 1 if games_played >= 5 else 0
-        
-        return {
-            'games_played': games_played,
-            'team1_wins': team1_wins,
-            'team2_wins': team2_wins,
-            'avg_margin': round(avg_margin, 2),
-            'last_meeting_date': last_meeting_date,
-            'last_meeting_winner': last_winner,
-            'is_rivalry': is_rivalry
-        }
+    def get_watermark(self) -> Optional[str]:
+        """Latest meeting already in head_to_head (None if it is empty)"""
+        return self.conn.execute("SELECT MAX(last_meeting_date) FROM head_to_head").fetchone()[0]
     
-    def check_same_conference(
-        self, 
-        team1_id: int, 
-        team2_id: int
-    ) -> int:
-        """Check if teams are in same conference"""
-        cursor = self.conn.cursor()
-        
+    def get_matchup_games(self, min_season: int, since: Optional[str] = None) -> pd.DataFrame:
+        """
+        Completed games in the lookback window as (team1_id < team2_id) matchups,
+        with the margin from team1's side - only matchups with a game on or after
+        `since`, if given (games scored later on the watermark date are picked up;
+        recalculating the matchups already stored for it is harmless)
+        """
         query = """
-            SELECT 
-                (SELECT conference FROM teams WHERE team_id = ?) = 
-                (SELECT conference FROM teams WHERE team_id = ?) as same_conf
+            WITH matchup_games AS (
+                SELECT
+                    game_date,
+                    CASE WHEN home_team_id < away_team_id THEN home_team_id ELSE away_team_id END AS team1_id,
+                    CASE WHEN home_team_id < away_team_id THEN away_team_id ELSE home_team_id END AS team2_id,
+                    CASE WHEN home_team_id < away_team_id THEN home_score - away_score
+                         ELSE away_score - home_score END AS margin
+                FROM games
+                WHERE home_score IS NOT NULL
+                    AND away_score IS NOT NULL
+                    AND season >= ?
+            )
+            SELECT mg.*
+            FROM matchup_games mg
+            WHERE ? IS NULL OR EXISTS (
+                SELECT 1 FROM matchup_games recent
+                WHERE recent.team1_id = mg.team1_id
+                    AND recent.team2_id = mg.team2_id
+                    AND recent.game_date >= ?
+            )
         """
+        return pd.read_sql_query(query, self.conn, params=(min_season, since, since))
+    
+    def calculate_h2h_metrics(self, games: pd.DataFrame) -> pd.DataFrame:
+        """One head_to_head row per matchup"""
+        games = games.sort_values('game_date', kind='stable')
+        games['team1_won'] = (games['margin'] > 0).astype(int)
+        
+        h2h = games.groupby(['team1_id', 'team2_id']).agg(
+            games_played=('margin', 'size'),
+            team1_wins=('team1_won', 'sum'),
+            avg_margin=('margin', 'mean'),
+            last_meeting_date=('game_date', 'last'),
+            last_margin=('margin', 'last'),
+        ).reset_index()
+        
+        h2h['team2_wins'] = h2h['games_played'] - h2h['team1_wins']
+        h2h['avg_margin'] = h2h['avg_margin'].round(2)
+        h2h['last_meeting_winner'] = h2h['team1_id'].where(h2h['last_margin'] > 0, h2h['team2_id'])
         
-        result = cursor.execute(query, (team1_id, team2_id)).fetchone()
-        return result['same_conf'] if result and result['same_conf'] else 0
+        # Rivalry indicator: 5+ games in lookback period
+        h2h['is_rivalry'] = (h2h['games_played'] >= 5).astype(int)
+        return h2h
     
-    def insert_h2h_record(
-        self,
-        team1_id: int,
-        team2_id: int,
-        metrics: Dict[str, Any],
-        same_conference: int
-    ) -> bool:
-        """Insert head-to-head record into database"""
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                INSERT OR REPLACE INTO head_to_head (
-                    team1_id, team2_id,
-                    games_played, team1_wins, team2_wins,
-                    avg_margin, last_meeting_date, last_meeting_winner,
-                    is_rivalry, same_conference
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                team1_id, team2_id,
-                metrics['games_played'], metrics['team1_wins'], metrics['team2_wins'],
-                metrics['avg_margin'], metrics['last_meeting_date'], 
-                metrics['last_meeting_winner'],
-                metrics['is_rivalry'], same_conference
-            ))
-            return True
-        except Exception as e:
-            logger.error(f"Error inserting H2H record: {e}")
-            return False
+    def add_same_conference(self, h2h: pd.DataFrame) -> pd.DataFrame:
+        """1 if both teams have the same (non-NULL) conference"""
+        teams = pd.read_sql_query("SELECT team_id, conference FROM teams", self.conn).drop_duplicates('team_id')
+        conference = teams.set_index('team_id')['conference']
+        team1_conf = h2h['team1_id'].map(conference)
+        team2_conf = h2h['team2_id'].map(conference)
+        h2h['same_conference'] = (team1_conf.notna() & (team1_conf == team2_conf)).astype(int)
+        return h2h
     
-    def get_unique_matchups(self) -> list:
-        """Get all unique team matchups from recent games"""
-        cursor = self.conn.cursor()
-        
-        # Get current max season
-        max_season_query = "SELECT MAX(season) as max_season FROM games"
-        max_season = cursor.execute(max_season_query).fetchone()['max_season']
-        min_season = max_season - self.lookback_seasons
-        
-        query = """
-            SELECT DISTINCT
-                CASE WHEN home_team_id < away_team_id THEN home_team_id ELSE away_team_id END as team1_id,
-                CASE WHEN home_team_id < away_team_id THEN away_team_id ELSE home_team_id END as team2_id
-            FROM games
-            WHERE home_score IS NOT NULL
-                AND season >= ?
-            ORDER BY team1_id, team2_id
-        """
-        
-        results = cursor.execute(query, (min_season,)).fetchall()
-        return [(row['team1_id'], row['team2_id']) for row in results]
+    def insert_h2h_records(self, h2h: pd.DataFrame) -> int:
+        """Upsert all rows in one executemany / one transaction"""
+        if h2h.empty:
+            return 0
+        
+        placeholders = ', '.join('?' * len(H2H_COLUMNS))
+        records = [
+            tuple(value.item() if hasattr(value, 'item') else value for value in record)
+            for record in h2h[H2H_COLUMNS].itertuples(index=False, name=None)
+        ]
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO head_to_head ({', '.join(H2H_COLUMNS)}) VALUES ({placeholders})",
+                records
+            )
+        return len(records)
     
-    def run(self) -> Dict[str, int]:
-        """Main execution - calculate H2H for all matchups"""
-        logger.info(f"Starting Head-to-Head Calculation (last {self.lookback_seasons} seasons)")
-        
-        # Get all unique matchups
-        matchups = self.get_unique_matchups()
-        logger.info(f"Processing {len(matchups)} unique matchups")
-        
-        inserted = 0
-        skipped = 0
-        errors = 0
-        rivalries = 0
-        
-        # Process each matchup
-        for team1_id, team2_id in tqdm(matchups, desc="Calculating H2H"):
-            try:
-                # Get games between these teams
-                games = self.get_matchup_games(team1_id, team2_id)
-                
-                if not games:
-                    skipped += 1
-                    continue
-                
-                # Calculate metrics
-                metrics = self.calculate_h2h_metrics(team1_id, team2_id, games)
-                if not metrics:
-                    skipped += 1
-                    continue
-                
-                # Check conference
-                same_conf = self.check_same_conference(team1_id, team2_id)
-                
-                # Insert
-                if self.insert_h2h_record(team1_id, team2_id, metrics, same_conf):
-                    inserted += 1
-                    if metrics['is_rivalry']:
-                        rivalries += 1
-                else:
-                    errors += 1
-                    
-            except Exception as e:
-                logger.error(f"Error processing matchup {team1_id} vs {team2_id}: {e}")
-                errors += 1
-            
-            # Commit periodically
-            if inserted % 100 == 0:
-                self.conn.commit()
-        
-        # Final commit
-        self.conn.commit()
+    def run(self, full: bool = False) -> Dict[str, int]:
+        """Main execution - calculate H2H for all matchups (only those with new games unless full)"""
+        watermark = None if full else self.get_watermark()
+        min_season = self.get_min_season()
+        if min_season is None:
+            logger.warning("No games - nothing to calculate")
+            return {'inserted': 0, 'rivalries': 0, 'total_rows': 0}
+        
+        if watermark and self.get_min_season(up_to_date=watermark) != min_season:
+            logger.info(f"Lookback window moved to {min_season}+ - recalculating every matchup")
+            watermark = None
+        
+        if watermark:
+            logger.info(f"Starting Head-to-Head Calculation (last {self.lookback_seasons} seasons, "
+                        f"matchups with games on or after {watermark})")
+        else:
+            logger.info(f"Starting Head-to-Head Calculation (last {self.lookback_seasons} seasons)")
+        
+        games = self.get_matchup_games(min_season, since=watermark)
+        h2h = self.add_same_conference(self.calculate_h2h_metrics(games))
+        logger.info(f"Processing {len(h2h)} matchups from {len(games)} games")
+        
+        inserted = self.insert_h2h_records(h2h)
         
         # Verify
-        cursor = self.conn.cursor()
-        count = cursor.execute("SELECT COUNT(*) FROM head_to_head").fetchone()[0]
+        count = self.conn.execute("SELECT COUNT(*) FROM head_to_head").fetchone()[0]
         
         results = {
             'inserted': inserted,
-            'skipped': skipped,
-            'errors': errors,
-            'rivalries': rivalries,
+            'rivalries': int(h2h['is_rivalry'].sum()),
             'total_rows': count
         }
         
@@ -271,26 +193,29 @@ class HeadToHeadCalculator:
         return results
 
 
-def main():
+def main(full: bool = False):
     """Entry point"""
     print("\n" + "="*70)
     print("🏀 NCAA BASKETBALL - HEAD-TO-HEAD CALCULATOR")
     print("="*70)
     
     with HeadToHeadCalculator(lookback_seasons=5) as calculator:
-        results = calculator.run()
+        results = calculator.run(full=full)
     
     print("\n" + "="*70)
     print("📊 RESULTS")
     print("="*70)
     print(f"✅ Inserted: {results['inserted']:,}")
     print(f"🏆 Rivalries: {results['rivalries']:,} (5+ games)")
-    print(f"⏭️  Skipped: {results['skipped']:,}")
-    print(f"❌ Errors: {results['errors']:,}")
     print(f"💾 Total Rows: {results['total_rows']:,}")
     print("="*70)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='NCAA Basketball Head-to-Head Calculator')
+    parser.add_argument('--full', action='store_true', help='Recalculate every matchup, not just those with new games')
+    
+    args = parser.parse_args()
+    
+    main(full=args.full)
 
@@ -13,14 +13,26 @@ Design Principles:
 - Efficient database queries
 - Type hints for maintainability
 - Comprehensive validation
+
+One recent_form row is kept per team per season per game date (as_of_date):
+the team's form over its games strictly before that date. Games are read
+once, sorted per team, and the last-5/last-10 windows, streaks and rest days
+are computed with rolling windows; each snapshot is then carried forward to
+the following game dates and written with one executemany.
+
+Daily runs are incremental: the watermark is the latest as_of_date already in
+recent_form. Only teams that played on or after it are recomputed from their
+games; every other team's row at the watermark is carried forward to the new
+dates (with days_since_last_game advanced). --full rebuilds every row.
 """
 
+import argparse
 import sqlite3
 import logging
 from pathlib import Path
-from typing import Optional, Dict, Any
-from datetime import datetime, timedelta
-from tqdm import tqdm
+from typing import Optional, Dict, List
+
+import pandas as pd
 
 # Setup logging
 logging.basicConfig(
@@ -31,6 +43,15 @@ logger = logging.getLogger(__name__)
 
 DB_PATH = Path(__file__).parent.parent / "ncaa_basketball.db"
 
+FORM_COLUMNS = [
+    'team_id', 'season', 'as_of_date',
+    'last5_wins', 'last5_losses', 'last5_avg_score',
+    'last5_avg_allowed', 'last5_avg_margin',
+    'last10_wins', 'last10_losses', 'last10_avg_margin',
+    'current_win_streak', 'current_loss_streak',
+    'days_since_last_game',
+]
+
 
 class RecentFormCalculator:
     """Calculates recent form metrics for teams"""
@@ -48,214 +69,191 @@ class RecentFormCalculator:
         if self.conn:
             self.conn.close()
     
-    def get_team_games(
-        self, 
-        team_id: int, 
-        season: int, 
-        up_to_date: str,
-        limit: int = 10
-    ) -> list:
-        """Get recent games for a team up to a specific date"""
-        cursor = self.conn.cursor()
-        
+    def get_watermark(self) -> Optional[str]:
+        """Latest as_of_date already calculated (None if recent_form is empty)"""
+        row = self.conn.execute("SELECT MAX(as_of_date) FROM recent_form").fetchone()
+        return row[0]
+    
+    def get_form_dates(self, after: Optional[str] = None) -> pd.DataFrame:
+        """Game dates (with their season) that get a recent_form row, optionally only those after a date"""
         query = """
-            SELECT 
-                game_date,
-                CASE WHEN home_team_id = ? THEN home_score ELSE away_score END as team_score,
-                CASE WHEN home_team_id = ? THEN away_score ELSE home_score END as opp_score,
-                CASE WHEN home_team_id = ? THEN 1 ELSE 0 END as was_home
+            SELECT DISTINCT game_date AS as_of_date, season
             FROM games
-            WHERE season = ?
-                AND game_date < ?
-                AND (home_team_id = ? OR away_team_id = ?)
-                AND home_score IS NOT NULL
-                AND away_score IS NOT NULL
-            ORDER BY game_date DESC
-            LIMIT ?
+            WHERE home_score IS NOT NULL
+                AND (? IS NULL OR game_date > ?)
+            ORDER BY season, game_date
         """
+        return pd.read_sql_query(query, self.conn, params=(after, after))
+    
+    def get_team_games(self, seasons: List[int], since: Optional[str] = None) -> pd.DataFrame:
+        """
+        One row per team per completed game in the seasons (two per game), for
+        teams in `teams` - only teams with a game on or after `since`, if given
+        """
+        placeholders = ','.join('?' * len(seasons))
+        query = f"""
+            WITH team_games AS (
+                SELECT game_date, season, home_team_id AS team_id,
+                       home_score AS team_score, away_score AS opp_score
+                FROM games
+                WHERE home_score IS NOT NULL AND away_score IS NOT NULL
+                UNION ALL
+                SELECT game_date, season, away_team_id AS team_id,
+                       away_score AS team_score, home_score AS opp_score
+                FROM games
+                WHERE home_score IS NOT NULL AND away_score IS NOT NULL
+            )
+            SELECT tg.team_id, tg.season, tg.game_date, tg.team_score, tg.opp_score
+            FROM team_games tg
+            JOIN teams t ON t.team_id = tg.team_id
+            WHERE tg.season IN ({placeholders})
+                AND (? IS NULL OR EXISTS (
+                    SELECT 1 FROM team_games recent
+                    WHERE recent.team_id = tg.team_id
+                        AND recent.season = tg.season
+                        AND recent.game_date >= ?
+                ))
+        """
+        return pd.read_sql_query(query, self.conn, params=[*seasons, since, since])
+    
+    def calculate_form_snapshots(self, games: pd.DataFrame) -> pd.DataFrame:
+        """
+        Form after each team's game day: last 5/10 record, averages and the
+        current streak (counted within the last 10 games), from rolling windows
+        over each team's games sorted by date
+        """
+        games = games.sort_values(['team_id', 'season', 'game_date'], kind='stable').reset_index(drop=True)
+        games['won'] = (games['team_score'] > games['opp_score']).astype(int)
+        games['margin'] = games['team_score'] - games['opp_score']
         
-        results = cursor.execute(
-            query, 
-            (team_id, team_id, team_id, season, up_to_date, team_id, team_id, limit)
-        ).fetchall()
+        by_team = games.groupby(['team_id', 'season'], sort=False)
         
-        return [dict(row) for row in results]
-    
-    def calculate_form_metrics(self, games: list) -> Optional[Dict[str, Any]]:
-        """Calculate form metrics from game list"""
-        if not games:
-            return None
+        def rolling(column: str, window: int, how: str) -> pd.Series:
+            result = getattr(by_team[column].rolling(window, min_periods=1), how)()
+            return result.reset_index(level=[0, 1], drop=True)
+        
+        snapshots = games[['team_id', 'season', 'game_date']].copy()
         
         # Last 5 games
-        last5 = games[:5]
-        last5_wins = sum(1 for g in last5 if g['team_score'] > g['opp_score'])
-        last5_losses = len(last5) - last5_wins
-        last5_avg_score = sum(g['team_score'] for g in last5) / len(last5)
-        last5_avg_allowed = sum(g['opp_score'] for g in last5) / len(last5)
-        last5_avg_margin = sum(g['team_score'] - g['opp_score'] for g in last5) / len(last5)
+        last5_games = rolling('won', 5, 'count')
+        snapshots['last5_wins'] = rolling('won', 5, 'sum')
+        snapshots['last5_losses'] = last5_games - snapshots['last5_wins']
+        snapshots['last5_avg_score'] = rolling('team_score', 5, 'mean').round(2)
+        snapshots['last5_avg_allowed'] = rolling('opp_score', 5, 'mean').round(2)
+        snapshots['last5_avg_margin'] = rolling('margin', 5, 'mean').round(2)
         
         # Last 10 games
-        last10 = games[:10]
-        last10_wins = sum(1 for g in last10 if g['team_score'] > g['opp_score'])
-        last10_losses = len(last10) - last10_wins
-        last10_avg_margin = sum(g['team_score'] - g['opp_score'] for g in last10) / len(last10)
+        last10_games = rolling('won', 10, 'count')
+        snapshots['last10_wins'] = rolling('won', 10, 'sum')
+        snapshots['last10_losses'] = last10_games - snapshots['last10_wins']
+        snapshots['last10_avg_margin'] = rolling('margin', 10, 'mean').round(2)
         
-        # Current streak
-        win_streak = 0
-        loss_streak = 0
-        for game in games:
-            won = game['team_score'] > game['opp_score']
-            if won:
-                if loss_streak > 0:
-                    break
-                win_streak += 1
-            else:
-                if win_streak > 0:
-                    break
-                loss_streak += 1
+        # Current streak: length of the run of equal results ending at this game
+        run_id = (games['won'] != by_team['won'].shift()).cumsum()
+        streak = (games.groupby(run_id).cumcount() + 1).clip(upper=10)
+        snapshots['current_win_streak'] = streak.where(games['won'] == 1, 0)
+        snapshots['current_loss_streak'] = streak.where(games['won'] == 0, 0)
         
-        # Days since last game (games are ordered DESC, so first is most recent)
-        days_since = 0
-        if games:
-            last_game_date = datetime.strptime(games[0]['game_date'], '%Y-%m-%d')
-            # Note: We calculate this relative to the game date being processed
-            # This will be updated by the caller
-            days_since = 0  # Placeholder
+        count_columns = ['last5_wins', 'last5_losses', 'last10_wins', 'last10_losses']
+        snapshots[count_columns] = snapshots[count_columns].astype(int)
         
-        return {
-            'last5_wins': last5_wins,
-            'last5_losses': last5_losses,
-            'last5_avg_score': round(last5_avg_score, 2),
-            'last5_avg_allowed': round(last5_avg_allowed, 2),
-            'last5_avg_margin': round(last5_avg_margin, 2),
-            'last10_wins': last10_wins,
-            'last10_losses': last10_losses,
-            'last10_avg_margin': round(last10_avg_margin, 2),
-            'current_win_streak': win_streak,
-            'current_loss_streak': loss_streak,
-            'days_since_last_game': days_since
-        }
+        # A team playing twice on one date: the later game's form holds from the next date
+        return snapshots.drop_duplicates(['team_id', 'season', 'game_date'], keep='last')
     
-    def calculate_days_rest(self, last_game_date: str, current_date: str) -> int:
-        """Calculate days between games"""
-        try:
-            last_dt = datetime.strptime(last_game_date, '%Y-%m-%d')
-            current_dt = datetime.strptime(current_date, '%Y-%m-%d')
-            return (current_dt - last_dt).days
-        except Exception as e:
-            logger.warning(f"Error calculating rest days: {e}")
-            return 0
+    def expand_to_dates(self, snapshots: pd.DataFrame, form_dates: pd.DataFrame) -> pd.DataFrame:
+        """recent_form rows: each team's latest snapshot strictly before every game date of its season"""
+        teams = snapshots[['team_id', 'season']].drop_duplicates()
+        grid = teams.merge(form_dates, on='season')
+        grid['as_of'] = pd.to_datetime(grid['as_of_date'])
+        
+        snapshots = snapshots.assign(last_game=pd.to_datetime(snapshots['game_date']))
+        rows = pd.merge_asof(
+            grid.sort_values('as_of'),
+            snapshots.drop(columns='game_date').sort_values('last_game'),
+            left_on='as_of', right_on='last_game',
+            by=['team_id', 'season'],
+            allow_exact_matches=False,   # Only games before the as_of_date
+        ).dropna(subset=['last_game'])
+        
+        rows['days_since_last_game'] = (rows['as_of'] - rows['last_game']).dt.days
+        return rows[FORM_COLUMNS]
     
-    def insert_form_record(
-        self, 
-        team_id: int, 
-        season: int, 
-        as_of_date: str,
-        metrics: Dict[str, Any]
-    ) -> bool:
-        """Insert form metrics into database"""
-        try:
-            cursor = self.conn.cursor()
-            cursor.execute("""
-                INSERT OR REPLACE INTO recent_form (
-                    team_id, season, as_of_date,
-                    last5_wins, last5_losses, last5_avg_score, 
-                    last5_avg_allowed, last5_avg_margin,
-                    last10_wins, last10_losses, last10_avg_margin,
-                    current_win_streak, current_loss_streak,
-                    days_since_last_game
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                team_id, season, as_of_date,
-                metrics['last5_wins'], metrics['last5_losses'],
-                metrics['last5_avg_score'], metrics['last5_avg_allowed'],
-                metrics['last5_avg_margin'],
-                metrics['last10_wins'], metrics['last10_losses'],
-                metrics['last10_avg_margin'],
-                metrics['current_win_streak'], metrics['current_loss_streak'],
-                metrics['days_since_last_game']
-            ))
-            return True
-        except Exception as e:
-            logger.error(f"Error inserting form record: {e}")
-            return False
+    def carry_forward(self, watermark: str, form_dates: pd.DataFrame, recalculated: pd.DataFrame) -> pd.DataFrame:
+        """
+        Rows for the new dates for teams that haven't played since the watermark:
+        their row at the watermark, with days_since_last_game advanced
+        """
+        query = f"""
+            SELECT {', '.join(FORM_COLUMNS)}
+            FROM recent_form
+            WHERE as_of_date = ?
+        """
+        base = pd.read_sql_query(query, self.conn, params=(watermark,))
+        base = base[base['season'].isin(form_dates['season'].unique())]
+        
+        recalculated_teams = recalculated[['team_id', 'season']].drop_duplicates()
+        base = base.merge(recalculated_teams, on=['team_id', 'season'], how='left', indicator=True)
+        base = base[base['_merge'] == 'left_only'].drop(columns=['_merge', 'as_of_date'])
+        
+        rows = base.merge(form_dates, on='season')
+        rows['days_since_last_game'] += (
+            pd.to_datetime(rows['as_of_date']) - pd.Timestamp(watermark)
+        ).dt.days
+        return rows[FORM_COLUMNS]
     
-    def run(self) -> Dict[str, int]:
-        """Main execution - calculate form for all teams and dates"""
-        logger.info("Starting Recent Form Calculation")
+    def insert_form_records(self, rows: pd.DataFrame) -> int:
+        """Write all rows in one executemany / one transaction"""
+        if rows.empty:
+            return 0
         
-        # Get all games to process
-        cursor = self.conn.cursor()
-        games_query = """
-            SELECT DISTINCT game_date, season
-            FROM games
-            WHERE home_score IS NOT NULL
-            ORDER BY season, game_date
-        """
-        game_dates = cursor.execute(games_query).fetchall()
+        placeholders = ', '.join('?' * len(FORM_COLUMNS))
+        records = [
+            tuple(value.item() if hasattr(value, 'item') else value for value in record)
+            for record in rows[FORM_COLUMNS].itertuples(index=False, name=None)
+        ]
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO recent_form ({', '.join(FORM_COLUMNS)}) VALUES ({placeholders})",
+                records
+            )
+        return len(records)
+    
+    def run(self, full: bool = False) -> Dict[str, int]:
+        """Main execution - calculate form for all teams and dates (only new dates unless full)"""
+        watermark = None if full else self.get_watermark()
+        if watermark:
+            logger.info(f"Starting Recent Form Calculation (incremental, after {watermark})")
+        else:
+            logger.info("Starting Recent Form Calculation (full rebuild)")
         
-        # Get all teams
-        teams_query = "SELECT team_id FROM teams ORDER BY team_id"
-        teams = cursor.execute(teams_query).fetchall()
+        form_dates = self.get_form_dates(after=watermark)
+        if form_dates.empty:
+            logger.info("✅ Recent form is up to date")
+            count = self.conn.execute("SELECT COUNT(*) FROM recent_form").fetchone()[0]
+            return {'inserted': 0, 'recalculated_teams': 0, 'carried_forward': 0, 'total_rows': count}
         
-        logger.info(f"Processing {len(game_dates)} dates × {len(teams)} teams")
+        seasons = sorted(int(s) for s in form_dates['season'].unique())
+        games = self.get_team_games(seasons, since=watermark)
+        logger.info(f"Processing {len(form_dates)} dates, {games[['team_id', 'season']].drop_duplicates().shape[0]} "
+                    f"team-seasons from {len(games)} team games")
         
-        inserted = 0
-        skipped = 0
-        errors = 0
+        snapshots = self.calculate_form_snapshots(games)
+        rows = self.expand_to_dates(snapshots, form_dates)
         
-        # Process each date
-        for date_row in tqdm(game_dates, desc="Calculating recent form"):
-            game_date = date_row['game_date']
-            season = date_row['season']
-            
-            # For each team, calculate form as of this date
-            for team_row in teams:
-                team_id = team_row['team_id']
-                
-                try:
-                    # Get recent games before this date
-                    games = self.get_team_games(team_id, season, game_date, limit=10)
-                    
-                    if not games:
-                        skipped += 1
-                        continue
-                    
-                    # Calculate metrics
-                    metrics = self.calculate_form_metrics(games)
-                    if not metrics:
-                        skipped += 1
-                        continue
-                    
-                    # Calculate rest days
-                    metrics['days_since_last_game'] = self.calculate_days_rest(
-                        games[0]['game_date'], 
-                        game_date
-                    )
-                    
-                    # Insert
-                    if self.insert_form_record(team_id, season, game_date, metrics):
-                        inserted += 1
-                    else:
-                        errors += 1
-                        
-                except Exception as e:
-                    logger.error(f"Error processing team {team_id} on {game_date}: {e}")
-                    errors += 1
-            
-            # Commit after each date
-            self.conn.commit()
+        carried = pd.DataFrame(columns=FORM_COLUMNS)
+        if watermark:
+            carried = self.carry_forward(watermark, form_dates, rows)
+            rows = pd.concat([rows, carried], ignore_index=True)
         
-        # Final commit
-        self.conn.commit()
+        inserted = self.insert_form_records(rows)
         
         # Verify
-        count = cursor.execute("SELECT COUNT(*) FROM recent_form").fetchone()[0]
+        count = self.conn.execute("SELECT COUNT(*) FROM recent_form").fetchone()[0]
         
         results = {
             'inserted': inserted,
-            'skipped': skipped,
-            'errors': errors,
+            'recalculated_teams': int(snapshots[['team_id', 'season']].drop_duplicates().shape[0]),
+            'carried_forward': len(carried),
             'total_rows': count
         }
         
@@ -263,25 +261,30 @@ class RecentFormCalculator:
         return results
 
 
-def main():
+def main(full: bool = False):
     """Entry point"""
     print("\n" + "="*70)
     print("🏀 NCAA BASKETBALL - RECENT FORM CALCULATOR")
     print("="*70)
     
     with RecentFormCalculator() as calculator:
-        results = calculator.run()
+        results = calculator.run(full=full)
     
     print("\n" + "="*70)
     print("📊 RESULTS")
     print("="*70)
     print(f"✅ Inserted: {results['inserted']:,}")
-    print(f"⏭️  Skipped: {results['skipped']:,}")
-    print(f"❌ Errors: {results['errors']:,}")
+    print(f"🔄 Recalculated teams: {results['recalculated_teams']:,}")
+    print(f"⏩ Carried forward: {results['carried_forward']:,}")
     print(f"💾 Total Rows: {results['total_rows']:,}")
     print("="*70)
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='NCAA Basketball Recent Form Calculator')
+    parser.add_argument('--full', action='store_true', help='Recalculate every date, not just those after the watermark')
+    
+    args = parser.parse_args()
+    
+    main(full=args.full)
 
@@ -8,9 +8,17 @@ Features are split into tiers:
 - Tier 3: Recent form & momentum
 - Tier 4: Matchup-specific features
 - Tier 5: Situational context
+
+Live predictions go through FeatureService (build_features_for_game /
+build_features_for_games): one long-lived connection, and each season's player
+aggregates computed once for every team - from a single player_stats query -
+and kept in memory and in the indexed team_player_aggregates table, so the next
+run starts warm. Cached aggregates expire after AGGREGATES_TTL_SECONDS, or
+when invalidate() is called for a team whose lineup/roster was just updated.
 """
 
 import sqlite3
+import time
 import pandas as pd
 import numpy as np
 from pathlib import Path
@@ -22,6 +30,44 @@ logger = logging.getLogger(__name__)
 
 DB_PATH = Path(__file__).parent.parent / "ncaa_basketball.db"
 
+AGGREGATES_TTL_SECONDS = 30 * 60   # Recompute a season's player aggregates after this long
+
+MASCOTS = ['Wildcats', 'Tigers', 'Bulldogs', 'Eagles', 'Panthers', 'Bears', 
+           'Spartans', 'Trojans', 'Huskies', 'Cougars', 'Cardinals', 'Cowboys',
+           'Blue Devils', 'Tar Heels', 'Crimson Tide', 'Volunteers', 'Gators',
+           'Razorbacks', 'Aggies', 'Longhorns', 'Sooners', 'Jayhawks',
+           'Red Storm', 'Hoyas', 'Orangemen', 'Orange', 'Badgers']
+
+AGGREGATE_COLUMNS = ['avg_player_ortg', 'top_player_ortg', 'top3_avg_ortg', 'avg_usage', 'avg_assist_rate',
+                     'avg_turnover_rate', 'roster_depth', 'minutes_concentration']
+
+
+def team_name_patterns(team_name):
+    """
+    (base name, first word) used to match player_stats.team_name - e.g.
+    "Duke Blue Devils" -> ("Duke", "Duke")
+    """
+    base_name = team_name
+    for mascot in MASCOTS:
+        if team_name.endswith(mascot):
+            base_name = team_name.replace(mascot, '').strip()
+            break
+    return base_name, team_name.split()[0]
+
+
+def aggregate_player_stats(df):
+    """Team-level aggregates from a team's player_stats rows"""
+    return {
+        'avg_player_ortg': df['offensive_rating'].mean(),
+        'top_player_ortg': df['offensive_rating'].max(),
+        'top3_avg_ortg': df.nlargest(3, 'offensive_rating')['offensive_rating'].mean(),
+        'avg_usage': df['usage_rate'].mean(),
+        'avg_assist_rate': df['assist_rate'].mean(),
+        'avg_turnover_rate': df['turnover_rate'].mean(),
+        'roster_depth': len(df[df['minutes_played'] > 10]),  # Players with significant minutes
+        'minutes_concentration': df.nlargest(5, 'minutes_played')['minutes_played'].sum() / df['minutes_played'].sum() if df['minutes_played'].sum() > 0 else 0
+    }
+
 
 class NCAAFeatureEngineering:
     """Feature engineering for NCAA basketball games"""
@@ -74,19 +120,7 @@ class NCAAFeatureEngineering:
         # 1. Direct match
         # 2. Partial match (e.g., "Duke" in "Duke Blue Devils")
         # 3. Remove mascot (e.g., "Duke Blue Devils" -> "Duke")
-        
-        # Extract base name (remove common mascots)
-        base_name = team_name
-        mascots = ['Wildcats', 'Tigers', 'Bulldogs', 'Eagles', 'Panthers', 'Bears', 
-                   'Spartans', 'Trojans', 'Huskies', 'Cougars', 'Cardinals', 'Cowboys',
-                   'Blue Devils', 'Tar Heels', 'Crimson Tide', 'Volunteers', 'Gators',
-                   'Razorbacks', 'Aggies', 'Longhorns', 'Sooners', 'Jayhawks',
-                   'Red Storm', 'Hoyas', 'Orangemen', 'Orange', 'Badgers']
-        
-        for mascot in mascots:
-            if team_name.endswith(mascot):
-                base_name = team_name.replace(mascot, '').strip()
-                break
+        base_name, first_word = team_name_patterns(team_name)
         
         # Query player_stats using the team_name column (much faster!)
         query = """
@@ -110,7 +144,7 @@ class NCAAFeatureEngineering:
         
         # Try various name formats
         like_pattern1 = f"%{base_name}%"
-        like_pattern2 = f"%{team_name.split()[0]}%"
+        like_pattern2 = f"%{first_word}%"
         
         df = pd.read_sql_query(query, self.conn, 
                                params=(season, team_name, like_pattern1, like_pattern2))
@@ -119,16 +153,7 @@ class NCAAFeatureEngineering:
             return None
         
         # Calculate team aggregates
-        aggregates = {
-            'avg_player_ortg': df['offensive_rating'].mean(),
-            'top_player_ortg': df['offensive_rating'].max(),
-            'top3_avg_ortg': df.nlargest(3, 'offensive_rating')['offensive_rating'].mean(),
-            'avg_usage': df['usage_rate'].mean(),
-            'avg_assist_rate': df['assist_rate'].mean(),
-            'avg_turnover_rate': df['turnover_rate'].mean(),
-            'roster_depth': len(df[df['minutes_played'] > 10]),  # Players with significant minutes
-            'minutes_concentration': df.nlargest(5, 'minutes_played')['minutes_played'].sum() / df['minutes_played'].sum() if df['minutes_played'].sum() > 0 else 0
-        }
+        aggregates = aggregate_player_stats(df)
         
         self.player_stats_cache[cache_key] = aggregates
         return aggregates
@@ -320,6 +345,250 @@ class NCAAFeatureEngineering:
         return output_file
 
 
+class FeatureService:
+    """
+    Long-lived feature builder for live predictions: one connection, player
+    aggregates per (team, season) cached in memory and in team_player_aggregates
+    """
+    
+    def __init__(self, db_path=DB_PATH, ttl_seconds=AGGREGATES_TTL_SECONDS):
+        self.conn = sqlite3.connect(db_path)
+        self.ttl_seconds = ttl_seconds
+        self._aggregates = {}      # (team_name, season) -> (aggregates or None, computed_at)
+        self._players = {}         # season -> (player_stats rows grouped by team_name, loaded_at)
+        self.hits = 0
+        self.misses = 0
+        self._create_table()
+    
+    def _create_table(self):
+        columns = ',\n'.join(f"                {c} REAL" for c in AGGREGATE_COLUMNS)
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS team_player_aggregates (
+                team_name TEXT NOT NULL,
+                season INTEGER NOT NULL,
+{columns},
+                player_count INTEGER NOT NULL,
+                computed_at REAL NOT NULL,
+                PRIMARY KEY (team_name, season)
+            )
+        """)
+        self.conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_team_player_aggregates_season
+            ON team_player_aggregates(season, computed_at)
+        """)
+        self.conn.commit()
+    
+    def _fresh(self, computed_at):
+        return time.time() - computed_at < self.ttl_seconds
+    
+    def _season_players(self, season):
+        """The season's player_stats rows, grouped by player_stats.team_name (one query per TTL)"""
+        cached = self._players.get(season)
+        if cached and self._fresh(cached[1]):
+            return cached[0]
+        
+        query = """
+            SELECT 
+                team_name,
+                offensive_rating,
+                usage_rate,
+                minutes_played,
+                assist_rate,
+                turnover_rate,
+                true_shooting_pct,
+                games_played
+            FROM player_stats
+            WHERE season = ?
+            AND offensive_rating IS NOT NULL
+            AND team_name IS NOT NULL
+        """
+        df = pd.read_sql_query(query, self.conn, params=(season,))
+        by_team = {name: rows.drop(columns='team_name') for name, rows in df.groupby('team_name', sort=False)}
+        self._players[season] = (by_team, time.time())
+        logger.info(f"Loaded {len(df):,} player_stats rows for {len(by_team)} teams (season {season})")
+        return by_team
+    
+    def _compute_aggregates(self, team_name, season):
+        """get_team_player_aggregates' name matching (exact or LIKE base name / first word), in memory"""
+        base_name, first_word = team_name_patterns(team_name)
+        patterns = (base_name.lower(), first_word.lower())
+        
+        by_team = self._season_players(season)
+        matched = [
+            rows for name, rows in by_team.items()
+            if name == team_name or any(p in name.lower() for p in patterns)
+        ]
+        if not matched:
+            return None
+        return aggregate_player_stats(pd.concat(matched, ignore_index=True))
+    
+    def preload(self, season, team_names=None):
+        """
+        Cache aggregates for every team in the season (or just team_names):
+        fresh rows from team_player_aggregates, the rest computed and saved
+        """
+        if team_names is None:
+            query = """
+                SELECT home_team_name AS team_name FROM games WHERE season = ?
+                UNION
+                SELECT away_team_name FROM games WHERE season = ?
+            """
+            team_names = [row[0] for row in self.conn.execute(query, (season, season)) if row[0]]
+        
+        query = f"""
+            SELECT team_name, {', '.join(AGGREGATE_COLUMNS)}, player_count, computed_at
+            FROM team_player_aggregates
+            WHERE season = ? AND computed_at >= ?
+        """
+        stored = pd.read_sql_query(query, self.conn, params=(season, time.time() - self.ttl_seconds))
+        for row in stored.itertuples(index=False):
+            aggregates = {c: getattr(row, c) for c in AGGREGATE_COLUMNS} if row.player_count else None
+            if aggregates:
+                aggregates['roster_depth'] = int(aggregates['roster_depth'])
+            self._aggregates[(row.team_name, season)] = (aggregates, row.computed_at)
+        
+        missing = [t for t in dict.fromkeys(team_names) if not self._cached(t, season)]
+        if missing:
+            self._store(season, {team: self._compute_aggregates(team, season) for team in missing})
+        logger.info(f"Player aggregates for season {season}: {len(stored)} from team_player_aggregates, "
+                    f"{len(missing)} computed")
+    
+    def _cached(self, team_name, season):
+        entry = self._aggregates.get((team_name, season))
+        return entry is not None and self._fresh(entry[1])
+    
+    def _store(self, season, aggregates_by_team):
+        computed_at = time.time()
+        rows = []
+        for team_name, aggregates in aggregates_by_team.items():
+            self._aggregates[(team_name, season)] = (aggregates, computed_at)
+            values = [None if aggregates is None else float(aggregates[c]) for c in AGGREGATE_COLUMNS]
+            rows.append((team_name, season, *values, 0 if aggregates is None else 1, computed_at))
+        
+        placeholders = ', '.join('?' * (len(AGGREGATE_COLUMNS) + 4))
+        with self.conn:
+            self.conn.executemany(f"""
+                INSERT OR REPLACE INTO team_player_aggregates
+                (team_name, season, {', '.join(AGGREGATE_COLUMNS)}, player_count, computed_at)
+                VALUES ({placeholders})
+            """, rows)
+    
+    def get_team_player_aggregates(self, team_name, season):
+        """Cached equivalent of NCAAFeatureEngineering.get_team_player_aggregates"""
+        if self._cached(team_name, season):
+            self.hits += 1
+            return self._aggregates[(team_name, season)][0]
+        
+        self.misses += 1
+        aggregates = self._compute_aggregates(team_name, season)
+        self._store(season, {team_name: aggregates})
+        return aggregates
+    
+    def invalidate(self, team_name=None, season=None):
+        """
+        Drop cached aggregates (for one team, one season, or everything) after
+        a lineup/roster update - they are recomputed from fresh player_stats
+        """
+        keys = [k for k in self._aggregates
+                if (team_name is None or k[0] == team_name) and (season is None or k[1] == season)]
+        for key in keys:
+            del self._aggregates[key]
+        for cached_season in list(self._players):
+            if season is None or cached_season == season:
+                del self._players[cached_season]
+        
+        with self.conn:
+            self.conn.execute("""
+                DELETE FROM team_player_aggregates
+                WHERE (? IS NULL OR team_name = ?) AND (? IS NULL OR season = ?)
+            """, (team_name, team_name, season, season))
+        logger.debug(f"Invalidated player aggregates for {team_name or 'all teams'} ({season or 'all seasons'})")
+    
+    def build_features_for_game(self, game_id, home_team, away_team, game_date, season):
+        """
+        Build features for a single game (for live prediction).
+        
+        Returns:
+            dict: Feature dictionary ready for model input, or None if features can't be built
+        """
+        try:
+            home_aggregates = self.get_team_player_aggregates(home_team, season)
+            away_aggregates = self.get_team_player_aggregates(away_team, season)
+            
+            if home_aggregates is None or away_aggregates is None:
+                logger.warning(f"Missing player aggregates for {home_team} vs {away_team}")
+                return None
+            
+            # Build feature dict
+            features = {}
+            
+            # Home team features
+            for key, value in home_aggregates.items():
+                features[f'home_{key}'] = value
+            
+            # Away team features
+            for key, value in away_aggregates.items():
+                features[f'away_{key}'] = value
+            
+            # Differential features
+            for key in home_aggregates.keys():
+                features[f'diff_{key}'] = home_aggregates[key] - away_aggregates[key]
+            
+            # Fill any missing values with 0
+            for key in features:
+                if pd.isna(features[key]):
+                    features[key] = 0.0
+            
+            logger.debug(f"Built {len(features)} features for {home_team} vs {away_team}")
+            return features
+            
+        except Exception as e:
+            logger.error(f"Error building features for game {game_id}: {e}")
+            return None
+    
+    def build_features_for_games(self, games):
+        """
+        Build features for a list of games (dicts with game_id, home_team_name,
+        away_team_name, game_date, season). Every team's aggregates are loaded
+        up front - one player_stats query per season at most.
+        
+        Returns:
+            list: Feature dicts (None where features can't be built), in the order of games
+        """
+        teams_by_season = {}
+        for game in games:
+            teams_by_season.setdefault(game['season'], []).extend([game['home_team_name'], game['away_team_name']])
+        for season, team_names in teams_by_season.items():
+            self.preload(season, team_names)
+        
+        return [
+            self.build_features_for_game(game['game_id'], game['home_team_name'], game['away_team_name'],
+                                         game['game_date'], game['season'])
+            for game in games
+        ]
+    
+    def stats(self):
+        return {
+            'cached_teams': len(self._aggregates),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+    
+    def close(self):
+        self.conn.close()
+
+
+_feature_service = None
+
+
+def get_feature_service():
+    """The process-wide FeatureService (created on first use)"""
+    global _feature_service
+    if _feature_service is None:
+        _feature_service = FeatureService()
+    return _feature_service
+
+
 def build_features_for_game(game_id, home_team, away_team, game_date, season):
     """
     Build features for a single game (for live prediction).
@@ -334,47 +603,12 @@ def build_features_for_game(game_id, home_team, away_team, game_date, season):
     Returns:
         dict: Feature dictionary ready for model input, or None if features can't be built
     """
-    try:
-        fe = NCAAFeatureEngineering()
-        
-        # Convert game_date to datetime if it's a string
-        if isinstance(game_date, str):
-            game_date = pd.to_datetime(game_date)
-        
-        # Get player aggregates for both teams
-        home_aggregates = fe.get_team_player_aggregates(home_team, season, game_date)
-        away_aggregates = fe.get_team_player_aggregates(away_team, season, game_date)
-        
-        if home_aggregates is None or away_aggregates is None:
-            logger.warning(f"Missing player aggregates for {home_team} vs {away_team}")
-            return None
-        
-        # Build feature dict
-        features = {}
-        
-        # Home team features
-        for key, value in home_aggregates.items():
-            features[f'home_{key}'] = value
-        
-        # Away team features
-        for key, value in away_aggregates.items():
-            features[f'away_{key}'] = value
-        
-        # Differential features
-        for key in home_aggregates.keys():
-            features[f'diff_{key}'] = home_aggregates[key] - away_aggregates[key]
-        
-        # Fill any missing values with 0
-        for key in features:
-            if pd.isna(features[key]):
-                features[key] = 0.0
-        
-        logger.debug(f"Built {len(features)} features for {home_team} vs {away_team}")
-        return features
-        
-    except Exception as e:
-        logger.error(f"Error building features for game {game_id}: {e}")
-        return None
+    return get_feature_service().build_features_for_game(game_id, home_team, away_team, game_date, season)
+
+
+def build_features_for_games(games):
+    """Build features for a list of games - see FeatureService.build_features_for_games"""
+    return get_feature_service().build_features_for_games(games)
 
 
 def main():
@@ -0,0 +1,83 @@
+"""
+Async Backend Client
+Non-blocking HTTP client for the C# Betfair backend (aiohttp), for asyncio betting loops.
+
+Every race task shares one aiohttp session (keep-alive connection pool), so
+dozens of concurrent races await their own placeOrders / listCurrentOrders
+responses instead of each holding a thread-pool worker inside requests.
+
+Responses keep the requests-style surface the betting scripts already use
+(status_code, text, json()), so call sites only change to `await`.
+
+Usage:
+    backend = AsyncBackendClient("http://localhost:5173")
+    response = await backend.get("/api/account/funds", timeout=10)
+    if response.status_code == 200:
+        print(response.json())
+    await backend.close()
+"""
+
+import json
+import logging
+from typing import Any, Dict, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+MAX_CONNECTIONS = 50   # Concurrent in-flight requests to the backend
+
+
+class BackendResponse:
+    """Fully-read HTTP response (status_code, text, json())"""
+
+    __slots__ = ('status_code', 'text', '_json')
+
+    def __init__(self, status_code: int, text: str):
+        self.status_code = status_code
+        self.text = text
+        self._json = None
+
+    def json(self) -> Any:
+        if self._json is None:
+            self._json = json.loads(self.text)
+        return self._json
+
+
+class AsyncBackendClient:
+    """Shared aiohttp session for the backend API"""
+
+    def __init__(self, base_url: str, max_connections: int = MAX_CONNECTIONS):
+        self.base_url = base_url.rstrip('/')
+        self.max_connections = max_connections
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Created lazily so it binds to the running event loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections)
+            )
+        return self._session
+
+    async def request(self, method: str, path: str, timeout: float = 10,
+                      params: Optional[Dict] = None, json_body: Any = None) -> BackendResponse:
+        """Send a request and read the whole body. Raises aiohttp/asyncio errors like requests would."""
+        async with self._get_session().request(
+            method, f"{self.base_url}{path}",
+            params=params, json=json_body,
+            timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            return BackendResponse(response.status, await response.text())
+
+    async def get(self, path: str, timeout: float = 10, params: Optional[Dict] = None) -> BackendResponse:
+        return await self.request('GET', path, timeout=timeout, params=params)
+
+    async def post(self, path: str, json: Any = None, timeout: float = 10,
+                   params: Optional[Dict] = None) -> BackendResponse:
+        return await self.request('POST', path, timeout=timeout, params=params, json_body=json)
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
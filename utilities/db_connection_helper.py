@@ -1,13 +1,21 @@
 """
 Database Connection Helper
 Provides robust database connections for PostgreSQL
+
+Connections are pooled per database: get_db_connection() checks a connection
+out of the pool and conn.close() hands it back, so existing callers keep
+working unchanged while skipping the TCP + auth handshake on every query.
 """
 
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras
 import time
 import logging
-from typing import Optional
+import threading
+import weakref
+import atexit
+from typing import Dict, Optional
 from contextlib import contextmanager
 import os
 
@@ -16,6 +24,11 @@ logger = logging.getLogger(__name__)
 # Track which databases we've already logged connection for
 _logged_connections = set()
 
+# Connection pool settings (per database, per process)
+POOL_MAX_SIZE = int(os.environ.get('BETFAIR_DB_POOL_MAX_SIZE', 5))
+POOL_IDLE_TIMEOUT = float(os.environ.get('BETFAIR_DB_POOL_IDLE_TIMEOUT', 300))   # Close idle connections after 5 min
+POOL_HEALTH_CHECK_AFTER = 30.0   # Ping connections that have been idle longer than this before reuse
+
 # PostgreSQL Configuration
 PG_CONFIG = {
     'betfairmarket': {
@@ -69,18 +82,206 @@ DB_PATH_MAPPING = {
 }
 
 
-def get_db_connection(db_path: str, timeout: float = 30.0) -> psycopg2.extensions.connection:
+class PooledConnection(psycopg2.extensions.connection):
     """
-    Create a PostgreSQL database connection.
-    
-    Args:
-        db_path: Original SQLite path (will be mapped to PostgreSQL database)
-        timeout: Timeout in seconds (used for compatibility, PostgreSQL handles timeouts differently)
-    
-    Returns:
-        PostgreSQL connection object
+    psycopg2 connection that returns itself to its pool on close().
+
+    Callers use it exactly like a normal connection; call discard() (or let
+    the pool detect a broken connection) to really close it.
     """
-    # Map SQLite path to PostgreSQL database name
+
+    _pool = None
+
+    def close(self):
+        pool = self._pool
+        if pool is None or self.closed:
+            super().close()
+            return
+        pool.release(self)
+
+    def discard(self):
+        """Really close the connection instead of returning it to the pool"""
+        pool = self._pool
+        self._pool = None
+        if pool is not None:
+            pool.forget(self)
+        super().close()
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of PostgreSQL connections for a single database.
+
+    - Checkout reuses the most recently returned connection (LIFO)
+    - Connections idle longer than POOL_HEALTH_CHECK_AFTER are pinged before reuse
+    - Connections idle longer than idle_timeout are closed
+    - At most max_size connections are open (idle + checked out); checkout blocks
+      up to `timeout` seconds when the pool is exhausted
+    """
+
+    def __init__(self, db_name: str, config: Dict, max_size: int = POOL_MAX_SIZE,
+                 idle_timeout: float = POOL_IDLE_TIMEOUT):
+        self.db_name = db_name
+        self.config = config
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+
+        self._idle = []  # [(connection, returned_at)]
+        # Checked-out connections; weak so a caller that never calls close()
+        # frees its slot once the connection is garbage collected
+        self._in_use = weakref.WeakSet()
+        self._opening = 0  # Slots reserved for connections currently being opened
+        self._cond = threading.Condition(threading.Lock())
+
+        self.created = 0
+        self.reused = 0
+        self.evicted = 0
+
+    def _open_count(self) -> int:
+        return len(self._idle) + len(self._in_use) + self._opening
+
+    def _connect(self) -> PooledConnection:
+        conn = psycopg2.connect(connection_factory=PooledConnection, **self.config)
+        conn.autocommit = False  # Require explicit commits
+        conn._pool = self
+        self.created += 1
+        if self.db_name not in _logged_connections:
+            logger.debug(f"Opened PostgreSQL pool for {self.db_name} (max {self.max_size})")
+            _logged_connections.add(self.db_name)
+        return conn
+
+    @staticmethod
+    def _is_healthy(conn: PooledConnection) -> bool:
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _evict_idle(self, now: float):
+        """Close connections idle longer than idle_timeout (caller holds the lock)"""
+        keep = []
+        for conn, returned_at in self._idle:
+            if now - returned_at > self.idle_timeout:
+                self._close_quietly(conn)
+                self.evicted += 1
+            else:
+                keep.append((conn, returned_at))
+        self._idle = keep
+
+    @staticmethod
+    def _close_quietly(conn: PooledConnection):
+        conn._pool = None
+        try:
+            psycopg2.extensions.connection.close(conn)
+        except Exception:
+            pass
+
+    def acquire(self, timeout: float = 30.0) -> PooledConnection:
+        """Check out a healthy connection, opening a new one if needed"""
+        deadline = time.monotonic() + timeout
+
+        while True:
+            with self._cond:
+                now = time.monotonic()
+                self._evict_idle(now)
+
+                candidate = None
+                if self._idle:
+                    candidate, returned_at = self._idle.pop()
+                    self._in_use.add(candidate)
+                elif self._open_count() < self.max_size:
+                    candidate, returned_at = None, None
+                    self._opening += 1
+                else:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise psycopg2.OperationalError(
+                            f"Connection pool for {self.db_name} exhausted ({self.max_size} connections in use)"
+                        )
+                    self._cond.wait(remaining)
+                    continue
+
+            if candidate is None:
+                # Open the new connection outside the lock
+                conn = None
+                try:
+                    conn = self._connect()
+                finally:
+                    with self._cond:
+                        self._opening -= 1
+                        if conn is not None:
+                            self._in_use.add(conn)
+                        else:
+                            self._cond.notify()
+                return conn
+
+            # Ping connections that sat idle long enough for the server to drop them
+            if candidate.closed or (now - returned_at > POOL_HEALTH_CHECK_AFTER and not self._is_healthy(candidate)):
+                logger.debug(f"Discarding dead pooled connection to {self.db_name}")
+                candidate.discard()
+                continue
+
+            self.reused += 1
+            return candidate
+
+    def release(self, conn: PooledConnection):
+        """Return a connection to the pool, rolling back any open transaction"""
+        reusable = not conn.closed
+        if reusable:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if conn.autocommit:
+                    conn.autocommit = False
+            except psycopg2.Error:
+                reusable = False
+
+        with self._cond:
+            self._in_use.discard(conn)
+            if reusable and self._open_count() < self.max_size:
+                self._idle.append((conn, time.monotonic()))
+            else:
+                self._close_quietly(conn)
+            self._cond.notify()
+
+    def forget(self, conn: PooledConnection):
+        """Drop a connection from the pool's bookkeeping (it is being closed)"""
+        with self._cond:
+            self._in_use.discard(conn)
+            self._cond.notify()
+
+    def close_all(self):
+        """Close every idle connection (checked-out connections close on release)"""
+        with self._cond:
+            for conn, _ in self._idle:
+                self._close_quietly(conn)
+            self._idle = []
+            self._cond.notify_all()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                'db_name': self.db_name,
+                'idle': len(self._idle),
+                'in_use': len(self._in_use),
+                'max_size': self.max_size,
+                'created': self.created,
+                'reused': self.reused,
+                'evicted': self.evicted,
+            }
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def resolve_db_name(db_path: str) -> str:
+    """Map an old SQLite path or database name to a PostgreSQL database name"""
     db_name = DB_PATH_MAPPING.get(db_path)
     
     if not db_name:
@@ -94,12 +295,57 @@ def get_db_connection(db_path: str, timeout: float = 30.0) -> psycopg2.extension
     if db_name not in PG_CONFIG:
         raise ValueError(f"Unknown PostgreSQL database: {db_name}")
     
+    return db_name
+
+
+def get_pool(db_path: str) -> ConnectionPool:
+    """Get (or lazily create) the connection pool for a database"""
+    db_name = resolve_db_name(db_path)
+    pool = _pools.get(db_name)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(db_name)
+            if pool is None:
+                pool = ConnectionPool(db_name, PG_CONFIG[db_name])
+                _pools[db_name] = pool
+    return pool
+
+
+def close_all_pools():
+    """Close all idle pooled connections (e.g. on shutdown)"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close_all()
+
+
+def get_pool_stats() -> Dict[str, Dict]:
+    """Per-database pool statistics"""
+    return {db_name: pool.stats() for db_name, pool in list(_pools.items())}
+
+
+atexit.register(close_all_pools)
+
+
+def get_db_connection(db_path: str, timeout: float = 30.0) -> psycopg2.extensions.connection:
+    """
+    Get a pooled PostgreSQL database connection.
+    
+    Call conn.close() when done - this returns the connection to the pool
+    (rolling back anything uncommitted) rather than closing the socket.
+    
+    Args:
+        db_path: Original SQLite path (will be mapped to PostgreSQL database)
+        timeout: Max seconds to wait for a free connection when the pool is full
+    
+    Returns:
+        PostgreSQL connection object
+    """
+    pool = get_pool(db_path)
+    
     try:
-        conn = psycopg2.connect(**PG_CONFIG[db_name])
-        conn.autocommit = False  # Require explicit commits
-        return conn
+        return pool.acquire(timeout)
     except psycopg2.Error as e:
-        logger.error(f"Failed to connect to PostgreSQL {db_name}: {e}")
+        logger.error(f"Failed to connect to PostgreSQL {pool.db_name}: {e}")
         raise
 
 
@@ -138,6 +384,8 @@ def db_transaction(db_path: str, max_retries: int = 3, timeout: float = 30.0):
                     conn.rollback()
                 except:
                     pass
+                # Don't hand a possibly-broken connection back to the pool
+                conn.discard()
                     
             last_error = e
             
@@ -203,6 +451,14 @@ def execute_with_retry(db_path: str, query: str, params: tuple = (), max_retries
         except psycopg2.OperationalError as e:
             last_error = e
             
+            if conn:
+                # Don't hand a possibly-broken connection back to the pool
+                dropped = bool(conn.closed)
+                conn.discard()
+                if dropped and attempt < max_retries - 1:
+                    logger.warning(f"Pooled connection dropped, retry {attempt + 1}/{max_retries}...")
+                    continue
+            
             if "deadlock" in str(e).lower() and attempt < max_retries - 1:
                 wait_time = (attempt + 1) * 0.5
                 logger.warning(f"Database deadlock, retry {attempt + 1}/{max_retries} in {wait_time}s...")
@@ -246,3 +502,15 @@ if __name__ == "__main__":
             conn.close()
         except Exception as e:
             print(f"❌ {db_name}: {e}")
+    
+    print()
+    print("Testing connection pool reuse...")
+    for db_name in PG_CONFIG:
+        try:
+            for _ in range(3):
+                conn = get_db_connection(db_name)
+                conn.cursor().execute("SELECT 1")
+                conn.close()
+            print(f"✅ {db_name}: {get_pool_stats()[db_name]}")
+        except Exception as e:
+            print(f"❌ {db_name}: {e}")
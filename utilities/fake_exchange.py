@@ -0,0 +1,757 @@
+"""
+Fake Exchange
+A local stand-in for the C# backend and the Betfair Stream API, so the betting
+scripts can be load-tested (e.g. 40 concurrent races) without a session token,
+real money or anything on localhost:5173.
+
+- FakeExchange holds scripted greyhound markets (runners, best back/lay prices,
+  scheduled start times) and the orders placed on them. Each price round moves
+  one runner per market a tick up or down (tick_ladder); a lay order at or
+  above the best lay price matches with fill_probability (at placement and on
+  each later move of its runner), so some bets rest and get cancelled/replaced
+- Markets stay OPEN (betDelay 1, so the live script's "race likely delayed"
+  guard passes) until jump_delay seconds after the scheduled start, are then
+  SUSPENDED, and CLOSED close_after seconds later (unmatched LAPSE orders lapse,
+  BSP orders are matched)
+- The fake backend (aiohttp) serves what the scripts call:
+    GET  /api/GreyhoundMarketBook/market/{id}    GET  /api/GreyhoundMarketBook/status/{id}
+    POST /api/GreyhoundMarketBook/markets        POST /api/PlaceOrder
+    GET  /api/ManageOrders/current               POST /api/ManageOrders/cancel?marketId=
+    GET  /api/account/funds
+  plus GET /api/fake/stats (request counts/latency and stream traffic)
+- The fake stream server speaks the Stream API over TLS: connection message,
+  authentication, marketSubscription (SUB_IMAGE, then deltas at mcm_rate
+  price rounds per second), orderSubscription (an ocm on every order change)
+  and heartbeats. A self-signed certificate for localhost is generated with
+  openssl unless one is given - clients trust it via BETFAIR_STREAM_CAFILE
+- backend_latency_ms delays every backend response, to mimic the real
+  backend's round trip to Betfair
+
+Usage:
+    python fake_exchange.py --races 40 --first-race 90 --spread 20 --mcm-rate 5 \\
+        --backend-port 5174 --stream-port 8443 --scenario-out /tmp/scenario.json
+
+    BETFAIR_BACKEND_URL=http://localhost:5174 BETFAIR_STREAM_HOST=localhost \\
+        BETFAIR_STREAM_PORT=8443 BETFAIR_STREAM_CAFILE=/tmp/fake_exchange/cert.pem ...
+
+greyhound-live/lay_betting/benchmark_lay_betting.py starts one of these and
+drives the live strategy against it.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import random
+import signal
+import ssl
+import subprocess
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Set
+
+from aiohttp import web
+
+from tick_ladder import add_ticks, round_price
+
+logger = logging.getLogger(__name__)
+
+BACKEND_PORT = 5174          # Next to the real backend's 5173
+STREAM_PORT = 8443
+CERT_DIR = "/tmp/fake_exchange"
+MCM_RATE = 5.0               # Price rounds per second (one runner moves per market per round)
+JUMP_DELAY = 20.0            # Seconds after the scheduled start a market is suspended
+CLOSE_AFTER = 30.0           # Seconds after suspension a market closes
+FILL_PROBABILITY = 0.5       # Chance a matchable lay order is (partly) filled at each opportunity
+BALANCE = 10000.0
+
+VENUES = ('Wentworth Park', 'The Meadows', 'Sandown Park', 'Albion Park', 'Angle Park', 'Cannington',
+          'Richmond', 'Healesville', 'Ballarat', 'Bendigo', 'Gosford', 'Dubbo')
+
+
+def build_scenario(races: int = 40, first_race_seconds: float = 90.0, spread_seconds: float = 20.0,
+                   runners: int = 8, min_odds: float = 1.5, max_odds: float = 4.0,
+                   seed: Optional[int] = None) -> List[Dict]:
+    """Markets for `races` races starting first_race_seconds from now, spread over spread_seconds"""
+    rng = random.Random(seed)
+    now = time.time()
+    base_id = rng.randrange(900000000, 990000000)
+    markets = []
+    for i in range(races):
+        favourite = rng.uniform(min_odds, max_odds)
+        # Second favourite within 3.5x, so the dominant-favourite guard doesn't skip every race
+        prices = [favourite, favourite * rng.uniform(1.05, 3.5)]
+        prices += [prices[1] * rng.uniform(1.0, 6.0) for _ in range(runners - 2)]
+        rng.shuffle(prices)
+        markets.append({
+            'market_id': f"1.{base_id + i}",
+            'venue': VENUES[i % len(VENUES)],
+            'country': 'AU',
+            'race_number': i // len(VENUES) + 1,
+            'start_time': now + first_race_seconds + spread_seconds * i / max(races - 1, 1),
+            'runners': [
+                {
+                    'selection_id': 40000000 + i * 100 + box,
+                    'name': f"Fake Dog {i}-{box}",
+                    'box': box,
+                    'lay': round_price(price),
+                }
+                for box, price in enumerate(prices, start=1)
+            ],
+        })
+    return markets
+
+
+def ensure_certificate(cert_dir: str = CERT_DIR) -> tuple:
+    """(certfile, keyfile) for localhost - a self-signed pair is generated with openssl if missing"""
+    os.makedirs(cert_dir, exist_ok=True)
+    certfile = os.path.join(cert_dir, 'cert.pem')
+    keyfile = os.path.join(cert_dir, 'key.pem')
+    if not (os.path.exists(certfile) and os.path.exists(keyfile)):
+        subprocess.run([
+            'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '30',
+            '-subj', '/CN=localhost', '-addext', 'subjectAltName=DNS:localhost,IP:127.0.0.1',
+            '-keyout', keyfile, '-out', certfile,
+        ], check=True, capture_output=True)
+        logger.info(f"🔐 Generated self-signed certificate {certfile}")
+    return certfile, keyfile
+
+
+def _iso(epoch: float) -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+class FakeRunner:
+    __slots__ = ('selection_id', 'name', 'box', 'lay', 'lay_size', 'back', 'back_size', 'ltp', 'tv')
+
+    def __init__(self, selection_id: int, name: str, box: int, lay: float, rng: random.Random):
+        self.selection_id = selection_id
+        self.name = name
+        self.box = box
+        self.lay = lay
+        self.back = add_ticks(lay, -1)
+        self.lay_size = round(rng.uniform(20, 200), 2)
+        self.back_size = round(rng.uniform(20, 200), 2)
+        self.ltp = lay
+        self.tv = 0.0
+
+    def rc(self) -> Dict:
+        """Runner change with the current best prices (level 0)"""
+        return {
+            'id': self.selection_id,
+            'batl': [[0, self.lay, self.lay_size]],
+            'batb': [[0, self.back, self.back_size]],
+            'ltp': self.ltp,
+            'tv': self.tv,
+        }
+
+
+class FakeMarket:
+    def __init__(self, spec: Dict, rng: random.Random):
+        self.market_id = spec['market_id']
+        self.venue = spec['venue']
+        self.country = spec.get('country', 'AU')
+        self.race_number = spec['race_number']
+        self.start_time = spec['start_time']
+        self.runners: Dict[int, FakeRunner] = {
+            r['selection_id']: FakeRunner(r['selection_id'], r['name'], r['box'], r['lay'], rng)
+            for r in spec['runners']
+        }
+        self.status = 'OPEN'
+        self.bet_delay = 1
+        self.version = 1
+
+    def definition(self) -> Dict:
+        return {
+            'status': self.status,
+            'inPlay': False,
+            'betDelay': self.bet_delay,
+            'marketTime': _iso(self.start_time),
+            'eventTypeId': '4339',
+            'venue': self.venue,
+            'countryCode': self.country,
+            'numberOfActiveRunners': len(self.runners),
+            'version': self.version,
+            'runners': [
+                {'id': r.selection_id, 'sortPriority': r.box, 'status': 'ACTIVE'}  # No names, as on Betfair
+                for r in self.runners.values()
+            ],
+        }
+
+    def image(self) -> Dict:
+        return {
+            'id': self.market_id,
+            'img': True,
+            'marketDefinition': self.definition(),
+            'tv': self.total_matched(),
+            'rc': [r.rc() for r in self.runners.values()],
+        }
+
+    def total_matched(self) -> float:
+        return round(sum(r.tv for r in self.runners.values()), 2)
+
+    def odds_rows(self) -> List[Dict]:
+        """/api/GreyhoundMarketBook/market/{id} 'odds' rows"""
+        if self.status == 'CLOSED':
+            return []
+        rows = []
+        for r in self.runners.values():
+            rows.append({'selectionid': r.selection_id, 'status': 'ACTIVE', 'pricetype': 'AvailableToBack',
+                         'price': r.back, 'size': r.back_size})
+            rows.append({'selectionid': r.selection_id, 'status': 'ACTIVE', 'pricetype': 'AvailableToLay',
+                         'price': r.lay, 'size': r.lay_size})
+        return rows
+
+
+class FakeExchange:
+    """Markets, orders and the price random walk; stream connections listen for changes"""
+
+    def __init__(self, scenario: List[Dict], jump_delay: float = JUMP_DELAY, close_after: float = CLOSE_AFTER,
+                 fill_probability: float = FILL_PROBABILITY, seed: Optional[int] = None):
+        self.rng = random.Random(seed)
+        self.fill_probability = fill_probability
+        self.markets: Dict[str, FakeMarket] = {spec['market_id']: FakeMarket(spec, self.rng) for spec in scenario}
+        self.jump_delay = jump_delay
+        self.close_after = close_after
+        self.orders: Dict[str, Dict] = {}
+        self._resting: Dict[str, Dict[str, Dict]] = {}   # market_id -> betId -> unmatched LIMIT orders
+        self._bet_ids = itertools.count(300000000001)
+        self.balance = BALANCE
+        self.connections: Set['StreamConnection'] = set()
+
+        self.stats = {
+            'orders_placed': 0,
+            'orders_rejected': 0,
+            'orders_cancelled': 0,
+            'size_matched': 0.0,
+            'price_rounds': 0,
+            'mcm_sent': 0,
+            'ocm_sent': 0,
+            'stream_connections': 0,
+        }
+
+    # Prices -------------------------------------------------------------
+
+    def price_round(self) -> List[Dict]:
+        """Move one runner per open market; returns the mc entries (market changes) for the stream"""
+        changes = []
+        for market in self.markets.values():
+            mc = self._advance_status(market)
+            if market.status != 'OPEN':
+                if mc:
+                    changes.append(mc)
+                continue
+
+            runner = self.rng.choice(list(market.runners.values()))
+            runner.lay = add_ticks(runner.lay, self.rng.choice((-1, 1)))
+            runner.back = add_ticks(runner.lay, -1)
+            runner.lay_size = round(self.rng.uniform(20, 200), 2)
+            runner.back_size = round(self.rng.uniform(20, 200), 2)
+            traded = round(self.rng.uniform(1, 50), 2)
+            runner.tv = round(runner.tv + traded, 2)
+            runner.ltp = runner.back
+            self._match_resting(market, runner)
+
+            mc = mc or {'id': market.market_id}
+            mc['tv'] = market.total_matched()
+            mc['rc'] = [runner.rc()]
+            changes.append(mc)
+
+        self.stats['price_rounds'] += 1
+        return changes
+
+    def _advance_status(self, market: FakeMarket) -> Optional[Dict]:
+        now = time.time()
+        status = market.status
+        if status == 'OPEN' and now >= market.start_time + self.jump_delay:
+            market.status = 'SUSPENDED'
+        elif status == 'SUSPENDED' and now >= market.start_time + self.jump_delay + self.close_after:
+            market.status = 'CLOSED'
+            self._close_orders(market)
+        if market.status == status:
+            return None
+        market.version += 1
+        return {'id': market.market_id, 'marketDefinition': market.definition()}
+
+    # Orders -------------------------------------------------------------
+
+    def place_order(self, market_id: str, instruction: Dict) -> Dict:
+        """One placeOrders instruction -> instruction report"""
+        market = self.markets.get(market_id)
+        if market is None or market.status != 'OPEN':
+            self.stats['orders_rejected'] += 1
+            error = 'MARKET_NOT_OPEN_FOR_BETTING' if market else 'INVALID_MARKET_ID'
+            return {'status': 'FAILURE', 'errorCode': error, 'instruction': instruction}
+        runner = market.runners.get(instruction.get('selectionId'))
+        if runner is None:
+            self.stats['orders_rejected'] += 1
+            return {'status': 'FAILURE', 'errorCode': 'INVALID_RUNNER', 'instruction': instruction}
+
+        order_type = instruction.get('orderType', 'LIMIT')
+        if order_type == 'LIMIT':
+            limit = instruction.get('limitOrder', {})
+            price, size = round_price(limit['price']), float(limit['size'])
+            persistence = limit.get('persistenceType') or instruction.get('persistenceType', 'LAPSE')
+        elif order_type == 'LIMIT_ON_CLOSE':
+            price = instruction.get('limitOnCloseOrder', {}).get('price')
+            size = float(instruction.get('limitOnCloseOrder', {}).get('liability', 0))
+            persistence = 'MARKET_ON_CLOSE'
+        else:
+            price = None
+            size = float(instruction.get('marketOnCloseOrder', {}).get('liability', 0))
+            persistence = 'MARKET_ON_CLOSE'
+
+        bet_id = str(next(self._bet_ids))
+        order = self.orders[bet_id] = {
+            'betId': bet_id,
+            'marketId': market_id,
+            'selectionId': runner.selection_id,
+            'handicap': 0,
+            'priceSize': {'price': price, 'size': size},
+            'side': 'LAY',
+            'status': 'EXECUTABLE',
+            'orderType': order_type,
+            'persistenceType': persistence,
+            'placedDate': _iso(time.time()),
+            'averagePriceMatched': 0.0,
+            'sizeMatched': 0.0,
+            'sizeRemaining': size,
+            'sizeLapsed': 0.0,
+            'sizeCancelled': 0.0,
+        }
+        self.stats['orders_placed'] += 1
+
+        if order_type == 'LIMIT':
+            self._resting.setdefault(market_id, {})[bet_id] = order
+            self._match(order, runner, notify=False)
+        self._order_changed(order)
+
+        return {
+            'status': 'SUCCESS',
+            'betId': bet_id,
+            'placedDate': order['placedDate'],
+            'averagePriceMatched': order['averagePriceMatched'],
+            'sizeMatched': order['sizeMatched'],
+            'orderStatus': order['status'],
+            'instruction': instruction,
+        }
+
+    def _match(self, order: Dict, runner: FakeRunner, notify: bool = True):
+        """A lay at price P matches the best available-to-lay offer when P >= it"""
+        if order['sizeRemaining'] <= 0 or order['priceSize']['price'] < runner.lay or runner.lay_size <= 0:
+            return
+        if self.rng.random() >= self.fill_probability:
+            return
+        fill = min(order['sizeRemaining'], runner.lay_size)
+        matched = order['sizeMatched'] + fill
+        order['averagePriceMatched'] = round(
+            (order['averagePriceMatched'] * order['sizeMatched'] + runner.lay * fill) / matched, 4)
+        order['sizeMatched'] = round(matched, 2)
+        order['sizeRemaining'] = round(order['sizeRemaining'] - fill, 2)
+        runner.lay_size = round(runner.lay_size - fill, 2)
+        runner.tv = round(runner.tv + fill, 2)
+        self.stats['size_matched'] += fill
+        if order['sizeRemaining'] <= 0:
+            order['status'] = 'EXECUTION_COMPLETE'
+            self._resting.get(order['marketId'], {}).pop(order['betId'], None)
+        if notify:
+            self._order_changed(order)
+
+    def _match_resting(self, market: FakeMarket, runner: FakeRunner):
+        for order in list(self._resting.get(market.market_id, {}).values()):
+            if order['selectionId'] == runner.selection_id:
+                self._match(order, runner)
+
+    def cancel_order(self, market_id: str, bet_id: str) -> Dict:
+        order = self.orders.get(str(bet_id))
+        if order is None or order['marketId'] != market_id:
+            return {'status': 'FAILURE', 'errorCode': 'INVALID_BET_ID', 'instruction': {'betId': bet_id}}
+        if order['status'] == 'EXECUTION_COMPLETE' or order['orderType'] != 'LIMIT':
+            return {'status': 'FAILURE', 'errorCode': 'BET_TAKEN_OR_LAPSED', 'instruction': {'betId': bet_id}}
+
+        cancelled = order['sizeRemaining']
+        order['sizeCancelled'] = cancelled
+        order['sizeRemaining'] = 0.0
+        order['status'] = 'EXECUTION_COMPLETE'
+        self._resting.get(market_id, {}).pop(order['betId'], None)
+        self.stats['orders_cancelled'] += 1
+        self._order_changed(order)
+        return {'status': 'SUCCESS', 'sizeCancelled': cancelled, 'instruction': {'betId': bet_id}}
+
+    def _close_orders(self, market: FakeMarket):
+        """Market closed: unmatched LAPSE orders lapse, BSP orders are matched at the favourite's last price"""
+        for order in self.orders.values():
+            if order['marketId'] != market.market_id or order['status'] != 'EXECUTABLE':
+                continue
+            if order['orderType'] == 'LIMIT':
+                order['sizeLapsed'] = order['sizeRemaining']
+            else:
+                order['sizeMatched'] = order['sizeRemaining']
+                order['averagePriceMatched'] = market.runners[order['selectionId']].ltp
+            order['sizeRemaining'] = 0.0
+            order['status'] = 'EXECUTION_COMPLETE'
+            self._order_changed(order)
+        self._resting.pop(market.market_id, None)
+
+    def current_orders(self) -> List[Dict]:
+        """listCurrentOrders: every order on a market that isn't closed yet"""
+        return [o for o in self.orders.values() if self.markets[o['marketId']].status != 'CLOSED']
+
+    def _order_changed(self, order: Dict):
+        for connection in list(self.connections):
+            connection.order_changed(order)
+
+
+class StreamConnection:
+    """One client connection to the fake stream server"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, exchange: FakeExchange, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.exchange = exchange
+        self.reader = reader
+        self.writer = writer
+        self.connection_id = f"fake-{next(self._ids):03d}"
+        self.authenticated = False
+        self.markets: Set[str] = set()
+        self.market_sub_id = None
+        self.order_sub_id = None
+        self.heartbeat_ms = 5000
+        self.last_sent = time.monotonic()
+        self._clk = itertools.count(1)
+
+    def send(self, message: Dict):
+        if self.writer.is_closing():
+            return
+        self.writer.write((json.dumps(message) + '\r\n').encode('utf-8'))
+        self.last_sent = time.monotonic()
+
+    def _change_message(self, op: str, sub_id: int, **fields) -> Dict:
+        return {'op': op, 'id': sub_id, 'clk': str(next(self._clk)), 'pt': int(time.time() * 1000), **fields}
+
+    def market_changes(self, changes: List[Dict]):
+        if self.market_sub_id is None:
+            return
+        mc = [change for change in changes if change['id'] in self.markets]
+        if mc:
+            self.send(self._change_message('mcm', self.market_sub_id, mc=mc))
+            self.exchange.stats['mcm_sent'] += 1
+
+    def order_changed(self, order: Dict):
+        if self.order_sub_id is None:
+            return
+        status = 'EC' if order['status'] == 'EXECUTION_COMPLETE' else 'E'
+        uo = {
+            'id': order['betId'], 'p': order['priceSize']['price'], 's': order['priceSize']['size'],
+            'side': 'L', 'status': status, 'pt': 'L', 'ot': 'L' if order['orderType'] == 'LIMIT' else 'LOC',
+            'sm': order['sizeMatched'], 'sr': order['sizeRemaining'], 'sl': order['sizeLapsed'],
+            'sc': order['sizeCancelled'], 'avp': order['averagePriceMatched'],
+        }
+        self.send(self._change_message('ocm', self.order_sub_id, oc=[
+            {'id': order['marketId'], 'orc': [{'id': order['selectionId'], 'uo': [uo]}]}
+        ]))
+        self.exchange.stats['ocm_sent'] += 1
+
+    def _status(self, message_id, status: str = 'SUCCESS', error: Optional[str] = None, close: bool = False):
+        response = {'op': 'status', 'id': message_id, 'statusCode': status, 'connectionClosed': close,
+                    'connectionId': self.connection_id}
+        if error:
+            response['errorCode'] = error
+        self.send(response)
+
+    def handle(self, message: Dict) -> bool:
+        """Handle one client message. Returns False to close the connection."""
+        op, message_id = message.get('op'), message.get('id')
+        if op == 'authentication':
+            self.authenticated = bool(message.get('session'))
+            self._status(message_id, 'SUCCESS' if self.authenticated else 'FAILURE',
+                         None if self.authenticated else 'NO_SESSION', close=not self.authenticated)
+            return self.authenticated
+        if not self.authenticated:
+            self._status(message_id, 'FAILURE', 'NOT_AUTHORIZED', close=True)
+            return False
+
+        if op == 'marketSubscription':
+            # A new subscription replaces the previous market set
+            self.markets = set(message.get('marketFilter', {}).get('marketIds') or [])
+            self.market_sub_id = message_id
+            self.heartbeat_ms = message.get('heartbeatMs', self.heartbeat_ms)
+            self._status(message_id)
+            images = [self.exchange.markets[m].image() for m in self.markets if m in self.exchange.markets]
+            clk = str(next(self._clk))
+            self.send({'op': 'mcm', 'id': message_id, 'initialClk': clk, 'clk': clk,
+                       'pt': int(time.time() * 1000), 'ct': 'SUB_IMAGE', 'mc': images})
+            self.exchange.stats['mcm_sent'] += 1
+        elif op == 'orderSubscription':
+            self.order_sub_id = message_id
+            self.heartbeat_ms = message.get('heartbeatMs', self.heartbeat_ms)
+            self._status(message_id)
+            for order in self.exchange.current_orders():
+                self.order_changed(order)
+        elif op == 'heartbeat':
+            self._status(message_id)
+        else:
+            self._status(message_id, 'FAILURE', 'INVALID_REQUEST')
+        return True
+
+    async def heartbeats(self):
+        while not self.writer.is_closing():
+            await asyncio.sleep(self.heartbeat_ms / 1000.0 / 2)
+            if time.monotonic() - self.last_sent < self.heartbeat_ms / 1000.0:
+                continue
+            if self.market_sub_id is not None:
+                self.send(self._change_message('mcm', self.market_sub_id, ct='HEARTBEAT'))
+            if self.order_sub_id is not None:
+                self.send(self._change_message('ocm', self.order_sub_id, ct='HEARTBEAT'))
+
+    async def run(self):
+        self.exchange.connections.add(self)
+        self.exchange.stats['stream_connections'] += 1
+        heartbeat_task = asyncio.create_task(self.heartbeats())
+        self.send({'op': 'connection', 'connectionId': self.connection_id})
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    self._status(None, 'FAILURE', 'INVALID_INPUT', close=True)
+                    break
+                if not self.handle(message):
+                    break
+                await self.writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            heartbeat_task.cancel()
+            self.exchange.connections.discard(self)
+            self.writer.close()
+
+
+class FakeExchangeServer:
+    """The fake backend + stream server + price rounds on one event loop"""
+
+    def __init__(self, exchange: FakeExchange, backend_port: int = BACKEND_PORT, stream_port: int = STREAM_PORT,
+                 mcm_rate: float = MCM_RATE, backend_latency_ms: float = 0.0, cert_dir: str = CERT_DIR,
+                 host: str = '127.0.0.1'):
+        self.exchange = exchange
+        self.backend_port = backend_port
+        self.stream_port = stream_port
+        self.mcm_rate = mcm_rate
+        self.backend_latency = backend_latency_ms / 1000.0
+        self.cert_dir = cert_dir
+        self.host = host
+        self.request_stats: Dict[str, Dict] = {}
+        self._runner = None
+        self._stream_server = None
+        self._ticker = None
+        self.started_at = None
+
+    # Backend ------------------------------------------------------------
+
+    @web.middleware
+    async def _timed(self, request, handler):
+        start = time.perf_counter()
+        if self.backend_latency:
+            await asyncio.sleep(self.backend_latency)
+        try:
+            return await handler(request)
+        finally:
+            route = request.match_info.route.resource.canonical if request.match_info.route.resource else request.path
+            stats = self.request_stats.setdefault(f"{request.method} {route}", {'count': 0, 'total_ms': 0.0})
+            stats['count'] += 1
+            stats['total_ms'] += (time.perf_counter() - start) * 1000
+
+    def _market_or_404(self, request) -> FakeMarket:
+        market = self.exchange.markets.get(request.match_info['market_id'])
+        if market is None:
+            raise web.HTTPNotFound(text=json.dumps({'error': 'Market not found'}), content_type='application/json')
+        return market
+
+    async def market_book(self, request):
+        market = self._market_or_404(request)
+        return web.json_response({'marketId': market.market_id, 'odds': market.odds_rows()})
+
+    async def market_books(self, request):
+        body = await request.json()
+        markets = {m: self.exchange.markets[m].odds_rows() for m in body.get('marketIds', [])
+                   if m in self.exchange.markets}
+        return web.json_response({'markets': markets})
+
+    async def market_status(self, request):
+        market = self._market_or_404(request)
+        return web.json_response({
+            'marketId': market.market_id,
+            'status': market.status,
+            'inplay': False,
+            'betDelay': market.bet_delay,
+            'numberOfActiveRunners': len(market.runners),
+        })
+
+    async def place_order(self, request):
+        body = await request.json()
+        market_id = body.get('marketId')
+        reports = [self.exchange.place_order(market_id, instruction) for instruction in body.get('instructions', [])]
+        failed = next((r for r in reports if r['status'] != 'SUCCESS'), None)
+        return web.json_response({
+            'customerRef': body.get('customerRef'),
+            'status': 'FAILURE' if failed else 'SUCCESS',
+            'errorCode': failed['errorCode'] if failed else None,
+            'marketId': market_id,
+            'instructionReports': reports,
+        })
+
+    async def cancel_orders(self, request):
+        market_id = request.query.get('marketId')
+        instructions = await request.json() if request.can_read_body else []
+        if not instructions:
+            instructions = [{'betId': o['betId']} for o in self.exchange.current_orders()
+                            if o['marketId'] == market_id and o['status'] == 'EXECUTABLE']
+        reports = [self.exchange.cancel_order(market_id, i.get('betId')) for i in instructions]
+        failed = next((r for r in reports if r['status'] != 'SUCCESS'), None)
+        return web.json_response({
+            'status': 'FAILURE' if failed else 'SUCCESS',
+            'errorCode': failed['errorCode'] if failed else None,
+            'marketId': market_id,
+            'instructionReports': reports,
+        })
+
+    async def current_orders(self, request):
+        return web.json_response({'currentOrders': self.exchange.current_orders(), 'moreAvailable': False})
+
+    async def account_funds(self, request):
+        return web.json_response({'availableToBetBalance': self.exchange.balance, 'exposure': 0.0})
+
+    async def fake_stats(self, request):
+        return web.json_response(self.stats())
+
+    def stats(self) -> Dict:
+        elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+        return {
+            'elapsed_seconds': round(elapsed, 2),
+            'exchange': dict(self.exchange.stats, size_matched=round(self.exchange.stats['size_matched'], 2)),
+            'requests': {
+                route: {'count': s['count'], 'mean_ms': round(s['total_ms'] / s['count'], 3)}
+                for route, s in sorted(self.request_stats.items())
+            },
+            'markets': {status: sum(1 for m in self.exchange.markets.values() if m.status == status)
+                        for status in ('OPEN', 'SUSPENDED', 'CLOSED')},
+        }
+
+    def _app(self) -> web.Application:
+        app = web.Application(middlewares=[self._timed])
+        app.router.add_get('/api/GreyhoundMarketBook/market/{market_id}', self.market_book)
+        app.router.add_post('/api/GreyhoundMarketBook/markets', self.market_books)
+        app.router.add_get('/api/GreyhoundMarketBook/status/{market_id}', self.market_status)
+        app.router.add_post('/api/PlaceOrder', self.place_order)
+        app.router.add_post('/api/ManageOrders/cancel', self.cancel_orders)
+        app.router.add_get('/api/ManageOrders/current', self.current_orders)
+        app.router.add_get('/api/account/funds', self.account_funds)
+        app.router.add_get('/api/fake/stats', self.fake_stats)
+        return app
+
+    # Stream -------------------------------------------------------------
+
+    async def _price_rounds(self):
+        interval = 1.0 / self.mcm_rate
+        while True:
+            changes = self.exchange.price_round()
+            if changes:
+                for connection in list(self.exchange.connections):
+                    connection.market_changes(changes)
+            await asyncio.sleep(interval)
+
+    async def _on_stream_client(self, reader, writer):
+        await StreamConnection(self.exchange, reader, writer).run()
+
+    # Lifecycle ----------------------------------------------------------
+
+    async def start(self):
+        self._runner = web.AppRunner(self._app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.backend_port).start()
+
+        certfile, keyfile = ensure_certificate(self.cert_dir)
+        context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+        context.load_cert_chain(certfile, keyfile)
+        self._stream_server = await asyncio.start_server(self._on_stream_client, self.host, self.stream_port,
+                                                         ssl=context)
+        self._ticker = asyncio.create_task(self._price_rounds())
+        self.started_at = time.monotonic()
+        logger.info(f"🧪 Fake backend on http://{self.host}:{self.backend_port}, stream on {self.host}:{self.stream_port} "
+                    f"(TLS, CA {certfile}) - {len(self.exchange.markets)} markets, {self.mcm_rate:g} price rounds/s")
+
+    async def stop(self):
+        if self._ticker is not None:
+            self._ticker.cancel()
+        if self._stream_server is not None:
+            self._stream_server.close()
+            for connection in list(self.exchange.connections):
+                connection.writer.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+async def _serve(args):
+    if args.scenario:
+        with open(args.scenario) as f:
+            scenario = json.load(f)
+    else:
+        scenario = build_scenario(args.races, args.first_race, args.spread, seed=args.seed)
+        if args.scenario_out:
+            with open(args.scenario_out, 'w') as f:
+                json.dump(scenario, f)
+
+    exchange = FakeExchange(scenario, jump_delay=args.jump_delay, close_after=args.close_after,
+                            fill_probability=args.fill_probability, seed=args.seed)
+    server = FakeExchangeServer(exchange, args.backend_port, args.stream_port, args.mcm_rate,
+                                args.backend_latency_ms, args.cert_dir)
+    await server.start()
+    print(f"FAKE_EXCHANGE_READY backend=http://127.0.0.1:{args.backend_port} stream=127.0.0.1:{args.stream_port} "
+          f"cafile={os.path.join(args.cert_dir, 'cert.pem')}", flush=True)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await asyncio.wait_for(stop.wait(), args.duration)
+    except asyncio.TimeoutError:
+        pass
+    finally:
+        logger.info(f"🧪 Fake exchange stats: {json.dumps(server.stats())}")
+        await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the backend API and Betfair Stream API")
+    parser.add_argument('--races', type=int, default=40)
+    parser.add_argument('--first-race', type=float, default=90.0, help="Seconds until the first scheduled start")
+    parser.add_argument('--spread', type=float, default=20.0, help="Seconds between the first and last starts")
+    parser.add_argument('--scenario', help="Markets JSON (from build_scenario) instead of generating them")
+    parser.add_argument('--scenario-out', help="Write the generated markets JSON here")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--mcm-rate', type=float, default=MCM_RATE, help="Price rounds per second")
+    parser.add_argument('--jump-delay', type=float, default=JUMP_DELAY)
+    parser.add_argument('--close-after', type=float, default=CLOSE_AFTER)
+    parser.add_argument('--fill-probability', type=float, default=FILL_PROBABILITY)
+    parser.add_argument('--backend-latency-ms', type=float, default=0.0)
+    parser.add_argument('--backend-port', type=int, default=BACKEND_PORT)
+    parser.add_argument('--stream-port', type=int, default=STREAM_PORT)
+    parser.add_argument('--cert-dir', default=CERT_DIR)
+    parser.add_argument('--duration', type=float, help="Stop after this many seconds (default: until Ctrl-C)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    asyncio.run(_serve(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Latency Metrics
+Per-stage timers for the betting pipeline, so a change can be shown to move
+bet latency (or not).
+
+- span(stage) times a block (sync or async code - it measures wall time, so
+  awaits inside the block count) and feeds that stage's histogram
+- Each stage keeps cumulative bucket counts (for Prometheus) plus its most
+  recent WINDOW samples, from which p50/p95/p99 are computed
+- observe(stage, ms) records a value directly - e.g. odds_age, the age of the
+  prices a bet decision was made on
+- count(event) keeps simple counters (e.g. which odds source was used)
+
+Export (either, or both):
+- serve(port) starts a Prometheus text endpoint at http://127.0.0.1:<port>/metrics
+- jsonl_path writes every observation as one JSON line to a rotating file
+  (RotatingFileHandler - max_bytes per file, `backups` old files kept)
+
+Usage:
+    metrics = LatencyMetrics('live_lay_position_1', jsonl_path='.../latency.jsonl')
+    metrics.serve(9108)
+    with metrics.span('place_limit_bet', market_id=market_id):
+        bet = await self.place_limit_bet(...)
+    metrics.observe('odds_age', 120.0, market_id=market_id)
+    metrics.log_summary()
+"""
+
+import bisect
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+QUANTILES = (0.5, 0.95, 0.99)
+WINDOW = 2048                      # Recent samples kept per stage for the quantiles
+JSONL_MAX_BYTES = 10 * 1024 * 1024
+JSONL_BACKUPS = 5
+
+
+class Histogram:
+    """Cumulative bucket counts plus a window of recent samples for one stage (milliseconds)"""
+
+    __slots__ = ('bucket_counts', 'count', 'sum', 'max', 'recent')
+
+    def __init__(self, window: int = WINDOW):
+        self.bucket_counts = [0] * (len(BUCKETS_MS) + 1)   # Last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, ms: float):
+        self.bucket_counts[bisect.bisect_left(BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.sum += ms
+        if ms > self.max:
+            self.max = ms
+        self.recent.append(ms)
+
+    def quantiles(self) -> Dict[float, Optional[float]]:
+        """Nearest-rank quantiles over the recent window"""
+        samples = sorted(self.recent)
+        if not samples:
+            return {q: None for q in QUANTILES}
+        return {q: samples[min(len(samples) - 1, int(q * len(samples)))] for q in QUANTILES}
+
+    def summary(self) -> Dict:
+        quantiles = self.quantiles()
+        return {
+            'count': self.count,
+            'mean_ms': round(self.sum / self.count, 3) if self.count else None,
+            'p50_ms': quantiles[0.5],
+            'p95_ms': quantiles[0.95],
+            'p99_ms': quantiles[0.99],
+            'max_ms': self.max,
+        }
+
+
+class LatencyMetrics:
+    """Named stage histograms and counters for one process"""
+
+    def __init__(self, name: str, jsonl_path: Optional[str] = None,
+                 max_bytes: int = JSONL_MAX_BYTES, backups: int = JSONL_BACKUPS):
+        self.name = name
+        self._lock = threading.Lock()   # The Prometheus endpoint reads from its own thread
+        self._histograms: Dict[str, Histogram] = {}
+        self._counters: Dict[str, int] = {}
+        self._server = None
+
+        self._events = None
+        if jsonl_path:
+            handler = RotatingFileHandler(jsonl_path, maxBytes=max_bytes, backupCount=backups)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self._events = logging.getLogger(f"latency.{name}")
+            self._events.propagate = False   # Keep observations out of the main log
+            self._events.setLevel(logging.INFO)
+            self._events.addHandler(handler)
+
+    @contextmanager
+    def span(self, stage: str, **labels):
+        """Time the enclosed block as one `stage` observation"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, (time.perf_counter() - start) * 1000, **labels)
+
+    def observe(self, stage: str, ms: float, **labels):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram()
+            histogram.observe(ms)
+
+        if self._events is not None:
+            self._events.info(json.dumps({'ts': round(time.time(), 3), 'stage': stage, 'ms': round(ms, 3), **labels},
+                                         default=str))
+
+    def count(self, event: str, n: int = 1):
+        with self._lock:
+            self._counters[event] = self._counters.get(event, 0) + n
+
+    def snapshot(self) -> Dict:
+        """{'stages': {stage: summary}, 'counters': {...}}"""
+        with self._lock:
+            return {
+                'stages': {stage: h.summary() for stage, h in sorted(self._histograms.items())},
+                'counters': dict(self._counters),
+            }
+
+    def log_summary(self):
+        snapshot = self.snapshot()
+        if not snapshot['stages']:
+            return
+        logger.info(f"⏱️  Latency ({self.name}):")
+        for stage, s in snapshot['stages'].items():
+            logger.info(f"   {stage:<22} n={s['count']:<6} p50={s['p50_ms']:.1f}ms "
+                        f"p95={s['p95_ms']:.1f}ms p99={s['p99_ms']:.1f}ms max={s['max_ms']:.1f}ms")
+        if snapshot['counters']:
+            logger.info(f"   counters: {snapshot['counters']}")
+
+    # Prometheus ---------------------------------------------------------
+
+    def prometheus_text(self) -> str:
+        """Prometheus text exposition: a histogram + quantile gauges per stage, and the counters"""
+        lines = [
+            '# HELP betting_stage_latency_ms Betting pipeline stage latency in milliseconds',
+            '# TYPE betting_stage_latency_ms histogram',
+        ]
+        quantile_lines = [
+            '# HELP betting_stage_latency_ms_quantile Stage latency quantiles over the recent window',
+            '# TYPE betting_stage_latency_ms_quantile gauge',
+        ]
+        with self._lock:
+            for stage, h in sorted(self._histograms.items()):
+                labels = f'process="{self.name}",stage="{stage}"'
+                cumulative = 0
+                for bound, n in zip(BUCKETS_MS + ('+Inf',), h.bucket_counts):
+                    cumulative += n
+                    lines.append(f'betting_stage_latency_ms_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'betting_stage_latency_ms_sum{{{labels}}} {h.sum}')
+                lines.append(f'betting_stage_latency_ms_count{{{labels}}} {h.count}')
+                for q, value in h.quantiles().items():
+                    if value is not None:
+                        quantile_lines.append(f'betting_stage_latency_ms_quantile{{{labels},quantile="{q}"}} {value}')
+
+            lines += quantile_lines
+            if self._counters:
+                lines += ['# HELP betting_events_total Betting pipeline event counts', '# TYPE betting_events_total counter']
+                for event, n in sorted(self._counters.items()):
+                    lines.append(f'betting_events_total{{process="{self.name}",event="{event}"}} {n}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port: int, host: str = '127.0.0.1'):
+        """Serve /metrics on a daemon thread"""
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/metrics', '/'):
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass   # No access log per scrape
+
+        try:
+            self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        except OSError as e:
+            logger.warning(f"⚠️  Latency metrics endpoint not started on port {port}: {e}")
+            return
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name=f"latency-metrics-{self.name}", daemon=True).start()
+        logger.info(f"⏱️  Latency metrics at http://{host}:{port}/metrics")
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._events is not None:
+            for handler in list(self._events.handlers):
+                handler.close()
+                self._events.removeHandler(handler)
@@ -0,0 +1,290 @@
+"""
+Lay Strategy Backtester
+Replays recorded market books + settled results through the lay_position_N.py
+decision logic, for a whole grid of strategy variants at once.
+
+Decision logic (same as LayStrategy.select_runner / lay_position_N.py):
+- runners ranked by (best lay price, selection_id) - lower selection ID breaks ties
+- runner at POSITION_TO_LAY is laid if 0 < odds <= MAX_ODDS (and >= min odds)
+- stake = FLAT_STAKE, liability = stake * (odds - 1)
+- runner WON -> lose the liability, otherwise win the stake
+
+Data:
+- best lay per runner = MIN(AvailableToLay price) in greyhoundmarketbook / horsemarketbook,
+  the same number get_odds_from_db bets on. The book is upserted per price level (no
+  timestamps), so this is the last recorded ladder, not a point-in-time snapshot.
+- result = runner status; only markets with a WINNER are replayed, REMOVED runners dropped
+
+Markets are loaded ONCE into a (markets x rank) odds/won matrix; every
+(position, min odds, max odds) variant is then a column slice + boolean mask,
+so a sweep of positions 1-8 x dozens of odds caps is a few NumPy passes.
+
+Usage:
+    python lay_backtest.py greyhound --positions 1-8 --max-odds 3,4,5,6,8,10,15,20,50,500
+    python lay_backtest.py horse --positions 1-18 --since 2025-01-01 --workers 4
+"""
+
+import sys
+sys.path.insert(0, '/Users/clairegrady/RiderProjects/betfair/utilities')
+
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from db_connection_helper import get_db_connection
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Market book table and paper trades table per sport
+SOURCES = {
+    'greyhound': {'book_table': 'greyhoundmarketbook', 'trades_table': 'paper_trades_greyhounds'},
+    'horse': {'book_table': 'horsemarketbook', 'trades_table': 'paper_trades_horses'},
+}
+
+# Upper bound on (variants x markets) cells evaluated per NumPy pass
+CHUNK_CELLS = 20_000_000
+
+
+@dataclass
+class ReplayBook:
+    """Settled markets as matrices: row = market (oldest first), column = rank by (odds, selection_id)"""
+    market_ids: np.ndarray      # (M,)
+    odds: np.ndarray            # (M, R) best lay price, NaN where the market has fewer runners
+    won: np.ndarray             # (M, R) runner at this rank was the WINNER
+    selection_ids: np.ndarray   # (M, R) 0 where empty
+
+    @property
+    def num_markets(self) -> int:
+        return len(self.market_ids)
+
+
+def market_ids_since(sport: str, since: str, until: Optional[str] = None) -> List[str]:
+    """Markets the paper strategies saw between dates (paper trades table), to replay the same universe"""
+    table = SOURCES[sport]['trades_table']
+    conn = get_db_connection('betfair_trades')
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT DISTINCT market_id
+        FROM {table}
+        WHERE date >= %s
+        AND (%s::text IS NULL OR date <= %s)
+    """, (since, until, until))
+    market_ids = [row[0] for row in cursor.fetchall()]
+    conn.close()
+    return market_ids
+
+
+def load_runners(sport: str, market_ids: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    One row per priced runner in every settled market: market_id, selection_id, odds, won.
+    A single grouped query over the market book (optionally restricted to market_ids).
+    """
+    table = SOURCES[sport]['book_table']
+    conn = get_db_connection('betfairmarket')
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT marketid, selectionid,
+               MIN(price) FILTER (WHERE pricetype = 'AvailableToLay' AND price > 0) AS best_lay,
+               BOOL_OR(status = 'WINNER') AS won,
+               BOOL_OR(status = 'REMOVED') AS removed
+        FROM {table}
+        WHERE (%s::text[] IS NULL OR marketid = ANY(%s))
+        GROUP BY marketid, selectionid
+    """, (market_ids, market_ids))
+    runners = pd.DataFrame(cursor.fetchall(), columns=['market_id', 'selection_id', 'odds', 'won', 'removed'])
+    conn.close()
+
+    runners = runners[~runners['removed'].fillna(False).astype(bool) & runners['odds'].notna()]
+    runners['won'] = runners['won'].fillna(False).astype(bool)
+
+    # Only markets with a result
+    settled = runners.groupby('market_id')['won'].transform('any')
+    logger.info(f"📊 Loaded {runners.loc[settled, 'market_id'].nunique()} settled {sport} markets "
+                f"({runners['market_id'].nunique()} recorded)")
+    return runners.loc[settled, ['market_id', 'selection_id', 'odds', 'won']]
+
+
+def build_book(runners: pd.DataFrame) -> ReplayBook:
+    """Rank runners by (odds, selection_id) within each market and pack into matrices"""
+    if runners.empty:
+        empty = np.empty((0, 0))
+        return ReplayBook(np.array([], dtype=object), empty, empty.astype(bool), empty.astype(np.int64))
+
+    runners = runners.copy()
+    runners['odds'] = runners['odds'].astype(float)
+    # Betfair market IDs increase over time ("1.234567890") - oldest market first for drawdown
+    runners['market_order'] = runners['market_id'].str.split('.').str[-1].astype(np.int64)
+    runners = runners.sort_values(['market_order', 'market_id', 'odds', 'selection_id'], kind='stable')
+
+    by_market = runners.groupby('market_id', sort=False)
+    market_ids = runners['market_id'].drop_duplicates().to_numpy()
+    row = by_market.ngroup().to_numpy()
+    rank = by_market.cumcount().to_numpy()
+
+    shape = (len(market_ids), int(rank.max()) + 1)
+    odds = np.full(shape, np.nan)
+    won = np.zeros(shape, dtype=bool)
+    selection_ids = np.zeros(shape, dtype=np.int64)
+    odds[row, rank] = runners['odds'].to_numpy()
+    won[row, rank] = runners['won'].to_numpy()
+    selection_ids[row, rank] = runners['selection_id'].to_numpy()
+    return ReplayBook(market_ids, odds, won, selection_ids)
+
+
+def _max_drawdown(pnl: np.ndarray) -> np.ndarray:
+    """Largest peak-to-trough drop of cumulative P&L, per row"""
+    equity = np.cumsum(pnl, axis=1)
+    peak = np.maximum.accumulate(np.maximum(equity, 0.0), axis=1)
+    return (peak - equity).max(axis=1, initial=0.0)
+
+
+def evaluate_position(book: ReplayBook, position: int, min_odds: np.ndarray, max_odds: np.ndarray,
+                      stake: float) -> pd.DataFrame:
+    """All (min_odds[i], max_odds[i]) variants laying the runner at one market position"""
+    results = []
+    if position > book.odds.shape[1]:
+        odds = np.full(book.num_markets, np.nan)
+        won = np.zeros(book.num_markets, dtype=bool)
+    else:
+        odds = book.odds[:, position - 1]
+        won = book.won[:, position - 1]
+
+    # Per-market P&L for a 1-unit lay if the bet is placed
+    unit_pnl = np.where(won, 1.0 - odds, 1.0)
+    unit_liability = odds - 1.0
+    priced = odds > 0  # NaN (not enough runners) compares False
+
+    chunk = max(1, CHUNK_CELLS // max(book.num_markets, 1))
+    for i in range(0, len(max_odds), chunk):
+        lo = min_odds[i:i + chunk, None]
+        hi = max_odds[i:i + chunk, None]
+        placed = priced & (odds >= lo) & (odds <= hi)
+
+        pnl = np.where(placed, unit_pnl, 0.0) * stake
+        bets = placed.sum(axis=1)
+        losses = (placed & won).sum(axis=1)
+        liability = np.where(placed, unit_liability, 0.0).sum(axis=1) * stake
+        total_pnl = pnl.sum(axis=1)
+
+        results.append(pd.DataFrame({
+            'position': position,
+            'min_odds': lo[:, 0],
+            'max_odds': hi[:, 0],
+            'bets': bets,
+            'wins': bets - losses,
+            'losses': losses,
+            'strike_rate': np.divide(bets - losses, bets, out=np.zeros(len(bets)), where=bets > 0) * 100,
+            'total_stake': bets * stake,
+            'total_liability': liability,
+            'pnl': total_pnl,
+            'roi_on_liability': np.divide(total_pnl, liability, out=np.zeros(len(bets)), where=liability > 0) * 100,
+            'max_drawdown': _max_drawdown(pnl),
+        }))
+
+    return pd.concat(results, ignore_index=True)
+
+
+def sweep(book: ReplayBook, positions: Iterable[int], max_odds: Iterable[float],
+          min_odds: Iterable[float] = (1.0,), stake: float = 10, workers: int = 1) -> pd.DataFrame:
+    """
+    Evaluate every position x min_odds x max_odds variant over the book.
+    workers > 1 spreads positions over a process pool.
+    """
+    lo, hi = np.meshgrid(np.asarray(list(min_odds), dtype=float), np.asarray(list(max_odds), dtype=float))
+    keep = lo.ravel() <= hi.ravel()
+    lo, hi = lo.ravel()[keep], hi.ravel()[keep]
+    positions = list(positions)
+
+    if workers > 1 and len(positions) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            frames = list(pool.map(evaluate_position, [book] * len(positions), positions,
+                                   [lo] * len(positions), [hi] * len(positions), [stake] * len(positions)))
+    else:
+        frames = [evaluate_position(book, p, lo, hi, stake) for p in positions]
+
+    return pd.concat(frames, ignore_index=True).sort_values('pnl', ascending=False, ignore_index=True)
+
+
+def replay_bets(book: ReplayBook, position: int, max_odds: float, min_odds: float = 1.0,
+                stake: float = 10) -> pd.DataFrame:
+    """Bet-by-bet replay of ONE variant (for checking against paper_trades)"""
+    if position > book.odds.shape[1]:
+        return pd.DataFrame(columns=['market_id', 'selection_id', 'odds', 'stake', 'liability', 'result', 'profit_loss'])
+
+    odds = book.odds[:, position - 1]
+    won = book.won[:, position - 1]
+    placed = (odds > 0) & (odds >= min_odds) & (odds <= max_odds)
+
+    bets = pd.DataFrame({
+        'market_id': book.market_ids[placed],
+        'selection_id': book.selection_ids[placed, position - 1],
+        'odds': odds[placed],
+        'stake': stake,
+        'liability': stake * (odds[placed] - 1),
+        'result': np.where(won[placed], 'lost', 'won'),
+    })
+    bets['profit_loss'] = np.where(won[placed], -bets['liability'], stake)
+    return bets
+
+
+def parse_range(text: str) -> List[int]:
+    """'1-8' or '1,3,5' -> list of ints"""
+    values = []
+    for part in text.split(','):
+        if '-' in part:
+            start, end = part.split('-')
+            values.extend(range(int(start), int(end) + 1))
+        else:
+            values.append(int(part))
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay lay strategies over recorded markets")
+    parser.add_argument('sport', choices=sorted(SOURCES))
+    parser.add_argument('--positions', default='1-8', help="e.g. 1-8 or 1,2,5")
+    parser.add_argument('--max-odds', default='2,3,4,5,6,8,10,15,20,30,50,100,500')
+    parser.add_argument('--min-odds', default='1.0')
+    parser.add_argument('--stake', type=float, default=10)
+    parser.add_argument('--since', help="Only markets paper-traded on/after this date (YYYY-MM-DD)")
+    parser.add_argument('--until', help="Only markets paper-traded on/before this date (YYYY-MM-DD)")
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--out', help="Write the full sweep to this CSV")
+    args = parser.parse_args()
+
+    market_ids = market_ids_since(args.sport, args.since, args.until) if args.since else None
+    book = build_book(load_runners(args.sport, market_ids))
+    if book.num_markets == 0:
+        logger.info("No settled markets to replay")
+        return
+
+    results = sweep(
+        book,
+        positions=parse_range(args.positions),
+        max_odds=[float(x) for x in args.max_odds.split(',')],
+        min_odds=[float(x) for x in args.min_odds.split(',')],
+        stake=args.stake,
+        workers=args.workers,
+    )
+    logger.info(f"✅ {len(results)} variants over {book.num_markets} markets")
+
+    with pd.option_context('display.width', 200, 'display.max_columns', 20):
+        print(results.head(args.top).round(2).to_string(index=False))
+
+    if args.out:
+        results.to_csv(args.out, index=False, float_format='%.2f')
+        logger.info(f"📄 Wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
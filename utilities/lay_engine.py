@@ -0,0 +1,545 @@
+"""
+Multi-Strategy Lay Engine (Paper Trading)
+Runs every simulated lay strategy in ONE process instead of one
+lay_position_N.py process per position (8 greyhound + 18 horse scripts).
+
+Each cycle:
+- Each sport's race schedule comes from an in-memory RaceScheduleCache
+  (the table is only re-read when it changes)
+- Races are matched to markets through an in-memory MarketResolver index
+- Runner names and boxes come from an in-memory RunnerMetadataCache
+  (preloaded for the day's markets - no per-race SQL)
+- Odds are fetched ONCE per market (from the host's shared odds cache when
+  shared_odds.py serve is running) and every strategy due on that race
+  is evaluated against the same snapshot
+- All resulting paper trades for the race are written in one transaction
+
+Strategies are loaded from lay_strategies.json:
+    {"sport": "greyhound", "position": 2, "maxOdds": 500, "stake": 10, "windowStart": 5, "windowEnd": 15}
+A strategy is due on a race when windowStart <= seconds until race <= windowEnd.
+
+Usage:
+    python lay_engine.py [path/to/lay_strategies.json]
+"""
+
+import sys
+sys.path.insert(0, '/Users/clairegrady/RiderProjects/betfair/utilities')
+
+import os
+import json
+import time
+import requests
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+from db_connection_helper import get_db_connection
+from shared_odds import SharedOddsReader
+from runner_metadata import RunnerMetadataCache
+from race_schedule import RaceScheduleCache
+from market_resolver import MarketResolver
+
+STRATEGIES_PATH = "/Users/clairegrady/RiderProjects/betfair/utilities/lay_strategies.json"
+BACKEND_URL = "http://localhost:5173"
+LOG_PATH = "/Users/clairegrady/RiderProjects/betfair/utilities/logs/lay_engine.log"
+
+logger = logging.getLogger(__name__)
+
+
+def configure_logging(log_path: str = LOG_PATH):
+    """File + console logging for the engine process (not done at import - importers keep their own)"""
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(log_path),
+            logging.StreamHandler()
+        ]
+    )
+
+
+class LayStrategy:
+    """One position-based lay strategy (what used to be a lay_position_N.py script)"""
+
+    def __init__(self, sport: str, position: int, max_odds: float, stake: float,
+                 window_start: float, window_end: float, name: Optional[str] = None):
+        self.sport = sport
+        self.position = position
+        self.max_odds = max_odds
+        self.stake = stake
+        self.window_start = window_start
+        self.window_end = window_end
+        self.name = name or f"{sport}_lay_{position}"
+
+    @classmethod
+    def from_config(cls, config: Dict) -> 'LayStrategy':
+        return cls(
+            sport=config['sport'],
+            position=int(config['position']),
+            max_odds=float(config.get('maxOdds', 500)),
+            stake=float(config.get('stake', 10)),
+            window_start=float(config.get('windowStart', 5)),
+            window_end=float(config.get('windowEnd', 15)),
+            name=config.get('name'),
+        )
+
+    def is_due(self, seconds_until: float) -> bool:
+        return self.window_start <= seconds_until <= self.window_end
+
+    def select_runner(self, sorted_runners: List[Dict]) -> Optional[Dict]:
+        """
+        Pick the runner at this strategy's market position.
+
+        sorted_runners must be sorted by (odds, selection_id) - lower selection ID
+        breaks ties between runners at the same odds.
+        """
+        if len(sorted_runners) < self.position:
+            logger.warning(f"❌ [{self.name}] Not enough runners (need {self.position}, have {len(sorted_runners)})")
+            return None
+
+        target = sorted_runners[self.position - 1]
+
+        # Check for zero or invalid odds - DO NOT BET!
+        if target['odds'] <= 0:
+            logger.error(f"❌ [{self.name}] SKIPPING - Invalid odds {target['odds']} for {target['name']} (Position {self.position})")
+            return None
+
+        if target['odds'] > self.max_odds:
+            logger.info(f"⏭️  [{self.name}] Skipping - odds {target['odds']} > {self.max_odds}")
+            return None
+
+        return target
+
+
+def load_strategies(path: str = STRATEGIES_PATH) -> Dict:
+    """Load engine settings and strategy list from JSON"""
+    with open(path, 'r') as f:
+        config = json.load(f)
+
+    strategies = [LayStrategy.from_config(s) for s in config.get('strategies', [])]
+    names = [s.name for s in strategies]
+    duplicates = {n for n in names if names.count(n) > 1}
+    if duplicates:
+        raise ValueError(f"Duplicate strategy names in {path}: {sorted(duplicates)}")
+
+    return {
+        'poll_seconds': float(config.get('pollSeconds', 5)),
+        'strategies': strategies,
+    }
+
+
+class GreyhoundMarkets:
+    """Schedule, odds and trade storage for greyhound races"""
+
+    sport = 'greyhound'
+    emoji = '🐕'
+    schedule_table = 'greyhound_race_times'
+    # Only bet on the next race at each venue (lowest race number in the window)
+    next_race_per_venue = True
+
+    def __init__(self, session: requests.Session):
+        self.session = session
+        self.shared_odds = SharedOddsReader()
+        self.runner_metadata = RunnerMetadataCache(self.sport)  # Names/boxes for the day's markets
+        self.schedule = RaceScheduleCache(self.schedule_table)
+
+    def get_odds_from_db(self, market_id: str) -> Optional[List[Dict]]:
+        """Fallback: best (lowest) lay price per runner from greyhoundmarketbook"""
+        try:
+            conn = get_db_connection('betfairmarket')
+            cursor = conn.cursor()
+
+            cursor.execute("""
+                SELECT selectionid, MIN(price)
+                FROM greyhoundmarketbook
+                WHERE marketid = %s
+                AND pricetype = 'AvailableToLay'
+                AND price IS NOT NULL
+                AND price > 0
+                GROUP BY selectionid
+            """, (market_id,))
+            results = cursor.fetchall()
+            conn.close()
+
+            if not results:
+                logger.warning(f"❌ No lay prices in DB for market {market_id}")
+                return None
+
+            runner_names, box_numbers = self.runner_metadata.get(market_id)
+
+            return [
+                {
+                    'selection_id': sel_id,
+                    'odds': price,
+                    'name': runner_names.get(sel_id, f'Dog {sel_id}'),
+                    'number': box_numbers.get(sel_id)
+                }
+                for sel_id, price in results
+            ]
+
+        except Exception as e:
+            logger.error(f"Error getting odds from DB: {e}")
+            return None
+
+    def get_odds_and_runners(self, market_id: str) -> Optional[List[Dict]]:
+        """Current best lay odds for all runners (API first, then DB fallback)"""
+        try:
+            # Host-wide shared odds cache first (utilities/shared_odds.py serve), then the API
+            odds_data = self.shared_odds.odds_rows(market_id)
+            if odds_data is None:
+                url = f"{BACKEND_URL}/api/GreyhoundMarketBook/market/{market_id}"
+                response = self.session.get(url, timeout=10)
+
+                if response.status_code != 200:
+                    logger.debug(f"API returned {response.status_code}, trying DB fallback")
+                    return self.get_odds_from_db(market_id)
+
+                odds_data = response.json().get('odds', [])
+            if not odds_data:
+                logger.warning(f"❌ No odds data returned from API for market {market_id}")
+                return self.get_odds_from_db(market_id)
+
+            # FOR LAY BETTING: Use the best (lowest) lay price available - no back price fallback
+            selection_lay_odds = {}
+            for odd in odds_data:
+                sel_id = odd.get('selectionid')
+                price = odd.get('price')
+                if sel_id and price and price > 0 and odd.get('pricetype') == 'AvailableToLay':
+                    if sel_id not in selection_lay_odds or price < selection_lay_odds[sel_id]:
+                        selection_lay_odds[sel_id] = price
+
+            if not selection_lay_odds:
+                logger.warning(f"❌ No lay prices available for market {market_id} - skipping")
+                return None
+
+            runner_names, box_numbers = self.runner_metadata.get(market_id)
+
+            return [
+                {
+                    'selection_id': sel_id,
+                    'odds': odds,
+                    'name': runner_names.get(sel_id, f'Dog {sel_id}'),
+                    'number': box_numbers.get(sel_id)
+                }
+                for sel_id, odds in selection_lay_odds.items()
+            ]
+
+        except Exception as e:
+            logger.warning(f"API error: {e}, trying DB fallback")
+            return self.get_odds_from_db(market_id)
+
+    def insert_trades(self, cursor, race_info: Dict, bets: List[tuple], total_matched: Optional[float]):
+        """Insert (strategy, runner) paper trades for one race"""
+        now = datetime.now()
+        for strategy, runner in bets:
+            cursor.execute("""
+                INSERT INTO paper_trades_greyhounds
+                (date, venue, country, race_number, market_id, selection_id, dog_name, box_number,
+                 position_in_market, odds, stake, liability, finishing_position, result, total_matched, created_at)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (
+                now.strftime('%Y-%m-%d'),
+                race_info['venue'],
+                race_info['country'],
+                race_info['race_number'],
+                race_info['market_id'],
+                runner['selection_id'],
+                runner['name'],
+                runner.get('number'),
+                strategy.position,
+                runner['odds'],
+                strategy.stake,
+                strategy.stake * (runner['odds'] - 1),
+                0,  # Will be updated later
+                'pending',
+                total_matched,
+                now
+            ))
+
+
+class HorseMarkets:
+    """Schedule, odds and trade storage for horse races"""
+
+    sport = 'horse'
+    emoji = '🏇'
+    schedule_table = 'horse_race_times'
+    next_race_per_venue = False
+
+    def __init__(self, session: requests.Session):
+        self.session = session
+        self.shared_odds = SharedOddsReader()
+        self.runner_metadata = RunnerMetadataCache(self.sport)  # Names/boxes for the day's markets
+        self.schedule = RaceScheduleCache(self.schedule_table)
+
+    def get_odds_from_db(self, market_id: str) -> Optional[List[Dict]]:
+        """Fallback: best (lowest) lay price per runner from horsemarketbook (Stream API data)"""
+        try:
+            conn = get_db_connection('betfairmarket')
+            cursor = conn.cursor()
+
+            cursor.execute("""
+                SELECT selectionid, MIN(price)
+                FROM horsemarketbook
+                WHERE marketid = %s
+                AND pricetype = 'AvailableToLay'
+                AND price IS NOT NULL
+                GROUP BY selectionid
+            """, (market_id,))
+            price_results = cursor.fetchall()
+            conn.close()
+
+            if not price_results:
+                return None
+
+            runner_names, barrier_numbers = self.runner_metadata.get(market_id)
+
+            return [
+                {
+                    'selection_id': sel_id,
+                    'odds': price,
+                    'name': runner_names.get(sel_id, f'Horse {sel_id}'),
+                    'number': barrier_numbers.get(sel_id)
+                }
+                for sel_id, price in price_results
+            ]
+
+        except Exception as e:
+            logger.error(f"Error getting odds from DB: {e}")
+            return None
+
+    def get_odds_and_runners(self, market_id: str) -> Optional[List[Dict]]:
+        """Current odds for all runners (API first, then horsemarketbook fallback)"""
+        try:
+            # Host-wide shared odds cache first (utilities/shared_odds.py serve), then the API
+            market_book = self.shared_odds.market_book(market_id)
+            if market_book is None:
+                url = f"{BACKEND_URL}/api/horse-racing/market-book/{market_id}"
+                response = self.session.get(url, timeout=10)
+
+                if response.status_code != 200:
+                    logger.debug(f"API returned {response.status_code}, trying DB fallback")
+                    return self.get_odds_from_db(market_id)
+
+                market_book = response.json()
+            runners = market_book.get('runners', [])
+            if not runners:
+                logger.debug("No runners from API, trying DB fallback")
+                return self.get_odds_from_db(market_id)
+
+            runner_names, barrier_numbers = self.runner_metadata.get(market_id)
+
+            odds_map = []
+            for runner in runners:
+                selection_id = runner.get('selectionId')
+                available_to_back = runner.get('ex', {}).get('availableToBack', [])
+                if available_to_back:
+                    odds = available_to_back[0].get('price')
+                    if odds and selection_id:
+                        odds_map.append({
+                            'selection_id': selection_id,
+                            'odds': odds,
+                            'name': runner_names.get(selection_id, f'Horse {selection_id}'),
+                            'number': barrier_numbers.get(selection_id)
+                        })
+
+            return odds_map or None
+
+        except Exception as e:
+            logger.warning(f"API error: {e}, trying DB fallback")
+            return self.get_odds_from_db(market_id)
+
+    def insert_trades(self, cursor, race_info: Dict, bets: List[tuple], total_matched: Optional[float]):
+        """Insert (strategy, runner) paper trades for one race"""
+        today = datetime.now().strftime('%Y-%m-%d')
+        for strategy, runner in bets:
+            cursor.execute("""
+                INSERT INTO paper_trades_horses
+                (date, venue, country, race_number, market_id, selection_id, horse_name, barrier_number,
+                 position_in_market, odds, stake, liability, finishing_position, result, total_matched)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+            """, (
+                today,
+                race_info['venue'],
+                race_info['country'],
+                race_info['race_number'],
+                race_info['market_id'],
+                runner['selection_id'],
+                runner['name'],
+                runner.get('number'),
+                strategy.position,
+                runner['odds'],
+                strategy.stake,
+                strategy.stake * (runner['odds'] - 1),
+                0,  # Will be updated later
+                'pending',
+                total_matched
+            ))
+
+
+SPORTS = {
+    'greyhound': GreyhoundMarkets,
+    'horse': HorseMarkets,
+}
+
+
+class MultiStrategyLayEngine:
+    """Evaluates every configured lay strategy against one shared odds snapshot per market"""
+
+    def __init__(self, strategies: List[LayStrategy], poll_seconds: float = 5):
+        self.session = requests.Session()
+        self.session.timeout = 10
+        self.poll_seconds = poll_seconds
+
+        unknown = {s.sport for s in strategies} - set(SPORTS)
+        if unknown:
+            raise ValueError(f"Unknown sport(s) in strategy config: {sorted(unknown)}")
+
+        # Group strategies by sport so each sport's schedule is scanned once per cycle
+        self.strategies_by_sport = {}
+        for strategy in strategies:
+            self.strategies_by_sport.setdefault(strategy.sport, []).append(strategy)
+        self.markets = {sport: SPORTS[sport](self.session) for sport in self.strategies_by_sport}
+        # One in-memory (venue, date, race) → marketId index shared by all sports
+        self.market_resolver = MarketResolver(sports=tuple(self.strategies_by_sport))
+
+        # (strategy name, market_id) pairs already evaluated this session
+        self.processed = set()
+        self.logged_initial_races = set()
+
+        self.odds_fetches = 0
+        self.bets_placed = 0
+
+    def get_due_races(self, sport: str) -> List[Dict]:
+        """Races where at least one of the sport's strategies is inside its betting window"""
+        markets = self.markets[sport]
+        strategies = self.strategies_by_sport[sport]
+        window_start = min(s.window_start for s in strategies)
+        window_end = max(s.window_end for s in strategies)
+
+        # Re-reads the schedule table only when it has changed
+        markets.schedule.refresh()
+
+        if sport not in self.logged_initial_races and len(markets.schedule):
+            logger.info(f"📊 Found {len(markets.schedule)} total {sport} races in database")
+            self.logged_initial_races.add(sport)
+
+        due_races = []
+        for race in markets.schedule.races_in_window(window_start, window_end):
+            venue, race_number, seconds_until = race['venue'], race['race_number'], race['seconds_until']
+
+            due = [s for s in strategies if s.is_due(seconds_until)]
+            if not due:
+                continue
+
+            market_id = self.market_resolver.find_market_id(sport, venue, race_number)
+            if not market_id:
+                logger.debug(f"No market found for {venue} R{race_number}")
+                continue
+
+            pending = [s for s in due if (s.name, market_id) not in self.processed]
+            if not pending:
+                continue
+
+            due_races.append(dict(race, market_id=market_id, strategies=pending))
+
+        if markets.next_race_per_venue:
+            # Only bet on the next race at each venue
+            next_by_venue = {}
+            for race in due_races:
+                current = next_by_venue.get(race['venue'])
+                if current is None or race['race_number'] < current['race_number']:
+                    next_by_venue[race['venue']] = race
+            due_races = list(next_by_venue.values())
+
+        return due_races
+
+    def get_total_matched(self, sport: str, market_id: str) -> Optional[float]:
+        """marketcatalogue.totalmatched from the runner metadata cache (no SQL per race)"""
+        return self.markets[sport].runner_metadata.total_matched(market_id)
+
+    def process_race(self, sport: str, race_info: Dict):
+        """Fetch one odds snapshot and evaluate every due strategy against it"""
+        markets = self.markets[sport]
+        strategies = race_info['strategies']
+        market_id = race_info['market_id']
+
+        for strategy in strategies:
+            self.processed.add((strategy.name, market_id))
+
+        logger.info(f"\n{'='*70}")
+        logger.info(f"{markets.emoji} {race_info['venue']} ({race_info['country']}) - Race {race_info['race_number']}")
+        logger.info(f"   {race_info['seconds_until']:.1f}s until race | {len(strategies)} strateg{'y' if len(strategies) == 1 else 'ies'} due")
+        logger.info(f"{'='*70}")
+
+        runners = markets.get_odds_and_runners(market_id)
+        self.odds_fetches += 1
+        if not runners:
+            logger.warning("❌ Could not get odds")
+            return
+
+        # Sort by odds (ascending) to get favorites
+        # Use selection_id as tie-breaker when odds are equal (lower ID = earlier favorite)
+        sorted_runners = sorted(runners, key=lambda x: (x['odds'], x['selection_id']))
+
+        bets = []
+        for strategy in strategies:
+            runner = strategy.select_runner(sorted_runners)
+            if runner:
+                bets.append((strategy, runner))
+
+        if not bets:
+            return
+
+        total_matched = self.get_total_matched(sport, market_id)
+
+        try:
+            conn = get_db_connection('betfair_trades')
+            cursor = conn.cursor()
+            markets.insert_trades(cursor, race_info, bets, total_matched)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error(f"Error placing bets: {e}")
+            return
+
+        self.bets_placed += len(bets)
+        for strategy, runner in bets:
+            number_info = f" [{runner['number']}]" if runner.get('number') else ""
+            liability = strategy.stake * (runner['odds'] - 1)
+            logger.info(f"✅ LAY BET [{strategy.name}]: {runner['name']}{number_info} (ID: {runner['selection_id']}) @ {runner['odds']} (Position {strategy.position}) - Liability: ${liability:.2f}")
+
+    def run(self):
+        """Main monitoring loop"""
+        logger.info("=" * 70)
+        logger.info("🎯 MULTI-STRATEGY LAY ENGINE")
+        logger.info("=" * 70)
+        for sport, strategies in self.strategies_by_sport.items():
+            positions = ', '.join(str(s.position) for s in strategies)
+            logger.info(f"   {self.markets[sport].emoji} {sport}: {len(strategies)} strategies (positions {positions})")
+        logger.info(f"   Poll interval: {self.poll_seconds}s")
+        logger.info("\n⏰ Monitoring races...\n")
+
+        try:
+            while True:
+                for sport in self.strategies_by_sport:
+                    for race in self.get_due_races(sport):
+                        try:
+                            self.process_race(sport, race)
+                        except Exception as e:
+                            logger.error(f"Error processing race: {e}")
+
+                time.sleep(self.poll_seconds)
+
+        except KeyboardInterrupt:
+            logger.info("\n\n⏹️  Stopped")
+            logger.info(f"   Odds fetches: {self.odds_fetches} | Bets placed: {self.bets_placed}")
+            logger.info(f"   Market lookups: {self.market_resolver.stats()}")
+            for sport, markets in self.markets.items():
+                logger.info(f"   {sport.capitalize()} runner metadata: {markets.runner_metadata.stats()}")
+
+
+if __name__ == "__main__":
+    configure_logging()
+    config = load_strategies(sys.argv[1] if len(sys.argv) > 1 else STRATEGIES_PATH)
+    engine = MultiStrategyLayEngine(config['strategies'], poll_seconds=config['poll_seconds'])
+    engine.run()
@@ -0,0 +1,246 @@
+"""
+Market Resolver
+Maps (venue, date, race number) → Betfair WIN marketId from an in-memory index of
+marketcatalogue, replacing the per-race
+    eventname ILIKE '%venue%day%' AND marketname ILIKE 'R<n> %'
+lookups (which can't use an index and ran on a fresh connection per race, per cycle).
+
+- Recent greyhound/horse marketcatalogue rows are bulk-loaded once
+- Event names ('Murray Bridge Straight (AUS) 13th Jan') and market names ('R1 515m Gr5')
+  are parsed once into {(sport, date): {venue_normalized: {race_number: marketId}}}
+- Later refreshes only read rows from transactions that hadn't finished before the
+  previous load started (snapshot xmin watermark - see refresh())
+- Lookups are O(1) dict hits; a venue that only matches by substring (schedule says
+  'Murray Bridge', Betfair says 'Murray Bridge Straight') is resolved once and cached
+
+Usage:
+    resolver = MarketResolver()
+    market_id = resolver.find_market_id('greyhound', 'Angle Park', 4)
+    print(resolver.stats())
+"""
+
+import re
+import time
+import pytz
+import logging
+from datetime import date, datetime
+from typing import Dict, Optional, Tuple
+from db_connection_helper import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+# Oldest transaction still running (as a 32-bit xid, comparable with xmin) - everything
+# older was committed or aborted already
+SNAPSHOT_XMIN_SQL = "SELECT txid_snapshot_xmin(txid_current_snapshot()) % 4294967296"
+
+EVENT_TYPES = {
+    'greyhound': 'Greyhound Racing',
+    'horse': 'Horse Racing',
+}
+
+# NZ venues race on the NZ calendar day (event names use the local date)
+NZ_VENUES = {'addington', 'manawatu', 'hatrick straight', 'cambridge'}
+
+MONTHS = {m: i for i, m in enumerate(
+    ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], start=1)}
+
+EVENT_NAME_RE = re.compile(r'^(.+?)\s+\(([A-Z]+)\)\s+(\d{1,2})(?:st|nd|rd|th)?\s+([A-Za-z]{3})')
+RACE_NUMBER_RE = re.compile(r'^R(\d+)\b', re.IGNORECASE)
+
+
+def normalize_venue(venue: str) -> str:
+    """Lowercase and collapse punctuation/whitespace: 'The  Meadows.' -> 'the meadows'"""
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', venue.lower()).split())
+
+
+def parse_event_name(event_name: str, reference: date) -> Optional[Tuple[str, str, date]]:
+    """
+    Parse 'Murray Bridge Straight (AUS) 13th Jan' -> ('murray bridge straight', 'AUS', date).
+
+    The year isn't in the event name, so it's taken from the reference date
+    (handling events on the other side of New Year).
+    """
+    match = EVENT_NAME_RE.match(event_name or '')
+    if not match:
+        return None
+
+    month = MONTHS.get(match.group(4).lower())
+    if not month:
+        return None
+
+    day = int(match.group(3))
+    candidates = []
+    for year in (reference.year - 1, reference.year, reference.year + 1):
+        try:
+            candidates.append(date(year, month, day))
+        except ValueError:
+            continue
+    if not candidates:
+        return None
+
+    event_date = min(candidates, key=lambda d: abs((d - reference).days))
+    return normalize_venue(match.group(1)), match.group(2), event_date
+
+
+class MarketResolver:
+    """In-memory (venue, date, race number) → marketId index over marketcatalogue"""
+
+    def __init__(self, sports: Tuple[str, ...] = ('greyhound', 'horse'),
+                 refresh_seconds: float = 60.0, miss_refresh_seconds: float = 5.0):
+        unknown = set(sports) - set(EVENT_TYPES)
+        if unknown:
+            raise ValueError(f"Unknown sport(s): {sorted(unknown)}")
+
+        self.sports = tuple(sports)
+        self.refresh_seconds = refresh_seconds
+        self.miss_refresh_seconds = miss_refresh_seconds
+
+        # {(sport, date): {venue_normalized: {race_number: market_id}}}
+        self._index = {}
+        # {(sport, date, venue_normalized): event venue it matched by substring (or None)}
+        self._venue_aliases = {}
+        self._watermark = None
+        self._loaded_for_date = None
+        self._last_refresh = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.rows_loaded = 0
+
+    def _add_row(self, sport: str, market_id: str, market_name: str, event_name: str, reference: date):
+        parsed = parse_event_name(event_name, reference)
+        race_match = RACE_NUMBER_RE.match(market_name or '')
+        if not parsed or not race_match:
+            return
+
+        venue, _, event_date = parsed
+        races = self._index.setdefault((sport, event_date), {}).setdefault(venue, {})
+        # Keep the first market seen for a race (rows are loaded in marketid order)
+        races.setdefault(int(race_match.group(1)), market_id)
+
+    def refresh(self, force: bool = False) -> int:
+        """
+        Load marketcatalogue rows written since the last refresh.
+
+        Returns the number of rows read. The first call (or force=True) loads
+        every market opening from yesterday onwards.
+
+        The watermark is the oldest transaction still running when the previous load
+        started, not the highest xmin seen: xids are assigned at transaction start, so a
+        row from an older transaction can commit after newer ones were read. Rows from
+        transactions at or after the watermark are re-read (harmless - the index keeps
+        the first market per race), and xids are compared by age() so wraparound is safe.
+        """
+        now = time.monotonic()
+        if not force and self._watermark is not None and now - self._last_refresh < self.miss_refresh_seconds:
+            return 0
+        self._last_refresh = now
+
+        event_types = [EVENT_TYPES[s] for s in self.sports]
+        sport_by_event_type = {EVENT_TYPES[s]: s for s in self.sports}
+        reference = datetime.now(pytz.timezone('Australia/Sydney')).date()
+        # Reload from scratch daily so old days drop out of the index
+        full_load = force or self._watermark is None or self._loaded_for_date != reference
+
+        try:
+            conn = get_db_connection('betfairmarket')
+            cursor = conn.cursor()
+
+            # Taken before the read: anything the read can't see yet belongs to a
+            # transaction at or after this xid, so the next refresh picks it up
+            cursor.execute(SNAPSHOT_XMIN_SQL)
+            watermark = cursor.fetchone()[0]
+
+            query = """
+                SELECT marketid, marketname, eventname, eventtypename
+                FROM marketcatalogue
+                WHERE eventtypename = ANY(%s)
+                AND opendate::timestamptz >= NOW() - INTERVAL '1 day'
+            """
+            params = [event_types]
+            if not full_load:
+                # Rows from transactions that were still open (or not started) at the last load
+                query += " AND age(xmin) <= age(%s::text::xid)"
+                params.append(str(self._watermark))
+            query += " ORDER BY marketid"
+
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            conn.close()
+
+        except Exception as e:
+            logger.error(f"Error refreshing market index: {e}")
+            return 0
+
+        if full_load:
+            self._index = {}
+            self._venue_aliases = {}
+
+        for market_id, market_name, event_name, event_type in rows:
+            self._add_row(sport_by_event_type[event_type], market_id, market_name, event_name, reference)
+
+        if rows and not full_load:
+            # New events may satisfy venues that previously had no match
+            self._venue_aliases = {k: v for k, v in self._venue_aliases.items() if v is not None}
+
+        self._watermark = watermark
+        self._loaded_for_date = reference
+        self.rows_loaded += len(rows)
+        if rows:
+            logger.debug(f"Market index: loaded {len(rows)} marketcatalogue rows ({'full' if full_load else 'incremental'})")
+        return len(rows)
+
+    def _lookup(self, sport: str, venue_key: str, race_date: date, race_number: int) -> Optional[str]:
+        venues = self._index.get((sport, race_date))
+        if not venues:
+            return None
+
+        races = venues.get(venue_key)
+        if races is None:
+            # Schedule venue names are often a substring of the Betfair event venue
+            alias_key = (sport, race_date, venue_key)
+            if alias_key not in self._venue_aliases:
+                self._venue_aliases[alias_key] = next(
+                    (v for v in sorted(venues) if venue_key in v), None
+                )
+            alias = self._venue_aliases[alias_key]
+            races = venues.get(alias) if alias else None
+
+        return races.get(race_number) if races else None
+
+    def find_market_id(self, sport: str, venue: str, race_number: int,
+                       race_date: Optional[date] = None) -> Optional[str]:
+        """
+        Find the WIN market ID for a race.
+
+        race_date defaults to today in the venue's local calendar (NZ venues use NZ time).
+        On a miss the index is refreshed incrementally (rate-limited) and the lookup retried.
+        """
+        if time.monotonic() - self._last_refresh >= self.refresh_seconds or self._watermark is None:
+            self.refresh()
+
+        venue_key = normalize_venue(venue)
+        if race_date is None:
+            tz = pytz.timezone('Pacific/Auckland' if venue_key in NZ_VENUES else 'Australia/Sydney')
+            race_date = datetime.now(tz).date()
+
+        market_id = self._lookup(sport, venue_key, race_date, int(race_number))
+        if market_id is None and self.refresh():
+            market_id = self._lookup(sport, venue_key, race_date, int(race_number))
+
+        if market_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return market_id
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and index size"""
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'markets': sum(len(r) for venues in self._index.values() for r in venues.values()),
+            'rows_loaded': self.rows_loaded,
+        }
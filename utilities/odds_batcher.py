@@ -0,0 +1,131 @@
+"""
+Market Book Batcher
+Coalesces concurrent odds requests from many race tasks into ONE backend call.
+
+Instead of every race task calling GET /api/GreyhoundMarketBook/market/{id} (or the
+horse market-book endpoint) on its own, once per second, callers await
+batcher.get(market_id). Requests arriving within window_ms - for the same market or
+different ones - are sent together as one POST of up to max_batch market IDs, and
+each caller gets its own market's payload back. A caller waits at most window_ms
+plus one backend round trip.
+
+Payload shapes match the single-market endpoints, so call sites don't change:
+- greyhound: {'marketId': ..., 'odds': [{selectionid, status, pricetype, price, size}, ...]}
+- horse:     the Betfair listMarketBook market book ({'marketId', 'status', 'runners', ...})
+None means the backend failed or doesn't have the market (callers fall back to the DB).
+
+Usage:
+    odds = MarketBookBatcher(backend, sport='greyhound', window_ms=50)
+    data = await odds.get(market_id)
+    print(odds.stats())       # requests vs. backend calls
+"""
+
+import asyncio
+import logging
+from typing import Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+WINDOW_MS = 50   # How long the first request of a batch waits for others to join
+MAX_BATCH = 40   # Markets per backend call (Betfair's listMarketBook limit)
+
+BATCH_ENDPOINTS = {
+    'greyhound': "/api/GreyhoundMarketBook/markets",
+    'horse': "/api/horse-racing/market-books",
+}
+
+
+class MarketBookBatcher:
+    """Micro-batches market book requests over an AsyncBackendClient"""
+
+    def __init__(self, backend, sport: str = 'greyhound', window_ms: float = WINDOW_MS,
+                 max_batch: int = MAX_BATCH, timeout: float = 10):
+        if sport not in BATCH_ENDPOINTS:
+            raise ValueError(f"Unknown sport: {sport}")
+        self.backend = backend
+        self.sport = sport
+        self.path = BATCH_ENDPOINTS[sport]
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.timeout = timeout
+
+        # market_id -> futures of every caller waiting on the next fetch of it
+        self._pending: Dict[str, List[asyncio.Future]] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._in_flight: Set[asyncio.Task] = set()
+
+        self.requests = 0
+        self.batches = 0
+        self.markets_fetched = 0
+        self.errors = 0
+
+    async def get(self, market_id: str) -> Optional[Dict]:
+        """This market's book from the next batched call (None on error / unknown market)"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(market_id, []).append(future)
+        self.requests += 1
+
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+
+        return await future
+
+    def _flush(self):
+        """Send everything pending as one batch"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch, self._pending = self._pending, {}
+        task = asyncio.ensure_future(self._fetch(batch))
+        self._in_flight.add(task)
+        task.add_done_callback(self._in_flight.discard)
+
+    async def _fetch(self, batch: Dict[str, List[asyncio.Future]]):
+        markets = {}
+        try:
+            response = await self.backend.post(self.path, json={"marketIds": list(batch)}, timeout=self.timeout)
+            if response.status_code == 200:
+                markets = response.json().get('markets', {})
+            else:
+                self.errors += 1
+                logger.warning(f"⚠️  Batched market books returned {response.status_code} for {len(batch)} markets")
+        except Exception as e:
+            self.errors += 1
+            logger.warning(f"⚠️  Batched market books failed for {len(batch)} markets: {e}")
+
+        self.batches += 1
+        self.markets_fetched += len(batch)
+
+        for market_id, futures in batch.items():
+            result = self._market_payload(market_id, markets.get(market_id))
+            for future in futures:
+                if not future.done():  # Caller may have timed out / been cancelled
+                    future.set_result(result)
+
+    def _market_payload(self, market_id: str, data) -> Optional[Dict]:
+        if data is None:
+            return None
+        if self.sport == 'greyhound':
+            return {'marketId': market_id, 'odds': data}
+        return data
+
+    async def close(self):
+        """Send anything still pending and wait for in-flight batches"""
+        self._flush()
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+    def stats(self) -> Dict:
+        return {
+            'requests': self.requests,
+            'batches': self.batches,
+            'markets_fetched': self.markets_fetched,
+            'errors': self.errors,
+            'requests_per_batch': round(self.requests / self.batches, 2) if self.batches else 0.0,
+        }
@@ -0,0 +1,248 @@
+"""
+Order Tracker
+In-memory betId → order state map shared by every concurrent race task, replacing a
+listCurrentOrders call + linear scan per bet, per check.
+
+Fed by either:
+- the Betfair order stream (ocm messages via AsyncBetfairStreamClient.order_handlers), or
+- ONE batched /api/ManageOrders/current poll per cycle while tracked bets are still open
+
+Reads are O(1) dict lookups; tasks can also await a bet's next change (or completion)
+instead of sleeping between status checks.
+
+Usage:
+    orders = OrderTracker()
+    asyncio.create_task(orders.run_polling(backend))      # when not on the order stream
+    orders.track(bet_id, market_id, size=10.0)
+    order = await orders.wait_until_complete(bet_id, timeout=30)
+    order['sizeMatched'], order['sizeRemaining'], order['sizeCancelled'], order['sizeLapsed']
+    OrderTracker.is_filled(order)                          # matched in full, not cancelled/lapsed
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+POLL_SECONDS = 1.0
+# A tracked bet missing from listCurrentOrders (exchange lag, an unfetched page) is only
+# closed once it has been absent from this many consecutive polls AND for this long
+MISSING_POLLS = 5
+MISSING_GRACE_SECONDS = 10.0
+
+# Order stream status codes
+STREAM_STATUS = {
+    'E': 'EXECUTABLE',
+    'EC': 'EXECUTION_COMPLETE',
+}
+
+
+class OrderTracker:
+    """
+    betId → {betId, marketId, selectionId, sizePlaced, sizeMatched, sizeRemaining,
+             sizeCancelled, sizeLapsed, status, averagePriceMatched}
+
+    EXECUTION_COMPLETE only means nothing is left on the exchange - a cancelled or
+    lapsed remainder completes a bet too. Use is_filled() for "fully matched".
+    """
+
+    def __init__(self, poll_seconds: float = POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self.orders: Dict[str, Dict] = {}
+        # Bets placed by this process that aren't complete yet (what polling is for)
+        self._open: Dict[str, Dict] = {}
+        # Open bets absent from recent complete polls: betId -> (consecutive misses, first missed at)
+        self._missing: Dict[str, tuple] = {}
+        # One event per bet someone is waiting on; set (and replaced) on each change
+        self._events: Dict[str, asyncio.Event] = {}
+        self.streaming = False
+
+        self.polls = 0
+        self.ocm_messages = 0
+        self.updates = 0
+
+    def track(self, bet_id: str, market_id: str, size: float, size_matched: float = 0.0,
+              price: Optional[float] = None):
+        """Register a bet we just placed (seeded from the placeOrders report)"""
+        bet_id = str(bet_id)
+        order = self.orders.get(bet_id)
+        if order is None:
+            order = self._update(bet_id, {
+                'betId': bet_id,
+                'marketId': market_id,
+                'sizePlaced': size,
+                'sizeMatched': size_matched,
+                'sizeRemaining': max(size - size_matched, 0.0),
+                'sizeCancelled': 0.0,
+                'sizeLapsed': 0.0,
+                'status': 'EXECUTION_COMPLETE' if size_matched >= size else 'EXECUTABLE',
+                'averagePriceMatched': price if size_matched else 0.0,
+            })
+        if order['status'] != 'EXECUTION_COMPLETE':
+            self._open[bet_id] = order
+
+    @staticmethod
+    def is_filled(order: Optional[Dict]) -> bool:
+        """True only when the whole stake matched (a cancelled/lapsed remainder is unfilled)"""
+        return bool(order) and order['sizeMatched'] >= order['sizePlaced']
+
+    def get(self, bet_id: str) -> Optional[Dict]:
+        """Latest known state of a bet (None if never seen)"""
+        return self.orders.get(str(bet_id))
+
+    def _update(self, bet_id: str, fields: Dict) -> Dict:
+        order = self.orders.get(bet_id)
+        if order is None:
+            order = self.orders[bet_id] = {'betId': bet_id}
+        order.update(fields)
+        order['updated_at'] = time.time()
+
+        if order.get('status') == 'EXECUTION_COMPLETE':
+            self._open.pop(bet_id, None)
+            self._missing.pop(bet_id, None)
+
+        self.updates += 1
+        event = self._events.pop(bet_id, None)
+        if event is not None:
+            event.set()
+        return order
+
+    def apply_ocm(self, message: Dict):
+        """Apply an order stream change message (ocm) - unmatched orders carry full state"""
+        self.ocm_messages += 1
+        for oc in message.get('oc', []):
+            market_id = oc.get('id')
+            for orc in oc.get('orc', []):
+                for uo in orc.get('uo', []):
+                    size_matched = uo.get('sm', 0.0)
+                    size_remaining = uo.get('sr', 0.0)
+                    size_cancelled = uo.get('sc', 0.0)
+                    size_lapsed = uo.get('sl', 0.0)
+                    self._update(str(uo['id']), {
+                        'marketId': market_id,
+                        'selectionId': orc.get('id'),
+                        'sizePlaced': uo.get('s', size_matched + size_remaining + size_cancelled + size_lapsed),
+                        'sizeMatched': size_matched,
+                        'sizeRemaining': size_remaining,
+                        'sizeCancelled': size_cancelled,
+                        'sizeLapsed': size_lapsed,
+                        'status': STREAM_STATUS.get(uo.get('status'), uo.get('status')),
+                        'averagePriceMatched': uo.get('avp', 0.0),
+                    })
+
+    def apply_current_orders(self, current_orders: List[Dict], complete: bool = True):
+        """
+        Apply one listCurrentOrders result.
+
+        An open bet of ours that isn't listed stays open (and polled) until it has been
+        missing from MISSING_POLLS complete results over MISSING_GRACE_SECONDS; only then
+        is it closed at its last known matched size, flagged 'missing'. Only what we saw
+        match counts as filled. complete=False (moreAvailable) doesn't count as a miss.
+        """
+        seen = set()
+        for o in current_orders:
+            bet_id = str(o.get('betId'))
+            seen.add(bet_id)
+            self._missing.pop(bet_id, None)
+            size_matched = o.get('sizeMatched', 0)
+            size_remaining = o.get('sizeRemaining', 0)
+            size_cancelled = o.get('sizeCancelled', 0)
+            size_lapsed = o.get('sizeLapsed', 0)
+            size_placed = (o.get('priceSize') or {}).get('size')
+            self._update(bet_id, {
+                'marketId': o.get('marketId'),
+                'selectionId': o.get('selectionId'),
+                'sizePlaced': size_placed or size_matched + size_remaining + size_cancelled + size_lapsed,
+                'sizeMatched': size_matched,
+                'sizeRemaining': size_remaining,
+                'sizeCancelled': size_cancelled,
+                'sizeLapsed': size_lapsed,
+                'status': o.get('status'),
+                'averagePriceMatched': o.get('averagePriceMatched', 0),
+            })
+
+        if not complete:
+            return
+
+        now = time.monotonic()
+        for bet_id, order in list(self._open.items()):
+            if bet_id in seen:
+                continue
+            misses, first_missed_at = self._missing.get(bet_id, (0, now))
+            misses += 1
+            if misses < MISSING_POLLS or now - first_missed_at < MISSING_GRACE_SECONDS:
+                self._missing[bet_id] = (misses, first_missed_at)
+                continue
+
+            del self._missing[bet_id]
+            logger.warning(f"⚠️  Bet {bet_id} missing from current orders for {misses} polls - "
+                           f"closing at last known matched ${order['sizeMatched']:.2f}")
+            self._update(bet_id, {
+                'sizeRemaining': 0.0,
+                'status': 'EXECUTION_COMPLETE',
+                'missing': True,
+            })
+
+    async def poll(self, backend) -> bool:
+        """One batched listCurrentOrders call for every bet. Returns False on error."""
+        try:
+            response = await backend.get("/api/ManageOrders/current", timeout=10)
+            if response.status_code != 200:
+                logger.error(f"❌ listCurrentOrders HTTP {response.status_code}: {response.text}")
+                return False
+
+            data = response.json()
+            result = data.get('result', data)
+            self.apply_current_orders(result.get('currentOrders', []),
+                                      complete=not result.get('moreAvailable', False))
+            self.polls += 1
+            return True
+
+        except Exception as e:
+            logger.error(f"❌ Exception polling current orders: {e}")
+            return False
+
+    async def run_polling(self, backend):
+        """Background task: poll once per cycle while any tracked bet is open (not needed on the order stream)"""
+        while True:
+            if self._open and not self.streaming:
+                await self.poll(backend)
+            await asyncio.sleep(self.poll_seconds)
+
+    async def wait_for_update(self, bet_id: str, timeout: float) -> Optional[Dict]:
+        """Wait for the bet's next change; returns the latest state either way"""
+        bet_id = str(bet_id)
+        event = self._events.get(bet_id)
+        if event is None:
+            event = self._events[bet_id] = asyncio.Event()
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        return self.orders.get(bet_id)
+
+    async def wait_until_complete(self, bet_id: str, timeout: float) -> Optional[Dict]:
+        """
+        Wait until the bet is fully matched or timeout; returns the latest state.
+        A cancelled/lapsed bet doesn't end the wait early - it never fills.
+        """
+        deadline = time.monotonic() + timeout
+        order = self.get(bet_id)
+        while not self.is_filled(order):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            order = await self.wait_for_update(bet_id, remaining)
+        return order
+
+    def stats(self) -> Dict:
+        return {
+            'orders': len(self.orders),
+            'open': len(self._open),
+            'missing': len(self._missing),
+            'polls': self.polls,
+            'ocm_messages': self.ocm_messages,
+            'updates': self.updates,
+        }
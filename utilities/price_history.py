@@ -0,0 +1,293 @@
+"""
+Price History Store
+Nightly export of each day's prices into partitioned Parquet, plus query helpers
+that read it with predicate pushdown - "best lay of every runner at T-30s for
+every market last month" is one dataset scan instead of a query per market.
+
+Sources:
+- stream: the day's StreamRecorder files (raw mcm frames) are replayed through
+  MarketCache and the top DEPTH back/lay levels of every runner are written each
+  time the runner changes - a real time series with receive timestamps
+- marketbook: greyhoundmarketbook / horsemarketbook for the day's markets. Those rows
+  are upserted per price level (no history), so they are written once with
+  ts = export time - the end-of-day ladder
+
+Layout (hive partitioned, zstd, rows sorted by market_id, selection_id, ts):
+    {base_dir}/prices/date=2025-01-13/source=stream/part-0.parquet
+        market_id, selection_id, ts, price_type, level, price, size
+    {base_dir}/markets/date=2025-01-13/part-0.parquet
+        market_id, market_time, venue, event_name, country_code, status, winner_id
+
+Usage:
+    python price_history.py export 2025-01-13 --ticks /path/to/ticks --sport greyhound
+    python price_history.py at 2025-01-01 2025-01-31 --seconds-before 30
+
+    from price_history import prices_at
+    best_lays = prices_at(PRICE_HISTORY_DIR, '2025-01-01', '2025-01-31', seconds_before=30)
+"""
+
+import sys
+sys.path.insert(0, '/Users/clairegrady/RiderProjects/betfair/utilities')
+sys.path.insert(0, '/Users/clairegrady/RiderProjects/betfair/greyhound-simulated/lay_betting')
+
+import argparse
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from db_connection_helper import get_db_connection
+from market_cache import MarketCache
+from market_resolver import EVENT_TYPES
+from stream_recorder import read_records, recorded_files
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+PRICE_HISTORY_DIR = "/Users/clairegrady/RiderProjects/betfair/databases/price_history"
+TICKS_DIR = "/Users/clairegrady/RiderProjects/betfair/databases/stream_ticks"
+DEPTH = 3   # Ladder levels kept per side
+
+BOOK_TABLES = {'greyhound': 'greyhoundmarketbook', 'horse': 'horsemarketbook'}
+
+PRICE_SCHEMA = pa.schema([
+    ('market_id', pa.string()),
+    ('selection_id', pa.int64()),
+    ('ts', pa.timestamp('ms', tz='UTC')),
+    ('price_type', pa.dictionary(pa.int8(), pa.string())),
+    ('level', pa.int8()),
+    ('price', pa.float64()),
+    ('size', pa.float64()),
+])
+
+MARKET_SCHEMA = pa.schema([
+    ('market_id', pa.string()),
+    ('market_time', pa.timestamp('ms', tz='UTC')),
+    ('venue', pa.string()),
+    ('event_name', pa.string()),
+    ('country_code', pa.string()),
+    ('status', pa.string()),
+    ('winner_id', pa.int64()),
+])
+
+
+def stream_price_rows(files: List[str], depth: int = DEPTH) -> tuple:
+    """
+    Replay recorded mcm frames and emit the top `depth` levels of each runner whenever it changes.
+    Returns (price rows as column lists, {market_id: market definition}).
+    """
+    cache = MarketCache()
+    columns = {name: [] for name in PRICE_SCHEMA.names}
+
+    for path in files:
+        for received_at, frame in read_records(path):
+            message = json.loads(frame)
+            if message.get('ct') == 'HEARTBEAT':
+                continue
+            cache.apply_mcm(message)
+            ts = int(received_at * 1000)
+
+            for mc in message.get('mc', []):
+                book = cache.get(mc.get('id'))
+                if book is None:
+                    continue
+                # A market image re-emits every runner; otherwise only the runners in the delta
+                selection_ids = book.runners.keys() if mc.get('img') else [rc['id'] for rc in mc.get('rc', [])]
+                for selection_id in selection_ids:
+                    runner = book.runners[selection_id]
+                    for price_type, ladder in (('AvailableToBack', runner.best_back(depth)),
+                                               ('AvailableToLay', runner.best_lay(depth))):
+                        for level, (price, size) in enumerate(ladder):
+                            columns['market_id'].append(book.market_id)
+                            columns['selection_id'].append(selection_id)
+                            columns['ts'].append(ts)
+                            columns['price_type'].append(price_type)
+                            columns['level'].append(level)
+                            columns['price'].append(price)
+                            columns['size'].append(size)
+
+    definitions = {market_id: book.market_definition for market_id, book in cache.markets.items()}
+    return columns, definitions
+
+
+def market_rows(definitions: Dict[str, Dict]) -> Dict[str, list]:
+    """markets table rows from stream market definitions"""
+    columns = {name: [] for name in MARKET_SCHEMA.names}
+    for market_id, definition in definitions.items():
+        winners = [r['id'] for r in definition.get('runners', []) if r.get('status') == 'WINNER']
+        market_time = definition.get('marketTime')
+        columns['market_id'].append(market_id)
+        columns['market_time'].append(pd.Timestamp(market_time) if market_time else None)
+        columns['venue'].append(definition.get('venue'))
+        columns['event_name'].append(definition.get('eventName'))
+        columns['country_code'].append(definition.get('countryCode'))
+        columns['status'].append(definition.get('status'))
+        columns['winner_id'].append(winners[0] if winners else None)
+    return columns
+
+
+def marketbook_price_rows(day: str, sport: str, depth: int = DEPTH) -> Dict[str, list]:
+    """End-of-day ladder of every market that opened on `day`, in one query"""
+    table = BOOK_TABLES[sport]
+    conn = get_db_connection('betfairmarket')
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT marketid, selectionid, pricetype, level, price, size
+        FROM (
+            SELECT b.marketid, b.selectionid, b.pricetype, b.price, b.size,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY b.marketid, b.selectionid, b.pricetype
+                       ORDER BY CASE WHEN b.pricetype = 'AvailableToLay' THEN b.price ELSE -b.price END
+                   ) - 1 AS level
+            FROM {table} b
+            JOIN marketcatalogue m ON m.marketid = b.marketid
+            WHERE m.eventtypename = %s
+            AND m.opendate::date = %s::date
+            AND b.pricetype IN ('AvailableToBack', 'AvailableToLay')
+            AND b.price > 0
+        ) ranked
+        WHERE level < %s
+    """, (EVENT_TYPES[sport], day, depth))
+    rows = cursor.fetchall()
+    conn.close()
+
+    ts = int(datetime.now(timezone.utc).timestamp() * 1000)
+    columns = {name: [] for name in PRICE_SCHEMA.names}
+    for market_id, selection_id, price_type, level, price, size in rows:
+        columns['market_id'].append(market_id)
+        columns['selection_id'].append(selection_id)
+        columns['ts'].append(ts)
+        columns['price_type'].append(price_type)
+        columns['level'].append(level)
+        columns['price'].append(price)
+        columns['size'].append(size)
+    return columns
+
+
+def _write(columns: Dict[str, list], schema: pa.Schema, path: str, sort_by: List[str]) -> int:
+    table = pa.Table.from_pydict(columns, schema=schema)
+    if table.num_rows == 0:
+        return 0
+    # Sorted rows -> tight per-row-group min/max statistics for market_id / ts filters
+    table = table.sort_by([(name, 'ascending') for name in sort_by])
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pq.write_table(table, path, compression='zstd', row_group_size=256 * 1024)
+    return table.num_rows
+
+
+def export_day(day: str, base_dir: str = PRICE_HISTORY_DIR, ticks_dir: Optional[str] = TICKS_DIR,
+               sport: Optional[str] = 'greyhound', depth: int = DEPTH) -> Dict[str, int]:
+    """Write day's stream and market book partitions (re-running a day replaces them)"""
+    written = {}
+
+    files = recorded_files(ticks_dir, day, day) if ticks_dir and os.path.isdir(ticks_dir) else []
+    if files:
+        columns, definitions = stream_price_rows(files, depth)
+        written['stream'] = _write(columns, PRICE_SCHEMA,
+                                   os.path.join(base_dir, 'prices', f'date={day}', 'source=stream', 'part-0.parquet'),
+                                   ['market_id', 'selection_id', 'ts'])
+        written['markets'] = _write(market_rows(definitions), MARKET_SCHEMA,
+                                    os.path.join(base_dir, 'markets', f'date={day}', 'part-0.parquet'),
+                                    ['market_id'])
+
+    if sport:
+        written['marketbook'] = _write(marketbook_price_rows(day, sport, depth), PRICE_SCHEMA,
+                                       os.path.join(base_dir, 'prices', f'date={day}', 'source=marketbook', 'part-0.parquet'),
+                                       ['market_id', 'selection_id', 'ts'])
+
+    logger.info(f"📦 Exported {day}: {written}")
+    return written
+
+
+def _date_filter(start_date: str, end_date: str) -> ds.Expression:
+    return (ds.field('date') >= start_date) & (ds.field('date') <= end_date)
+
+
+def _dataset(path: str) -> ds.Dataset:
+    return ds.dataset(path, format='parquet', partitioning=ds.partitioning(
+        pa.schema([('date', pa.string()), ('source', pa.string())]) if path.endswith('prices')
+        else pa.schema([('date', pa.string())]), flavor='hive'))
+
+
+def load_prices(base_dir: str, start_date: str, end_date: str, market_ids: Optional[List[str]] = None,
+                price_type: Optional[str] = None, level: Optional[int] = None, source: str = 'stream',
+                columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """Price rows for a date range - partition, market, type and level filters are pushed down to Parquet"""
+    expression = _date_filter(start_date, end_date) & (ds.field('source') == source)
+    if market_ids is not None:
+        expression &= ds.field('market_id').isin(list(market_ids))
+    if price_type is not None:
+        expression &= ds.field('price_type') == price_type
+    if level is not None:
+        expression &= ds.field('level') == level
+
+    table = _dataset(os.path.join(base_dir, 'prices')).to_table(columns=columns, filter=expression)
+    return table.to_pandas()
+
+
+def load_markets(base_dir: str, start_date: str, end_date: str) -> pd.DataFrame:
+    return _dataset(os.path.join(base_dir, 'markets')).to_table(filter=_date_filter(start_date, end_date)).to_pandas()
+
+
+def prices_at(base_dir: str, start_date: str, end_date: str, seconds_before: float = 30,
+              price_type: str = 'AvailableToLay', level: int = 0) -> pd.DataFrame:
+    """
+    Price of every runner in every market as of `seconds_before` the scheduled start:
+    one row per (market_id, selection_id) - the latest update at or before the cutoff.
+    """
+    markets = load_markets(base_dir, start_date, end_date)[['market_id', 'market_time', 'venue', 'winner_id']]
+    prices = load_prices(base_dir, start_date, end_date, price_type=price_type, level=level,
+                         columns=['market_id', 'selection_id', 'ts', 'price', 'size'])
+    if prices.empty or markets.empty:
+        return pd.DataFrame(columns=['market_id', 'selection_id', 'ts', 'price', 'size', 'market_time', 'venue', 'winner_id'])
+
+    prices = prices.merge(markets, on='market_id')
+    cutoff = prices['market_time'] - pd.to_timedelta(seconds_before, unit='s')
+    prices = prices[prices['ts'] <= cutoff]
+
+    latest = prices.sort_values('ts').groupby(['market_id', 'selection_id'], sort=False).tail(1)
+    return latest.sort_values(['market_id', 'price']).reset_index(drop=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parquet price history export / queries")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export_cmd = commands.add_parser('export')
+    export_cmd.add_argument('date', nargs='?', default=datetime.now().strftime('%Y-%m-%d'))
+    export_cmd.add_argument('--base-dir', default=PRICE_HISTORY_DIR)
+    export_cmd.add_argument('--ticks', default=TICKS_DIR)
+    export_cmd.add_argument('--sport', choices=sorted(BOOK_TABLES), default='greyhound')
+    export_cmd.add_argument('--depth', type=int, default=DEPTH)
+
+    at_cmd = commands.add_parser('at')
+    at_cmd.add_argument('start_date')
+    at_cmd.add_argument('end_date')
+    at_cmd.add_argument('--base-dir', default=PRICE_HISTORY_DIR)
+    at_cmd.add_argument('--seconds-before', type=float, default=30)
+    at_cmd.add_argument('--price-type', default='AvailableToLay')
+    at_cmd.add_argument('--out', help="Write the result to this CSV")
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        export_day(args.date, args.base_dir, args.ticks, args.sport, args.depth)
+    else:
+        result = prices_at(args.base_dir, args.start_date, args.end_date, args.seconds_before, args.price_type)
+        logger.info(f"✅ {len(result)} runners in {result['market_id'].nunique()} markets")
+        if args.out:
+            result.to_csv(args.out, index=False)
+        else:
+            print(result.head(30).to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
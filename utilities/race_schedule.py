@@ -0,0 +1,153 @@
+"""
+Race Schedule Cache
+Keeps today's and tomorrow's race times in memory, pre-parsed and sorted by start time,
+so betting loops don't re-query and re-parse greyhound_race_times / horse_race_times every cycle.
+
+- Start times are parsed and localized ONCE (DB stores all times in AEST)
+- "Races starting in 5-60s" is two bisects over a sorted array: O(log n)
+- The table is only re-read when its fingerprint (row count + newest row version)
+  changes or the AEST date rolls over; the fingerprint is checked every refresh_seconds
+
+Usage:
+    schedule = RaceScheduleCache('greyhound_race_times')
+    schedule.refresh()                           # cheap unless the table changed
+    for race in schedule.races_in_window(5, 60):
+        print(race['venue'], race['race_number'], race['seconds_until'])
+"""
+
+import time
+import pytz
+import logging
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from typing import Dict, List, Optional
+from db_connection_helper import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_TABLES = ('greyhound_race_times', 'horse_race_times')
+AEST = pytz.timezone('Australia/Sydney')
+
+
+class RaceScheduleCache:
+    """Sorted, in-memory index of upcoming race start times for one schedule table"""
+
+    def __init__(self, table: str = 'greyhound_race_times', refresh_seconds: float = 30.0):
+        if table not in SCHEDULE_TABLES:
+            raise ValueError(f"Unknown race schedule table: {table}")
+
+        self.table = table
+        self.refresh_seconds = refresh_seconds
+
+        self._starts = []   # Sorted race start times (epoch seconds)
+        self._races = []    # Race dicts, same order as _starts
+        self._fingerprint = None
+        self._loaded_for_date = None
+        self._last_check = 0.0
+
+        self.reloads = 0
+
+    def __len__(self):
+        return len(self._races)
+
+    def _get_fingerprint(self, cursor) -> tuple:
+        """
+        Cheap change detector for the schedule table.
+
+        The scrapers DELETE + re-INSERT (and normalize venue names with UPDATE), so any
+        change produces new row versions - the newest xmin plus the row count moves.
+        """
+        cursor.execute(f"""
+            SELECT COUNT(*), COALESCE(MAX(xmin::text::bigint), 0)
+            FROM {self.table}
+            WHERE race_date::date >= CURRENT_DATE
+            AND race_date::date <= CURRENT_DATE + INTERVAL '1 day'
+        """)
+        return tuple(cursor.fetchone())
+
+    def _load(self, cursor):
+        cursor.execute(f"""
+            SELECT venue, race_number, race_time, race_date, country
+            FROM {self.table}
+            WHERE race_date::date >= CURRENT_DATE
+            AND race_date::date <= CURRENT_DATE + INTERVAL '1 day'
+        """)
+
+        entries = []
+        for venue, race_number, race_time, race_date, country in cursor.fetchall():
+            try:
+                # IMPORTANT: DB stores ALL times in AEST (converted by scraper)
+                race_datetime = AEST.localize(datetime.strptime(f"{race_date} {race_time}", '%Y-%m-%d %H:%M'))
+            except (ValueError, TypeError) as e:
+                logger.warning(f"Skipping unparseable race time {venue} R{race_number}: {race_date} {race_time} ({e})")
+                continue
+
+            entries.append((race_datetime.timestamp(), {
+                'venue': venue,
+                'race_number': race_number,
+                'country': country or 'AUS',
+                'race_datetime': race_datetime,
+            }))
+
+        entries.sort(key=lambda e: (e[0], e[1]['venue'], e[1]['race_number']))
+        self._starts = [start for start, _ in entries]
+        self._races = [race for _, race in entries]
+        self.reloads += 1
+
+    def refresh(self, force: bool = False) -> bool:
+        """
+        Reload the schedule if the table changed (checked at most every refresh_seconds).
+
+        Returns True if the in-memory schedule was reloaded. On a DB error the
+        previous schedule is kept.
+        """
+        now = time.monotonic()
+        today = datetime.now(AEST).date()
+
+        if not force and self._loaded_for_date == today and now - self._last_check < self.refresh_seconds:
+            return False
+        self._last_check = now
+
+        try:
+            conn = get_db_connection('betfair_races')
+            cursor = conn.cursor()
+
+            fingerprint = self._get_fingerprint(cursor)
+            if not force and fingerprint == self._fingerprint and self._loaded_for_date == today:
+                conn.close()
+                return False
+
+            self._load(cursor)
+            conn.close()
+
+            self._fingerprint = fingerprint
+            self._loaded_for_date = today
+            logger.debug(f"Race schedule reloaded from {self.table}: {len(self._races)} races")
+            return True
+
+        except Exception as e:
+            logger.error(f"Error refreshing race schedule from {self.table}: {e}")
+            return False
+
+    def races_in_window(self, min_seconds: float, max_seconds: float, now: Optional[float] = None) -> List[Dict]:
+        """
+        Races starting between min_seconds and max_seconds from now (inclusive),
+        in start-time order. Each result is a copy with 'seconds_until' filled in.
+        """
+        now = time.time() if now is None else now
+        lo = bisect_left(self._starts, now + min_seconds)
+        hi = bisect_right(self._starts, now + max_seconds)
+
+        return [
+            dict(self._races[i], seconds_until=self._starts[i] - now)
+            for i in range(lo, hi)
+        ]
+
+    def next_race(self, max_seconds: float = float('inf'), now: Optional[float] = None) -> Optional[Dict]:
+        """The next race that hasn't started yet, if it starts within max_seconds"""
+        now = time.time() if now is None else now
+        i = bisect_right(self._starts, now)
+
+        if i >= len(self._starts) or self._starts[i] - now > max_seconds:
+            return None
+        return dict(self._races[i], seconds_until=self._starts[i] - now)
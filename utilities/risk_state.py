@@ -0,0 +1,326 @@
+"""
+Risk State
+Running daily-risk totals for live trading, kept in memory so the limit checks
+before every race are O(1) instead of
+    COUNT(*) / SUM(profit_loss) FROM live_trades WHERE date = ...
+    SUM(profit_loss) FROM live_trades WHERE result IN ('won', 'lost')   -- all history
+
+- Totals are loaded once at start-up (from the last saved snapshot, or a
+  reconcile when there isn't one)
+- Bets the trade journal hasn't written yet are counted from its pending rows,
+  so a stalled writer can't hide placements from the daily limit; once the
+  journal commits more rows the next check refreshes before counting
+- refresh() applies what changed since the last one using indexed lookups only:
+  rows with id > the highest id seen (new trades) and the still-open trades by
+  id (settlements written by check_results_LIVE.py)
+- reconcile() re-runs the aggregates on a slower timer (and at the start of a
+  new day) and corrects any drift
+- The state is saved to a small JSON snapshot every persist_seconds
+
+Usage:
+    journal = TradeJournal('live_lay_position_1')
+    risk = RiskState(journal=journal)             # same table the journal writes to
+    can_bet, reason = risk.check(RISK_LIMITS)     # refreshes/reconciles when due
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+
+from db_connection_helper import get_db_connection
+
+logger = logging.getLogger(__name__)
+
+RISK_STATE_PATH = "/Users/clairegrady/RiderProjects/betfair/databases/journal/live_trades_risk_state.json"
+SETTLED_RESULTS = ('won', 'lost')
+
+
+def _contribution(row: Dict, today: str) -> Tuple[int, float, float]:
+    """(bets today, P&L today, settled P&L) one trade adds to the totals"""
+    counted_today = row['date'] == today and row['status'] != 'FAILED'
+    profit_loss = float(row['profit_loss'] or 0)
+    return (
+        1 if counted_today else 0,
+        profit_loss if counted_today else 0.0,
+        profit_loss if row['result'] in SETTLED_RESULTS else 0.0,
+    )
+
+
+class RiskState:
+    """In-memory bets-today / P&L-today / total settled P&L for one trades table"""
+
+    def __init__(self, table: str = 'live_trades', db_path: str = 'betfair_trades',
+                 state_path: Optional[str] = RISK_STATE_PATH, refresh_seconds: float = 15.0,
+                 reconcile_seconds: float = 600.0, persist_seconds: float = 60.0, journal=None):
+        self.table = table
+        self.journal = journal  # TradeJournal writing this table - its unwritten rows count too
+        self.db_path = db_path
+        self.state_path = state_path
+        self.refresh_seconds = refresh_seconds
+        self.reconcile_seconds = reconcile_seconds
+        self.persist_seconds = persist_seconds
+
+        self._lock = threading.RLock()
+        self.day = None
+        self.bets_today = 0
+        self.pnl_today = 0.0
+        self.total_pnl = 0.0
+        self._max_id = 0
+        self._open: Dict[int, Dict] = {}          # id -> row, for trades that can still be settled
+        self._journal_written = journal.written if journal is not None else 0  # as of the last refresh
+
+        self._last_refresh = 0.0
+        self._last_reconcile = 0.0
+        self._last_persist = time.monotonic()
+
+        self.refreshes = 0
+        self.reconciles = 0
+        self.drift_corrections = 0
+
+        if not self._load_snapshot():
+            self.reconcile()
+
+    # DB sync ------------------------------------------------------------
+
+    def _apply(self, row: Dict, sign: int = 1):
+        bets, pnl_today, settled_pnl = _contribution(row, self.day)
+        self.bets_today += sign * bets
+        self.pnl_today += sign * pnl_today
+        self.total_pnl += sign * settled_pnl
+
+    def _track(self, row_id: int, row: Dict):
+        if (row['result'] in (None, 'pending')) and row['status'] != 'FAILED':
+            self._open[row_id] = row
+        else:
+            self._open.pop(row_id, None)
+
+    def refresh(self) -> int:
+        """Apply new trades and settlements since the last refresh. Returns rows read."""
+        with self._lock:
+            self._last_refresh = time.monotonic()
+            today = datetime.now().strftime('%Y-%m-%d')
+            if today != self.day:
+                return self.reconcile()
+
+            # Read before the query: rows the journal commits after this show up next time
+            journal_written = self.journal.written if self.journal is not None else 0
+            try:
+                conn = get_db_connection(self.db_path)
+                cursor = conn.cursor()
+                cursor.execute(f"""
+                    SELECT id, date, status, result, profit_loss
+                    FROM {self.table}
+                    WHERE id > %s
+                    ORDER BY id
+                """, (self._max_id,))
+                new_rows = cursor.fetchall()
+
+                changed_rows = []
+                if self._open:
+                    cursor.execute(f"""
+                        SELECT id, date, status, result, profit_loss
+                        FROM {self.table}
+                        WHERE id = ANY(%s)
+                    """, (list(self._open),))
+                    changed_rows = cursor.fetchall()
+                conn.close()
+            except Exception as e:
+                logger.error(f"Error refreshing risk state: {e}")
+                return 0
+
+            for row_id, date, status, result, profit_loss in changed_rows:
+                row = {'date': str(date), 'status': status, 'result': result, 'profit_loss': profit_loss}
+                old = self._open[row_id]
+                if row != old:
+                    self._apply(old, -1)
+                    self._apply(row)
+                    self._track(row_id, row)
+
+            for row_id, date, status, result, profit_loss in new_rows:
+                row = {'date': str(date), 'status': status, 'result': result, 'profit_loss': profit_loss}
+                self._apply(row)
+                self._track(row_id, row)
+                self._max_id = max(self._max_id, row_id)
+
+            self._journal_written = journal_written
+            self.refreshes += 1
+            self._maybe_persist()
+            return len(new_rows) + len(changed_rows)
+
+    def reconcile(self) -> int:
+        """Recompute every total from the table, correcting drift. Returns open trades loaded."""
+        with self._lock:
+            today = datetime.now().strftime('%Y-%m-%d')
+            if self.day == today:
+                # Catch up first, so only real drift (not refresh lag) gets reported
+                self.refresh()
+            self._last_refresh = self._last_reconcile = time.monotonic()
+
+            journal_written = self.journal.written if self.journal is not None else 0
+            try:
+                conn = get_db_connection(self.db_path)
+                cursor = conn.cursor()
+                cursor.execute(f"""
+                    SELECT COUNT(*), COALESCE(SUM(profit_loss), 0)
+                    FROM {self.table}
+                    WHERE date = %s AND status != 'FAILED'
+                """, (today,))
+                bets_today, pnl_today = cursor.fetchone()
+
+                # Settled P&L and the id watermark in one pass
+                cursor.execute(f"""
+                    SELECT COALESCE(SUM(profit_loss) FILTER (WHERE result IN ('won', 'lost')), 0),
+                           COALESCE(MAX(id), 0)
+                    FROM {self.table}
+                """)
+                total_pnl, max_id = cursor.fetchone()
+
+                cursor.execute(f"""
+                    SELECT id, date, status, result, profit_loss
+                    FROM {self.table}
+                    WHERE result = 'pending' AND status != 'FAILED'
+                """)
+                open_rows = cursor.fetchall()
+                conn.close()
+            except Exception as e:
+                logger.error(f"Error reconciling risk state: {e}")
+                return 0
+
+            if self.day == today and (self.bets_today, round(self.pnl_today, 2), round(self.total_pnl, 2)) != \
+                    (bets_today, round(float(pnl_today), 2), round(float(total_pnl), 2)):
+                self.drift_corrections += 1
+                logger.warning(f"⚠️  Risk state drift corrected: bets {self.bets_today}→{bets_today}, "
+                               f"P&L today {self.pnl_today:.2f}→{float(pnl_today):.2f}, "
+                               f"total P&L {self.total_pnl:.2f}→{float(total_pnl):.2f}")
+
+            self.day = today
+            self.bets_today = int(bets_today)
+            self.pnl_today = float(pnl_today)
+            self.total_pnl = float(total_pnl)
+            self._max_id = int(max_id)
+            self._open = {
+                row_id: {'date': str(date), 'status': status, 'result': result, 'profit_loss': profit_loss}
+                for row_id, date, status, result, profit_loss in open_rows
+            }
+            self._journal_written = journal_written
+
+            self.reconciles += 1
+            self._persist()
+            return len(open_rows)
+
+    def _maybe_refresh(self):
+        now = time.monotonic()
+        if now - self._last_reconcile >= self.reconcile_seconds:
+            self.reconcile()
+        elif now - self._last_refresh >= self.refresh_seconds:
+            self.refresh()
+
+    # Snapshot -----------------------------------------------------------
+
+    def _persist(self):
+        self._last_persist = time.monotonic()
+        if not self.state_path:
+            return
+        state = {
+            'table': self.table,
+            'day': self.day,
+            'bets_today': self.bets_today,
+            'pnl_today': self.pnl_today,
+            'total_pnl': self.total_pnl,
+            'max_id': self._max_id,
+            'open': {str(k): v for k, v in self._open.items()},
+            'saved_at': time.time(),
+        }
+        try:
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            tmp_path = self.state_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(state, f, default=str)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.warning(f"⚠️  Could not save risk state: {e}")
+
+    def _maybe_persist(self):
+        if time.monotonic() - self._last_persist >= self.persist_seconds:
+            self._persist()
+
+    def _load_snapshot(self) -> bool:
+        """Start from the saved snapshot (then catch up with refresh) if it's for today"""
+        if not self.state_path or not os.path.exists(self.state_path):
+            return False
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️  Ignoring unreadable risk state {self.state_path}: {e}")
+            return False
+        if state.get('table') != self.table or state.get('day') != datetime.now().strftime('%Y-%m-%d'):
+            return False
+
+        with self._lock:
+            self.day = state['day']
+            self.bets_today = state['bets_today']
+            self.pnl_today = state['pnl_today']
+            self.total_pnl = state['total_pnl']
+            self._max_id = state['max_id']
+            self._open = {int(k): v for k, v in state['open'].items()}
+            # Reconcile on the normal timer, measured from when the snapshot was written
+            self._last_reconcile = time.monotonic() - max(0.0, time.time() - state['saved_at'])
+        self.refresh()
+        logger.info(f"📒 Risk state restored: {self.bets_today} bets today, P&L today ${self.pnl_today:.2f}")
+        return True
+
+    # Limit checks -------------------------------------------------------
+
+    def _unwritten_today(self) -> int:
+        """
+        Bets today the journal hasn't committed yet. If it committed rows since the
+        last refresh, refresh first so they're in the totals - pending rows are read
+        before that, so a commit in between is counted twice rather than not at all.
+        """
+        if self.journal is None:
+            return 0
+        pending = self.journal.pending_rows(self.table)
+        if self.journal.written != self._journal_written:
+            self.refresh()
+        return sum(1 for row in pending if row['date'] == self.day and row.get('status') != 'FAILED')
+
+    def totals(self) -> Dict:
+        """Current totals, including placements the table doesn't have yet"""
+        with self._lock:
+            self._maybe_refresh()
+            unwritten = self._unwritten_today()  # May refresh - read the totals after it
+            return {
+                'bets_today': self.bets_today + unwritten,
+                'pnl_today': self.pnl_today,
+                'total_pnl': self.total_pnl,
+            }
+
+    def check(self, limits: Dict) -> Tuple[bool, str]:
+        """Daily bet / daily loss / emergency stop-loss checks against RISK_LIMITS. Returns (can_bet, reason)"""
+        totals = self.totals()
+
+        if totals['bets_today'] >= limits['maxDailyBets']:
+            return False, f"Daily bet limit reached: {totals['bets_today']}/{limits['maxDailyBets']}"
+
+        # Only stop if NET P&L is negative and exceeds the limit
+        if totals['pnl_today'] < 0 and abs(totals['pnl_today']) >= limits['maxDailyLoss']:
+            return False, f"Daily loss limit reached: ${totals['pnl_today']:.2f} (limit: -${limits['maxDailyLoss']:.2f})"
+
+        if 'emergencyStopLoss' in limits and totals['total_pnl'] <= -limits['emergencyStopLoss']:
+            return False, f"EMERGENCY STOP: Total loss ${abs(totals['total_pnl']):.2f} >= ${limits['emergencyStopLoss']:.2f}"
+
+        return True, ""
+
+    def stats(self) -> Dict:
+        return {
+            'refreshes': self.refreshes,
+            'reconciles': self.reconciles,
+            'drift_corrections': self.drift_corrections,
+            'open_trades': len(self._open),
+            'unwritten': len(self.journal.pending_rows(self.table)) if self.journal is not None else 0,
+        }
@@ -0,0 +1,292 @@
+"""
+Runner Metadata Cache
+Keeps cleaned runner names and box/barrier numbers for the day's markets in memory,
+replacing the per-call
+    SELECT ... FROM marketcatalogue_runners WHERE marketid = %s
+    SELECT DISTINCT selectionid, runnername, box FROM greyhoundmarketbook WHERE marketid = %s
+queries (and the '1. ' prefix regex) that ran every second of a race's retry loop.
+
+- The first lookup bulk-loads every market opening from yesterday onwards; later
+  refreshes only read marketcatalogue rows from transactions that hadn't finished
+  before the previous load started (snapshot xmin watermark, as in MarketResolver),
+  so a catalogue fetch is picked up within refresh_seconds
+- Names from marketcatalogue_runners win; the book table (greyhoundmarketbook /
+  horsemarketbook) only fills runners or boxes the catalogue doesn't have
+- A market missing from the preload is loaded on its own once, then cached
+- Markets are dropped CLOSED_AFTER_SECONDS after their start time, with an LRU
+  cap as a backstop, so the cache only ever holds the day's live markets
+
+Per-tick odds handling does no SQL:
+    metadata = RunnerMetadataCache('greyhound')
+    runner_names, box_numbers = metadata.get(market_id)
+    total_matched = metadata.total_matched(market_id)
+"""
+
+import re
+import time
+import pytz
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from db_connection_helper import get_db_connection
+from market_resolver import EVENT_TYPES, SNAPSHOT_XMIN_SQL
+
+logger = logging.getLogger(__name__)
+
+MAX_MARKETS = 2000
+CLOSED_AFTER_SECONDS = 30 * 60   # Markets are settled well within 30 minutes of the jump
+
+# Where each sport's runner names/numbers come from
+METADATA_SOURCES = {
+    'greyhound': {
+        'catalogue_runners': True,
+        'book_table': 'greyhoundmarketbook',
+        'name_column': 'runnername',
+        'number_column': 'box',
+    },
+    'horse': {
+        'catalogue_runners': False,
+        'book_table': 'horsemarketbook',
+        'name_column': 'runner_name',
+        'number_column': 'stall_draw',
+    },
+}
+
+PREFIX_RE = re.compile(r'^\d+\.\s*')
+
+
+def clean_runner_name(runner_name: str) -> str:
+    """Strip the '1. ' saddle/box prefix Betfair puts on runner names"""
+    return PREFIX_RE.sub('', runner_name)
+
+
+class MarketRunners:
+    """Names and numbers for one market's runners (shared - don't mutate)"""
+
+    __slots__ = ('names', 'numbers', 'total_matched', 'start_time', 'loaded_at')
+
+    def __init__(self, total_matched: Optional[float] = None, start_time: Optional[float] = None):
+        self.names: Dict[int, str] = {}
+        self.numbers: Dict[int, int] = {}
+        self.total_matched = total_matched
+        self.start_time = start_time
+        self.loaded_at = time.monotonic()
+
+    def needs_book_fallback(self) -> bool:
+        return not self.names or len(self.numbers) < len(self.names)
+
+
+class RunnerMetadataCache:
+    """In-memory market_id -> runner names / box numbers for one sport"""
+
+    def __init__(self, sport: str = 'greyhound', max_markets: int = MAX_MARKETS,
+                 refresh_seconds: float = 60.0, miss_refresh_seconds: float = 5.0):
+        if sport not in METADATA_SOURCES:
+            raise ValueError(f"Unknown sport: {sport}")
+
+        self.sport = sport
+        self.source = METADATA_SOURCES[sport]
+        self.max_markets = max_markets
+        self.refresh_seconds = refresh_seconds
+        self.miss_refresh_seconds = miss_refresh_seconds
+
+        self._markets: 'OrderedDict[str, MarketRunners]' = OrderedDict()
+        self._lock = threading.RLock()  # Safe to share with asyncio.to_thread workers
+        self._watermark = None
+        self._loaded_for_date = None
+        self._last_refresh = 0.0
+
+        self.hits = 0
+        self.misses = 0
+        self.markets_loaded = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._markets)
+
+    def _load_runners(self, cursor, markets: Dict[str, MarketRunners]):
+        """Fill names/numbers for these markets with one query per table"""
+        market_ids = list(markets)
+
+        if self.source['catalogue_runners']:
+            cursor.execute("""
+                SELECT marketid, selectionid, runnername, sortpriority
+                FROM marketcatalogue_runners
+                WHERE marketid = ANY(%s)
+            """, (market_ids,))
+            for market_id, sel_id, name, sort in cursor.fetchall():
+                entry = markets[market_id]
+                if name:
+                    entry.names[sel_id] = name
+                if sort:
+                    entry.numbers[sel_id] = sort
+
+        fallback_ids = [m for m in market_ids if markets[m].needs_book_fallback()]
+        if not fallback_ids:
+            return
+
+        cursor.execute(f"""
+            SELECT DISTINCT marketid, selectionid, {self.source['name_column']}, {self.source['number_column']}
+            FROM {self.source['book_table']}
+            WHERE marketid = ANY(%s)
+        """, (fallback_ids,))
+        for market_id, sel_id, runner_name, number in cursor.fetchall():
+            entry = markets[market_id]
+            # Only use if not already set from the catalogue
+            if sel_id not in entry.names and runner_name:
+                entry.names[sel_id] = clean_runner_name(runner_name)
+            if sel_id not in entry.numbers and number:
+                entry.numbers[sel_id] = number
+
+    def _store(self, market_id: str, entry: MarketRunners):
+        self._markets[market_id] = entry
+        self._markets.move_to_end(market_id)
+        while len(self._markets) > self.max_markets:
+            self._markets.popitem(last=False)
+            self.evictions += 1
+
+    def evict_closed(self, now: Optional[float] = None) -> int:
+        """Drop markets that started more than CLOSED_AFTER_SECONDS ago"""
+        cutoff = (time.time() if now is None else now) - CLOSED_AFTER_SECONDS
+        with self._lock:
+            closed = [m for m, e in self._markets.items() if e.start_time is not None and e.start_time < cutoff]
+            for market_id in closed:
+                del self._markets[market_id]
+            self.evictions += len(closed)
+        return len(closed)
+
+    def discard(self, market_id: str):
+        """Forget a market (e.g. once it's settled)"""
+        with self._lock:
+            if self._markets.pop(market_id, None) is not None:
+                self.evictions += 1
+
+    def preload(self, force: bool = False) -> int:
+        """
+        Bulk-load runner metadata for catalogue markets written since the last load.
+
+        Returns the number of markets (re)loaded. The first call (or force=True, or a
+        new day) loads every market opening from yesterday onwards.
+        """
+        with self._lock:
+            return self._preload(force)
+
+    def _preload(self, force: bool) -> int:
+        self._last_refresh = time.monotonic()
+        today = datetime.now(pytz.timezone('Australia/Sydney')).date()
+        full_load = force or self._watermark is None or self._loaded_for_date != today
+
+        try:
+            conn = get_db_connection('betfairmarket')
+            cursor = conn.cursor()
+
+            # Before the read, so a catalogue write that commits late is covered next time
+            cursor.execute(SNAPSHOT_XMIN_SQL)
+            watermark = cursor.fetchone()[0]
+
+            query = """
+                SELECT marketid, totalmatched, EXTRACT(EPOCH FROM opendate::timestamptz)
+                FROM marketcatalogue
+                WHERE eventtypename = %s
+                AND opendate::timestamptz >= NOW() - INTERVAL '1 day'
+            """
+            params = [EVENT_TYPES[self.sport]]
+            if not full_load:
+                # Markets written by catalogue fetches still open (or not started) at the last load
+                query += " AND age(xmin) <= age(%s::text::xid)"
+                params.append(str(self._watermark))
+
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+
+            cutoff = time.time() - CLOSED_AFTER_SECONDS
+            markets = {
+                market_id: MarketRunners(total_matched, float(start) if start is not None else None)
+                for market_id, total_matched, start in rows
+                if start is None or float(start) >= cutoff
+            }
+            if markets:
+                self._load_runners(cursor, markets)
+            conn.close()
+
+        except Exception as e:
+            logger.error(f"Error preloading runner metadata: {e}")
+            return 0
+
+        if full_load:
+            self._markets = OrderedDict()
+
+        for market_id, entry in markets.items():
+            self._store(market_id, entry)
+
+        self._watermark = watermark
+        self._loaded_for_date = today
+        self.markets_loaded += len(markets)
+        self.evict_closed()
+
+        if markets:
+            logger.debug(f"Runner metadata: loaded {len(markets)} {self.sport} markets ({'full' if full_load else 'incremental'})")
+        return len(markets)
+
+    def _load_market(self, market_id: str) -> MarketRunners:
+        """A market the preload didn't cover (or had no runners for yet)"""
+        entry = MarketRunners()
+        try:
+            conn = get_db_connection('betfairmarket')
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT totalmatched, EXTRACT(EPOCH FROM opendate::timestamptz)
+                FROM marketcatalogue
+                WHERE marketid = %s
+            """, (market_id,))
+            row = cursor.fetchone()
+            if row:
+                entry.total_matched = row[0]
+                entry.start_time = float(row[1]) if row[1] is not None else None
+            self._load_runners(cursor, {market_id: entry})
+            conn.close()
+        except Exception as e:
+            logger.error(f"Error loading runner metadata for {market_id}: {e}")
+        return entry
+
+    def _entry(self, market_id: str) -> MarketRunners:
+        if time.monotonic() - self._last_refresh >= self.refresh_seconds:
+            self._preload(force=False)
+
+        entry = self._markets.get(market_id)
+        if entry is not None and (entry.names or time.monotonic() - entry.loaded_at < self.miss_refresh_seconds):
+            self._markets.move_to_end(market_id)
+            self.hits += 1
+            return entry
+
+        # Not preloaded, or no runners yet when it was - load it on its own (rate-limited)
+        self.misses += 1
+        entry = self._load_market(market_id)
+        self._store(market_id, entry)
+        return entry
+
+    def get(self, market_id: str) -> Tuple[Dict[int, str], Dict[int, int]]:
+        """(runner_names, box/barrier numbers) keyed by selection ID"""
+        with self._lock:
+            entry = self._entry(market_id)
+        return entry.names, entry.numbers
+
+    def total_matched(self, market_id: str) -> Optional[float]:
+        """marketcatalogue.totalmatched as of the last catalogue fetch"""
+        with self._lock:
+            return self._entry(market_id).total_matched
+
+    def market_ids(self) -> List[str]:
+        with self._lock:
+            return list(self._markets)
+
+    def stats(self) -> Dict:
+        return {
+            'markets': len(self._markets),
+            'hits': self.hits,
+            'misses': self.misses,
+            'markets_loaded': self.markets_loaded,
+            'evictions': self.evictions,
+        }
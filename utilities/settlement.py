@@ -0,0 +1,243 @@
+"""
+Settlement Engine
+Shared by check_results_greyhounds / check_results_horses / check_results_LIVE.
+
+Instead of one UPDATE (and one fresh connection) per bet plus one fallback query
+per market, a run is:
+- bets grouped by market (one DataFrame)
+- results for every market: backend /api/results/settled, then ONE
+  `WHERE marketid = ANY(%s)` query for the markets the backend didn't return
+- finishing position and P&L computed vectorized over all bets at once
+- every settlement written with ONE `UPDATE ... FROM (VALUES ...)` per page
+
+Usage:
+    bets = pd.DataFrame(get_unsettled_bets())          # id, market_id, selection_id, stake, liability, ...
+    results = get_market_results(bets['market_id'].unique().tolist(), sport='greyhound')
+    settled, pending_markets = settle_bets(bets, results)
+    write_settlements('paper_trades_greyhounds', settled)
+"""
+
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import requests
+from psycopg2.extras import execute_values
+
+from db_connection_helper import db_transaction, get_db_connection
+
+logger = logging.getLogger(__name__)
+
+BACKEND_URL = "http://localhost:5173"
+WRITE_PAGE_SIZE = 1000  # Settlements per UPDATE ... FROM (VALUES ...) statement
+
+# Market book table per sport for the DB fallback (BSP isn't stored for greyhounds)
+RESULT_SOURCES = {
+    'greyhound': {
+        'table': 'greyhoundmarketbook',
+        'name_column': 'runnername',
+        'bsp_column': None,
+        'default_name': 'Dog',
+    },
+    'horse': {
+        'table': 'horsemarketbook',
+        'name_column': 'runner_name',
+        'bsp_column': 'bsp',
+        'default_name': 'Horse',
+    },
+}
+
+RESULT_COLUMNS = ['market_id', 'selection_id', 'runner_name', 'status', 'bsp']
+
+# When a runner has several statuses, the most settled one is its result
+STATUS_RANK = {'WINNER': 3, 'PLACED': 2, 'LOSER': 1, 'REMOVED': 1, 'ACTIVE': 0}
+
+
+def fetch_settled_results(market_ids: List[str], batch_size: Optional[int] = None,
+                          log: Callable[[str], None] = logger.info) -> Dict[str, List[Dict]]:
+    """
+    Settled results from the backend: {market_id: [{selectionId, runnerName, status, bsp}, ...]}.
+    batch_size=None sends every market in one request.
+    """
+    markets = {}
+    batch_size = batch_size or max(len(market_ids), 1)
+
+    for i in range(0, len(market_ids), batch_size):
+        batch = market_ids[i:i + batch_size]
+        try:
+            log(f"   🌐 Calling backend with {len(batch)} market IDs...")
+            response = requests.post(
+                f"{BACKEND_URL}/api/results/settled",
+                json={"marketIds": batch},
+                timeout=30
+            )
+            log(f"   📡 Backend response: {response.status_code}")
+
+            if response.status_code == 200:
+                markets.update(response.json().get('markets', {}))
+            else:
+                log(f"❌ Error fetching results: {response.status_code}")
+
+        except Exception as e:
+            log(f"❌ Error contacting backend: {e}")
+
+    return markets
+
+
+def get_results_from_db(market_ids: List[str], sport: str = 'greyhound') -> Dict[str, List[Dict]]:
+    """Fallback: settled runner statuses for ALL given markets in one query"""
+    if not market_ids:
+        return {}
+
+    source = RESULT_SOURCES[sport]
+    bsp = source['bsp_column'] or 'NULL'
+
+    try:
+        conn = get_db_connection('betfairmarket')
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT DISTINCT marketid, selectionid, {source['name_column']}, status, {bsp}
+            FROM {source['table']}
+            WHERE marketid = ANY(%s)
+            AND status IS NOT NULL
+        """, (list(market_ids),))
+        rows = cursor.fetchall()
+        conn.close()
+
+    except Exception as e:
+        logger.warning(f"   ⚠️  Error getting results from DB: {e}")
+        return {}
+
+    markets = {}
+    for market_id, sel_id, runner_name, status, bsp_value in rows:
+        markets.setdefault(market_id, []).append({
+            'selectionId': sel_id,
+            # Clean trap / saddle cloth number from name
+            'runnerName': runner_name.split('. ', 1)[-1] if runner_name and runner_name[:1].isdigit()
+                          else runner_name or f"{source['default_name']} {sel_id}",
+            'status': status,
+            'bsp': bsp_value,
+        })
+    return markets
+
+
+def get_market_results(market_ids: List[str], sport: str = 'greyhound', batch_size: Optional[int] = None,
+                       log: Callable[[str], None] = logger.info) -> Dict[str, List[Dict]]:
+    """Backend results, with every market it didn't return looked up in the DB in one query"""
+    markets = fetch_settled_results(market_ids, batch_size, log)
+    log(f"✅ Fetched {len(markets)} markets from API")
+
+    missing = [m for m in market_ids if m not in markets]
+    if missing:
+        log(f"🔍 Checking {len(missing)} markets in database...")
+        markets.update(get_results_from_db(missing, sport))
+
+    log(f"✅ Total markets found: {len(markets)}/{len(market_ids)}")
+    return markets
+
+
+def results_frame(markets: Dict[str, List[Dict]], require_winner: bool = False) -> pd.DataFrame:
+    """
+    One row per runner: RESULT_COLUMNS + finishing_position + market_settled.
+
+    finishing_position: 1 = WINNER, 2, 3, ... = PLACED (in result order), 0 = unplaced.
+    A market is settled once any runner has left ACTIVE (and has a WINNER if require_winner).
+    """
+    rows = [
+        (market_id, r['selectionId'], r.get('runnerName'), r.get('status'), r.get('bsp'))
+        for market_id, runners in markets.items()
+        for r in (runners or [])
+    ]
+    results = pd.DataFrame(rows, columns=RESULT_COLUMNS)
+    if results.empty:
+        results['finishing_position'] = pd.Series(dtype=int)
+        results['market_settled'] = pd.Series(dtype=bool)
+        return results
+
+    # Same runner can appear more than once in the fallback (greyhoundmarketbook has a row
+    # per price, and a runner's status can differ between them) - keep its most settled status
+    rank = results['status'].map(STATUS_RANK).fillna(0)
+    results = (results.iloc[np.argsort(-rank.to_numpy(), kind='stable')]
+               .drop_duplicates(['market_id', 'selection_id'])
+               .sort_index())
+
+    is_winner = results['status'].eq('WINNER')
+    is_placed = results['status'].eq('PLACED')
+    placed_rank = is_placed.astype(int).groupby(results['market_id']).cumsum()
+
+    results['finishing_position'] = np.select([is_winner, is_placed], [1, 1 + placed_rank], 0)
+
+    left_active = results['status'].notna() & results['status'].ne('ACTIVE')
+    settled = left_active.groupby(results['market_id']).transform('any')
+    if require_winner:
+        settled &= is_winner.groupby(results['market_id']).transform('any')
+    results['market_settled'] = settled
+    return results
+
+
+def settle_bets(bets: pd.DataFrame, markets: Dict[str, List[Dict]],
+                require_winner: bool = False) -> Tuple[pd.DataFrame, List[str]]:
+    """
+    Settle LAY bets against market results, vectorized.
+
+    bets needs id, market_id, selection_id, stake and liability (the amounts to settle).
+    Returns (settled, pending_market_ids): settled is bets joined with
+    result / finishing_position / profit_loss / bsp / runner status for every bet
+    that could be settled. A bet whose runner has no result is left out (and logged).
+    """
+    results = results_frame(markets, require_winner)
+    merged = bets.merge(results, on=['market_id', 'selection_id'], how='left', suffixes=('', '_result'))
+
+    settled_markets = set(results.loc[results['market_settled'], 'market_id'])
+    in_settled_market = merged['market_id'].isin(settled_markets)
+    pending_markets = sorted(set(bets['market_id']) - settled_markets)
+
+    no_result = in_settled_market & merged['status'].isna()
+    for _, bet in merged[no_result].iterrows():
+        logger.warning(f"   ⚠️  {bet['market_id']} selection {bet['selection_id']}: No result found")
+
+    settled = merged[in_settled_market & ~no_result].copy()
+
+    # For LAY bets: runner WON -> we lose the liability; runner lost -> we keep the stake
+    runner_won = settled['status'].eq('WINNER').to_numpy()
+    settled['result'] = np.where(runner_won, 'lost', 'won')
+    settled['profit_loss'] = np.where(runner_won, -settled['liability'].astype(float), settled['stake'].astype(float))
+    settled['finishing_position'] = settled['finishing_position'].astype(int)
+    settled['bsp'] = settled['bsp'].astype(object).where(settled['bsp'].notna(), None)
+    return settled, pending_markets
+
+
+def write_settlements(table: str, settled: pd.DataFrame, db_path: str = 'betfair_trades') -> int:
+    """
+    Write result / finishing_position / profit_loss / bsp for every settled bet
+    in one transaction, one UPDATE ... FROM (VALUES ...) per page. Only rows still
+    'pending' are touched, so a re-run can't double-settle. Returns rows updated.
+    """
+    if settled.empty:
+        return 0
+
+    values = list(zip(
+        settled['id'].astype(int).tolist(),
+        settled['result'].tolist(),
+        settled['finishing_position'].astype(int).tolist(),
+        settled['profit_loss'].astype(float).round(2).tolist(),
+        [None if pd.isna(b) else float(b) for b in settled['bsp']],
+    ))
+
+    with db_transaction(db_path) as conn:
+        cursor = conn.cursor()
+        updated = 0
+        for i in range(0, len(values), WRITE_PAGE_SIZE):
+            execute_values(cursor, f"""
+                UPDATE {table} AS t
+                SET result = v.result, finishing_position = v.finishing_position,
+                    profit_loss = v.profit_loss, bsp = v.bsp
+                FROM (VALUES %s) AS v(id, result, finishing_position, profit_loss, bsp)
+                WHERE t.id = v.id AND t.result = 'pending'
+            """, values[i:i + WRITE_PAGE_SIZE],
+                template="(%s::bigint, %s::text, %s::integer, %s::double precision, %s::double precision)",
+                page_size=WRITE_PAGE_SIZE)
+            updated += cursor.rowcount
+
+    return updated
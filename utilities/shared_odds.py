@@ -0,0 +1,446 @@
+"""
+Shared Odds Cache
+One fetcher per host fills a memory-mapped file of fixed-size market records;
+every lay_position_* process reads it instead of calling the backend itself.
+
+- `python shared_odds.py serve` tracks every greyhound/horse market starting in the
+  next few minutes (RaceScheduleCache + MarketResolver) and refreshes them from the
+  Stream API (if BETFAIR_SESSION_TOKEN is set) or ONE batched backend call per sport
+  per cycle. Backend load no longer grows with the number of strategy processes.
+- Readers map the same file read-only. Each record carries a sequence number
+  (odd while being written) and an updated_at timestamp: a read is a NumPy lookup
+  plus a copy, retried if the writer was mid-update - no locks, microseconds.
+- updated_at is when the prices were last known to be current (for the stream: its
+  last message or heartbeat); changed_at is when the market's prices last changed.
+
+Layout: 64-byte header, then MAX_MARKETS records of
+    seq, market_id, updated_at, changed_at, status, inplay, n_runners, total_matched,
+    runners[MAX_RUNNERS] = (selection_id, back, back_size, lay, lay_size, ltp)
+
+Usage (reader, in a lay script):
+    shared_odds = SharedOddsReader()
+    market = shared_odds.get(market_id, max_age=2.0)       # None if missing/stale
+    rows = shared_odds.odds_rows(market_id)                  # GreyhoundMarketBook 'odds' shape
+"""
+
+import sys
+sys.path.insert(0, '/Users/clairegrady/RiderProjects/betfair/utilities')
+sys.path.insert(0, '/Users/clairegrady/RiderProjects/betfair/greyhound-simulated/lay_betting')
+
+import logging
+import mmap
+import os
+import tempfile
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SHARED_ODDS_PATH = os.path.join('/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir(),
+                                'betfair_odds_cache.bin')
+MAX_MARKETS = 512
+MAX_RUNNERS = 32
+MAX_AGE_SECONDS = 2.0   # Readers treat older records as missing
+STREAM_HEARTBEAT_MS = 1000  # Quiet streams still refresh updated_at well inside MAX_AGE_SECONDS
+HEADER_SIZE = 64
+MAGIC = b'BFODDS02'
+READ_RETRIES = 5
+
+RUNNER_DTYPE = np.dtype([
+    ('selection_id', '<i8'),
+    ('back', '<f8'),
+    ('back_size', '<f8'),
+    ('lay', '<f8'),
+    ('lay_size', '<f8'),
+    ('ltp', '<f8'),
+])
+
+MARKET_DTYPE = np.dtype([
+    ('seq', '<u8'),
+    ('market_id', 'S16'),
+    ('updated_at', '<f8'),
+    ('changed_at', '<f8'),
+    ('status', 'S12'),
+    ('inplay', 'u1'),
+    ('n_runners', 'u1'),
+    ('total_matched', '<f8'),
+    ('runners', RUNNER_DTYPE, (MAX_RUNNERS,)),
+], align=True)
+
+HEADER_DTYPE = np.dtype([('magic', 'S8'), ('max_markets', '<u4'), ('record_size', '<u4')])
+
+
+def _file_size(max_markets: int) -> int:
+    return HEADER_SIZE + max_markets * MARKET_DTYPE.itemsize
+
+
+def _nan_to_none(value: float) -> Optional[float]:
+    return None if value != value else float(value)
+
+
+class SharedOddsWriter:
+    """Single writer (the fetcher daemon) - owns slot assignment"""
+
+    def __init__(self, path: str = SHARED_ODDS_PATH, max_markets: int = MAX_MARKETS):
+        self.path = path
+        size = _file_size(max_markets)
+        with open(path, 'a+b') as f:
+            f.truncate(size)
+        self._fd = os.open(path, os.O_RDWR)
+        self._mmap = mmap.mmap(self._fd, size)
+
+        header = np.frombuffer(self._mmap, dtype=HEADER_DTYPE, count=1)
+        self.markets = np.frombuffer(self._mmap, dtype=MARKET_DTYPE, count=max_markets, offset=HEADER_SIZE)
+        # A fresh file for readers: no stale records from a previous run
+        self.markets[:] = np.zeros(max_markets, dtype=MARKET_DTYPE)
+        header[0] = (MAGIC, max_markets, MARKET_DTYPE.itemsize)
+
+        self._slots: Dict[str, int] = {}
+        self._free = list(range(max_markets - 1, -1, -1))
+        self.writes = 0
+
+    def _slot(self, market_id: str) -> int:
+        slot = self._slots.get(market_id)
+        if slot is not None:
+            return slot
+        if not self._free:
+            # Full: reuse the least recently updated market's slot
+            oldest = min(self._slots, key=lambda m: self.markets['updated_at'][self._slots[m]])
+            self.remove(oldest)
+        slot = self._slots[market_id] = self._free.pop()
+        return slot
+
+    def put(self, market_id: str, runners: List[Dict], status: Optional[str] = None, inplay: bool = False,
+            total_matched: Optional[float] = None, updated_at: Optional[float] = None,
+            changed_at: Optional[float] = None):
+        """
+        runners: [{selection_id, back, back_size, lay, lay_size, ltp}] (missing prices -> None).
+        updated_at: when these prices were last confirmed current (default now);
+        changed_at: when they last changed (default updated_at).
+        """
+        i = self._slot(market_id)
+        record = self.markets[i:i + 1]
+
+        runner_array = np.zeros(MAX_RUNNERS, dtype=RUNNER_DTYPE)
+        for name in ('back', 'back_size', 'lay', 'lay_size', 'ltp'):
+            runner_array[name] = np.nan
+        for j, runner in enumerate(runners[:MAX_RUNNERS]):
+            runner_array[j] = tuple(
+                runner.get(name) if runner.get(name) is not None else (0 if name == 'selection_id' else np.nan)
+                for name in RUNNER_DTYPE.names
+            )
+
+        record['seq'] += 1  # Odd: readers retry
+        record['market_id'] = market_id.encode()
+        record['updated_at'] = time.time() if updated_at is None else updated_at
+        record['changed_at'] = record['updated_at'] if changed_at is None else changed_at
+        record['status'] = (status or '').encode()[:12]
+        record['inplay'] = 1 if inplay else 0
+        record['n_runners'] = min(len(runners), MAX_RUNNERS)
+        record['total_matched'] = np.nan if total_matched is None else total_matched
+        record['runners'][0] = runner_array
+        record['seq'] += 1  # Even: consistent
+        self.writes += 1
+
+    def remove(self, market_id: str):
+        i = self._slots.pop(market_id, None)
+        if i is None:
+            return
+        record = self.markets[i:i + 1]
+        record['seq'] += 1
+        record['market_id'] = b''
+        record['n_runners'] = 0
+        record['seq'] += 1
+        self._free.append(i)
+
+    def market_ids(self) -> List[str]:
+        return list(self._slots)
+
+    def close(self):
+        self.markets = None
+        self._mmap.close()
+        os.close(self._fd)
+
+
+class SharedOddsReader:
+    """Read-only, lock-free view of the cache (any number of processes)"""
+
+    def __init__(self, path: str = SHARED_ODDS_PATH, max_age: float = MAX_AGE_SECONDS):
+        self.path = path
+        self.max_age = max_age
+        self.markets = None
+        self._mmap = None
+        self._next_open_attempt = 0.0
+
+        self.hits = 0
+        self.misses = 0
+
+    def _open(self) -> bool:
+        if self.markets is not None:
+            return True
+        # The daemon may not be running - don't stat the file on every call
+        now = time.monotonic()
+        if now < self._next_open_attempt:
+            return False
+        self._next_open_attempt = now + 5.0
+        try:
+            with open(self.path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            header = np.frombuffer(self._mmap, dtype=HEADER_DTYPE, count=1)[0]
+            if header['magic'] != MAGIC or header['record_size'] != MARKET_DTYPE.itemsize:
+                logger.warning(f"⚠️  {self.path} is not a compatible shared odds file")
+                return False
+            self.markets = np.frombuffer(self._mmap, dtype=MARKET_DTYPE,
+                                         count=int(header['max_markets']), offset=HEADER_SIZE)
+            return True
+        except (OSError, ValueError):
+            return False
+
+    def _read(self, market_id: str) -> Optional[np.void]:
+        if not self._open():
+            return None
+        key = market_id.encode()
+        slots = np.flatnonzero(self.markets['market_id'] == key)
+        if not len(slots):
+            return None
+        i = slots[0]
+
+        for _ in range(READ_RETRIES):
+            seq = self.markets['seq'][i]
+            if seq & 1:
+                continue
+            record = self.markets[i].copy()
+            if self.markets['seq'][i] == seq and record['market_id'] == key:
+                return record
+        return None
+
+    def get(self, market_id: str, max_age: Optional[float] = None) -> Optional[Dict]:
+        """The market's latest record, or None if missing / older than max_age seconds"""
+        record = self._read(market_id)
+        max_age = self.max_age if max_age is None else max_age
+        if record is None or time.time() - record['updated_at'] > max_age:
+            self.misses += 1
+            return None
+        self.hits += 1
+
+        runners = record['runners'][:record['n_runners']]
+        return {
+            'market_id': market_id,
+            'updated_at': float(record['updated_at']),
+            'changed_at': float(record['changed_at']),
+            'status': record['status'].decode() or None,
+            'inplay': bool(record['inplay']),
+            'total_matched': _nan_to_none(record['total_matched']),
+            'runners': [
+                {
+                    'selection_id': int(r['selection_id']),
+                    'back': _nan_to_none(r['back']),
+                    'back_size': _nan_to_none(r['back_size']),
+                    'lay': _nan_to_none(r['lay']),
+                    'lay_size': _nan_to_none(r['lay_size']),
+                    'ltp': _nan_to_none(r['ltp']),
+                }
+                for r in runners
+            ],
+        }
+
+    def odds_rows(self, market_id: str, max_age: Optional[float] = None) -> Optional[List[Dict]]:
+        """Best prices as GreyhoundMarketBook/market/{id} 'odds' rows (selectionid, status, pricetype, price, size)"""
+        market = self.get(market_id, max_age)
+        if market is None:
+            return None
+        rows = []
+        for r in market['runners']:
+            if r['back'] is not None:
+                rows.append({'selectionid': r['selection_id'], 'status': market['status'],
+                             'pricetype': 'AvailableToBack', 'price': r['back'], 'size': r['back_size']})
+            if r['lay'] is not None:
+                rows.append({'selectionid': r['selection_id'], 'status': market['status'],
+                             'pricetype': 'AvailableToLay', 'price': r['lay'], 'size': r['lay_size']})
+        return rows
+
+    def market_book(self, market_id: str, max_age: Optional[float] = None) -> Optional[Dict]:
+        """Best prices as a listMarketBook market book (horse-racing/market-book/{id} shape)"""
+        market = self.get(market_id, max_age)
+        if market is None:
+            return None
+        return {
+            'marketId': market_id,
+            'status': market['status'],
+            'inplay': market['inplay'],
+            'totalMatched': market['total_matched'],
+            'runners': [
+                {
+                    'selectionId': r['selection_id'],
+                    'lastPriceTraded': r['ltp'],
+                    'ex': {
+                        'availableToBack': [{'price': r['back'], 'size': r['back_size']}] if r['back'] is not None else [],
+                        'availableToLay': [{'price': r['lay'], 'size': r['lay_size']}] if r['lay'] is not None else [],
+                    },
+                }
+                for r in market['runners']
+            ],
+        }
+
+    def stats(self) -> Dict:
+        return {'hits': self.hits, 'misses': self.misses}
+
+
+# Fetcher daemon ---------------------------------------------------------------
+
+BACKEND_URL = "http://localhost:5173"
+REFRESH_SECONDS = 0.5
+TRACK_WINDOW = (-120, 600)   # Track markets from 10 minutes before to 2 minutes after the start
+
+
+def runners_from_odds_rows(rows: Iterable[Dict]) -> List[Dict]:
+    """GreyhoundMarketBook rows -> best back (highest) / best lay (lowest) per runner"""
+    runners = {}
+    for row in rows:
+        price = row.get('price')
+        if not price or price <= 0:
+            continue
+        runner = runners.setdefault(row['selectionid'], {'selection_id': row['selectionid']})
+        if row.get('pricetype') == 'AvailableToBack' and price > (runner.get('back') or 0):
+            runner['back'], runner['back_size'] = price, row.get('size')
+        elif row.get('pricetype') == 'AvailableToLay' and price < (runner.get('lay') or float('inf')):
+            runner['lay'], runner['lay_size'] = price, row.get('size')
+    return list(runners.values())
+
+
+def runners_from_market_book(book: Dict) -> List[Dict]:
+    """listMarketBook market book -> best back / lay / ltp per active runner"""
+    runners = []
+    for runner in book.get('runners', []):
+        if runner.get('status', 'ACTIVE') != 'ACTIVE':
+            continue
+        ex = runner.get('ex', {})
+        back = (ex.get('availableToBack') or [{}])[0]
+        lay = (ex.get('availableToLay') or [{}])[0]
+        runners.append({
+            'selection_id': runner['selectionId'],
+            'back': back.get('price'), 'back_size': back.get('size'),
+            'lay': lay.get('price'), 'lay_size': lay.get('size'),
+            'ltp': runner.get('lastPriceTraded'),
+        })
+    return runners
+
+
+def runners_from_stream(book) -> List[Dict]:
+    """Stream MarketBook -> best back / lay / ltp per active runner"""
+    runners = []
+    for runner in book.active_runners():
+        back = runner.best_back(1)
+        lay = runner.best_lay(1)
+        runners.append({
+            'selection_id': runner.selection_id,
+            'back': back[0][0] if back else None, 'back_size': back[0][1] if back else None,
+            'lay': lay[0][0] if lay else None, 'lay_size': lay[0][1] if lay else None,
+            'ltp': runner.ltp,
+        })
+    return runners
+
+
+def serve(path: str = SHARED_ODDS_PATH, refresh_seconds: float = REFRESH_SECONDS):
+    """Fill the shared cache for every market starting soon, until interrupted"""
+    import requests
+    from market_resolver import MarketResolver
+    from race_schedule import RaceScheduleCache
+
+    batch_paths = {'greyhound': "/api/GreyhoundMarketBook/markets", 'horse': "/api/horse-racing/market-books"}
+    schedules = {'greyhound': RaceScheduleCache('greyhound_race_times'), 'horse': RaceScheduleCache('horse_race_times')}
+    resolver = MarketResolver()
+    writer = SharedOddsWriter(path)
+    session = requests.Session()
+
+    stream = None
+    session_token = os.environ.get('BETFAIR_SESSION_TOKEN')
+    if session_token:
+        from betfair_stream_client import BetfairStreamClient
+        stream = BetfairStreamClient(os.environ.get('BETFAIR_APP_KEY', "tjBWsmDXH5zwhfjj"), session_token,
+                                     heartbeat_ms=STREAM_HEARTBEAT_MS)
+        if stream.connect() and stream.authenticate():
+            stream.start_listening()
+        else:
+            logger.warning("⚠️  Stream API unavailable - using batched backend calls")
+            stream = None
+
+    logger.info(f"🗂️  Shared odds cache at {path} ({'stream' if stream else 'backend'} source)")
+    last_log = time.monotonic()
+
+    try:
+        while True:
+            started = time.monotonic()
+            tracked = {}
+            for sport, schedule in schedules.items():
+                schedule.refresh()
+                for race in schedule.races_in_window(*TRACK_WINDOW):
+                    market_id = resolver.find_market_id(sport, race['venue'], race['race_number'])
+                    if market_id:
+                        tracked[market_id] = sport
+
+            for market_id in set(writer.market_ids()) - set(tracked):
+                writer.remove(market_id)
+                if stream:
+                    stream.forget_market(market_id)
+
+            if stream:
+                for market_id in tracked:
+                    if market_id not in stream.subscribed_markets:
+                        stream.subscribe_to_market(market_id)
+                    # While dropped/reconnecting the books are frozen - let readers see them age out
+                    last_message = stream.metrics['last_message_at']
+                    if not stream.connected.is_set() or last_message is None:
+                        continue
+                    book = stream.get_market_book(market_id)
+                    if book is not None and book.runners and book.updated_at:
+                        # A quiet market on a live stream is still current: stamp the stream's last
+                        # message/heartbeat (a stalled stream stops advancing it), not our copy time
+                        writer.put(market_id, runners_from_stream(book), book.status, book.inplay, book.tv,
+                                   updated_at=last_message.timestamp(), changed_at=book.updated_at)
+            else:
+                for sport in ('greyhound', 'horse'):
+                    market_ids = [m for m, s in tracked.items() if s == sport]
+                    if not market_ids:
+                        continue
+                    try:
+                        response = session.post(f"{BACKEND_URL}{batch_paths[sport]}",
+                                                json={"marketIds": market_ids}, timeout=10)
+                        if response.status_code != 200:
+                            logger.warning(f"⚠️  {sport} batch returned {response.status_code}")
+                            continue
+                        for market_id, data in response.json().get('markets', {}).items():
+                            if sport == 'greyhound':
+                                status = next((row.get('status') for row in data if row.get('status')), None)
+                                writer.put(market_id, runners_from_odds_rows(data), status)
+                            else:
+                                writer.put(market_id, runners_from_market_book(data), data.get('status'),
+                                           bool(data.get('inplay')), data.get('totalMatched'))
+                    except Exception as e:
+                        logger.warning(f"⚠️  {sport} batch failed: {e}")
+
+            if time.monotonic() - last_log >= 60:
+                logger.info(f"📊 Tracking {len(tracked)} markets, {writer.writes} record writes")
+                last_log = time.monotonic()
+
+            time.sleep(max(0.0, refresh_seconds - (time.monotonic() - started)))
+
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if stream:
+            stream.disconnect()
+        writer.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    if len(sys.argv) > 1 and sys.argv[1] != 'serve':
+        print("Usage: python shared_odds.py serve [path]")
+        sys.exit(1)
+    serve(sys.argv[2] if len(sys.argv) > 2 else SHARED_ODDS_PATH)
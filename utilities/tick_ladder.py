@@ -0,0 +1,140 @@
+"""
+Betfair Tick Ladder
+All 350 valid Betfair prices (1.01 - 1000) precomputed once, sorted, so price
+arithmetic is a bisect instead of an if/elif chain of tick-size bands.
+
+- round_price(odds, 'nearest' | 'up' | 'down') snaps any number onto the ladder
+- add_ticks(price, n) walks the ladder, so multi-tick moves cross band
+  boundaries correctly (3.95 + 2 ticks = 4.1, not 4.05)
+- ticks_between(a, b) is the signed tick distance between two prices
+- *_array variants do the same on NumPy arrays for backtests
+
+Usage:
+    from tick_ladder import round_price, add_ticks, ticks_between
+    add_ticks(1.99, 3)            # 2.04
+    round_price(4.03, 'up')       # 4.1
+    ticks_between(2.0, 3.0)       # 50
+"""
+
+from bisect import bisect_left, bisect_right
+from typing import Tuple
+
+import numpy as np
+
+# (band upper bound, tick size) - a price p is in the first band with p <= upper
+TICK_BANDS: Tuple[Tuple[float, float], ...] = (
+    (2.0, 0.01),
+    (3.0, 0.02),
+    (4.0, 0.05),
+    (6.0, 0.1),
+    (10.0, 0.2),
+    (20.0, 0.5),
+    (30.0, 1.0),
+    (50.0, 2.0),
+    (100.0, 5.0),
+    (1000.0, 10.0),
+)
+
+MIN_PRICE = 1.01
+MAX_PRICE = 1000.0
+
+# Tolerance for float inputs that are "on" a tick (e.g. 2.0000000004)
+EPSILON = 1e-9
+
+
+def _build_ladder() -> Tuple[float, ...]:
+    prices = []
+    lower = 1.0
+    for upper, tick in TICK_BANDS:
+        # Work in integer hundredths so 1.01 + 0.01 * n never drifts
+        step = int(round(tick * 100))
+        start = int(round(lower * 100)) + step
+        stop = int(round(upper * 100))
+        prices.extend(round(p / 100, 2) for p in range(start, stop + 1, step))
+        lower = upper
+    return tuple(prices)
+
+
+PRICES: Tuple[float, ...] = _build_ladder()
+PRICE_ARRAY = np.array(PRICES)
+
+assert len(PRICES) == 350 and PRICES[0] == MIN_PRICE and PRICES[-1] == MAX_PRICE
+
+
+def price_index(odds: float, mode: str = 'nearest') -> int:
+    """Ladder index of odds after rounding (clamped to the ladder)"""
+    if mode == 'up':
+        i = bisect_left(PRICES, odds - EPSILON)
+    elif mode == 'down':
+        i = bisect_right(PRICES, odds + EPSILON) - 1
+    elif mode == 'nearest':
+        i = bisect_left(PRICES, odds - EPSILON)
+        # Between PRICES[i-1] and PRICES[i]: take the closer (ties go up)
+        if 0 < i < len(PRICES) and odds - PRICES[i - 1] < PRICES[i] - odds - EPSILON:
+            i -= 1
+    else:
+        raise ValueError(f"Unknown rounding mode: {mode}")
+    return min(max(i, 0), len(PRICES) - 1)
+
+
+def round_price(odds: float, mode: str = 'nearest') -> float:
+    """Snap odds to a valid Betfair price ('nearest', 'up' or 'down')"""
+    return PRICES[price_index(odds, mode)]
+
+
+def is_valid_price(odds: float) -> bool:
+    return abs(PRICES[price_index(odds)] - odds) < EPSILON
+
+
+def tick_size(odds: float) -> float:
+    """Increment of the band odds falls in (the step to the next price up)"""
+    for upper, tick in TICK_BANDS:
+        if odds < upper - EPSILON:
+            return tick
+    return TICK_BANDS[-1][1]
+
+
+def add_ticks(odds: float, num_ticks: int, mode: str = 'nearest') -> float:
+    """
+    Move num_ticks along the ladder from odds (snapped with mode first).
+    Negative num_ticks moves down; the result is clamped to 1.01 - 1000.
+    """
+    i = price_index(odds, mode) + num_ticks
+    return PRICES[min(max(i, 0), len(PRICES) - 1)]
+
+
+def ticks_between(from_odds: float, to_odds: float) -> int:
+    """Signed number of ticks from from_odds to to_odds (both snapped to nearest)"""
+    return price_index(to_odds) - price_index(from_odds)
+
+
+# Vectorized variants (NumPy arrays of prices) --------------------------------
+
+def price_index_array(odds: np.ndarray, mode: str = 'nearest') -> np.ndarray:
+    odds = np.asarray(odds, dtype=float)
+    if mode == 'up':
+        i = np.searchsorted(PRICE_ARRAY, odds - EPSILON, side='left')
+    elif mode == 'down':
+        i = np.searchsorted(PRICE_ARRAY, odds + EPSILON, side='right') - 1
+    elif mode == 'nearest':
+        i = np.searchsorted(PRICE_ARRAY, odds - EPSILON, side='left')
+        below = PRICE_ARRAY[np.clip(i - 1, 0, len(PRICES) - 1)]
+        above = PRICE_ARRAY[np.clip(i, 0, len(PRICES) - 1)]
+        i = np.where((i > 0) & (i < len(PRICES)) & (odds - below < above - odds - EPSILON), i - 1, i)
+    else:
+        raise ValueError(f"Unknown rounding mode: {mode}")
+    return np.clip(i, 0, len(PRICES) - 1)
+
+
+def round_price_array(odds: np.ndarray, mode: str = 'nearest') -> np.ndarray:
+    return PRICE_ARRAY[price_index_array(odds, mode)]
+
+
+def add_ticks_array(odds: np.ndarray, num_ticks, mode: str = 'nearest') -> np.ndarray:
+    """num_ticks may be a scalar or an array the same shape as odds"""
+    i = price_index_array(odds, mode) + np.asarray(num_ticks)
+    return PRICE_ARRAY[np.clip(i, 0, len(PRICES) - 1)]
+
+
+def ticks_between_array(from_odds: np.ndarray, to_odds: np.ndarray) -> np.ndarray:
+    return price_index_array(to_odds) - price_index_array(from_odds)
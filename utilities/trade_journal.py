@@ -0,0 +1,274 @@
+"""
+Trade Journal
+Write-behind storage for paper and live trades: recording a bet no longer waits
+on Postgres.
+
+- record(table, row) appends the trade to a local append-only journal file
+  (flushed + fsync'd, so it survives a crash) and queues it - it returns in
+  about the time of one fsync, with no DB round trips
+- A background writer batches queued trades into multi-row INSERTs (one
+  execute_values per table per batch, one transaction per batch), retrying
+  with backoff while the DB is unavailable
+- After each commit the last committed sequence number is saved next to the
+  journal; once everything is committed the journal is truncated
+- On start-up, journaled trades past the committed sequence number (the
+  process died before they were written) are replayed into the queue
+
+Delivery is at-least-once: a crash between a commit and saving its sequence
+number would re-insert that one batch on restart.
+
+Trades not yet written are visible through pending_rows(), so checks like
+"already bet on this market" can include them.
+
+Usage:
+    journal = TradeJournal('greyhound_lay_position_1')
+    journal.record('paper_trades_greyhounds', {'date': ..., 'venue': ..., ...})
+    journal.close()   # also runs at exit: flushes everything still queued
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+from db_connection_helper import db_transaction
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_DIR = "/Users/clairegrady/RiderProjects/betfair/databases/journal"
+BATCH_SIZE = 500         # Trades per INSERT batch
+FLUSH_SECONDS = 0.5      # Max time a trade waits in the queue before a batch is written
+RETRY_SECONDS = (1, 2, 5, 10, 30)
+
+# Columns a journal may write, per table
+TRADE_TABLES = {
+    'paper_trades_greyhounds': (
+        'date', 'venue', 'country', 'race_number', 'market_id', 'selection_id', 'dog_name', 'box_number',
+        'position_in_market', 'odds', 'stake', 'liability', 'finishing_position', 'result', 'total_matched',
+        'created_at',
+    ),
+    'paper_trades_horses': (
+        'date', 'venue', 'country', 'race_number', 'market_id', 'selection_id', 'horse_name', 'barrier_number',
+        'position_in_market', 'odds', 'stake', 'liability', 'finishing_position', 'result', 'total_matched',
+    ),
+    'live_trades': (
+        'date', 'venue', 'country', 'race_number', 'market_id', 'dog_name', 'box_number', 'position_in_market',
+        'selection_id', 'initial_odds_requested', 'final_odds_matched', 'stake', 'liability', 'betfair_bet_id',
+        'status', 'total_matched', 'placement_time', 'matched_time',
+    ),
+}
+
+
+class TradeJournal:
+    """fsync'd local journal + background batched INSERTs for one process's trades"""
+
+    def __init__(self, name: str, journal_dir: str = JOURNAL_DIR, db_path: str = 'betfair_trades',
+                 batch_size: int = BATCH_SIZE, flush_seconds: float = FLUSH_SECONDS):
+        os.makedirs(journal_dir, exist_ok=True)
+        self.name = name
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+
+        self.path = os.path.join(journal_dir, f"{name}.journal")
+        self._committed_path = os.path.join(journal_dir, f"{name}.committed")
+
+        self._lock = threading.Lock()
+        self._queue: 'queue.Queue[Tuple[int, str, Dict]]' = queue.Queue()
+        self._unflushed: Dict[int, Tuple[str, Dict]] = {}   # seq -> (table, row), until committed
+        self._committed_seq = self._read_committed_seq()
+        self._seq = self._committed_seq
+
+        self.recorded = 0
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+
+        replayed = self._replay()
+        self._file = open(self.path, 'ab')
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._writer_loop, name=f"trade-journal-{name}", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+        if replayed:
+            logger.warning(f"📒 Replaying {replayed} trade(s) from {self.path} that never reached the DB")
+
+    def _read_committed_seq(self) -> int:
+        try:
+            with open(self._committed_path) as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _replay(self) -> int:
+        """Queue journaled trades past the committed sequence number"""
+        if not os.path.exists(self.path):
+            return 0
+
+        replayed = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # Torn last line from a crash mid-append: that trade was never acknowledged
+                    logger.warning(f"⚠️  Skipping unreadable journal line in {self.path}")
+                    continue
+                seq = entry['seq']
+                self._seq = max(self._seq, seq)
+                if seq > self._committed_seq:
+                    self._unflushed[seq] = (entry['table'], entry['row'])
+                    self._queue.put((seq, entry['table'], entry['row']))
+                    replayed += 1
+
+            # Drop a torn tail so new records start on their own line
+            data_end = f.tell()
+            f.seek(0)
+            last_newline = f.read().rfind(b'\n')
+        if last_newline + 1 != data_end:
+            os.truncate(self.path, last_newline + 1)
+        return replayed
+
+    def record(self, table: str, row: Dict) -> int:
+        """Journal one trade and queue it for the DB. Returns its sequence number."""
+        columns = TRADE_TABLES.get(table)
+        if columns is None:
+            raise ValueError(f"Unknown trade table: {table}")
+        unknown = set(row) - set(columns)
+        if unknown:
+            raise ValueError(f"Unknown {table} columns: {sorted(unknown)}")
+
+        with self._lock:
+            self._seq += 1
+            seq = self._seq
+            line = json.dumps({'seq': seq, 'table': table, 'row': row}, default=str)
+            self._file.write(line.encode() + b'\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._unflushed[seq] = (table, row)
+            self.recorded += 1
+
+        self._queue.put((seq, table, row))
+        return seq
+
+    def pending_rows(self, table: str) -> List[Dict]:
+        """Trades recorded for this table that aren't committed to the DB yet"""
+        with self._lock:
+            return [row for t, row in self._unflushed.values() if t == table]
+
+    def _next_batch(self) -> List[Tuple[int, str, Dict]]:
+        try:
+            batch = [self._queue.get(timeout=self.flush_seconds)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write_batch(self, batch: List[Tuple[int, str, Dict]]):
+        by_table: Dict[str, List[Dict]] = {}
+        for _, table, row in batch:
+            by_table.setdefault(table, []).append(row)
+
+        with db_transaction(self.db_path) as conn:
+            cursor = conn.cursor()
+            for table, rows in by_table.items():
+                columns = TRADE_TABLES[table]
+                execute_values(
+                    cursor,
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s",
+                    [tuple(row.get(c) for c in columns) for row in rows],
+                    page_size=self.batch_size,
+                )
+
+    def _mark_committed(self, batch: List[Tuple[int, str, Dict]]):
+        with self._lock:
+            for seq, _, _ in batch:
+                self._unflushed.pop(seq, None)
+            # Everything up to the oldest still-unflushed trade is in the DB
+            committed = (min(self._unflushed) - 1) if self._unflushed else self._seq
+            self._committed_seq = max(self._committed_seq, committed)
+
+            tmp_path = self._committed_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                f.write(str(self._committed_seq))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self._committed_path)
+
+            if not self._unflushed:
+                # Nothing left to recover - start the journal afresh
+                self._file.truncate(0)
+
+            self.written += len(batch)
+            self.batches += 1
+
+    def _writer_loop(self):
+        failures = 0
+        batch = []
+        while True:
+            if not batch:
+                if self._stop.is_set() and self._queue.empty():
+                    return
+                batch = self._next_batch()
+                if not batch:
+                    continue
+
+            try:
+                self._write_batch(batch)
+                self._mark_committed(batch)
+                batch = []
+                failures = 0
+            except Exception as e:
+                self.errors += 1
+                delay = RETRY_SECONDS[min(failures, len(RETRY_SECONDS) - 1)]
+                failures += 1
+                logger.error(f"❌ Trade journal {self.name}: writing {len(batch)} trade(s) failed ({e}) - retrying in {delay}s")
+                if self._stop.wait(delay) and failures >= len(RETRY_SECONDS):
+                    # Shutting down with the DB still unavailable: the journal replays them next start
+                    logger.error(f"❌ Trade journal {self.name}: {len(self._unflushed)} trade(s) left in {self.path}")
+                    return
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every recorded trade is committed. Returns False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                if not self._unflushed:
+                    return True
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+
+    def close(self, timeout: float = 30.0):
+        """Write everything still queued (up to timeout seconds) and stop the writer"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        with self._lock:
+            self._file.close()
+
+    def stats(self) -> Dict:
+        return {
+            'recorded': self.recorded,
+            'written': self.written,
+            'batches': self.batches,
+            'pending': len(self._unflushed),
+            'errors': self.errors,
+        }